@@ -32,4 +32,62 @@ async def health_check():
             "payload_processor_service",
             "bind_service"
         ]
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/transport/stats")
+async def transport_stats():
+    """Connection pool and request counters for the shared IMS SOAP transport."""
+    from app.services.ims.soap_transport import get_soap_transport
+    transport = get_soap_transport()
+    return {"endpoints": transport.get_stats(), "cassette": transport.get_cassette_stats()}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the IMS lookup caches."""
+    from app.utils.lookup_cache import get_all_cache_stats
+    return {"caches": get_all_cache_stats()}
+
+
+@router.get("/dataset/schemas")
+async def dataset_schemas():
+    """Column schemas learned from ExecuteDataSet results, keyed procedure.table."""
+    from app.services.ims.dataset import get_schema_cache
+    return {"schemas": get_schema_cache()}
+
+
+@router.post("/cache/{name}/invalidate")
+async def invalidate_cache(name: str, key: Optional[str] = None):
+    """
+    Drop one normalized key, or the whole cache when no key is given.
+    
+    Only the worker process serving this request drops its entries (and,
+    for a persisted cache, removes them from the file on its next flush).
+    Other uvicorn workers keep the entries they already hold in memory
+    until those expire (ttl_seconds / negative_ttl_seconds).
+    """
+    from app.utils.lookup_cache import get_lookup_cache
+    from config import CACHE_CONFIG
+    if name not in CACHE_CONFIG:
+        raise HTTPException(status_code=404, detail=f"Unknown cache {name}; expected one of {', '.join(CACHE_CONFIG)}")
+    removed = get_lookup_cache(name).invalidate(key)
+    return {"cache": name, "removed": removed}
+
+
+@router.get("/reference-data/stats")
+async def reference_data_stats():
+    """Sizes and last sync results of the local producer/underwriter snapshot."""
+    from app.services.ims.reference_data_service import get_reference_data_service
+    return get_reference_data_service().get_stats()
+
+
+@router.post("/reference-data/sync")
+async def sync_reference_data():
+    """Pull producers and underwriters from IMS now."""
+    from app.services.ims.async_services import run_ims_call
+    from app.services.ims.reference_data_service import get_reference_data_service
+    success, message = await run_ims_call(get_reference_data_service().sync)
+    if not success:
+        raise HTTPException(status_code=502, detail=message)
+    return {"success": True, "message": message}
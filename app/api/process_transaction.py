@@ -1,12 +1,17 @@
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import AsyncIterator, Callable, Dict, Any, Optional, Tuple
 
-from app.services.transaction_handler import get_transaction_handler
+from app.services.ims.payload_processor_service import get_payload_processor_service
+from app.services.transaction_handler import get_transaction_handler, get_async_transaction_handler
+from app.utils.json_stream import JSONStreamError
+from config import APP_CONFIG
 
 logger = logging.getLogger(__name__)
 
 
-def process_triton_transaction(payload: Dict[str, Any]) -> Dict[str, Any]:
+def process_triton_transaction(payload: Dict[str, Any],
+                               progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
     Process a transaction from Triton.
     
@@ -15,6 +20,7 @@ def process_triton_transaction(payload: Dict[str, Any]) -> Dict[str, Any]:
     
     Args:
         payload: The Triton transaction payload
+        progress: Optional callback, called with each workflow step name as it finishes
         
     Returns:
         Dict containing the processing results
@@ -24,21 +30,36 @@ def process_triton_transaction(payload: Dict[str, Any]) -> Dict[str, Any]:
         handler = get_transaction_handler()
         
         # Process the transaction
-        success, results, message = handler.process_transaction(payload)
+        success, results, message = handler.process_transaction(payload, progress)
+        return _build_result(success, results, message)
+            
+    except Exception as e:
+        logger.error(f"Fatal error processing transaction: {str(e)}", exc_info=True)
+        return {
+            "success": False,
+            "message": f"Fatal error: {str(e)}",
+            "error": str(e)
+        }
+
+
+async def process_triton_transaction_async(payload: Dict[str, Any], handler=None) -> Dict[str, Any]:
+    """
+    Async variant of process_triton_transaction for the FastAPI routes.
+    
+    The IMS calls run on the shared IMS executor, so the event loop keeps
+    serving other requests while this transaction is in flight.
+    
+    Args:
+        payload: The Triton transaction payload
+        handler: AsyncTransactionHandler to use (defaults to the singleton)
         
-        if success:
-            return {
-                "success": True,
-                "message": message,
-                "data": results
-            }
-        else:
-            return {
-                "success": False,
-                "message": message,
-                "data": results,
-                "error": results.get("error")
-            }
+    Returns:
+        Dict containing the processing results
+    """
+    try:
+        handler = handler or get_async_transaction_handler()
+        success, results, message = await handler.process_transaction(payload)
+        return _build_result(success, results, message)
             
     except Exception as e:
         logger.error(f"Fatal error processing transaction: {str(e)}", exc_info=True)
@@ -46,4 +67,106 @@ def process_triton_transaction(payload: Dict[str, Any]) -> Dict[str, Any]:
             "success": False,
             "message": f"Fatal error: {str(e)}",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+
+async def process_triton_transactions_stream(records: AsyncIterator[Tuple[int, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Process a stream of Triton payloads, yielding each result as it completes.
+    
+    Records are validated with payload_processor.validate_payload and run
+    through the transaction scheduler, so records for one opportunity apply
+    in stream order and different opportunities run in parallel. At most
+    APP_CONFIG["batch_max_in_flight"] records are read ahead of their results.
+    
+    Args:
+        records: (index, payload) pairs, e.g. from iter_json_records
+        
+    Yields:
+        Dict with index and transaction_id plus the single-transaction
+        result shape (success, message, data, error)
+    """
+    handler = get_async_transaction_handler()
+    payload_processor = get_payload_processor_service()
+    in_flight = asyncio.Semaphore(APP_CONFIG.get("batch_max_in_flight", 200))
+    completed: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+    done_reading = object()
+    
+    async def run_record(index: int, payload: Dict[str, Any]):
+        result = await process_triton_transaction_async(payload, handler)
+        await completed.put(_batch_result(index, payload, result))
+    
+    async def read_records():
+        try:
+            async for index, payload in records:
+                await in_flight.acquire()
+                if not isinstance(payload, dict):
+                    await completed.put(_batch_result(index, {}, {
+                        "success": False,
+                        "message": "Record is not a JSON object",
+                        "error": "Record is not a JSON object"
+                    }))
+                    continue
+                is_valid, validation_error = payload_processor.validate_payload(payload)
+                if not is_valid:
+                    message = f"Payload validation failed: {validation_error}"
+                    await completed.put(_batch_result(index, payload, {
+                        "success": False,
+                        "message": message,
+                        "error": message
+                    }))
+                    continue
+                task = asyncio.create_task(run_record(index, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except JSONStreamError as e:
+            logger.error(f"Batch input error: {str(e)}")
+            await completed.put({"index": None, "success": False, "message": str(e), "error": str(e)})
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await completed.put(done_reading)
+    
+    reader = asyncio.create_task(read_records())
+    try:
+        while True:
+            item = await completed.get()
+            if item is done_reading:
+                break
+            if item.get("index") is not None:
+                in_flight.release()
+            yield item
+    finally:
+        # Client went away: stop reading and drop records that have not started
+        # (a transaction already running in IMS still finishes)
+        if not reader.done():
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+
+def _batch_result(index: int, payload: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Tag a single-transaction result with its position in the batch."""
+    return {
+        "index": index,
+        "transaction_id": payload.get("transaction_id"),
+        **result
+    }
+
+
+def _build_result(success: bool, results: Dict[str, Any], message: str) -> Dict[str, Any]:
+    """Shape handler output into the API result dict."""
+    if success:
+        return {
+            "success": True,
+            "message": message,
+            "data": results
+        }
+    else:
+        return {
+            "success": False,
+            "message": message,
+            "data": results,
+            "error": results.get("error")
+        }
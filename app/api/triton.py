@@ -1,16 +1,41 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
+import json
 import logging
 
-from app.api.process_transaction import process_triton_transaction
-from app.services.ims.invoice_service import get_invoice_service
+from app.api.process_transaction import process_triton_transaction_async, process_triton_transactions_stream
+from app.services.ims.async_services import get_async_invoice_service
+from app.services.ims.deferred_invoice_service import get_deferred_invoice_service
+from app.services.job_queue_service import get_job_queue_service
+from app.services.transaction_scheduler import get_transaction_scheduler
+from app.utils.json_stream import iter_json_records
+from app.utils.tracing import get_timing_histograms
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/triton", tags=["triton"])
 
 
+class RequestBodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for a body iterator that is still reading the request.
+    
+    Starlette's StreamingResponse listens for http.disconnect on receive()
+    while it streams, which takes the http.request messages request.stream()
+    is waiting for and leaves the response hanging. This one only sends;
+    a client that goes away during the upload still ends request.stream()
+    with ClientDisconnect.
+    """
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
 class TritonPayload(BaseModel):
     """Triton transaction payload model."""
     transaction_id: str
@@ -32,7 +57,10 @@ class TransactionResponse(BaseModel):
 
 
 @router.post("/transaction/new", response_model=TransactionResponse)
-async def process_transaction(payload: Dict[str, Any]):
+async def process_transaction(
+    payload: Dict[str, Any],
+    mode: str = Query("sync", description="sync: process and respond with the result; queue: persist and respond 202 with a job id")
+):
     """
     Process a new transaction from Triton.
     
@@ -60,12 +88,21 @@ async def process_transaction(payload: Dict[str, Any]):
     
     Returns the processing results including all created GUIDs and 
     policy numbers.
+    
+    With mode=queue the payload is stored in the durable job queue and the
+    response is 202 Accepted with a job_id; poll
+    GET /api/triton/transaction/jobs/{job_id} for status and result.
     """
+    if mode == "queue":
+        return await submit_transaction(payload)
+    if mode != "sync":
+        raise HTTPException(status_code=400, detail=f"Unsupported mode: {mode}")
+    
     try:
         logger.info(f"Received transaction: {payload.get('transaction_id')} - Type: {payload.get('transaction_type')}")
         
         # Process the transaction
-        result = process_triton_transaction(payload)
+        result = await process_triton_transaction_async(payload)
         
         if result["success"]:
             logger.info(f"Successfully processed transaction: {payload.get('transaction_id')}")
@@ -96,6 +133,102 @@ async def process_transaction(payload: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/transactions/batch")
+async def process_transaction_batch(request: Request):
+    """
+    Process many transactions from one request.
+    
+    The body is NDJSON (one payload per line) or a JSON array of payloads
+    and is read as a stream. Each record is validated and processed like
+    /transaction/new; records for the same opportunity apply in body order,
+    different opportunities in parallel.
+    
+    The response is NDJSON with one line per record, written as each
+    completes (not in input order):
+    {"index": 0, "transaction_id": "...", "success": true, "message": "...", "data": {...}}
+    A malformed body ends the stream with a line whose index is null.
+    """
+    logger.info("Received transaction batch")
+    
+    async def result_lines():
+        processed = failed = 0
+        async for result in process_triton_transactions_stream(iter_json_records(request.stream())):
+            processed += 1
+            if not result["success"]:
+                failed += 1
+            yield json.dumps(result, default=str) + "\n"
+        logger.info(f"Transaction batch finished: {processed} results, {failed} failed")
+    
+    return RequestBodyStreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+
+async def submit_transaction(payload: Dict[str, Any]) -> JSONResponse:
+    """Queue a transaction and respond 202 with its job (200 if already queued/processed)."""
+    if not payload.get("transaction_id") or not payload.get("transaction_type"):
+        raise HTTPException(status_code=400, detail="transaction_id and transaction_type are required")
+    
+    try:
+        job, created = await run_in_threadpool(get_job_queue_service().submit, payload)
+    except Exception as e:
+        logger.error(f"Error queueing transaction: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logger.info(f"Accepted transaction {payload.get('transaction_id')} as job {job['job_id']}")
+    return JSONResponse(
+        status_code=202 if created else 200,
+        content={
+            "success": True,
+            "message": "Transaction queued" if created else f"Transaction already {job['status']}",
+            "data": job
+        },
+        headers={"Location": job["status_url"]}
+    )
+
+
+@router.get("/transaction/jobs")
+async def get_transaction_queue_stats():
+    """Queued/running/completed/failed job counts."""
+    return await run_in_threadpool(get_job_queue_service().get_stats)
+
+
+@router.get("/transaction/scheduler")
+async def get_transaction_scheduler_stats(top: int = Query(10, description="Number of most-lagging opportunities to list")):
+    """
+    Transaction scheduler queue depth and per-opportunity lag.
+    
+    Transactions for one opportunity run in order, different opportunities
+    in parallel; lag_seconds is how long the oldest waiting transaction of
+    an opportunity has been queued.
+    """
+    return get_transaction_scheduler().get_stats(top)
+
+
+@router.get("/timings")
+async def get_timing_histograms_stats():
+    """
+    Latency histograms since startup, by kind: transaction (per type),
+    step (workflow steps) and ims (per SOAP action / stored procedure).
+    
+    Each transaction's own breakdown is returned in its results["timings"].
+    """
+    return get_timing_histograms().snapshot()
+
+
+@router.get("/transaction/jobs/{job_id}")
+async def get_transaction_job(job_id: str):
+    """
+    Status of a queued transaction.
+    
+    status is queued, running (step is the last finished workflow step),
+    completed or failed; result holds the same body /transaction/new
+    returns in sync mode once the job has finished.
+    """
+    job = await run_in_threadpool(get_job_queue_service().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 @router.get("/transaction-types")
 async def get_transaction_types():
     """Get supported transaction types."""
@@ -137,11 +270,21 @@ async def get_invoice(
                 detail="At least one parameter must be provided: invoice_num, quote_guid, policy_number, or opportunity_id"
             )
         
+        # A deferred invoice already fetched after bind is served without another IMS call
+        if quote_guid and not invoice_num:
+            invoice_data = await run_in_threadpool(get_deferred_invoice_service().get_completed_by_quote_guid, quote_guid)
+            if invoice_data:
+                return {
+                    "success": True,
+                    "message": "Invoice data retrieved successfully",
+                    "invoice_data": invoice_data
+                }
+        
         # Get the invoice service
-        invoice_service = get_invoice_service()
+        invoice_service = get_async_invoice_service()
         
         # Call the service to get invoice data
-        success, invoice_data, message = invoice_service.get_invoice_by_params(
+        success, invoice_data, message = await invoice_service.get_invoice_by_params(
             invoice_num=invoice_num,
             quote_guid=quote_guid,
             policy_number=policy_number,
@@ -169,6 +312,21 @@ async def get_invoice(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/invoice/status/{invoice_id}")
+async def get_invoice_status(invoice_id: str):
+    """
+    Status of an invoice retrieved in the background after a transaction.
+    
+    Transactions return an invoice_request handle (invoice_id, status_url)
+    instead of invoice_data when deferred invoices are enabled. Status is
+    pending, completed (invoice_data included) or failed.
+    """
+    invoice_request = await run_in_threadpool(get_deferred_invoice_service().get_status, invoice_id)
+    if invoice_request is None:
+        raise HTTPException(status_code=404, detail=f"Invoice request {invoice_id} not found")
+    return invoice_request
+
+
 @router.get("/status")
 async def status():
     """Check Triton API status."""
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.services.ims.auth_service import get_auth_service
+from app.services.ims.insured_service import get_insured_service
+from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.underwriter_service import get_underwriter_service
+from app.services.ims.quote_service import get_quote_service
+from app.services.ims.quote_options_service import get_quote_options_service
+from app.services.ims.payload_processor_service import get_payload_processor_service
+from app.services.ims.bind_service import get_bind_service
+from app.services.ims.issue_service import get_issue_service
+from app.services.ims.unbind_service import get_unbind_service
+from app.services.ims.endorsement_service import get_endorsement_service
+from app.services.ims.cancellation_service import get_cancellation_service
+from app.services.ims.reinstatement_service import get_reinstatement_service
+from app.services.ims.invoice_service import get_invoice_service
+from config import APP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+# Executor shared by every async IMS call; bounds how many blocking SOAP
+# calls can be in flight at once
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_ims_executor() -> ThreadPoolExecutor:
+    """Get the shared executor that runs IMS calls for async callers."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = APP_CONFIG.get("max_concurrent_transactions", 32)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ims")
+                logger.info(f"Created IMS executor with {max_workers} workers")
+    return _executor
+
+
+async def run_ims_call(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking IMS call without blocking the event loop.
+
+    Args:
+        func: Sync service method or function
+        *args, **kwargs: Passed through to func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_ims_executor(), functools.partial(func, *args, **kwargs))
+
+
+class AsyncServiceProxy:
+    """
+    Async view of a sync IMS service.
+
+    Every public method of the wrapped service is exposed as a coroutine
+    with the same signature and return value, e.g.
+    ``await get_async_bind_service().bind_quote(quote_guid)``.
+    Attributes that are not callables are returned as-is.
+    """
+
+    def __init__(self, service: Any):
+        self._service = service
+        self._methods: Dict[str, Callable] = {}
+
+    @property
+    def sync(self) -> Any:
+        """The wrapped sync service."""
+        return self._service
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._service, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        method = self._methods.get(name)
+        if method is None:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await run_ims_call(getattr(self._service, name), *args, **kwargs)
+            self._methods[name] = method
+        return method
+
+
+_async_services: Dict[str, AsyncServiceProxy] = {}
+_async_services_lock = threading.Lock()
+
+
+def _get_async_service(name: str, getter: Callable[[], Any]) -> AsyncServiceProxy:
+    """Get (or create) the singleton async proxy for a service."""
+    proxy = _async_services.get(name)
+    if proxy is None:
+        with _async_services_lock:
+            proxy = _async_services.get(name)
+            if proxy is None:
+                proxy = AsyncServiceProxy(getter())
+                _async_services[name] = proxy
+    return proxy
+
+
+def get_async_auth_service() -> AsyncServiceProxy:
+    """Get async variant of the auth service."""
+    return _get_async_service("auth", get_auth_service)
+
+
+def get_async_insured_service() -> AsyncServiceProxy:
+    """Get async variant of the insured service."""
+    return _get_async_service("insured", get_insured_service)
+
+
+def get_async_data_access_service() -> AsyncServiceProxy:
+    """Get async variant of the data access service."""
+    return _get_async_service("data_access", get_data_access_service)
+
+
+def get_async_underwriter_service() -> AsyncServiceProxy:
+    """Get async variant of the underwriter service."""
+    return _get_async_service("underwriter", get_underwriter_service)
+
+
+def get_async_quote_service() -> AsyncServiceProxy:
+    """Get async variant of the quote service."""
+    return _get_async_service("quote", get_quote_service)
+
+
+def get_async_quote_options_service() -> AsyncServiceProxy:
+    """Get async variant of the quote options service."""
+    return _get_async_service("quote_options", get_quote_options_service)
+
+
+def get_async_payload_processor_service() -> AsyncServiceProxy:
+    """Get async variant of the payload processor service."""
+    return _get_async_service("payload_processor", get_payload_processor_service)
+
+
+def get_async_bind_service() -> AsyncServiceProxy:
+    """Get async variant of the bind service."""
+    return _get_async_service("bind", get_bind_service)
+
+
+def get_async_issue_service() -> AsyncServiceProxy:
+    """Get async variant of the issue service."""
+    return _get_async_service("issue", get_issue_service)
+
+
+def get_async_unbind_service() -> AsyncServiceProxy:
+    """Get async variant of the unbind service."""
+    return _get_async_service("unbind", get_unbind_service)
+
+
+def get_async_endorsement_service() -> AsyncServiceProxy:
+    """Get async variant of the endorsement service."""
+    return _get_async_service("endorsement", get_endorsement_service)
+
+
+def get_async_cancellation_service() -> AsyncServiceProxy:
+    """Get async variant of the cancellation service."""
+    return _get_async_service("cancellation", get_cancellation_service)
+
+
+def get_async_reinstatement_service() -> AsyncServiceProxy:
+    """Get async variant of the reinstatement service."""
+    return _get_async_service("reinstatement", get_reinstatement_service)
+
+
+def get_async_invoice_service() -> AsyncServiceProxy:
+    """Get async variant of the invoice service."""
+    return _get_async_service("invoice", get_invoice_service)
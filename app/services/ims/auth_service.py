@@ -1,10 +1,15 @@
 import logging
+import re
+import threading
 import requests
-import xml.etree.ElementTree as ET
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import os
 
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import LOGON_NAMESPACE, SoapTemplate, envelope_text
+from app.services.ims.soap_transport import get_soap_transport
+
 # Try to import config, but provide defaults if not available
 try:
     from config import IMS_CONFIG
@@ -24,11 +29,32 @@ except ImportError:
             "username": os.getenv("IMS_ONE_USERNAME"),
             "password": os.getenv("IMS_ONE_PASSWORD"),
         },
-        "timeout": int(os.getenv("IMS_TIMEOUT", "30"))
+        "timeout": int(os.getenv("IMS_TIMEOUT", "30")),
+        "auth": {
+            "token_lifetime_minutes": 480,
+            "refresh_margin_minutes": 15,
+            "background_refresh": True
+        }
     }
 
 logger = logging.getLogger(__name__)
 
+LOGIN_IMS_USER = SoapTemplate(LOGON_NAMESPACE, "LoginIMSUser", """
+    <userName>{username}</userName>
+    <tripleDESEncryptedPassword>{password}</tripleDESEncryptedPassword>
+""", token_header=False)
+
+# Fields of the LoginIMSUser response
+LOGIN_USER_GUID = soap_parser.SoapPath(".//logon:UserGuid")
+LOGIN_TOKEN = soap_parser.SoapPath(".//logon:Token")
+
+# Fault strings IMS returns when a session token is no longer accepted
+INVALID_TOKEN_FAULT = re.compile(
+    r'<faultstring>[^<]*(invalid\s+token|token\s+(is\s+)?(invalid|expired|not\s+valid)|'
+    r'session\s+(has\s+)?expired|not\s+logged\s+in)[^<]*</faultstring>',
+    re.IGNORECASE
+)
+
 
 class IMSAuthService:
     """Service for handling IMS authentication and token management."""
@@ -38,21 +64,35 @@ class IMSAuthService:
         self.logon_endpoint = IMS_CONFIG["endpoints"]["logon"]
         self.username = IMS_CONFIG["credentials"]["username"]
         self.password = IMS_CONFIG["credentials"]["password"]
-        self.timeout = IMS_CONFIG["timeout"]
+        self.transport = get_soap_transport()
+        
+        auth_config = IMS_CONFIG.get("auth", {})
+        self.token_lifetime = timedelta(minutes=auth_config.get("token_lifetime_minutes", 480))
+        self.refresh_margin = timedelta(minutes=auth_config.get("refresh_margin_minutes", 15))
+        self.background_refresh = auth_config.get("background_refresh", True)
         
         # Token management
         self._token: Optional[str] = None
         self._user_guid: Optional[str] = None
         self._token_expiry: Optional[datetime] = None
         
+        # Single-flight: only one LoginIMSUser call may be in progress at a time
+        self._login_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_stop = threading.Event()
+        
+        # Login and refresh counters reported by /metrics
+        self._stats = {
+            "logins": 0,
+            "login_failures": 0,
+            "background_refreshes": 0,
+            "invalid_token_retries": 0
+        }
+        
     @property
     def token(self) -> Optional[str]:
         """Get current token, refresh if expired."""
-        if self._token and self._token_expiry and datetime.now() < self._token_expiry:
-            return self._token
-        
-        # Token expired or doesn't exist, need to login
-        success, message = self.login()
+        success, message = self.ensure_authenticated()
         if success:
             return self._token
         else:
@@ -62,54 +102,61 @@ class IMSAuthService:
     @property
     def user_guid(self) -> Optional[str]:
         """Get current user GUID, refresh if expired."""
-        if self._user_guid and self._token_expiry and datetime.now() < self._token_expiry:
-            return self._user_guid
-        
-        # Token expired or doesn't exist, need to login
-        success, message = self.login()
+        success, message = self.ensure_authenticated()
         if success:
             return self._user_guid
         else:
             logger.error(f"Failed to refresh token and get user GUID: {message}")
             return None
     
+    def ensure_authenticated(self) -> Tuple[bool, str]:
+        """
+        Make sure a valid token is cached, logging in only if it is missing or expired.
+        
+        Concurrent callers share a single login; the ones that waited on the
+        lock pick up the token the first caller obtained.
+        
+        Returns:
+            Tuple[bool, str]: (success, message)
+        """
+        if self.is_authenticated():
+            return True, "Using cached token"
+        
+        with self._login_lock:
+            if self.is_authenticated():
+                return True, "Using cached token"
+            return self._login()
+    
     def login(self) -> Tuple[bool, str]:
         """
         Authenticate with IMS and obtain a session token.
         
+        Always performs a LoginIMSUser call; use ensure_authenticated() to
+        reuse a cached token.
+        
         Returns:
             Tuple[bool, str]: (success, message)
         """
+        with self._login_lock:
+            return self._login()
+    
+    def _login(self) -> Tuple[bool, str]:
+        """Perform the LoginIMSUser call. Caller must hold _login_lock."""
         try:
             # Construct SOAP request
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-    <soap:Body>
-        <LoginIMSUser xmlns="http://tempuri.org/IMSWebServices/Logon">
-            <userName>{self.username}</userName>
-            <tripleDESEncryptedPassword>{self.password}</tripleDESEncryptedPassword>
-        </LoginIMSUser>
-    </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/Logon/LoginIMSUser'
-            }
+            soap_request = LOGIN_IMS_USER.render(username=self.username, password=self.password)
+            headers = LOGIN_IMS_USER.headers
             
             # Make request
             url = f"{self.base_url}{self.logon_endpoint}"
             logger.info(f"Attempting IMS login at: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
-            response = requests.post(
+            response = self.transport.post(
                 url,
                 data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                headers=headers
             )
             
             # Check HTTP status
@@ -120,13 +167,19 @@ class IMSAuthService:
             logger.debug(f"SOAP Response:\n{response.text}")
             
             # Parse response
-            return self._parse_login_response(response.text)
+            success, message = self._parse_login_response(response.text)
+            self._stats["logins" if success else "login_failures"] += 1
+            if success and self.background_refresh:
+                self._start_background_refresh()
+            return success, message
             
         except requests.exceptions.RequestException as e:
+            self._stats["login_failures"] += 1
             error_msg = f"HTTP request failed: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
         except Exception as e:
+            self._stats["login_failures"] += 1
             error_msg = f"Unexpected error during login: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
@@ -145,19 +198,16 @@ class IMSAuthService:
             # Log raw response for debugging
             logger.debug(f"Raw response to parse:\n{response_xml}")
             
-            # Parse XML - use a simpler approach
-            import re
+            # Parse XML
+            root = soap_parser.parse(response_xml)
             
-            # Extract UserGuid and Token using regex
-            user_guid_match = re.search(r'<UserGuid>([^<]+)</UserGuid>', response_xml)
-            token_match = re.search(r'<Token>([^<]+)</Token>', response_xml)
+            # Extract UserGuid and Token
+            user_guid = LOGIN_USER_GUID.text(root)
+            token = LOGIN_TOKEN.text(root)
             
-            if not user_guid_match or not token_match:
+            if not user_guid or not token:
                 return False, "UserGuid or Token not found in response"
             
-            user_guid = user_guid_match.group(1)
-            token = token_match.group(1)
-            
             logger.debug(f"Extracted UserGuid: {user_guid}")
             logger.debug(f"Extracted Token: {token}")
             
@@ -170,12 +220,12 @@ class IMSAuthService:
             # Store credentials
             self._user_guid = user_guid
             self._token = token
-            self._token_expiry = datetime.now() + timedelta(hours=8)  # Assume 8-hour session
+            self._token_expiry = datetime.now() + self.token_lifetime
             
             logger.info(f"Successfully authenticated. UserGuid: {user_guid}")
             return True, f"Login successful. Token: {token[:8]}..."
             
-        except ET.ParseError as e:
+        except soap_parser.SoapParseError as e:
             error_msg = f"Failed to parse XML response: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
@@ -202,8 +252,103 @@ class IMSAuthService:
                self._token_expiry is not None and \
                datetime.now() < self._token_expiry
     
+    def invalidate_token(self, stale_token: Optional[str] = None):
+        """
+        Drop the cached token so the next caller logs in again.
+        
+        Args:
+            stale_token: Token IMS rejected. If another thread already replaced
+                it with a fresh one, the fresh token is kept.
+        """
+        with self._login_lock:
+            if stale_token is None or stale_token == self._token:
+                self._token_expiry = None
+                logger.info("Cached IMS token invalidated")
+    
+    def is_invalid_token_fault(self, response_text: str) -> bool:
+        """Check whether a SOAP response is an IMS fault for a rejected token."""
+        return bool(response_text) and INVALID_TOKEN_FAULT.search(response_text) is not None
+    
+    def post_with_token_retry(self, url: str, soap_request: Union[str, bytes], headers: Dict[str, str],
+                              token: str, stream: bool = False) -> requests.Response:
+        """
+        Post a SOAP request that carries a token, re-logging in once if IMS rejects it.
+        
+        Args:
+            url: IMS endpoint URL
+            soap_request: SOAP envelope containing the token
+            headers: Request headers
+            token: Token embedded in soap_request
+            stream: Leave a successful response's body unread (see IMSSoapTransport.post)
+            
+        Returns:
+            The IMS response (of the retry, if one was needed)
+        """
+        response = self.transport.post(url, data=soap_request, headers=headers, stream=stream)
+        
+        if response.status_code == 200 or not self.is_invalid_token_fault(response.text):
+            return response
+        
+        logger.warning("IMS rejected the session token, logging in again and retrying once")
+        self._stats["invalid_token_retries"] += 1
+        self.invalidate_token(token)
+        new_token = self.token
+        if not new_token or new_token == token:
+            return response
+        
+        if isinstance(soap_request, bytes):
+            soap_request = soap_request.replace(token.encode("utf-8"), new_token.encode("utf-8"))
+        else:
+            soap_request = soap_request.replace(token, new_token)
+        return self.transport.post(url, data=soap_request, headers=headers, stream=stream)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Login and token refresh counters, and whether a token is cached."""
+        return {
+            **self._stats,
+            "authenticated": self.is_authenticated()
+        }
+    
+    def _start_background_refresh(self):
+        """Start the daemon thread that renews the token before it expires."""
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop,
+            name="ims-token-refresh",
+            daemon=True
+        )
+        self._refresh_thread.start()
+    
+    def _refresh_loop(self):
+        """Renew the token refresh_margin before expiry until stopped."""
+        while not self._refresh_stop.is_set():
+            expiry = self._token_expiry
+            if expiry is None:
+                wait_seconds = 60
+            else:
+                wait_seconds = max((expiry - self.refresh_margin - datetime.now()).total_seconds(), 0)
+            
+            if self._refresh_stop.wait(wait_seconds):
+                break
+            
+            if self._token_expiry is None or datetime.now() >= self._token_expiry - self.refresh_margin:
+                logger.info("Refreshing IMS token before expiry")
+                self._stats["background_refreshes"] += 1
+                success, message = self.login()
+                if not success:
+                    logger.error(f"Background token refresh failed: {message}")
+                    # Back off before trying again
+                    self._refresh_stop.wait(60)
+    
+    def stop_background_refresh(self):
+        """Stop the background refresh thread."""
+        self._refresh_stop.set()
+    
     def logout(self):
         """Clear stored authentication credentials."""
+        self.stop_background_refresh()
         self._token = None
         self._user_guid = None
         self._token_expiry = None
@@ -212,11 +357,14 @@ class IMSAuthService:
 
 # Singleton instance
 _auth_service = None
+_auth_service_lock = threading.Lock()
 
 
 def get_auth_service() -> IMSAuthService:
     """Get singleton instance of auth service."""
     global _auth_service
     if _auth_service is None:
-        _auth_service = IMSAuthService()
+        with _auth_service_lock:
+            if _auth_service is None:
+                _auth_service = IMSAuthService()
     return _auth_service
\ No newline at end of file
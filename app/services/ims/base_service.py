@@ -1,18 +1,52 @@
 import logging
+import threading
 import requests
 from typing import Optional
 from abc import ABC, abstractmethod
 
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims.soap_transport import get_soap_transport
 
 logger = logging.getLogger(__name__)
 
 
+class ThreadLocalAttribute:
+    """
+    Attribute whose value is kept per thread.
+    
+    Services are singletons shared by every in-flight transaction, so the
+    last SOAP request/response kept for error messages must not leak
+    between concurrent calls.
+    """
+    
+    def __init__(self, default=None):
+        self.default = default
+        self._local = threading.local()
+        
+    def __set_name__(self, owner, name):
+        self.name = name
+        
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return getattr(self._local, f"{self.name}_{id(instance)}", self.default)
+    
+    def __set__(self, instance, value):
+        setattr(self._local, f"{self.name}_{id(instance)}", value)
+
+
 class BaseIMSService(ABC):
     """Base class for IMS services with common functionality."""
     
-    def __init__(self):
+    # Per-call diagnostics, see ThreadLocalAttribute
+    _last_soap_request = ThreadLocalAttribute()
+    _last_soap_response = ThreadLocalAttribute()
+    _last_url = ThreadLocalAttribute()
+    
+    def __init__(self, endpoint_key: Optional[str] = None):
         self._auth_service = None
+        self.endpoint_key = endpoint_key
+        self.transport = get_soap_transport()
         
     def _get_auth_service(self):
         """Get auth service instance."""
@@ -23,11 +57,10 @@ class BaseIMSService(ABC):
     def _make_request(self, endpoint: str, soap_body: str, headers: dict) -> Optional[requests.Response]:
         """Make SOAP request to IMS."""
         try:
-            response = requests.post(
+            response = self.transport.post(
                 endpoint,
                 data=soap_body,
-                headers=headers,
-                timeout=30
+                headers=headers
             )
             
             if response.status_code == 200:
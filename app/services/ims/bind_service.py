@@ -1,16 +1,21 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple, Dict, Any
 from datetime import datetime
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.deferred_invoice_service import get_deferred_invoice_service
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import QUOTE_FUNCTIONS_NAMESPACE, SoapTemplate, envelope_text
 from config import IMS_CONFIG
 import requests
 
 logger = logging.getLogger(__name__)
 
+BIND_QUOTE = SoapTemplate(QUOTE_FUNCTIONS_NAMESPACE, "BindQuote", "<quoteGuid>{quote_guid}</quoteGuid>")
+BIND_QUOTE_RESULT = soap_parser.SoapPath(".//quote:BindQuoteResult")
+
 
 class IMSBindService(BaseIMSService):
     """Service for binding quotes in IMS."""
@@ -20,23 +25,27 @@ class IMSBindService(BaseIMSService):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["quote_functions"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
         self.data_access_service = get_data_access_service()
         self._last_soap_request = None
         self._last_soap_response = None
         self._last_url = None
     
-    def bind_quote(self, quote_guid: str) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+    def bind_quote(self, quote_guid: str, defer_invoice: Optional[bool] = None,
+                   transaction_id: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
         """
         Bind a quote and get the policy number and invoice data.
         
         Args:
             quote_guid: The GUID of the quote to bind
+            defer_invoice: Fetch the invoice in the background instead of before
+                returning; defaults to INVOICE_CONFIG["deferred"]
+            transaction_id: Triton transaction being bound (recorded on a deferred invoice request)
             
         Returns:
             Tuple[bool, Optional[Dict], str]: (success, result_data, message)
-            result_data contains: policy_number and invoice_data
+            result_data contains: policy_number and invoice_data, or
+            invoice_request (pending handle) when the invoice is deferred
         """
         try:
             # Get auth token
@@ -50,25 +59,23 @@ class IMSBindService(BaseIMSService):
             
             # Make the request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
-            headers = {
-                "Content-Type": "text/xml; charset=utf-8",
-                "SOAPAction": "http://tempuri.org/IMSWebServices/QuoteFunctions/BindQuote"
-            }
+            headers = BIND_QUOTE.headers
             
             logger.info(f"Binding quote: {quote_guid}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
             try:
-                response = requests.post(
+                response = self.auth_service.post_with_token_retry(
                     url,
-                    data=soap_request,
-                    headers=headers,
-                    timeout=self.timeout
+                    soap_request,
+                    headers,
+                    token
                 )
                 
                 # Store response for error reporting
@@ -83,6 +90,18 @@ class IMSBindService(BaseIMSService):
                 if success:
                     logger.info(f"Successfully bound quote {quote_guid} - Policy Number: {policy_number}")
                     
+                    deferred_invoices = get_deferred_invoice_service()
+                    if defer_invoice is None:
+                        defer_invoice = deferred_invoices.enabled
+                    if defer_invoice:
+                        # Respond now; the invoice is fetched in the background
+                        result_data = {
+                            "policy_number": policy_number,
+                            "invoice_data": None,
+                            "invoice_request": deferred_invoices.submit(quote_guid, transaction_id)
+                        }
+                        return True, result_data, f"Quote bound successfully. Policy Number: {policy_number}. Invoice pending"
+                    
                     # Get invoice data after successful bind
                     invoice_success, invoice_data, invoice_message = self.data_access_service.get_invoice_data(quote_guid)
                     
@@ -109,7 +128,7 @@ class IMSBindService(BaseIMSService):
                 if self._last_url:
                     detailed_msg += f"\n\nRequest URL: {self._last_url}"
                 if self._last_soap_request:
-                    detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                    detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
                 if hasattr(e, 'response') and e.response is not None:
                     detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                     detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -120,22 +139,9 @@ class IMSBindService(BaseIMSService):
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _build_bind_quote_request(self, quote_guid: str, token: str) -> str:
+    def _build_bind_quote_request(self, quote_guid: str, token: str) -> bytes:
         """Build the SOAP request for BindQuote."""
-        return f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <BindQuote xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <quoteGuid>{quote_guid}</quoteGuid>
-    </BindQuote>
-  </soap:Body>
-</soap:Envelope>"""
+        return BIND_QUOTE.render(token=token, quote_guid=quote_guid)
     
     def _parse_bind_quote_response(self, response_text: str) -> Tuple[bool, Optional[str], str]:
         """
@@ -149,20 +155,18 @@ class IMSBindService(BaseIMSService):
         """
         try:
             # Parse the XML
-            root = ET.fromstring(response_text)
+            root = soap_parser.parse(response_text)
             
             # Find BindQuoteResult
-            bind_result = root.find('.//{http://tempuri.org/IMSWebServices/QuoteFunctions}BindQuoteResult')
+            bind_result = BIND_QUOTE_RESULT.find(root)
             
             if bind_result is not None and bind_result.text:
                 policy_number = bind_result.text.strip()
                 return True, policy_number, "Bind successful"
             
             # Check for fault
-            fault = root.find('.//soap:Fault', {'soap': 'http://schemas.xmlsoap.org/soap/envelope/'})
-            if fault is not None:
-                fault_string = fault.find('faultstring')
-                error_msg = fault_string.text if fault_string is not None else "Unknown SOAP fault"
+            error_msg = soap_parser.fault_message(root)
+            if error_msg is not None:
                 return False, None, f"SOAP Fault: {error_msg}"
             
             return False, None, "No BindQuoteResult found in response"
@@ -1,11 +1,11 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple, Dict, Any
 from datetime import datetime
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.dataset import DataSet, stripped
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -89,7 +89,7 @@ class IMSCancellationService(BaseIMSService):
             
             # Call the stored procedure (IMS adds _WS suffix automatically)
             # Using ProcessFlatCancellation wrapper for consistency with endorsements
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_ProcessFlatCancellation",
                 parameters=params
             )
@@ -98,11 +98,11 @@ class IMSCancellationService(BaseIMSService):
                 return False, {}, f"Failed to execute cancellation procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_cancellation_procedure_result(result_xml)
+            result_data = self._parse_cancellation_procedure_result(dataset)
             
             # Log the raw result for debugging
             if not result_data:
-                logger.error(f"Failed to parse cancellation result. Raw XML: {result_xml[:500] if result_xml else 'None'}")
+                logger.error(f"Failed to parse cancellation result. Raw XML: {dataset.xml[:500] if dataset else 'None'}")
             else:
                 logger.debug(f"Parsed cancellation result: {result_data}")
             
@@ -176,7 +176,7 @@ class IMSCancellationService(BaseIMSService):
             
             # Call the base stored procedure directly since we have the QuoteGuid
             # (IMS adds _WS suffix automatically)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="ProcessFlatCancellation",
                 parameters=params
             )
@@ -185,11 +185,11 @@ class IMSCancellationService(BaseIMSService):
                 return False, {}, f"Failed to execute cancellation procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_cancellation_procedure_result(result_xml)
+            result_data = self._parse_cancellation_procedure_result(dataset)
             
             # Log the raw result for debugging
             if not result_data:
-                logger.error(f"Failed to parse cancellation result. Raw XML: {result_xml[:500] if result_xml else 'None'}")
+                logger.error(f"Failed to parse cancellation result. Raw XML: {dataset.xml[:500] if dataset else 'None'}")
             else:
                 logger.debug(f"Parsed cancellation result: {result_data}")
             
@@ -209,103 +209,100 @@ class IMSCancellationService(BaseIMSService):
             logger.error(error_msg, exc_info=True)
             return False, {}, error_msg
     
-    def _parse_cancellation_procedure_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_cancellation_procedure_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from Triton_CancelPolicy_WS stored procedure.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
             # Check all Table elements - collect all tables with different names
             all_results = []
             
             # Check Table3 first (most complete for Triton cancellations)
-            for table in root.findall('.//Table3'):
-                all_results.append(('Table3', table))
+            for row in dataset.rows('Table3'):
+                all_results.append(('Table3', row))
             # Then Table2
-            for table in root.findall('.//Table2'):
-                all_results.append(('Table2', table))
+            for row in dataset.rows('Table2'):
+                all_results.append(('Table2', row))
             # Then Table1
-            for table in root.findall('.//Table1'):
-                all_results.append(('Table1', table))
+            for row in dataset.rows('Table1'):
+                all_results.append(('Table1', row))
             # Finally plain Table
-            for table in root.findall('.//Table'):
-                all_results.append(('Table', table))
+            for row in dataset.rows('Table'):
+                all_results.append(('Table', row))
             
             best_result = None
             best_score = 0
             
-            for table_name, table in all_results:
+            for table_name, row in all_results:
                 # Try to extract structured fields
                 result_data = {}
                 
                 # Extract Result (0 or 1)
-                result_elem = table.find('Result')
-                if result_elem is not None and result_elem.text:
-                    result_data['Result'] = result_elem.text.strip()
+                result_value = stripped(row, 'Result')
+                if result_value is not None:
+                    result_data['Result'] = result_value
                 
                 # Extract Message
-                message_elem = table.find('Message')
-                if message_elem is not None and message_elem.text:
-                    result_data['Message'] = message_elem.text.strip()
+                message_value = stripped(row, 'Message')
+                if message_value is not None:
+                    result_data['Message'] = message_value
                 
                 # Extract CancellationQuoteGuid or NewQuoteGuid (the new quote created for cancellation)
-                cancellation_guid_elem = table.find('CancellationQuoteGuid')
-                if cancellation_guid_elem is not None and cancellation_guid_elem.text:
-                    result_data['CancellationQuoteGuid'] = cancellation_guid_elem.text.strip()
+                cancellation_guid_value = stripped(row, 'CancellationQuoteGuid')
+                if cancellation_guid_value is not None:
+                    result_data['CancellationQuoteGuid'] = cancellation_guid_value
                 else:
                     # Check for NewQuoteGuid (from Triton_ProcessFlatCancellation_WS)
-                    new_guid_elem = table.find('NewQuoteGuid')
-                    if new_guid_elem is not None and new_guid_elem.text:
-                        result_data['CancellationQuoteGuid'] = new_guid_elem.text.strip()
-                        result_data['NewQuoteGuid'] = new_guid_elem.text.strip()
+                    new_guid_value = stripped(row, 'NewQuoteGuid')
+                    if new_guid_value is not None:
+                        result_data['CancellationQuoteGuid'] = new_guid_value
+                        result_data['NewQuoteGuid'] = new_guid_value
                 
                 # Extract NewQuoteOptionGuid (from Triton_ProcessFlatCancellation_WS)
-                option_guid_elem = table.find('NewQuoteOptionGuid')
-                if option_guid_elem is not None and option_guid_elem.text:
-                    result_data['NewQuoteOptionGuid'] = option_guid_elem.text.strip()
+                option_guid_value = stripped(row, 'NewQuoteOptionGuid')
+                if option_guid_value is not None:
+                    result_data['NewQuoteOptionGuid'] = option_guid_value
                 
                 # Extract QuoteOptionGuid (alternative name)
                 if 'NewQuoteOptionGuid' not in result_data:
-                    option_guid_elem = table.find('QuoteOptionGuid')
-                    if option_guid_elem is not None and option_guid_elem.text:
-                        result_data['QuoteOptionGuid'] = option_guid_elem.text.strip()
+                    option_guid_value = stripped(row, 'QuoteOptionGuid')
+                    if option_guid_value is not None:
+                        result_data['QuoteOptionGuid'] = option_guid_value
                 
                 # Extract OriginalQuoteGuid
-                original_guid_elem = table.find('OriginalQuoteGuid')
-                if original_guid_elem is not None and original_guid_elem.text:
-                    result_data['OriginalQuoteGuid'] = original_guid_elem.text.strip()
+                original_guid_value = stripped(row, 'OriginalQuoteGuid')
+                if original_guid_value is not None:
+                    result_data['OriginalQuoteGuid'] = original_guid_value
                 
                 # Extract PolicyNumber
-                policy_num_elem = table.find('PolicyNumber')
-                if policy_num_elem is not None and policy_num_elem.text:
-                    result_data['PolicyNumber'] = policy_num_elem.text.strip()
+                policy_num_value = stripped(row, 'PolicyNumber')
+                if policy_num_value is not None:
+                    result_data['PolicyNumber'] = policy_num_value
                 
                 # Extract RefundAmount if available (check both RefundAmount and ReturnPremium)
-                refund_elem = table.find('RefundAmount')
-                if refund_elem is not None and refund_elem.text:
-                    result_data['RefundAmount'] = refund_elem.text.strip()
+                refund_value = stripped(row, 'RefundAmount')
+                if refund_value is not None:
+                    result_data['RefundAmount'] = refund_value
                 else:
                     # Also check for ReturnPremium (from Triton_ProcessFlatCancellation_WS)
-                    return_elem = table.find('ReturnPremium')
-                    if return_elem is not None and return_elem.text:
-                        result_data['RefundAmount'] = return_elem.text.strip()
-                        result_data['ReturnPremium'] = return_elem.text.strip()
+                    return_value = stripped(row, 'ReturnPremium')
+                    if return_value is not None:
+                        result_data['RefundAmount'] = return_value
+                        result_data['ReturnPremium'] = return_value
                 
                 # Extract QuoteOptionGuid if available
-                option_guid_elem = table.find('QuoteOptionGuid')
-                if option_guid_elem is not None and option_guid_elem.text:
-                    result_data['QuoteOptionGuid'] = option_guid_elem.text.strip()
+                option_guid_value = stripped(row, 'QuoteOptionGuid')
+                if option_guid_value is not None:
+                    result_data['QuoteOptionGuid'] = option_guid_value
                 
                 # Score this result based on completeness
                 score = 0
@@ -338,12 +335,9 @@ class IMSCancellationService(BaseIMSService):
                 return best_result
             
             # If no recognized format, log what we found
-            logger.warning(f"Unrecognized cancellation result format. XML: {result_xml}")
+            logger.warning(f"Unrecognized cancellation result format. XML: {dataset.xml}")
             return None
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse cancellation procedure result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing cancellation procedure result: {str(e)}")
             return None
@@ -0,0 +1,239 @@
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from html import unescape
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_FORMAT = "ims-cassette"
+CASSETTE_VERSION = 1
+
+_BODY = re.compile(rb"<(?:\w+:)?Body[^>]*>(.*)</(?:\w+:)?Body>", re.DOTALL)
+_BETWEEN_TAGS = re.compile(rb">\s+<")
+_PROCEDURE = re.compile(rb"<procedureName>\s*([^<]*?)\s*</procedureName>")
+_PARAMETER = re.compile(rb"<string>([^<]*)</string>")
+_PARAMETERS = re.compile(rb"<parameters>(.*?)</parameters>", re.DOTALL)
+_TOKEN = re.compile(r"<Token>[^<]*</Token>")
+
+# Written in place of the session token LoginIMSUser returns (not the null GUID, which means "login failed")
+REDACTED_TOKEN = "ca55e77e-0000-4000-8000-000000000000"
+
+
+def request_key(soap_action: str, body: bytes) -> Tuple[str, str, str]:
+    """
+    Identify a SOAP request for recording and replay.
+
+    The key covers the SOAP action, the ExecuteDataSet procedure and the
+    request body with insignificant whitespace removed. Only the soap:Body
+    counts, so the session token in the header does not change the key.
+
+    Args:
+        soap_action: SOAPAction header value
+        body: Request envelope
+
+    Returns:
+        Tuple[str, str, str]: (action, procedure or "", key)
+    """
+    action = soap_action.strip('"').rsplit("/", 1)[-1]
+    procedure = ""
+    if action == "ExecuteDataSet":
+        match = _PROCEDURE.search(body)
+        if match:
+            procedure = match.group(1).decode("utf-8", "replace")
+
+    match = _BODY.search(body)
+    normalized = _BETWEEN_TAGS.sub(b"><", (match.group(1) if match else body).strip())
+    digest = hashlib.sha1(normalized).hexdigest()[:16]
+    return action, procedure, f"{action}:{procedure}:{digest}"
+
+
+def procedure_parameters(body: bytes) -> List[str]:
+    """The name/value strings of an ExecuteDataSet request (kept in the cassette to ease debugging)."""
+    match = _PARAMETERS.search(body)
+    if not match:
+        return []
+    return [unescape(value.decode("utf-8", "replace")) for value in _PARAMETER.findall(match.group(1))]
+
+
+def build_response(request: requests.PreparedRequest, status: int, content: bytes) -> requests.Response:
+    """A requests Response carrying a recorded SOAP response."""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "OK" if status == 200 else "Internal Server Error"
+    response.headers = CaseInsensitiveDict({"Content-Type": "text/xml; charset=utf-8"})
+    response.encoding = "utf-8"
+    response._content = content
+    response._content_consumed = True
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class CassetteWriter:
+    """
+    Appends IMS request/response pairs to a cassette file.
+
+    A cassette is gzip-compressed JSON lines: a header line, then one line
+    per call with its key, action, procedure (and parameters), HTTP status,
+    latency and the response XML. Requests are identified by their key
+    only, so credentials are not written, and the session token in the
+    LoginIMSUser response is replaced by REDACTED_TOKEN. Each line is
+    flushed as it is written, so a cassette survives the process being
+    killed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._write_line({
+            "format": CASSETTE_FORMAT,
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.now().isoformat()
+        })
+        logger.info(f"Recording IMS traffic to {path}")
+
+    def write(self, soap_action: str, body: bytes, status: int, content: bytes, elapsed_ms: float):
+        """Record one call."""
+        action, procedure, key = request_key(soap_action, body)
+        response = content.decode("utf-8", "replace")
+        if action == "LoginIMSUser":
+            response = _TOKEN.sub(f"<Token>{REDACTED_TOKEN}</Token>", response)
+        call = {
+            "key": key,
+            "action": action,
+            "procedure": procedure,
+            "status": status,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "response": response
+        }
+        if procedure:
+            call["parameters"] = procedure_parameters(body)
+        self._write_line(call)
+        self.calls += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                logger.info(f"Closed IMS cassette {self.path} ({self.calls} calls)")
+
+    def _write_line(self, record: Dict[str, Any]):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+def load_cassette(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Read a cassette.
+
+    Returns:
+        Tuple[List, List]: (headers, calls); a cassette appended to by
+        several recording sessions has one header per session
+    """
+    headers, calls = [], []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("format") == CASSETTE_FORMAT:
+                    if record.get("version") != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version {record.get('version')} in {path}")
+                    headers.append(record)
+                else:
+                    calls.append(record)
+        except EOFError:
+            # Every line is flushed, so a recorder that was killed only loses the gzip trailer
+            logger.warning(f"Cassette {path} was not closed cleanly; read {len(calls)} calls")
+    return headers, calls
+
+
+class CassetteReplayAdapter(BaseAdapter):
+    """
+    Requests adapter serving a cassette instead of IMS.
+
+    Each request gets the first unused recorded call with the same key, so
+    repeated identical requests get their responses in recorded order (and
+    the last one again once they run out). A request with no exact match
+    gets the next unused call for the same action and procedure, which
+    covers requests that embed values like the current time. Responses are
+    delayed by the recorded latency times latency_scale (0 answers at once).
+    """
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.latency_scale = latency_scale
+        _, self.calls = load_cassette(path)
+        self._by_key: Dict[str, List[int]] = {}
+        self._by_call: Dict[str, List[int]] = {}
+        for index, call in enumerate(self.calls):
+            self._by_key.setdefault(call["key"], []).append(index)
+            self._by_call.setdefault(f"{call['action']}:{call['procedure']}", []).append(index)
+        self._used = [False] * len(self.calls)
+        self._cursors: Dict[str, int] = {}
+        self.stats = {"exact": 0, "repeated": 0, "nearest": 0, "missing": 0}
+        self._lock = threading.Lock()
+        logger.info(f"Replaying {len(self.calls)} recorded IMS calls from {path} (latency x{latency_scale})")
+
+    def send(self, request, **kwargs):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else (request.body or b"")
+        action, procedure, key = request_key(request.headers.get("SOAPAction", ""), body)
+
+        with self._lock:
+            call = self._next(key, f"{action}:{procedure}")
+        if call is None:
+            name = f"{action}:{procedure}" if procedure else action
+            raise requests.exceptions.ConnectionError(f"No recorded IMS response for {name} in {self.path}")
+
+        delay = call.get("elapsed_ms", 0) * self.latency_scale / 1000
+        if delay > 0:
+            time.sleep(delay)
+        return build_response(request, call["status"], call["response"].encode("utf-8"))
+
+    def close(self):
+        pass
+
+    def _next(self, key: str, call_name: str) -> Optional[Dict[str, Any]]:
+        """Pick the recorded call answering a request. Caller must hold _lock."""
+        index = self._take(f"key:{key}", self._by_key.get(key))
+        if index is not None:
+            self.stats["exact"] += 1
+            return self.calls[index]
+        if key in self._by_key:
+            self.stats["repeated"] += 1
+            return self.calls[self._by_key[key][-1]]
+        index = self._take(f"call:{call_name}", self._by_call.get(call_name))
+        if index is not None:
+            self.stats["nearest"] += 1
+            return self.calls[index]
+        self.stats["missing"] += 1
+        return None
+
+    def _take(self, cursor: str, indexes: Optional[List[int]]) -> Optional[int]:
+        """First unused index of indexes, marked used."""
+        if not indexes:
+            return None
+        position = self._cursors.get(cursor, 0)
+        while position < len(indexes) and self._used[indexes[position]]:
+            position += 1
+        self._cursors[cursor] = position
+        if position == len(indexes):
+            return None
+        self._used[indexes[position]] = True
+        return indexes[position]
@@ -1,26 +1,57 @@
 import logging
-import json
-import re
 import requests
-import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional, Tuple, Any
-from xml.sax.saxutils import unescape
+from typing import Dict, List, Optional, Tuple, Any, Union
 
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims.base_service import ThreadLocalAttribute
+from app.services.ims.dataset import (
+    DataSet, DataSetDecodeError, TableSelection, decode_dataset_response, decode_dataset_xml, stream_dataset_response
+)
+from app.services.ims.soap_request import DATA_ACCESS_NAMESPACE, SoapTemplate, envelope_text, string_array
+from app.services.ims.soap_transport import get_soap_transport
+from app.services.ims.unit_of_work import get_current_unit_of_work, serialized_payload
+from app.utils.lookup_cache import get_lookup_cache
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
 
+EXECUTE_DATASET = SoapTemplate(DATA_ACCESS_NAMESPACE, "ExecuteDataSet", """
+      <procedureName>{procedure}</procedureName>
+      <parameters>{parameters}</parameters>
+""")
+
+# The ryan_rptInvoice tables and columns the invoice JSON is built from
+INVOICE_TABLES: TableSelection = {
+    "Table": (
+        "InvoiceNum", "OfficeInvoiceNum", "PolicyNumber", "ControlNo", "PolicyType", "LineName",
+        "Premium", "CommissionPct", "CommissionAmount", "NetPremium", "NetDue",
+        "EffectiveDate", "ExpirationDate", "InvoiceDate", "DueDate", "PolicyPeriod",
+        "NamedInsured", "InsuredNameAddress", "InsuredID", "ProducerName", "ProducerNameAddress",
+        "CompanyName", "QuotingOfficeName", "QuotingOfficePhone",
+        "AchOrWireTransfer", "CheckToLockbox", "MakeCheckPayableTo"
+    ),
+    "Table5": (
+        "InvoiceNum", "Description", "EffectiveDate", "DueDate", "Premium", "Fees",
+        "Commission", "GrossPremium", "AmountDue", "NetAmountDue"
+    )
+}
+
 
 class IMSDataAccessService:
     """Service for handling IMS DataAccess operations using stored procedures."""
     
+    # Per-call diagnostics, kept per thread since the service is shared
+    _last_soap_request = ThreadLocalAttribute()
+    _last_soap_response = ThreadLocalAttribute()
+    _last_url = ThreadLocalAttribute()
+    
     def __init__(self):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["data_access"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
+        self.transport = get_soap_transport()
+        self.producer_cache = get_lookup_cache("producer")
         self._last_soap_request = None
         self._last_soap_response = None
         self._last_url = None
@@ -36,72 +67,105 @@ class IMSDataAccessService:
         Returns:
             Tuple[bool, Optional[str], str]: (success, result_xml, message)
         """
+        success, dataset, message = self.query_dataset(procedure_name, parameters)
+        return success, dataset.xml if dataset is not None else None, message
+    
+    def query_dataset(self, procedure_name: str, parameters: List[str],
+                      tables: Optional[TableSelection] = None) -> Tuple[bool, Optional[DataSet], str]:
+        """
+        Execute a stored procedure and return its decoded result sets.
+        
+        Args:
+            procedure_name: Name of the stored procedure (without _WS suffix)
+            parameters: List of parameters as [param_name, param_value, ...]
+            tables: Only decode these tables/columns, streaming the response
+                (for large results); default decodes everything
+            
+        Returns:
+            Tuple[bool, Optional[DataSet], str]: (success, dataset, message)
+        """
+        # Inside a transaction, repeated read-only calls are served from its memo
+        uow = get_current_unit_of_work()
+        if uow is not None:
+            memo_key = tuple(str(param) for param in parameters)
+            if tables is not None:
+                # A partial decode must not answer a full one (or another selection)
+                memo_key += (f"#tables={sorted((name, tuple(columns or ())) for name, columns in tables.items())}",)
+            return uow.execute(
+                procedure_name,
+                memo_key,
+                lambda: self._execute_dataset(procedure_name, parameters, tables)
+            )
+        return self._execute_dataset(procedure_name, parameters, tables)
+    
+    def query_invoice(self, parameters: List[str]) -> Tuple[bool, Optional[DataSet], str]:
+        """Run ryan_rptInvoice, decoding only the tables and columns the invoice JSON uses."""
+        return self.query_dataset("ryan_rptInvoice", parameters, INVOICE_TABLES)
+    
+    def _execute_dataset(self, procedure_name: str, parameters: List[str],
+                         tables: Optional[TableSelection] = None) -> Tuple[bool, Optional[DataSet], str]:
+        """Run ExecuteDataSet against IMS (no memo)."""
         try:
             # Ensure we have a valid token
             token = self.auth_service.token
             if not token:
                 return False, None, "Failed to authenticate with IMS"
             
-            # Build parameters XML
-            params_xml = ""
-            for param in parameters:
-                params_xml += f"        <string>{self._escape_xml(str(param))}</string>\n"
-            
             # Construct SOAP request
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/DataAccess">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <ExecuteDataSet xmlns="http://tempuri.org/IMSWebServices/DataAccess">
-      <procedureName>{procedure_name}</procedureName>
-      <parameters>
-{params_xml.rstrip()}
-      </parameters>
-    </ExecuteDataSet>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/DataAccess/ExecuteDataSet'
-            }
+            soap_request = EXECUTE_DATASET.render(
+                token=token,
+                procedure=procedure_name,
+                parameters=string_array(parameters)
+            )
+            headers = EXECUTE_DATASET.headers
             
             # Make request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
             logger.info(f"Executing stored procedure: {procedure_name}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
-            response = requests.post(
+            # A table selection means a large result: read and decode it as it arrives
+            stream = tables is not None
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token,
+                stream=stream
             )
             
-            # Store response for error reporting
-            self._last_soap_response = response.text
+            # Store response for error reporting (a streamed body is never held as text)
+            self._last_soap_response = None if stream and response.ok else response.text
             
             # Check HTTP status
             response.raise_for_status()
             
             logger.debug(f"SOAP Response Status: {response.status_code}")
-            logger.debug(f"SOAP Response:\n{response.text}")
-            
-            # Parse response
-            return self._parse_dataset_response(response.text, procedure_name)
+            if logger.isEnabledFor(logging.DEBUG) and not stream:
+                logger.debug(f"SOAP Response:\n{response.text}")
+            
+            # Decode the result sets straight from the envelope
+            if stream:
+                chunks = self.transport.iter_body(response)
+                try:
+                    success, dataset, message = stream_dataset_response(chunks, procedure_name, tables)
+                except DataSetDecodeError as e:
+                    # The body is gone; fetch the (read-only) result again and decode it leniently
+                    logger.warning(f"{str(e)}; fetching {procedure_name} again without streaming")
+                    return self._execute_dataset(procedure_name, parameters)
+                finally:
+                    chunks.close()
+            else:
+                success, dataset, message = decode_dataset_response(self._last_soap_response, procedure_name)
+            if not success and not message.startswith("No results returned"):
+                logger.error(message)
+            return success, dataset, message
             
         except requests.exceptions.RequestException as e:
             error_msg = f"HTTP request failed: {str(e)}"
@@ -111,7 +175,7 @@ class IMSDataAccessService:
             if self._last_url:
                 detailed_msg += f"\n\nRequest URL: {self._last_url}"
             if self._last_soap_request:
-                detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
             if hasattr(e, 'response') and e.response is not None:
                 detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                 detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -123,52 +187,6 @@ class IMSDataAccessService:
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _parse_dataset_response(self, response_xml: str, procedure_name: str) -> Tuple[bool, Optional[str], str]:
-        """
-        Parse the ExecuteDataSet response XML.
-        
-        Args:
-            response_xml: The SOAP response XML string
-            procedure_name: The procedure that was executed
-            
-        Returns:
-            Tuple[bool, Optional[str], str]: (success, result_xml, message)
-        """
-        try:
-            # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/DataAccess'
-            }
-            
-            # Find ExecuteDataSetResult
-            result = root.find('.//ims:ExecuteDataSetResult', namespaces)
-            
-            if result is None:
-                return False, None, "ExecuteDataSetResult not found in response"
-            
-            # The result contains escaped XML, need to unescape it
-            result_xml = result.text
-            if result_xml:
-                # Unescape the XML content
-                result_xml = unescape(result_xml)
-                logger.debug(f"Procedure {procedure_name} returned: {result_xml}")
-                return True, result_xml, f"Successfully executed {procedure_name}"
-            else:
-                return False, None, f"No results returned from {procedure_name}"
-            
-        except ET.ParseError as e:
-            error_msg = f"Failed to parse XML response: {str(e)}"
-            logger.error(error_msg)
-            return False, None, error_msg
-        except Exception as e:
-            error_msg = f"Error processing dataset response: {str(e)}"
-            logger.error(error_msg)
-            return False, None, error_msg
-    
     def get_producer_by_email_or_name(self, producer_email: str, producer_name: str) -> Tuple[bool, Optional[Dict[str, str]], str]:
         """
         Get producer information by email first, then by name if email not found.
@@ -181,9 +199,34 @@ class IMSDataAccessService:
             Tuple[bool, Optional[Dict], str]: (success, producer_info, message)
             producer_info contains: ProducerContactGUID, ProducerLocationGUID
         """
+        # Resolve from the local producer snapshot when it knows the producer
+        from app.services.ims.reference_data_service import get_reference_data_service
+        producer_info = get_reference_data_service().find_producer(producer_email, producer_name)
+        if producer_info:
+            logger.info(f"Found producer '{producer_email or producer_name}' in reference data: {producer_info}")
+            return True, producer_info, f"Found producer: {producer_email or producer_name} (reference data)"
+        
+        # Producers change rarely; serve repeat lookups from the cache
+        cache_key = self.producer_cache.normalize_key(producer_email, producer_name)
+        hit, negative, cached = self.producer_cache.get(cache_key)
+        if hit:
+            if negative:
+                return False, None, cached
+            logger.info(f"Found producer '{producer_email or producer_name}' in cache: {cached}")
+            return True, dict(cached), f"Found producer: {producer_email or producer_name} (cached)"
+        
+        success, producer_info, message = self._lookup_producer_by_email_or_name(producer_email, producer_name)
+        if success:
+            self.producer_cache.set(cache_key, producer_info)
+        elif self._is_producer_not_found(message):
+            self.producer_cache.set_negative(cache_key, message)
+        return success, producer_info, message
+    
+    def _lookup_producer_by_email_or_name(self, producer_email: str, producer_name: str) -> Tuple[bool, Optional[Dict[str, str]], str]:
+        """Run getProducerGuid for an email/name pair (uncached)."""
         try:
             # Execute the stored procedure with both parameters
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "getProducerGuid",
                 ["producer_email", producer_email or "", "producer_name", producer_name or ""]
             )
@@ -191,24 +234,16 @@ class IMSDataAccessService:
             if not success:
                 return False, None, message
             
-            # Parse the result XML
-            if result_xml:
-                result_root = ET.fromstring(result_xml)
-                
-                # Find the Table element
-                table = result_root.find('.//Table')
-                if table is not None:
+            # Read the first row of the result
+            if dataset:
+                row = dataset.first()
+                if row is not None:
                     producer_info = {}
                     
-                    # Extract ProducerContactGUID
-                    contact_guid = table.find('ProducerContactGUID')
-                    if contact_guid is not None and contact_guid.text:
-                        producer_info['ProducerContactGUID'] = contact_guid.text
-                    
-                    # Extract ProducerLocationGUID
-                    location_guid = table.find('ProducerLocationGUID')
-                    if location_guid is not None and location_guid.text:
-                        producer_info['ProducerLocationGUID'] = location_guid.text
+                    # Extract ProducerContactGUID and ProducerLocationGUID
+                    for column in ('ProducerContactGUID', 'ProducerLocationGUID'):
+                        if row.get(column):
+                            producer_info[column] = row[column]
                     
                     if producer_info:
                         lookup_method = "email" if producer_email else "name"
@@ -222,15 +257,32 @@ class IMSDataAccessService:
             else:
                 return False, None, "No results returned"
                 
-        except ET.ParseError as e:
-            error_msg = f"Failed to parse producer results: {str(e)}"
-            logger.error(error_msg)
-            return False, None, error_msg
         except Exception as e:
             error_msg = f"Error getting producer: {str(e)}"
             logger.error(error_msg)
             return False, None, error_msg
     
+    def _is_producer_not_found(self, message: str) -> bool:
+        """Whether a producer lookup failure means "no such producer" rather than an IMS/transport error."""
+        return bool(message) and message.startswith(
+            ("Producer not found", "No producer found", "No results returned")
+        )
+    
+    def invalidate_producer_cache(self, producer_email: Optional[str] = None, producer_name: Optional[str] = None) -> int:
+        """
+        Drop cached producer lookups.
+        
+        Args:
+            producer_email: Email of the entry to drop (with producer_name)
+            producer_name: Name of the entry to drop (with producer_email)
+            
+        Returns:
+            Number of entries removed; drops everything when neither is given
+        """
+        if producer_email is None and producer_name is None:
+            return self.producer_cache.invalidate()
+        return self.producer_cache.invalidate(self.producer_cache.normalize_key(producer_email, producer_name))
+    
     def get_producer_by_email(self, producer_email: str) -> Tuple[bool, Optional[Dict[str, str]], str]:
         """
         Get producer information by email.
@@ -244,7 +296,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "getProducerGuid",
                 ["producer_email", producer_email]
             )
@@ -252,24 +304,16 @@ class IMSDataAccessService:
             if not success:
                 return False, None, message
             
-            # Parse the result XML
-            if result_xml:
-                result_root = ET.fromstring(result_xml)
-                
-                # Find the Table element
-                table = result_root.find('.//Table')
-                if table is not None:
+            # Read the first row of the result
+            if dataset:
+                row = dataset.first()
+                if row is not None:
                     producer_info = {}
                     
-                    # Extract ProducerContactGUID
-                    contact_guid = table.find('ProducerContactGUID')
-                    if contact_guid is not None and contact_guid.text:
-                        producer_info['ProducerContactGUID'] = contact_guid.text
-                    
-                    # Extract ProducerLocationGUID
-                    location_guid = table.find('ProducerLocationGUID')
-                    if location_guid is not None and location_guid.text:
-                        producer_info['ProducerLocationGUID'] = location_guid.text
+                    # Extract ProducerContactGUID and ProducerLocationGUID
+                    for column in ('ProducerContactGUID', 'ProducerLocationGUID'):
+                        if row.get(column):
+                            producer_info[column] = row[column]
                     
                     if producer_info:
                         logger.info(f"Found producer with email '{producer_email}': {producer_info}")
@@ -281,10 +325,6 @@ class IMSDataAccessService:
             else:
                 return False, None, "No results returned"
                 
-        except ET.ParseError as e:
-            error_msg = f"Failed to parse producer results: {str(e)}"
-            logger.error(error_msg)
-            return False, None, error_msg
         except Exception as e:
             error_msg = f"Error getting producer: {str(e)}"
             logger.error(error_msg)
@@ -316,7 +356,7 @@ class IMSDataAccessService:
             if self._last_url:
                 detailed_message += f"\n\nRequest URL: {self._last_url}"
             if self._last_soap_request:
-                detailed_message += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                detailed_message += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
             if self._last_soap_response:
                 detailed_message += f"\n\nSOAP Response Received:\n{self._last_soap_response}"
             return success, info, detailed_message
@@ -335,7 +375,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetQuoteByPolicyNumber",
                 ["PolicyNumber", policy_number]
             )
@@ -344,7 +384,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return False, None, f"No quote found for policy number: {policy_number}"
@@ -389,7 +429,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetQuoteByOptionID",
                 ["OptionID", str(option_id)]
             )
@@ -398,7 +438,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict or not result_dict.get("QuoteGuid"):
                 return False, None, f"No quote found for option_id: {option_id}"
@@ -416,47 +456,28 @@ class IMSDataAccessService:
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _parse_single_row_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_single_row_result(self, result: Union[DataSet, str, None]) -> Optional[Dict[str, Any]]:
         """
-        Parse XML result expecting a single row of data.
+        Read a result expecting a single row of data.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            result: The DataSet from query_dataset (or DataSet XML)
             
         Returns:
             Dict containing the row data or None if no row found
         """
         try:
-            if not result_xml:
+            if not result:
                 return None
             
-            # Fix common XML issues - escape unescaped ampersands
-            # This handles cases where data from SQL contains & characters
-            # that aren't properly escaped as &amp;
-            # Replace & that aren't part of existing entities
-            result_xml = re.sub(r'&(?!(?:amp|lt|gt|apos|quot);)', '&amp;', result_xml)
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
+            if isinstance(result, str):
+                result = decode_dataset_xml(result)
             
-            # Find the first Table element (single row result)
-            table = root.find('.//Table')
-            if table is None:
-                return None
+            # The first Table row; a row with no columns counts as no row
+            return result.first() or None
             
-            # Convert all child elements to a dictionary
-            result = {}
-            for child in table:
-                if child.text is not None:
-                    result[child.tag] = child.text
-                else:
-                    result[child.tag] = None
-                    
-            return result if result else None
-            
-        except ET.ParseError as e:
+        except DataSetDecodeError as e:
             logger.error(f"XML Parse Error in single row result: {str(e)}")
-            logger.debug(f"Problematic XML (first 500 chars): {result_xml[:500] if result_xml else 'None'}")
             return None
         except Exception as e:
             logger.error(f"Error parsing single row result: {str(e)}")
@@ -466,6 +487,11 @@ class IMSDataAccessService:
         """
         Store transaction data using spStoreTritonTransaction_WS.
         
+        The payload is sent as compact JSON. With payload_by_reference on,
+        its hash goes along and, once IMS confirms it holds that payload,
+        the unit of work remembers it so spProcessTritonPayload_WS can read
+        the stored copy.
+        
         Args:
             payload: The Triton transaction payload
             
@@ -473,29 +499,39 @@ class IMSDataAccessService:
             Tuple[bool, Optional[Dict], str]: (success, result_data, message)
         """
         try:
+            transaction_id = payload.get("transaction_id", "")
+            payload_json, payload_hash = serialized_payload(payload)
+            parameters = [
+                "transaction_id", transaction_id,
+                "full_payload_json", payload_json,
+                "opportunity_id", str(payload.get("opportunity_id", "")),
+                "policy_number", payload.get("policy_number", ""),
+                "insured_name", payload.get("insured_name", ""),
+                "transaction_type", payload.get("transaction_type", ""),
+                "transaction_date", payload.get("transaction_date", ""),
+                "source_system", payload.get("source_system", "triton")
+            ]
+            by_reference = IMS_CONFIG.get("payload_by_reference", False)
+            if by_reference:
+                parameters.extend(["payload_hash", payload_hash])
+            
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
-                "spStoreTritonTransaction",
-                [
-                    "transaction_id", payload.get("transaction_id", ""),
-                    "full_payload_json", json.dumps(payload),
-                    "opportunity_id", str(payload.get("opportunity_id", "")),
-                    "policy_number", payload.get("policy_number", ""),
-                    "insured_name", payload.get("insured_name", ""),
-                    "transaction_type", payload.get("transaction_type", ""),
-                    "transaction_date", payload.get("transaction_date", ""),
-                    "source_system", payload.get("source_system", "triton")
-                ]
-            )
+            success, dataset, message = self.query_dataset("spStoreTritonTransaction", parameters)
             
             if not success:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if result_dict:
                 logger.info(f"Transaction stored: {result_dict.get('Status')} - {result_dict.get('Message')}")
+                # An existing row only counts when it holds this exact payload
+                uow = get_current_unit_of_work()
+                if (by_reference and uow is not None and transaction_id
+                        and result_dict.get("Status") in ("Success", "Warning")
+                        and result_dict.get("payload_hash") == payload_hash):
+                    uow.note_stored_payload(transaction_id, payload_hash)
                 return True, result_dict, result_dict.get("Message", "Transaction stored")
             else:
                 return False, None, "No result returned from stored procedure"
@@ -517,7 +553,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetQuoteByOpportunityID",
                 ["OpportunityID", str(opportunity_id)]
             )
@@ -526,7 +562,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return True, None, f"No quote found for opportunity_id: {opportunity_id}"
@@ -551,7 +587,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spCheckQuoteBoundStatus",
                 ["QuoteGuid", quote_guid]
             )
@@ -560,7 +596,7 @@ class IMSDataAccessService:
                 return False, False, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return False, False, "No result returned from bound status check"
@@ -588,7 +624,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetQuoteByExpiringPolicyNumber",
                 ["ExpiringPolicyNumber", policy_number]
             )
@@ -597,7 +633,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return True, None, f"No quote found for policy number: {policy_number}"
@@ -610,17 +646,6 @@ class IMSDataAccessService:
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _escape_xml(self, value: str) -> str:
-        """Escape special XML characters."""
-        if not value:
-            return ""
-        return (value
-                .replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&apos;"))
-    
     def get_invoice_data(self, quote_guid: str) -> Tuple[bool, Optional[Dict[str, Any]], str]:
         """
         Get invoice data using ryan_rptInvoice_WS stored procedure.
@@ -633,16 +658,13 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
-                "ryan_rptInvoice",
-                ["QuoteGuid", quote_guid]
-            )
+            success, dataset, message = self.query_invoice(["QuoteGuid", quote_guid])
             
             if not success:
                 return False, None, message
             
             # Parse the invoice XML to JSON
-            invoice_data = self._parse_invoice_xml_to_json(result_xml)
+            invoice_data = self._parse_invoice_dataset(dataset)
             
             if invoice_data:
                 logger.info(f"Successfully retrieved invoice data for quote {quote_guid}")
@@ -655,28 +677,19 @@ class IMSDataAccessService:
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _parse_invoice_xml_to_json(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_invoice_dataset(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
-        Parse invoice XML response into structured JSON.
+        Turn the ryan_rptInvoice result sets into structured JSON.
         
         Args:
-            result_xml: The XML result from ryan_rptInvoice
+            dataset: The DataSet from ryan_rptInvoice
             
         Returns:
-            Dict containing structured invoice data or None if parsing fails
+            Dict containing structured invoice data or None if there is no result
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Log the raw XML for debugging (first 1000 chars)
-            logger.debug(f"Raw invoice XML (first 1000 chars): {result_xml[:1000]}")
-            
-            # Try to clean up common XML issues
-            cleaned_xml = self._clean_xml_for_parsing(result_xml)
-            
-            # Parse the XML
-            root = ET.fromstring(cleaned_xml)
             
             # Initialize result structure
             invoice_data = {
@@ -691,108 +704,74 @@ class IMSDataAccessService:
             }
             
             # Parse main invoice table (Table)
-            main_table = root.find('.//Table')
+            main_table = dataset.first()
             if main_table is not None:
                 # Extract invoice info
-                invoice_data["invoice_info"]["invoice_num"] = self._get_xml_text(main_table, "InvoiceNum")
-                invoice_data["invoice_info"]["office_invoice_num"] = self._get_xml_text(main_table, "OfficeInvoiceNum")
-                invoice_data["invoice_info"]["policy_number"] = self._get_xml_text(main_table, "PolicyNumber")
-                invoice_data["invoice_info"]["control_no"] = self._get_xml_text(main_table, "ControlNo")
-                invoice_data["invoice_info"]["policy_type"] = self._get_xml_text(main_table, "PolicyType")
-                invoice_data["invoice_info"]["line_name"] = self._get_xml_text(main_table, "LineName")
+                invoice_data["invoice_info"]["invoice_num"] = self._row_text(main_table, "InvoiceNum")
+                invoice_data["invoice_info"]["office_invoice_num"] = self._row_text(main_table, "OfficeInvoiceNum")
+                invoice_data["invoice_info"]["policy_number"] = self._row_text(main_table, "PolicyNumber")
+                invoice_data["invoice_info"]["control_no"] = self._row_text(main_table, "ControlNo")
+                invoice_data["invoice_info"]["policy_type"] = self._row_text(main_table, "PolicyType")
+                invoice_data["invoice_info"]["line_name"] = self._row_text(main_table, "LineName")
                 
                 # Extract financial info
-                invoice_data["financial"]["premium"] = self._parse_float(self._get_xml_text(main_table, "Premium"))
-                invoice_data["financial"]["commission_pct"] = self._parse_float(self._get_xml_text(main_table, "CommissionPct"))
-                invoice_data["financial"]["commission_amount"] = self._parse_float(self._get_xml_text(main_table, "CommissionAmount"))
-                invoice_data["financial"]["net_premium"] = self._parse_float(self._get_xml_text(main_table, "NetPremium"))
-                invoice_data["financial"]["net_due"] = self._parse_float(self._get_xml_text(main_table, "NetDue"))
+                invoice_data["financial"]["premium"] = self._parse_float(self._row_text(main_table, "Premium"))
+                invoice_data["financial"]["commission_pct"] = self._parse_float(self._row_text(main_table, "CommissionPct"))
+                invoice_data["financial"]["commission_amount"] = self._parse_float(self._row_text(main_table, "CommissionAmount"))
+                invoice_data["financial"]["net_premium"] = self._parse_float(self._row_text(main_table, "NetPremium"))
+                invoice_data["financial"]["net_due"] = self._parse_float(self._row_text(main_table, "NetDue"))
                 
                 # Extract dates
-                invoice_data["dates"]["effective_date"] = self._get_xml_text(main_table, "EffectiveDate")
-                invoice_data["dates"]["expiration_date"] = self._get_xml_text(main_table, "ExpirationDate")
-                invoice_data["dates"]["invoice_date"] = self._get_xml_text(main_table, "InvoiceDate")
-                invoice_data["dates"]["due_date"] = self._get_xml_text(main_table, "DueDate")
-                invoice_data["dates"]["policy_period"] = self._get_xml_text(main_table, "PolicyPeriod")
+                invoice_data["dates"]["effective_date"] = self._row_text(main_table, "EffectiveDate")
+                invoice_data["dates"]["expiration_date"] = self._row_text(main_table, "ExpirationDate")
+                invoice_data["dates"]["invoice_date"] = self._row_text(main_table, "InvoiceDate")
+                invoice_data["dates"]["due_date"] = self._row_text(main_table, "DueDate")
+                invoice_data["dates"]["policy_period"] = self._row_text(main_table, "PolicyPeriod")
                 
                 # Extract insured info
-                invoice_data["insured"]["name"] = self._get_xml_text(main_table, "NamedInsured")
-                invoice_data["insured"]["address"] = self._get_xml_text(main_table, "InsuredNameAddress")
-                invoice_data["insured"]["id"] = self._get_xml_text(main_table, "InsuredID")
+                invoice_data["insured"]["name"] = self._row_text(main_table, "NamedInsured")
+                invoice_data["insured"]["address"] = self._row_text(main_table, "InsuredNameAddress")
+                invoice_data["insured"]["id"] = self._row_text(main_table, "InsuredID")
                 
                 # Extract producer info
-                invoice_data["producer"]["name"] = self._get_xml_text(main_table, "ProducerName")
-                invoice_data["producer"]["address"] = self._get_xml_text(main_table, "ProducerNameAddress")
+                invoice_data["producer"]["name"] = self._row_text(main_table, "ProducerName")
+                invoice_data["producer"]["address"] = self._row_text(main_table, "ProducerNameAddress")
                 
                 # Extract company info
-                invoice_data["company"]["name"] = self._get_xml_text(main_table, "CompanyName")
-                invoice_data["company"]["office_name"] = self._get_xml_text(main_table, "QuotingOfficeName")
-                invoice_data["company"]["office_phone"] = self._get_xml_text(main_table, "QuotingOfficePhone")
+                invoice_data["company"]["name"] = self._row_text(main_table, "CompanyName")
+                invoice_data["company"]["office_name"] = self._row_text(main_table, "QuotingOfficeName")
+                invoice_data["company"]["office_phone"] = self._row_text(main_table, "QuotingOfficePhone")
                 
                 # Extract payment instructions
-                invoice_data["payment_instructions"]["ach_wire"] = self._get_xml_text(main_table, "AchOrWireTransfer")
-                invoice_data["payment_instructions"]["check_to_lockbox"] = self._get_xml_text(main_table, "CheckToLockbox")
-                invoice_data["payment_instructions"]["make_check_payable_to"] = self._get_xml_text(main_table, "MakeCheckPayableTo")
+                invoice_data["payment_instructions"]["ach_wire"] = self._row_text(main_table, "AchOrWireTransfer")
+                invoice_data["payment_instructions"]["check_to_lockbox"] = self._row_text(main_table, "CheckToLockbox")
+                invoice_data["payment_instructions"]["make_check_payable_to"] = self._row_text(main_table, "MakeCheckPayableTo")
             
             # Parse line items (Table5)
-            for line_item in root.findall('.//Table5'):
+            for line_item in dataset.rows('Table5'):
                 item = {
-                    "invoice_num": self._get_xml_text(line_item, "InvoiceNum"),
-                    "description": self._get_xml_text(line_item, "Description"),
-                    "effective_date": self._get_xml_text(line_item, "EffectiveDate"),
-                    "due_date": self._get_xml_text(line_item, "DueDate"),
-                    "premium": self._parse_float(self._get_xml_text(line_item, "Premium")),
-                    "fees": self._parse_float(self._get_xml_text(line_item, "Fees")),
-                    "commission": self._parse_float(self._get_xml_text(line_item, "Commission")),
-                    "gross_premium": self._parse_float(self._get_xml_text(line_item, "GrossPremium")),
-                    "amount_due": self._parse_float(self._get_xml_text(line_item, "AmountDue")),
-                    "net_amount_due": self._parse_float(self._get_xml_text(line_item, "NetAmountDue"))
+                    "invoice_num": self._row_text(line_item, "InvoiceNum"),
+                    "description": self._row_text(line_item, "Description"),
+                    "effective_date": self._row_text(line_item, "EffectiveDate"),
+                    "due_date": self._row_text(line_item, "DueDate"),
+                    "premium": self._parse_float(self._row_text(line_item, "Premium")),
+                    "fees": self._parse_float(self._row_text(line_item, "Fees")),
+                    "commission": self._parse_float(self._row_text(line_item, "Commission")),
+                    "gross_premium": self._parse_float(self._row_text(line_item, "GrossPremium")),
+                    "amount_due": self._parse_float(self._row_text(line_item, "AmountDue")),
+                    "net_amount_due": self._parse_float(self._row_text(line_item, "NetAmountDue"))
                 }
                 invoice_data["line_items"].append(item)
             
             return invoice_data
             
         except Exception as e:
-            logger.error(f"Error parsing invoice XML: {str(e)}")
-            
-            # Save problematic XML for debugging
-            try:
-                import os
-                from datetime import datetime
-                
-                # Create debug directory if it doesn't exist
-                debug_dir = "debug_xml"
-                if not os.path.exists(debug_dir):
-                    os.makedirs(debug_dir)
-                
-                # Save the raw XML
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = os.path.join(debug_dir, f"invoice_xml_error_{timestamp}.xml")
-                
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(result_xml)
-                
-                logger.error(f"Problematic XML saved to: {filename}")
-                
-                # Also log the specific location of the error if available
-                if hasattr(e, 'position'):
-                    line, column = e.position
-                    logger.error(f"XML error at line {line}, column {column}")
-                    
-                    # Try to show the problematic section
-                    lines = result_xml.split('\n')
-                    if line <= len(lines):
-                        logger.error(f"Problematic line: {lines[line-1]}")
-                        
-            except Exception as save_error:
-                logger.warning(f"Could not save debug XML: {save_error}")
-            
+            logger.error(f"Error parsing invoice data: {str(e)}")
             return None
     
-    def _get_xml_text(self, element: ET.Element, tag: str) -> Optional[str]:
-        """Safely get text from XML element."""
-        child = element.find(tag)
-        return child.text if child is not None and child.text else None
+    def _row_text(self, row: Dict[str, Optional[str]], column: str) -> Optional[str]:
+        """Text of a column, or None if it is absent or empty."""
+        return row.get(column) or None
     
     def _parse_float(self, value: Optional[str]) -> Optional[float]:
         """Safely parse float from string."""
@@ -818,7 +797,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetLatestQuoteByOpportunityID",
                 ["OpportunityID", str(opportunity_id)]
             )
@@ -827,7 +806,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict or not result_dict.get("QuoteGuid"):
                 return False, None, f"No quote found for opportunity_id: {opportunity_id}"
@@ -852,7 +831,7 @@ class IMSDataAccessService:
         """
         try:
             # Execute the stored procedure
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "spGetPolicyPremiumTotal",
                 ["ControlNo", str(control_no)]
             )
@@ -861,7 +840,7 @@ class IMSDataAccessService:
                 return False, 0.0, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return True, 0.0, "No invoices found for policy"
@@ -895,7 +874,7 @@ class IMSDataAccessService:
                 WHERE QuoteGuid = @QuoteGuid
             """
             
-            success, result_xml, message = self.execute_dataset(
+            success, dataset, message = self.query_dataset(
                 "ExecuteDataSet",
                 ["Query", query, "QuoteGuid", quote_guid]
             )
@@ -904,7 +883,7 @@ class IMSDataAccessService:
                 return False, None, message
             
             # Parse the result
-            result_dict = self._parse_single_row_result(result_xml)
+            result_dict = self._parse_single_row_result(dataset)
             
             if not result_dict:
                 return False, None, f"No quote found with QuoteGuid: {quote_guid}"
@@ -956,45 +935,6 @@ class IMSDataAccessService:
             error_msg = f"Error changing producer: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
-    
-    def _clean_xml_for_parsing(self, xml_string: str) -> str:
-        """
-        Clean XML string to handle common issues that cause parsing errors.
-        
-        Args:
-            xml_string: Raw XML string
-            
-        Returns:
-            Cleaned XML string
-        """
-        try:
-            # Remove any BOM (Byte Order Mark)
-            if xml_string.startswith('\ufeff'):
-                xml_string = xml_string[1:]
-            
-            # Replace common problematic characters
-            # Replace control characters except tab, newline, carriage return
-            import re
-            xml_string = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', xml_string)
-            
-            # Handle unescaped ampersands that aren't part of entities
-            xml_string = re.sub(r'&(?!(?:amp|lt|gt|apos|quot);)', '&amp;', xml_string)
-            
-            # Remove any content before the first '<'
-            first_tag = xml_string.find('<')
-            if first_tag > 0:
-                xml_string = xml_string[first_tag:]
-            
-            # Log if we made any changes
-            if xml_string != xml_string:
-                logger.debug("XML was cleaned for parsing")
-            
-            return xml_string
-            
-        except Exception as e:
-            logger.warning(f"Error cleaning XML: {str(e)}")
-            # Return original if cleaning fails
-            return xml_string
 
 
 # Singleton instance
@@ -0,0 +1,393 @@
+import logging
+import re
+import threading
+from typing import Collection, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple, Union
+from xml.parsers import expat
+
+from app.services.ims import soap_parser
+
+logger = logging.getLogger(__name__)
+
+Row = Dict[str, Optional[str]]
+
+# Tables to decode, each with the columns to keep (None keeps every column)
+TableSelection = Mapping[str, Optional[Collection[str]]]
+
+_RESULT_START = re.compile(r"<(?:[\w.-]+:)?ExecuteDataSetResult(?:\s[^>]*)?(/?)>")
+_RESULT_END = re.compile(r"</(?:[\w.-]+:)?ExecuteDataSetResult\s*>")
+_CHARACTER_REFERENCE = re.compile(r"&(#[0-9]+|#[xX][0-9a-fA-F]+|lt|gt|amp|quot|apos);")
+_NAMED_ENTITIES = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+_CONTROL_CHARACTERS = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+_BARE_AMPERSAND = re.compile(r"&(?!(?:amp|lt|gt|apos|quot|#[0-9]+|#[xX][0-9a-fA-F]+);)")
+
+# Column order seen per (procedure, table), kept for the life of the process
+_schemas: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+_schemas_lock = threading.Lock()
+
+_RESULT_PATH = soap_parser.SoapPath(".//data:ExecuteDataSetResult")
+
+
+class DataSetDecodeError(ValueError):
+    """The ExecuteDataSet result could not be decoded."""
+
+
+class DataSet:
+    """
+    The result sets of one ExecuteDataSet call.
+
+    Tables are keyed by their DataSet name (Table, Table1, ...) and hold one
+    dict per row mapping column name to text. A column IMS left out of a row
+    (a NULL) is absent from that row's dict; an empty column maps to None.
+    Rows can be shared through the unit of work memo, so treat them as read
+    only; first() returns a copy.
+    """
+
+    __slots__ = ("procedure", "xml", "_tables", "_columns")
+
+    def __init__(self, procedure: str, tables: Dict[str, List[Row]],
+                 columns: Dict[str, Tuple[str, ...]], xml: str = ""):
+        self.procedure = procedure
+        self.xml = xml
+        self._tables = tables
+        self._columns = columns
+
+    @property
+    def table_names(self) -> List[str]:
+        """Table names in the order IMS returned them."""
+        return list(self._tables)
+
+    def has_table(self, table: str) -> bool:
+        return table in self._tables
+
+    def rows(self, table: str = "Table") -> List[Row]:
+        """Rows of a table (empty if IMS did not return it)."""
+        return self._tables.get(table, [])
+
+    def first(self, table: str = "Table") -> Optional[Row]:
+        """A copy of the first row of a table, or None."""
+        rows = self._tables.get(table)
+        return dict(rows[0]) if rows else None
+
+    def columns(self, table: str = "Table") -> Tuple[str, ...]:
+        """Every column seen in a table for this procedure, in first-seen order."""
+        return self._columns.get(table, ())
+
+    def tuples(self, table: str = "Table") -> List[Tuple[Optional[str], ...]]:
+        """Rows of a table as tuples in columns() order (None where a column is absent)."""
+        columns = self.columns(table)
+        return [tuple(row.get(column) for column in columns) for row in self.rows(table)]
+
+    def __repr__(self) -> str:
+        sizes = ", ".join(f"{name}={len(rows)}" for name, rows in self._tables.items())
+        return f"DataSet({self.procedure}: {sizes})"
+
+
+def stripped(row: Optional[Row], column: str) -> Optional[str]:
+    """A column's text with surrounding whitespace removed, or None if absent or empty."""
+    value = row.get(column) if row else None
+    return value.strip() if value else None
+
+
+class _RowBuilder:
+    """
+    expat handlers turning NewDataSet/TableN/Column elements into row dicts.
+
+    With a selection, tables and columns outside it are skipped as they
+    are read rather than built and thrown away.
+    """
+
+    def __init__(self, tables: Optional[TableSelection] = None):
+        self.tables: Dict[str, List[Row]] = {}
+        self._selection: Optional[Dict[str, Optional[FrozenSet[str]]]] = None
+        if tables is not None:
+            self._selection = {
+                name: frozenset(columns) if columns is not None else None
+                for name, columns in tables.items()
+            }
+        self._depth = 0
+        self._row: Optional[Row] = None
+        self._wanted: Optional[FrozenSet[str]] = None
+        self._column: Optional[str] = None
+        self._text: List[str] = []
+
+    def start(self, name: str, attributes):
+        self._depth += 1
+        if self._depth == 2:
+            # Skip an inline xs:schema; every other child of the root is a row
+            if ":" in name or (self._selection is not None and name not in self._selection):
+                return
+            self._wanted = self._selection[name] if self._selection is not None else None
+            self._row = {}
+            rows = self.tables.get(name)
+            if rows is None:
+                rows = self.tables[name] = []
+            rows.append(self._row)
+        elif self._depth == 3 and self._row is not None:
+            if self._wanted is None or name in self._wanted:
+                self._column = name
+                self._text = []
+
+    def end(self, name: str):
+        if self._depth == 3 and self._column is not None:
+            self._row[self._column] = "".join(self._text) or None
+            self._column = None
+        elif self._depth == 2:
+            self._row = None
+        self._depth -= 1
+
+    def characters(self, data: str):
+        if self._column is not None and self._depth == 3:
+            self._text.append(data)
+
+    def parser(self) -> "expat.XMLParserType":
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        return parser
+
+
+def _parse_rows(xml: str, tables: Optional[TableSelection] = None) -> Dict[str, List[Row]]:
+    builder = _RowBuilder(tables)
+    builder.parser().Parse(xml, True)
+    return builder.tables
+
+
+def clean_xml(xml: str) -> str:
+    """
+    Repair the problems SQL data has been seen to put into DataSet XML:
+    a byte order mark, control characters and unescaped ampersands.
+    """
+    if xml.startswith("\ufeff"):
+        xml = xml[1:]
+    xml = _CONTROL_CHARACTERS.sub("", xml)
+    xml = _BARE_AMPERSAND.sub("&amp;", xml)
+    first_tag = xml.find("<")
+    return xml[first_tag:] if first_tag > 0 else xml
+
+
+def _learn_columns(procedure: str, tables: Dict[str, List[Row]]) -> Dict[str, Tuple[str, ...]]:
+    """Column schema of each table, extending the cached schema only when a new column appears."""
+    columns = {}
+    for table, rows in tables.items():
+        key = (procedure, table)
+        schema = _schemas.get(key, ())
+        known = set(schema)
+        added = []
+        for row in rows:
+            if len(row) <= len(known) and known.issuperset(row):
+                continue
+            for column in row:
+                if column not in known:
+                    known.add(column)
+                    added.append(column)
+        if added or key not in _schemas:
+            schema = schema + tuple(added)
+            with _schemas_lock:
+                _schemas[key] = schema
+        columns[table] = schema
+    return columns
+
+
+def decode_dataset_xml(xml: str, procedure: str = "", tables: Optional[TableSelection] = None) -> DataSet:
+    """
+    Decode an unescaped NewDataSet document.
+
+    Args:
+        xml: The DataSet XML
+        procedure: Procedure that produced it (keys the column schema cache)
+        tables: Only decode these tables/columns (default: everything)
+
+    Returns:
+        DataSet
+
+    Raises:
+        DataSetDecodeError: The XML is malformed even after clean_xml()
+    """
+    try:
+        rows = _parse_rows(xml, tables)
+    except expat.ExpatError as first_error:
+        try:
+            rows = _parse_rows(clean_xml(xml), tables)
+        except expat.ExpatError:
+            raise DataSetDecodeError(f"Failed to parse {procedure or 'DataSet'} result: {first_error}") from None
+        logger.debug(f"DataSet XML from {procedure} was cleaned for parsing")
+    return DataSet(procedure, rows, _learn_columns(procedure, rows), xml)
+
+
+def _unescape(text: str) -> str:
+    """Undo the one level of XML escaping IMS applies to the DataSet inside the envelope."""
+    if "&#" in text:
+        return _CHARACTER_REFERENCE.sub(_replace_reference, text)
+    return (text
+            .replace("&lt;", "<")
+            .replace("&gt;", ">")
+            .replace("&quot;", '"')
+            .replace("&apos;", "'")
+            .replace("&amp;", "&"))
+
+
+def _replace_reference(match: "re.Match[str]") -> str:
+    name = match.group(1)
+    if name[0] == "#":
+        return chr(int(name[2:], 16) if name[1] in "xX" else int(name[1:]))
+    return _NAMED_ENTITIES[name]
+
+
+def _result_text(response_xml: str) -> Optional[str]:
+    """
+    The escaped ExecuteDataSetResult text, located without parsing the envelope.
+
+    The DataSet is escaped, so the text runs to the next "<". Falls back to
+    the SOAP parser for envelopes the scan does not understand (CDATA, say).
+    Returns "" for an empty result and None when there is no result element.
+    """
+    start = _RESULT_START.search(response_xml)
+    if start is not None:
+        if start.group(1):
+            return ""
+        end = response_xml.find("<", start.end())
+        if end != -1 and _RESULT_END.match(response_xml, end):
+            return response_xml[start.end():end]
+
+    root = soap_parser.parse(response_xml)
+    result = _RESULT_PATH.find(root)
+    if result is None:
+        return None
+    # The parser has already undone the escaping; escape it back for a single code path
+    text = result.text or ""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def decode_dataset_response(response_xml: str, procedure: str,
+                            tables: Optional[TableSelection] = None) -> Tuple[bool, Optional[DataSet], str]:
+    """
+    Decode an ExecuteDataSet SOAP response in one pass.
+
+    The escaped DataSet is cut out of the envelope, unescaped once and
+    parsed straight into rows, instead of building a tree for the envelope,
+    unescaping and building another for the DataSet.
+
+    Args:
+        response_xml: The SOAP response
+        procedure: The procedure that was executed
+        tables: Only decode these tables/columns (default: everything)
+
+    Returns:
+        Tuple[bool, Optional[DataSet], str]: (success, dataset, message)
+    """
+    try:
+        text = _result_text(response_xml)
+    except soap_parser.SoapParseError as e:
+        return False, None, f"Failed to parse XML response: {str(e)}"
+    if text is None:
+        return False, None, "ExecuteDataSetResult not found in response"
+    if not text.strip():
+        return False, None, f"No results returned from {procedure}"
+
+    xml = _unescape(text)
+    logger.debug(f"Procedure {procedure} returned: {xml}")
+    try:
+        dataset = decode_dataset_xml(xml, procedure, tables)
+    except DataSetDecodeError as e:
+        return False, None, str(e)
+    return True, dataset, f"Successfully executed {procedure}"
+
+
+class _ResultStream:
+    """
+    expat handlers for the SOAP envelope that pass the ExecuteDataSetResult
+    text, as the envelope parser unescapes it, on to the DataSet parser.
+    """
+
+    def __init__(self, builder: _RowBuilder):
+        self.found = False
+        self.fed = False
+        self._inside = False
+        self._inner = builder.parser()
+
+    def start(self, name: str, attributes):
+        if name.rpartition(":")[2] == "ExecuteDataSetResult":
+            self.found = self._inside = True
+
+    def end(self, name: str):
+        if self._inside and name.rpartition(":")[2] == "ExecuteDataSetResult":
+            self._inside = False
+            if self.fed:
+                self._inner.Parse("", True)
+
+    def characters(self, data: str):
+        if not self._inside:
+            return
+        if not self.fed:
+            # Whitespace ahead of the DataSet root is not allowed before an XML declaration
+            data = data.lstrip()
+            if not data:
+                return
+            self.fed = True
+        self._inner.Parse(data, False)
+
+
+def stream_dataset_response(response: Union[bytes, str, Iterable[bytes]], procedure: str,
+                            tables: Optional[TableSelection] = None) -> Tuple[bool, Optional[DataSet], str]:
+    """
+    Decode an ExecuteDataSet response while reading the envelope.
+
+    The envelope parser hands the result text to the DataSet parser as it
+    unescapes it, so neither the escaped nor the unescaped DataSet is held
+    as one string, and rows outside tables are dropped as they are read.
+    Given the body as an iterable of chunks (IMSSoapTransport.iter_body),
+    each chunk is parsed as it arrives and the body is never held whole.
+    Meant for large results such as invoices. The DataSet's xml is not kept.
+
+    If the strict pass fails, a complete body is decoded again with
+    decode_dataset_response (which cleans bad characters); a chunked body
+    is gone by then, so DataSetDecodeError is raised instead and the caller
+    has to fetch the result again.
+
+    Args:
+        response: The SOAP response (bytes as received, text, or byte chunks)
+        procedure: The procedure that was executed
+        tables: Only decode these tables/columns (default: everything)
+
+    Returns:
+        Tuple[bool, Optional[DataSet], str]: (success, dataset, message)
+
+    Raises:
+        DataSetDecodeError: A chunked response is not well-formed XML
+    """
+    builder = _RowBuilder(tables)
+    stream = _ResultStream(builder)
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.buffer_size = 65536
+    parser.StartElementHandler = stream.start
+    parser.EndElementHandler = stream.end
+    parser.CharacterDataHandler = stream.characters
+    try:
+        if isinstance(response, (bytes, str)):
+            parser.Parse(response, True)
+        else:
+            for chunk in response:
+                parser.Parse(chunk, False)
+            parser.Parse(b"", True)
+    except expat.ExpatError as e:
+        if not isinstance(response, (bytes, str)):
+            raise DataSetDecodeError(f"Streaming decode of {procedure} failed: {str(e)}") from e
+        logger.debug(f"Streaming decode of {procedure} failed ({str(e)}); decoding the full text")
+        text = response.decode("utf-8", "replace") if isinstance(response, bytes) else response
+        return decode_dataset_response(text, procedure, tables)
+
+    if not stream.found:
+        return False, None, "ExecuteDataSetResult not found in response"
+    if not stream.fed:
+        return False, None, f"No results returned from {procedure}"
+    rows = builder.tables
+    return True, DataSet(procedure, rows, _learn_columns(procedure, rows)), f"Successfully executed {procedure}"
+
+
+def get_schema_cache() -> Dict[str, List[str]]:
+    """The cached column schemas, keyed "procedure.table" (for diagnostics)."""
+    with _schemas_lock:
+        return {f"{procedure}.{table}": list(columns) for (procedure, table), columns in _schemas.items()}
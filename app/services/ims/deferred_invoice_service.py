@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.ims.data_access_service import get_data_access_service
+from config import INVOICE_CONFIG, JOB_QUEUE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredInvoiceService:
+    """
+    Fetches invoices after bind/endorsement/cancellation/reinstatement in the
+    background, so the transaction can respond without waiting for
+    ryan_rptInvoice and the XML-to-JSON conversion.
+
+    Each request gets an invoice_id handle; clients poll
+    GET /api/triton/invoice/status/{invoice_id} (or GET /api/triton/invoice
+    with the quote_guid) for the result.
+
+    Requests are stored in the SQLite job database (JOB_QUEUE_CONFIG
+    db_path), so any uvicorn worker can answer the poll. The process that
+    fetches an invoice (owner) renews a lease on it; a pending request whose
+    lease has expired, because its process stopped, is fetched again by the
+    next process that sees it.
+
+    Request status: pending -> completed | failed
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or INVOICE_CONFIG
+        self.enabled = config.get("deferred", False)
+        self.max_attempts = config.get("max_attempts", 3)
+        self.retry_delay_seconds = config.get("retry_delay_seconds", 2)
+        self.retention = config.get("retention", 1000)
+        self.db_path = Path(config.get("db_path", JOB_QUEUE_CONFIG.get("db_path", "data/transaction_jobs.db")))
+        self.lease_seconds = config.get("lease_seconds", JOB_QUEUE_CONFIG.get("lease_seconds", 60))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.data_service = get_data_access_service()
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get("workers", 4),
+            thread_name_prefix="invoice"
+        )
+        self._lock = threading.Lock()
+        self._lease_thread: Optional[threading.Thread] = None
+
+    def submit(self, quote_guid: str, transaction_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue an invoice fetch for a quote.
+
+        Args:
+            quote_guid: Quote to get the invoice for
+            transaction_id: Triton transaction that triggered it (for logging/status)
+
+        Returns:
+            The pending invoice handle (an already pending request for the
+            same quote is reused)
+        """
+        now = datetime.utcnow().isoformat()
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = conn.execute(
+                "SELECT * FROM invoice_requests WHERE quote_key = ? AND status = 'pending' "
+                "ORDER BY requested_at DESC, rowid DESC LIMIT 1",
+                (quote_guid.lower(),)
+            ).fetchone()
+            if existing is not None:
+                return self._handle(existing)
+
+            invoice_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO invoice_requests (invoice_id, quote_guid, quote_key, transaction_id, status, "
+                "attempts, message, requested_at, owner, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, 'pending', 0, 'Invoice retrieval queued', ?, ?, ?)",
+                (invoice_id, quote_guid, quote_guid.lower(), transaction_id, now, self.owner, now)
+            )
+            row = conn.execute("SELECT * FROM invoice_requests WHERE invoice_id = ?", (invoice_id,)).fetchone()
+
+        self._start_lease_thread()
+        self._executor.submit(self._fetch, invoice_id, quote_guid)
+        logger.info(f"Queued invoice retrieval {invoice_id} for quote {quote_guid}")
+        return self._handle(row)
+
+    def get_status(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of an invoice request (with invoice_data once completed)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM invoice_requests WHERE invoice_id = ?", (invoice_id,)).fetchone()
+        if row is None:
+            return None
+        if row["status"] == "pending":
+            self._resume_expired([row])
+        return self._to_request(row)
+
+    def get_completed_by_quote_guid(self, quote_guid: str) -> Optional[Dict[str, Any]]:
+        """Invoice data of the latest completed request for a quote, if any."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM invoice_requests WHERE quote_key = ? "
+                "ORDER BY requested_at DESC, rowid DESC LIMIT 1",
+                ((quote_guid or "").lower(),)
+            ).fetchone()
+        if row is not None and row["status"] == "completed":
+            return self._to_request(row)["invoice_data"]
+        return None
+
+    def _handle(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "invoice_id": row["invoice_id"],
+            "quote_guid": row["quote_guid"],
+            "status": row["status"],
+            "status_url": f"/api/triton/invoice/status/{row['invoice_id']}"
+        }
+
+    def _fetch(self, invoice_id: str, quote_guid: str):
+        """Worker: fetch the invoice, retrying while IMS has not generated it yet."""
+        success, invoice_data, message = False, None, ""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                success, invoice_data, message = self.data_service.get_invoice_data(quote_guid)
+            except Exception as e:
+                success, invoice_data, message = False, None, f"Error getting invoice data: {str(e)}"
+            self._update(
+                "UPDATE invoice_requests SET attempts = ?, heartbeat_at = ? WHERE invoice_id = ? AND owner = ?",
+                (attempt, datetime.utcnow().isoformat(), invoice_id, self.owner)
+            )
+            if success:
+                break
+            if attempt < self.max_attempts:
+                time.sleep(self.retry_delay_seconds * attempt)
+
+        stored = self._update(
+            "UPDATE invoice_requests SET status = ?, invoice_data = ?, message = ?, completed_at = ?, "
+            "owner = NULL, heartbeat_at = NULL WHERE invoice_id = ? AND owner = ?",
+            (
+                "completed" if success else "failed",
+                json.dumps(invoice_data, default=str) if invoice_data is not None else None,
+                message,
+                datetime.utcnow().isoformat(),
+                invoice_id,
+                self.owner
+            )
+        )
+        if not stored:
+            logger.error(f"Invoice retrieval {invoice_id} finished after its lease was lost; result not stored")
+            return
+
+        if success:
+            logger.info(f"Invoice retrieval {invoice_id} completed for quote {quote_guid}")
+        else:
+            logger.warning(f"Invoice retrieval {invoice_id} failed for quote {quote_guid}: {message}")
+        self._purge_old_requests()
+
+    # ------------------------------------------------------------------
+    # Leases
+    # ------------------------------------------------------------------
+
+    def _start_lease_thread(self):
+        """Start the lease thread (once per process)."""
+        with self._lock:
+            if self._lease_thread is not None and self._lease_thread.is_alive():
+                return
+            self._lease_thread = threading.Thread(target=self._lease_loop, name="invoice-lease", daemon=True)
+        self._lease_thread.start()
+
+    def _lease_loop(self):
+        """Renew the leases of this process's pending requests and resume expired ones."""
+        interval = max(self.lease_seconds / 3, 1)
+        while True:
+            time.sleep(interval)
+            try:
+                self._update(
+                    "UPDATE invoice_requests SET heartbeat_at = ? WHERE status = 'pending' AND owner = ?",
+                    (datetime.utcnow().isoformat(), self.owner)
+                )
+                with self._connect() as conn:
+                    rows = conn.execute(
+                        "SELECT * FROM invoice_requests WHERE status = 'pending' AND heartbeat_at < ?",
+                        (self._lease_cutoff(),)
+                    ).fetchall()
+                self._resume_expired(rows)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew invoice request leases: {str(e)}")
+
+    def _resume_expired(self, rows: List[sqlite3.Row]):
+        """Take over pending requests whose owner stopped renewing them and fetch them here."""
+        cutoff = self._lease_cutoff()
+        for row in rows:
+            if row["heartbeat_at"] is not None and row["heartbeat_at"] >= cutoff:
+                continue
+            claimed = self._update(
+                "UPDATE invoice_requests SET owner = ?, heartbeat_at = ? WHERE invoice_id = ? "
+                "AND status = 'pending' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (self.owner, datetime.utcnow().isoformat(), row["invoice_id"], cutoff)
+            )
+            if claimed:
+                logger.warning(f"Resuming invoice retrieval {row['invoice_id']} whose worker stopped")
+                self._start_lease_thread()
+                self._executor.submit(self._fetch, row["invoice_id"], row["quote_guid"])
+
+    def _lease_cutoff(self) -> str:
+        return (datetime.utcnow() - timedelta(seconds=self.lease_seconds)).isoformat()
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _update(self, sql: str, params: tuple) -> int:
+        """Run one write statement; returns the number of rows changed."""
+        with self._lock, self._connect() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def _purge_old_requests(self):
+        """Keep only the latest `retention` finished requests."""
+        try:
+            self._update(
+                "DELETE FROM invoice_requests WHERE status != 'pending' AND invoice_id NOT IN "
+                "(SELECT invoice_id FROM invoice_requests ORDER BY requested_at DESC LIMIT ?)",
+                (self.retention,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not purge old invoice requests: {str(e)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS invoice_requests (
+            invoice_id TEXT PRIMARY KEY, quote_guid TEXT NOT NULL, quote_key TEXT NOT NULL,
+            transaction_id TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            message TEXT, invoice_data TEXT, requested_at TEXT NOT NULL, completed_at TEXT,
+            owner TEXT, heartbeat_at TEXT)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_invoice_requests_quote ON invoice_requests (quote_key, requested_at)")
+        return conn
+
+    def _to_request(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "invoice_id": row["invoice_id"],
+            "quote_guid": row["quote_guid"],
+            "transaction_id": row["transaction_id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "message": row["message"],
+            "invoice_data": json.loads(row["invoice_data"]) if row["invoice_data"] else None,
+            "requested_at": row["requested_at"],
+            "completed_at": row["completed_at"]
+        }
+
+
+# Singleton instance
+_deferred_invoice_service = None
+_deferred_invoice_service_lock = threading.Lock()
+
+
+def get_deferred_invoice_service() -> DeferredInvoiceService:
+    """Get singleton instance of deferred invoice service."""
+    global _deferred_invoice_service
+    if _deferred_invoice_service is None:
+        with _deferred_invoice_service_lock:
+            if _deferred_invoice_service is None:
+                _deferred_invoice_service = DeferredInvoiceService()
+    return _deferred_invoice_service
@@ -1,11 +1,11 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple, Dict, Any
 from datetime import datetime
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.dataset import DataSet, stripped
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -72,7 +72,7 @@ class IMSEndorsementService(BaseIMSService):
             ]
             
             # Call the stored procedure (IMS adds _WS suffix automatically)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_EndorsePolicy",
                 parameters=params
             )
@@ -81,7 +81,7 @@ class IMSEndorsementService(BaseIMSService):
                 return False, {}, f"Failed to execute endorsement procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_endorsement_procedure_result(result_xml)
+            result_data = self._parse_endorsement_procedure_result(dataset)
             
             if result_data and result_data.get("Result") == "1":
                 logger.info(f"Successfully created endorsement. QuoteGuid: {result_data.get('EndorsementQuoteGuid')}")
@@ -137,7 +137,7 @@ class IMSEndorsementService(BaseIMSService):
             ]
             
             # Call the stored procedure (IMS adds _WS suffix automatically)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_EndorsePolicy",
                 parameters=params
             )
@@ -146,7 +146,7 @@ class IMSEndorsementService(BaseIMSService):
                 return False, {}, f"Failed to execute endorsement procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_endorsement_procedure_result(result_xml)
+            result_data = self._parse_endorsement_procedure_result(dataset)
             
             if result_data and result_data.get("Result") == "1":
                 logger.info(f"Successfully created endorsement. New QuoteGuid: {result_data.get('EndorsementQuoteGuid')}")
@@ -222,7 +222,7 @@ class IMSEndorsementService(BaseIMSService):
                 params.extend(["ProducerName", producer_name])
             
             # Call the wrapper procedure (which calculates total and calls base procedure)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_ProcessFlatEndorsement",
                 parameters=params
             )
@@ -231,11 +231,11 @@ class IMSEndorsementService(BaseIMSService):
                 return False, {}, f"Failed to execute Triton_ProcessFlatEndorsement: {message}"
             
             # Parse the result
-            result_data = self._parse_triton_endorsement_result(result_xml)
+            result_data = self._parse_triton_endorsement_result(dataset)
             
             # Log the raw XML if debug is needed
             if not result_data:
-                logger.error(f"Failed to parse result. Raw XML: {result_xml[:500] if result_xml else 'None'}")
+                logger.error(f"Failed to parse result. Raw XML: {dataset.xml[:500] if dataset else 'None'}")
             
             # Check for success - Result could be 1 (int), "1" (string), or "Success" (from base procedure)
             result_str = str(result_data.get("Result", "")).lower() if result_data else ""
@@ -323,7 +323,7 @@ class IMSEndorsementService(BaseIMSService):
                 params.extend(["UserGuid", str(user_guid)])
             
             # Call the wrapper procedure (which will call the base procedure)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_ProcessFlatEndorsement",
                 parameters=params
             )
@@ -332,7 +332,7 @@ class IMSEndorsementService(BaseIMSService):
                 return False, {}, f"Failed to execute ProcessFlatEndorsement: {message}"
             
             # Parse the result
-            result_data = self._parse_flat_endorsement_result(result_xml)
+            result_data = self._parse_flat_endorsement_result(dataset)
             
             if result_data and result_data.get("Result") == "Success":
                 new_quote_guid = result_data.get("NewQuoteGuid")
@@ -353,64 +353,61 @@ class IMSEndorsementService(BaseIMSService):
             logger.error(error_msg, exc_info=True)
             return False, {}, error_msg
     
-    def _parse_triton_endorsement_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_triton_endorsement_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from Triton_ProcessFlatEndorsement wrapper procedure.
         The wrapper returns TWO result sets - we need the second one.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
             # The wrapper procedure returns multiple result sets
             # First result set is from the base procedure (Result="Success")
             # Second result set is from the wrapper (Result=1)
             # We need to find the correct one
             
-            # Find all table elements - they can be named Table, Table1, Table2, etc.
-            tables = []
+            # Collect the rows of every result set - they can be named Table, Table1, Table2, etc.
+            rows = []
             for table_name in ['Table', 'Table1', 'Table2']:
-                tables.extend(root.findall(f'.//{table_name}'))
+                rows.extend(dataset.rows(table_name))
             
             # Look for the table that has NewQuoteOptionGuid (wrapper's result - second table)
             # The wrapper returns TWO tables:
             # 1. First table (<Table>) from ProcessFlatEndorsement (base) - no QuoteOptionGuid
             # 2. Second table (<Table1>) from Triton_ProcessFlatEndorsement_WS (wrapper) - has NewQuoteOptionGuid
-            for table in tables:
+            for row in rows:
                 result_data = {}
                 has_quote_option_guid = False
                 
                 # Extract all fields from this table
-                for child in table:
-                    if child.text is not None:
+                for column, text in row.items():
+                    if text is not None:
                         # Check if this table has NewQuoteOptionGuid (wrapper's signature field)
-                        if child.tag == 'NewQuoteOptionGuid':
+                        if column == 'NewQuoteOptionGuid':
                             has_quote_option_guid = True
                         
                         # Convert numeric fields
-                        if child.tag in ['Result', 'ControlNo']:
+                        if column in ['Result', 'ControlNo']:
                             try:
-                                result_data[child.tag] = str(int(child.text.strip()))
+                                result_data[column] = str(int(text.strip()))
                             except:
-                                result_data[child.tag] = child.text.strip()
-                        elif child.tag in ['ExistingPremium', 'EndorsementPremium', 'TotalPremium']:
+                                result_data[column] = text.strip()
+                        elif column in ['ExistingPremium', 'EndorsementPremium', 'TotalPremium']:
                             try:
-                                result_data[child.tag] = float(child.text.strip())
+                                result_data[column] = float(text.strip())
                             except:
-                                result_data[child.tag] = child.text.strip()
+                                result_data[column] = text.strip()
                         else:
-                            result_data[child.tag] = child.text.strip()
+                            result_data[column] = text.strip()
                     else:
-                        result_data[child.tag] = None
+                        result_data[column] = None
                 
                 # If this table has NewQuoteOptionGuid, it's the wrapper's result (second table)
                 if has_quote_option_guid:
@@ -426,18 +423,18 @@ class IMSEndorsementService(BaseIMSService):
                     return result_data
             
             # If we didn't find the wrapper result with QuoteOptionGuid, check for ControlNo as secondary indicator
-            for table in tables:
+            for row in rows:
                 result_data = {}
                 has_control_no = False
                 
                 # Extract all fields from this table
-                for child in table:
-                    if child.text is not None:
-                        if child.tag == 'ControlNo':
+                for column, text in row.items():
+                    if text is not None:
+                        if column == 'ControlNo':
                             has_control_no = True
-                        result_data[child.tag] = child.text.strip()
+                        result_data[column] = text.strip()
                     else:
-                        result_data[child.tag] = None
+                        result_data[column] = None
                 
                 # If this table has ControlNo and Result=1, it might be the wrapper's result
                 if has_control_no and str(result_data.get('Result')) == '1':
@@ -452,14 +449,14 @@ class IMSEndorsementService(BaseIMSService):
                     return result_data
             
             # Last resort: Look specifically for Table1 if we haven't found anything yet
-            table1 = root.find('.//Table1')
+            table1 = dataset.first('Table1')
             if table1 is not None:
                 result_data = {}
-                for child in table1:
-                    if child.text is not None:
-                        result_data[child.tag] = child.text.strip()
+                for column, text in table1.items():
+                    if text is not None:
+                        result_data[column] = text.strip()
                     else:
-                        result_data[child.tag] = None
+                        result_data[column] = None
                 
                 if 'NewQuoteOptionGuid' in result_data:
                     logger.info(f"Found Table1 with QuoteOptionGuid: {result_data.get('NewQuoteOptionGuid')}")
@@ -472,57 +469,50 @@ class IMSEndorsementService(BaseIMSService):
                     return result_data
             
             # Really last resort: use the first table found
-            if tables:
-                table = tables[0]
+            if rows:
                 result_data = {}
-                for child in table:
-                    if child.text is not None:
-                        result_data[child.tag] = child.text.strip()
+                for column, text in rows[0].items():
+                    if text is not None:
+                        result_data[column] = text.strip()
                     else:
-                        result_data[child.tag] = None
+                        result_data[column] = None
                 
                 logger.warning(f"Using fallback result set (base procedure - no QuoteOptionGuid): {result_data}")
                 return result_data
             
             return None
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse Triton endorsement result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing Triton endorsement result: {str(e)}")
             return None
     
-    def _parse_flat_endorsement_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_flat_endorsement_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from ProcessFlatEndorsement stored procedure.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
-            # Look for the result table
-            table = root.find('.//Table')
-            if table is None:
+            # Look for the result row
+            row = dataset.first()
+            if row is None:
                 return None
             
             result_data = {}
             
             # Extract all fields from the result
-            for child in table:
-                if child.text is not None:
-                    result_data[child.tag] = child.text.strip()
+            for column, text in row.items():
+                if text is not None:
+                    result_data[column] = text.strip()
                 else:
-                    result_data[child.tag] = None
+                    result_data[column] = None
             
             # Log the parsed result
             if result_data:
@@ -530,80 +520,74 @@ class IMSEndorsementService(BaseIMSService):
             
             return result_data
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse ProcessFlatEndorsement result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing ProcessFlatEndorsement result: {str(e)}")
             return None
     
-    def _parse_endorsement_procedure_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_endorsement_procedure_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from Triton_EndorsePolicy_WS stored procedure.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
             # Check all Table elements - look for Table1 first (common for endorsements)
-            tables = root.findall('.//Table1')
-            if not tables:
-                tables = root.findall('.//Table2')  # Then Table2
-            if not tables:
-                tables = root.findall('.//Table')  # Fall back to Table
+            rows = dataset.rows('Table1')
+            if not rows:
+                rows = dataset.rows('Table2')  # Then Table2
+            if not rows:
+                rows = dataset.rows('Table')  # Fall back to Table
             
-            for table in tables:
+            for row in rows:
                 # Try to extract structured fields
                 result_data = {}
                 
                 # Extract Result (0 or 1)
-                result_elem = table.find('Result')
-                if result_elem is not None and result_elem.text:
-                    result_data['Result'] = result_elem.text.strip()
+                result_value = stripped(row, 'Result')
+                if result_value is not None:
+                    result_data['Result'] = result_value
                 
                 # Extract Message
-                message_elem = table.find('Message')
-                if message_elem is not None and message_elem.text:
-                    result_data['Message'] = message_elem.text.strip()
+                message_value = stripped(row, 'Message')
+                if message_value is not None:
+                    result_data['Message'] = message_value
                 
                 # Extract EndorsementQuoteGuid (the new quote created)
-                endorsement_guid_elem = table.find('EndorsementQuoteGuid')
-                if endorsement_guid_elem is not None and endorsement_guid_elem.text:
-                    result_data['EndorsementQuoteGuid'] = endorsement_guid_elem.text.strip()
+                endorsement_guid_value = stripped(row, 'EndorsementQuoteGuid')
+                if endorsement_guid_value is not None:
+                    result_data['EndorsementQuoteGuid'] = endorsement_guid_value
                 
                 # Extract OriginalQuoteGuid
-                original_guid_elem = table.find('OriginalQuoteGuid')
-                if original_guid_elem is not None and original_guid_elem.text:
-                    result_data['OriginalQuoteGuid'] = original_guid_elem.text.strip()
+                original_guid_value = stripped(row, 'OriginalQuoteGuid')
+                if original_guid_value is not None:
+                    result_data['OriginalQuoteGuid'] = original_guid_value
                 
                 # Extract PolicyNumber
-                policy_num_elem = table.find('PolicyNumber')
-                if policy_num_elem is not None and policy_num_elem.text:
-                    result_data['PolicyNumber'] = policy_num_elem.text.strip()
+                policy_num_value = stripped(row, 'PolicyNumber')
+                if policy_num_value is not None:
+                    result_data['PolicyNumber'] = policy_num_value
                 
                 # Extract EndorsementNumber
-                endorsement_num_elem = table.find('EndorsementNumber')
-                if endorsement_num_elem is not None and endorsement_num_elem.text:
-                    result_data['EndorsementNumber'] = endorsement_num_elem.text.strip()
+                endorsement_num_value = stripped(row, 'EndorsementNumber')
+                if endorsement_num_value is not None:
+                    result_data['EndorsementNumber'] = endorsement_num_value
                 
                 # Extract QuoteOptionGuid if available
-                option_guid_elem = table.find('QuoteOptionGuid')
-                if option_guid_elem is not None and option_guid_elem.text:
-                    result_data['QuoteOptionGuid'] = option_guid_elem.text.strip()
+                option_guid_value = stripped(row, 'QuoteOptionGuid')
+                if option_guid_value is not None:
+                    result_data['QuoteOptionGuid'] = option_guid_value
                 
                 # Extract InvoiceNumber if endorsement was bound
-                invoice_elem = table.find('InvoiceNumber')
-                if invoice_elem is not None and invoice_elem.text:
-                    result_data['InvoiceNumber'] = invoice_elem.text.strip()
+                invoice_value = stripped(row, 'InvoiceNumber')
+                if invoice_value is not None:
+                    result_data['InvoiceNumber'] = invoice_value
                 
                 # If we got structured data with Result field, return it
                 if 'Result' in result_data:
@@ -611,12 +595,9 @@ class IMSEndorsementService(BaseIMSService):
                     return result_data
             
             # If no recognized format, log what we found
-            logger.warning(f"Unrecognized endorsement result format. XML: {result_xml}")
+            logger.warning(f"Unrecognized endorsement result format. XML: {dataset.xml}")
             return None
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse endorsement procedure result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing endorsement procedure result: {str(e)}")
             return None
@@ -1,14 +1,46 @@
 import logging
+import re
 import requests
-import xml.etree.ElementTree as ET
 from typing import Dict, Optional, Tuple
 from datetime import datetime
 
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import INSURED_FUNCTIONS_NAMESPACE, SoapTemplate
+from app.utils.lookup_cache import get_lookup_cache
+from app.utils.named_lock import get_named_lock_service
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
 
+FIND_INSURED_BY_NAME = SoapTemplate(INSURED_FUNCTIONS_NAMESPACE, "FindInsuredByName", """
+      <insuredName>{insured_name}</insuredName>
+      <city>{city}</city>
+      <state>{state}</state>
+      <zip>{zip}</zip>
+""")
+ADD_INSURED_WITH_LOCATION = SoapTemplate(INSURED_FUNCTIONS_NAMESPACE, "AddInsuredWithLocation", """
+      <insured>
+        <BusinessTypeID>9</BusinessTypeID>
+        <CorporationName>{insured_name}</CorporationName>
+        <NameOnPolicy>{insured_name}</NameOnPolicy>
+      </insured>
+      <location>
+        <LocationName>{insured_name}</LocationName>
+        <Address1>{address1}</Address1>
+        <Address2>{address2}</Address2>
+        <City>{city}</City>
+        <State>{state}</State>
+        <Zip>{zip}</Zip>
+        <ISOCountryCode>USA</ISOCountryCode>
+        <DeliveryMethodID>1</DeliveryMethodID>
+        <LocationTypeID>1</LocationTypeID>
+      </location>
+""")
+
+FIND_INSURED_RESULT = soap_parser.SoapPath(".//insured:FindInsuredByNameResult")
+ADD_INSURED_RESULT = soap_parser.SoapPath(".//insured:AddInsuredWithLocationResult")
+
 
 class IMSInsuredService:
     """Service for handling IMS Insured-related operations."""
@@ -18,9 +50,19 @@ class IMSInsuredService:
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.login_env = IMS_CONFIG.get("environments", {}).get("login", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["insured_functions"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
+        # Insureds we have found or created, keyed by normalized name + location
+        self.insured_index = get_lookup_cache("insured")
+        # Named locks so concurrent find-or-create calls for the same insured, in
+        # any worker process, run one at a time (and the second one finds what the first created)
+        self.locks = get_named_lock_service()
         
+    def _insured_key(self, insured_name: str, city: str, state: str, zip_code: str) -> str:
+        """Index key: name without punctuation/extra spaces, city, state, 5-digit ZIP."""
+        name = re.sub(r"[.,]", "", insured_name or "")
+        zip5 = re.sub(r"\D", "", zip_code or "")[:5]
+        return self.insured_index.normalize_key(name, city, state, zip5)
+    
     def find_insured_by_name(self, insured_name: str, city: str = "", 
                             state: str = "", zip_code: str = "") -> Tuple[bool, Optional[str], str]:
         """
@@ -35,6 +77,24 @@ class IMSInsuredService:
         Returns:
             Tuple[bool, Optional[str], str]: (found, insured_guid, message)
         """
+        key = self._insured_key(insured_name, city, state, zip_code)
+        hit, negative, cached = self.insured_index.get(key)
+        if hit:
+            if negative:
+                return False, None, cached
+            logger.info(f"Found insured '{insured_name}' in index: {cached}")
+            return True, cached, f"Found insured with GUID: {cached}"
+        
+        found, insured_guid, message = self._find_insured_by_name(insured_name, city, state, zip_code)
+        if found:
+            self.insured_index.set(key, insured_guid)
+        elif message.endswith("not found in IMS"):
+            self.insured_index.set_negative(key, message)
+        return found, insured_guid, message
+    
+    def _find_insured_by_name(self, insured_name: str, city: str = "", 
+                              state: str = "", zip_code: str = "") -> Tuple[bool, Optional[str], str]:
+        """Call FindInsuredByName (uncached)."""
         try:
             # Ensure we have a valid token
             token = self.auth_service.token
@@ -42,41 +102,20 @@ class IMSInsuredService:
                 return False, None, "Failed to authenticate with IMS"
             
             # Construct SOAP request
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/InsuredFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <FindInsuredByName xmlns="http://tempuri.org/IMSWebServices/InsuredFunctions">
-      <insuredName>{self._escape_xml(insured_name)}</insuredName>
-      <city>{self._escape_xml(city)}</city>
-      <state>{self._escape_xml(state)}</state>
-      <zip>{self._escape_xml(zip_code)}</zip>
-    </FindInsuredByName>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/InsuredFunctions/FindInsuredByName'
-            }
+            soap_request = FIND_INSURED_BY_NAME.render(
+                token=token, insured_name=insured_name, city=city, state=state, zip=zip_code
+            )
+            headers = FIND_INSURED_BY_NAME.headers
             
             # Make request - FindInsuredByName uses /ims_one
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
             logger.info(f"Searching for insured: {insured_name} in {city}, {state} {zip_code}")
             
-            response = requests.post(
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token
             )
             
             # Check HTTP status
@@ -107,16 +146,10 @@ class IMSInsuredService:
         """
         try:
             # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/InsuredFunctions'
-            }
+            root = soap_parser.parse(response_xml)
             
             # Find FindInsuredByNameResult
-            result = root.find('.//ims:FindInsuredByNameResult', namespaces)
+            result = FIND_INSURED_RESULT.find(root)
             
             if result is None:
                 return False, None, "FindInsuredByNameResult not found in response"
@@ -130,7 +163,7 @@ class IMSInsuredService:
             logger.info(f"Found insured '{insured_name}' with GUID: {insured_guid}")
             return True, insured_guid, f"Found insured with GUID: {insured_guid}"
             
-        except ET.ParseError as e:
+        except soap_parser.SoapParseError as e:
             error_msg = f"Failed to parse XML response: {str(e)}"
             logger.error(error_msg)
             return False, None, error_msg
@@ -185,54 +218,22 @@ class IMSInsuredService:
                 return False, None, "Failed to authenticate with IMS"
             
             # Construct SOAP request with hardcoded values as specified
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/InsuredFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <AddInsuredWithLocation xmlns="http://tempuri.org/IMSWebServices/InsuredFunctions">
-      <insured>
-        <BusinessTypeID>9</BusinessTypeID>
-        <CorporationName>{self._escape_xml(insured_name)}</CorporationName>
-        <NameOnPolicy>{self._escape_xml(insured_name)}</NameOnPolicy>
-      </insured>
-      <location>
-        <LocationName>{self._escape_xml(insured_name)}</LocationName>
-        <Address1>{self._escape_xml(address1)}</Address1>
-        <Address2>{self._escape_xml(address2)}</Address2>
-        <City>{self._escape_xml(city)}</City>
-        <State>{self._escape_xml(state)}</State>
-        <Zip>{self._escape_xml(zip_code)}</Zip>
-        <ISOCountryCode>USA</ISOCountryCode>
-        <DeliveryMethodID>1</DeliveryMethodID>
-        <LocationTypeID>1</LocationTypeID>
-      </location>
-    </AddInsuredWithLocation>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/InsuredFunctions/AddInsuredWithLocation'
-            }
+            soap_request = ADD_INSURED_WITH_LOCATION.render(
+                token=token, insured_name=insured_name, address1=address1, address2=address2,
+                city=city, state=state, zip=zip_code
+            )
+            headers = ADD_INSURED_WITH_LOCATION.headers
             
             # Make request - AddInsuredWithLocation uses /ims_one as specified
             url = f"{self.base_url}{self.login_env}{self.endpoint}"
             logger.info(f"Adding new insured: {insured_name}")
             logger.info(f"DEBUG: add_insured_with_location - State being used: {state}")
             
-            response = requests.post(
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token
             )
             
             # Check HTTP status
@@ -263,16 +264,10 @@ class IMSInsuredService:
         """
         try:
             # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/InsuredFunctions'
-            }
+            root = soap_parser.parse(response_xml)
             
             # Find AddInsuredWithLocationResult
-            result = root.find('.//ims:AddInsuredWithLocationResult', namespaces)
+            result = ADD_INSURED_RESULT.find(root)
             
             if result is None:
                 return False, None, "AddInsuredWithLocationResult not found in response"
@@ -286,7 +281,7 @@ class IMSInsuredService:
             logger.info(f"Successfully created insured '{insured_name}' with GUID: {insured_guid}")
             return True, insured_guid, f"Created insured with GUID: {insured_guid}"
             
-        except ET.ParseError as e:
+        except soap_parser.SoapParseError as e:
             error_msg = f"Failed to parse XML response: {str(e)}"
             logger.error(error_msg)
             return False, None, error_msg
@@ -319,43 +314,47 @@ class IMSInsuredService:
         if not insured_name:
             return False, None, "No insured name found in payload"
         
-        # First, try to find the insured
-        logger.info(f"Attempting to find insured: {insured_name}")
-        found, insured_guid, find_message = self.find_insured_by_name(
-            insured_name, city, state, zip_code
-        )
-        
-        if found:
-            logger.info(f"Insured already exists: {insured_guid}")
-            return True, insured_guid, f"Found existing insured: {insured_guid}"
-        
-        # Insured not found, create new one
-        logger.info(f"Insured not found, creating new record")
+        key = self._insured_key(insured_name, city, state, zip_code)
         
-        # Validate required fields for creation
-        if not all([address1, city, state, zip_code]):
-            return False, None, "Missing required location information for creating insured"
-        
-        # Create new insured
-        success, new_guid, create_message = self.add_insured_with_location(
-            insured_name, address1, city, state, zip_code, address2
-        )
-        
-        if success:
-            return True, new_guid, f"Created new insured: {new_guid}"
-        else:
-            return False, None, create_message
-    
-    def _escape_xml(self, value: str) -> str:
-        """Escape special XML characters."""
-        if not value:
-            return ""
-        return (value
-                .replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&apos;"))
+        # Only one find-or-create per insured at a time, so two concurrent
+        # binds for the same new insured cannot both create it
+        with self.locks.hold(f"insured|{key}"):
+            # First, try to find the insured. A cached GUID is trusted, but a cached
+            # "not found" is not: another worker (or an earlier create that timed out)
+            # may have created the insured since, so IMS is always searched before creating
+            hit, negative, cached = self.insured_index.get(key)
+            if hit and not negative:
+                logger.info(f"Insured already exists (index): {cached}")
+                return True, cached, f"Found existing insured: {cached}"
+            
+            logger.info(f"Attempting to find insured: {insured_name}")
+            found, insured_guid, find_message = self._find_insured_by_name(
+                insured_name, city, state, zip_code
+            )
+            
+            if found:
+                self.insured_index.set(key, insured_guid)
+                logger.info(f"Insured already exists: {insured_guid}")
+                return True, insured_guid, f"Found existing insured: {insured_guid}"
+            
+            # Insured not found, create new one
+            logger.info(f"Insured not found, creating new record")
+            
+            # Validate required fields for creation
+            if not all([address1, city, state, zip_code]):
+                return False, None, "Missing required location information for creating insured"
+            
+            # Create new insured
+            success, new_guid, create_message = self.add_insured_with_location(
+                insured_name, address1, city, state, zip_code, address2
+            )
+            
+            if success:
+                # Index it right away so the next transaction for this insured skips the search
+                self.insured_index.set(key, new_guid)
+                return True, new_guid, f"Created new insured: {new_guid}"
+            else:
+                return False, None, create_message
 
 
 # Singleton instance
@@ -5,6 +5,7 @@ from uuid import UUID
 from .base_service import BaseIMSService
 from .auth_service import IMSAuthService, get_auth_service
 from .data_access_service import get_data_access_service
+from .unit_of_work import unit_of_work
 
 logger = logging.getLogger(__name__)
 
@@ -82,9 +83,21 @@ class InvoiceService(BaseIMSService):
         Returns:
             Tuple[bool, Optional[Dict], str]: (success, invoice_data, message)
         """
+        # The lookups below may repeat the same quote query; memoize them for this request
+        with unit_of_work("invoice"):
+            return self._get_invoice_by_params(invoice_num, quote_guid, policy_number, opportunity_id)
+    
+    def _get_invoice_by_params(
+        self,
+        invoice_num: Optional[int],
+        quote_guid: Optional[str],
+        policy_number: Optional[str],
+        opportunity_id: Optional[str]
+    ) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """Look up the invoice (see get_invoice_by_params)."""
         try:
-            # Ensure authentication
-            auth_success, auth_message = self.auth_service.login()
+            # Ensure authentication (reuses the cached token when still valid)
+            auth_success, auth_message = self.auth_service.ensure_authenticated()
             if not auth_success:
                 return False, None, f"Authentication failed: {auth_message}"
             
@@ -134,16 +147,13 @@ class InvoiceService(BaseIMSService):
                 return False, None, "No valid parameters provided for invoice lookup"
             
             # Execute the stored procedure
-            success, result_xml, message = self.data_access_service.execute_dataset(
-                "ryan_rptInvoice",
-                params
-            )
+            success, dataset, message = self.data_access_service.query_invoice(params)
             
             if not success:
                 return False, None, f"Failed to retrieve invoice: {message}"
             
-            # Parse the invoice XML to JSON
-            invoice_data = self.data_access_service._parse_invoice_xml_to_json(result_xml)
+            # Parse the invoice result sets to JSON
+            invoice_data = self.data_access_service._parse_invoice_dataset(dataset)
             
             if invoice_data:
                 logger.info(f"Successfully retrieved invoice data")
@@ -1,15 +1,19 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple
 from datetime import datetime
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import QUOTE_FUNCTIONS_NAMESPACE, SoapTemplate, envelope_text
 from config import IMS_CONFIG
 import requests
 
 logger = logging.getLogger(__name__)
 
+ISSUE_POLICY = SoapTemplate(QUOTE_FUNCTIONS_NAMESPACE, "IssuePolicy", "<quoteGuid>{quote_guid}</quoteGuid>")
+ISSUE_POLICY_RESULT = soap_parser.SoapPath(".//quote:IssuePolicyResult")
+
 
 class IMSIssueService(BaseIMSService):
     """Service for issuing policies in IMS."""
@@ -19,7 +23,6 @@ class IMSIssueService(BaseIMSService):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["quote_functions"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
         self._last_soap_request = None
         self._last_soap_response = None
@@ -47,25 +50,23 @@ class IMSIssueService(BaseIMSService):
             
             # Make the request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
-            headers = {
-                "Content-Type": "text/xml; charset=utf-8",
-                "SOAPAction": "http://tempuri.org/IMSWebServices/QuoteFunctions/IssuePolicy"
-            }
+            headers = ISSUE_POLICY.headers
             
             logger.info(f"Issuing policy for quote: {quote_guid}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
             try:
-                response = requests.post(
+                response = self.auth_service.post_with_token_retry(
                     url,
-                    data=soap_request,
-                    headers=headers,
-                    timeout=self.timeout
+                    soap_request,
+                    headers,
+                    token
                 )
                 
                 # Store response for error reporting
@@ -92,7 +93,7 @@ class IMSIssueService(BaseIMSService):
                 if self._last_url:
                     detailed_msg += f"\n\nRequest URL: {self._last_url}"
                 if self._last_soap_request:
-                    detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                    detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
                 if hasattr(e, 'response') and e.response is not None:
                     detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                     detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -103,22 +104,9 @@ class IMSIssueService(BaseIMSService):
             logger.error(error_msg)
             return False, None, error_msg
     
-    def _build_issue_policy_request(self, quote_guid: str, token: str) -> str:
+    def _build_issue_policy_request(self, quote_guid: str, token: str) -> bytes:
         """Build the SOAP request for IssuePolicy."""
-        return f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <IssuePolicy xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <quoteGuid>{quote_guid}</quoteGuid>
-    </IssuePolicy>
-  </soap:Body>
-</soap:Envelope>"""
+        return ISSUE_POLICY.render(token=token, quote_guid=quote_guid)
     
     def _parse_issue_policy_response(self, response_text: str) -> Tuple[bool, Optional[str], str]:
         """
@@ -132,20 +120,18 @@ class IMSIssueService(BaseIMSService):
         """
         try:
             # Parse the XML
-            root = ET.fromstring(response_text)
+            root = soap_parser.parse(response_text)
             
             # Find IssuePolicyResult
-            issue_result = root.find('.//{http://tempuri.org/IMSWebServices/QuoteFunctions}IssuePolicyResult')
+            issue_result = ISSUE_POLICY_RESULT.find(root)
             
             if issue_result is not None and issue_result.text:
                 issue_date = issue_result.text.strip()
                 return True, issue_date, "Issue successful"
             
             # Check for fault
-            fault = root.find('.//soap:Fault', {'soap': 'http://schemas.xmlsoap.org/soap/envelope/'})
-            if fault is not None:
-                fault_string = fault.find('faultstring')
-                error_msg = fault_string.text if fault_string is not None else "Unknown SOAP fault"
+            error_msg = soap_parser.fault_message(root)
+            if error_msg is not None:
                 return False, None, f"SOAP Fault: {error_msg}"
             
             return False, None, "No IssuePolicyResult found in response"
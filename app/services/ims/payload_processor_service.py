@@ -1,10 +1,11 @@
 import logging
-import json
 from typing import Dict, Optional, Tuple, Any
 from datetime import datetime
 
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.dataset import DataSet
+from app.services.ims.unit_of_work import get_current_unit_of_work, serialized_payload
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -56,7 +57,7 @@ class IMSPayloadProcessorService:
             parameters = self._build_stored_proc_params(payload, quote_guid, quote_option_guid)
             
             # Execute the stored procedure
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 "spProcessTritonPayload",
                 parameters
             )
@@ -65,7 +66,7 @@ class IMSPayloadProcessorService:
                 return False, None, f"Failed to process payload: {message}"
             
             # Parse the result
-            result_data = self._parse_processing_result(result_xml)
+            result_data = self._parse_processing_result(dataset)
             
             if result_data.get("Status") == "Success":
                 logger.info(f"Successfully processed payload for quote: {quote_guid}")
@@ -89,6 +90,11 @@ class IMSPayloadProcessorService:
         """
         Build parameter list for the stored procedure.
         
+        When spStoreTritonTransaction_WS already stored this exact payload in
+        the current unit of work, only its transaction_id and hash are sent
+        and the procedure reads the stored copy; otherwise the compact JSON
+        is sent.
+        
         Args:
             payload: The Triton payload
             quote_guid: Quote GUID
@@ -103,10 +109,19 @@ class IMSPayloadProcessorService:
             "QuoteOptionGuid", quote_option_guid
         ]
         
-        # Add the full JSON payload for audit trail
-        params.extend([
-            "full_payload_json", json.dumps(payload, indent=2)
-        ])
+        # Add the JSON payload for audit trail, or point at the stored copy
+        payload_json, payload_hash = serialized_payload(payload)
+        transaction_id = payload.get("transaction_id")
+        uow = get_current_unit_of_work()
+        if transaction_id and uow is not None and uow.stored_payload_hash(transaction_id) == payload_hash:
+            params.extend([
+                "payload_transaction_id", transaction_id,
+                "payload_hash", payload_hash
+            ])
+        else:
+            params.extend([
+                "full_payload_json", payload_json
+            ])
         
         # Add renewal information only if it has a valid value (not empty string)
         renewal_guid = payload.get("renewal_of_quote_guid")
@@ -119,32 +134,20 @@ class IMSPayloadProcessorService:
         # now parses the JSON internally
         return params
     
-    def _parse_processing_result(self, result_xml: str) -> Dict[str, Any]:
+    def _parse_processing_result(self, dataset: Optional[DataSet]) -> Dict[str, Any]:
         """
         Parse the result from the stored procedure.
         
         Args:
-            result_xml: XML result from ExecuteDataSet
+            dataset: DataSet from ExecuteDataSet
             
         Returns:
             Dictionary with processing results
         """
         try:
-            import xml.etree.ElementTree as ET
-            
-            result_data = {}
-            
-            if result_xml:
-                root = ET.fromstring(result_xml)
-                
-                # Find the first Table element
-                table = root.find('.//Table')
-                if table is not None:
-                    # Extract all fields from the result
-                    for element in table:
-                        result_data[element.tag] = element.text
-            
-            return result_data
+            # Fields of the first Table row
+            result_data = dataset.first() if dataset else None
+            return result_data or {}
             
         except Exception as e:
             logger.error(f"Error parsing processing result: {str(e)}")
@@ -1,22 +1,35 @@
 import logging
 import requests
-import xml.etree.ElementTree as ET
 from typing import Dict, Optional, Tuple
 
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims.base_service import ThreadLocalAttribute
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import QUOTE_FUNCTIONS_NAMESPACE, SoapTemplate, envelope_text
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
 
+AUTO_ADD_QUOTE_OPTIONS = SoapTemplate(QUOTE_FUNCTIONS_NAMESPACE, "AutoAddQuoteOptions", "<quoteGuid>{quote_guid}</quoteGuid>")
+QUOTE_OPTION = soap_parser.SoapPath(".//bo:QuoteOption")
+QUOTE_OPTION_FIELDS = {
+    field: soap_parser.SoapPath(f"bo:{field}")
+    for field in ("QuoteOptionGuid", "LineGuid", "LineName", "CompanyLocation")
+}
+
 
 class IMSQuoteOptionsService:
     """Service for handling IMS Quote Options operations."""
     
+    # Per-call diagnostics, kept per thread since the service is shared
+    _last_soap_request = ThreadLocalAttribute()
+    _last_soap_response = ThreadLocalAttribute()
+    _last_url = ThreadLocalAttribute()
+    
     def __init__(self):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["quote_functions"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
         self._last_soap_request = None
         self._last_soap_response = None
@@ -40,44 +53,25 @@ class IMSQuoteOptionsService:
                 return False, None, "Failed to authenticate with IMS"
             
             # Construct SOAP request
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <AutoAddQuoteOptions xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <quoteGuid>{quote_guid}</quoteGuid>
-    </AutoAddQuoteOptions>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/QuoteFunctions/AutoAddQuoteOptions'
-            }
+            soap_request = AUTO_ADD_QUOTE_OPTIONS.render(token=token, quote_guid=quote_guid)
+            headers = AUTO_ADD_QUOTE_OPTIONS.headers
             
             # Make request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
             logger.info(f"Adding quote options for quote: {quote_guid}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
-            response = requests.post(
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token
             )
             
             # Store response for error reporting
@@ -97,7 +91,7 @@ class IMSQuoteOptionsService:
             if self._last_url:
                 detailed_msg += f"\n\nRequest URL: {self._last_url}"
             if self._last_soap_request:
-                detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
             if hasattr(e, 'response') and e.response is not None:
                 detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                 detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -124,17 +118,10 @@ class IMSQuoteOptionsService:
         """
         try:
             # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/QuoteFunctions',
-                'bo': 'http://ws.mgasystems.com/BusinessObjects'
-            }
+            root = soap_parser.parse(response_xml)
             
             # Find QuoteOption element
-            quote_option = root.find('.//bo:QuoteOption', namespaces)
+            quote_option = QUOTE_OPTION.find(root)
             
             if quote_option is None:
                 return False, None, "QuoteOption not found in response"
@@ -142,25 +129,11 @@ class IMSQuoteOptionsService:
             # Extract quote option details
             option_info = {}
             
-            # Extract QuoteOptionGuid
-            option_guid = quote_option.find('bo:QuoteOptionGuid', namespaces)
-            if option_guid is not None and option_guid.text:
-                option_info['QuoteOptionGuid'] = option_guid.text
-            
-            # Extract LineGuid
-            line_guid = quote_option.find('bo:LineGuid', namespaces)
-            if line_guid is not None and line_guid.text:
-                option_info['LineGuid'] = line_guid.text
-            
-            # Extract LineName
-            line_name = quote_option.find('bo:LineName', namespaces)
-            if line_name is not None and line_name.text:
-                option_info['LineName'] = line_name.text
-            
-            # Extract CompanyLocation
-            company_location = quote_option.find('bo:CompanyLocation', namespaces)
-            if company_location is not None and company_location.text:
-                option_info['CompanyLocation'] = company_location.text
+            # Extract QuoteOptionGuid, LineGuid, LineName and CompanyLocation
+            for field, path in QUOTE_OPTION_FIELDS.items():
+                value = path.text(quote_option)
+                if value:
+                    option_info[field] = value
             
             # Validate we got the essential GUID
             if 'QuoteOptionGuid' not in option_info:
@@ -169,7 +142,7 @@ class IMSQuoteOptionsService:
             logger.info(f"Successfully added quote option: {option_info.get('QuoteOptionGuid')} for quote: {quote_guid}")
             return True, option_info, f"Quote option added successfully"
             
-        except ET.ParseError as e:
+        except soap_parser.SoapParseError as e:
             error_msg = f"Failed to parse XML response: {str(e)}"
             logger.error(error_msg)
             return False, None, error_msg
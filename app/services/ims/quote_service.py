@@ -1,23 +1,61 @@
 import logging
 import requests
-import xml.etree.ElementTree as ET
 from typing import Dict, Optional, Tuple
 from datetime import datetime, date
 
 from app.services.ims.auth_service import get_auth_service
+from app.services.ims.base_service import ThreadLocalAttribute
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import QUOTE_FUNCTIONS_NAMESPACE, SoapTemplate, element, envelope_text
 from config import IMS_CONFIG, QUOTE_CONFIG
 
 logger = logging.getLogger(__name__)
 
+ADD_QUOTE_WITH_SUBMISSION = SoapTemplate(QUOTE_FUNCTIONS_NAMESPACE, "AddQuoteWithSubmission", """
+      <submission>
+        <Insured>{insured_guid}</Insured>
+        <ProducerContact>{producer_contact_guid}</ProducerContact>
+        <Underwriter>{underwriter_guid}</Underwriter>
+        <SubmissionDate>{submission_date}</SubmissionDate>
+      </submission>
+      <quote>
+        <QuotingLocation>{quoting_location}</QuotingLocation>
+        <IssuingLocation>{issuing_location}</IssuingLocation>
+        <CompanyLocation>{company_location}</CompanyLocation>
+        <Line>{line_guid}</Line>
+        <StateID>{state_id}</StateID>
+        <ProducerContact>{producer_contact_guid}</ProducerContact>
+        <QuoteStatusID>{quote_status_id}</QuoteStatusID>
+        <Effective>{effective_date}</Effective>
+        <Expiration>{expiration_date}</Expiration>
+        <BillingTypeID>{billing_type_id}</BillingTypeID>
+        <QuoteDetail>
+          <CompanyCommission>{company_commission}</CompanyCommission>
+          <ProducerCommission>{producer_commission}</ProducerCommission>
+          <LineGUID>{line_guid}</LineGUID>
+          <CompanyLocationGUID>{company_location}</CompanyLocationGUID>
+        </QuoteDetail>
+        <Underwriter>{underwriter_guid}</Underwriter>
+        <PolicyTypeID>{policy_type_id}</PolicyTypeID>
+        <InsuredBusinessTypeID>{business_type_id}</InsuredBusinessTypeID>
+        {renewal_fields}
+      </quote>
+""")
+ADD_QUOTE_RESULT = soap_parser.SoapPath(".//quote:AddQuoteWithSubmissionResult")
+
 
 class IMSQuoteService:
     """Service for handling IMS Quote operations."""
     
+    # Per-call diagnostics, kept per thread since the service is shared
+    _last_soap_request = ThreadLocalAttribute()
+    _last_soap_response = ThreadLocalAttribute()
+    _last_url = ThreadLocalAttribute()
+    
     def __init__(self):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["quote_functions"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
         self.quote_config = QUOTE_CONFIG
         self._last_soap_request = None
@@ -82,81 +120,55 @@ class IMSQuoteService:
                 producer_commission_str = str(producer_commission / 100) if producer_commission > 1 else str(producer_commission)
             
             # Build renewal fields if applicable
-            renewal_fields = ""
+            renewal_fields = []
             if policy_type_id == 2:  # Renewal
                 if expiring_quote_guid:
-                    renewal_fields += f"        <ExpiringQuoteGuid>{expiring_quote_guid}</ExpiringQuoteGuid>\n"
+                    renewal_fields.append(element("ExpiringQuoteGuid", expiring_quote_guid))
                 if expiring_policy_number:
-                    renewal_fields += f"        <ExpiringPolicyNumber>{self._escape_xml(expiring_policy_number)}</ExpiringPolicyNumber>\n"
+                    renewal_fields.append(element("ExpiringPolicyNumber", expiring_policy_number))
                 if renewal_of_quote_guid:
-                    renewal_fields += f"        <RenewalOfQuoteGuid>{renewal_of_quote_guid}</RenewalOfQuoteGuid>\n"
+                    renewal_fields.append(element("RenewalOfQuoteGuid", renewal_of_quote_guid))
             
             # Construct SOAP request
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <AddQuoteWithSubmission xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <submission>
-        <Insured>{insured_guid}</Insured>
-        <ProducerContact>{producer_contact_guid}</ProducerContact>
-        <Underwriter>{underwriter_guid}</Underwriter>
-        <SubmissionDate>{submission_date}</SubmissionDate>
-      </submission>
-      <quote>
-        <QuotingLocation>{self.quote_config["quoting_location"]}</QuotingLocation>
-        <IssuingLocation>{self.quote_config["issuing_location"]}</IssuingLocation>
-        <CompanyLocation>{self.quote_config["company_location"]}</CompanyLocation>
-        <Line>{line_guid}</Line>
-        <StateID>{self._escape_xml(state_id)}</StateID>
-        <ProducerContact>{producer_contact_guid}</ProducerContact>
-        <QuoteStatusID>{self.quote_config["default_quote_status_id"]}</QuoteStatusID>
-        <Effective>{effective_date}</Effective>
-        <Expiration>{expiration_date}</Expiration>
-        <BillingTypeID>{self.quote_config["default_billing_type_id"]}</BillingTypeID>
-        <QuoteDetail>
-          <CompanyCommission>{company_commission}</CompanyCommission>
-          <ProducerCommission>{producer_commission_str}</ProducerCommission>
-          <LineGUID>{line_guid}</LineGUID>
-          <CompanyLocationGUID>{self.quote_config["company_location"]}</CompanyLocationGUID>
-        </QuoteDetail>
-        <Underwriter>{underwriter_guid}</Underwriter>
-        <PolicyTypeID>{policy_type_id}</PolicyTypeID>
-        <InsuredBusinessTypeID>{self.quote_config["default_business_type_id"]}</InsuredBusinessTypeID>
-{renewal_fields.rstrip()}
-      </quote>
-    </AddQuoteWithSubmission>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/QuoteFunctions/AddQuoteWithSubmission'
-            }
+            soap_request = ADD_QUOTE_WITH_SUBMISSION.render(
+                token=token,
+                insured_guid=insured_guid,
+                producer_contact_guid=producer_contact_guid,
+                underwriter_guid=underwriter_guid,
+                submission_date=submission_date,
+                quoting_location=self.quote_config["quoting_location"],
+                issuing_location=self.quote_config["issuing_location"],
+                company_location=self.quote_config["company_location"],
+                line_guid=line_guid,
+                state_id=state_id,
+                quote_status_id=self.quote_config["default_quote_status_id"],
+                effective_date=effective_date,
+                expiration_date=expiration_date,
+                billing_type_id=self.quote_config["default_billing_type_id"],
+                company_commission=company_commission,
+                producer_commission=producer_commission_str,
+                policy_type_id=policy_type_id,
+                business_type_id=self.quote_config["default_business_type_id"],
+                renewal_fields=b"".join(renewal_fields)
+            )
+            headers = ADD_QUOTE_WITH_SUBMISSION.headers
             
             # Make request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
             logger.info(f"Creating quote for insured: {insured_guid}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
-            response = requests.post(
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token
             )
             
             # Store response for error reporting
@@ -176,7 +188,7 @@ class IMSQuoteService:
             if self._last_url:
                 detailed_msg += f"\n\nRequest URL: {self._last_url}"
             if self._last_soap_request:
-                detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
             if hasattr(e, 'response') and e.response is not None:
                 detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                 detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -198,16 +210,10 @@ class IMSQuoteService:
         """
         try:
             # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/QuoteFunctions'
-            }
+            root = soap_parser.parse(response_xml)
             
             # Find AddQuoteWithSubmissionResult
-            result = root.find('.//ims:AddQuoteWithSubmissionResult', namespaces)
+            result = ADD_QUOTE_RESULT.find(root)
             
             if result is None:
                 return False, None, "AddQuoteWithSubmissionResult not found in response"
@@ -221,7 +227,7 @@ class IMSQuoteService:
             logger.info(f"Successfully created quote with GUID: {quote_guid}")
             return True, quote_guid, f"Quote created successfully: {quote_guid}"
             
-        except ET.ParseError as e:
+        except soap_parser.SoapParseError as e:
             error_msg = f"Failed to parse XML response: {str(e)}"
             logger.error(error_msg)
             return False, None, error_msg
@@ -380,17 +386,6 @@ class IMSQuoteService:
         
         # Return with any captured error details
         return success, quote_guid, message
-    
-    def _escape_xml(self, value: str) -> str:
-        """Escape special XML characters."""
-        if not value:
-            return ""
-        return (value
-                .replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&apos;"))
 
 
 # Singleton instance
@@ -0,0 +1,298 @@
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any
+
+from app.services.ims.data_access_service import get_data_access_service
+from config import REFERENCE_DATA_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class IMSReferenceDataService:
+    """
+    Local snapshot of IMS producers and underwriters.
+
+    The full producer contact and underwriter lists are pulled from IMS in
+    bulk (getProducerContactList / getUserList) at startup and on a schedule,
+    stored in SQLite so a restart is warm, and indexed in memory by email,
+    normalized name and GUID. Lookups that miss the snapshot return None
+    and the caller falls back to IMS.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or REFERENCE_DATA_CONFIG
+        self.enabled = config.get("enabled", False)
+        self.db_path = Path(config.get("db_path", "data/reference_data.db"))
+        self.sync_interval_seconds = config.get("sync_interval_seconds", 3600)
+        self.data_service = get_data_access_service()
+
+        # In-memory indexes, swapped as a whole on every sync
+        self._producers_by_email: Dict[str, Dict[str, str]] = {}
+        self._producers_by_name: Dict[str, Dict[str, str]] = {}
+        self._producers_by_guid: Dict[str, Dict[str, str]] = {}
+        self._underwriters_by_name: Dict[str, str] = {}
+        self._underwriters_by_guid: Dict[str, str] = {}
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._last_sync: Dict[str, Dict[str, Any]] = {}
+        self._sync_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def normalize_name(name: Optional[str]) -> str:
+        """Lower-case a full name and collapse whitespace."""
+        return re.sub(r"\s+", " ", (name or "").strip().lower())
+
+    @staticmethod
+    def normalize_email(email: Optional[str]) -> str:
+        """Lower-case and trim an email address."""
+        return (email or "").strip().lower()
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def find_producer(self, producer_email: Optional[str], producer_name: Optional[str]) -> Optional[Dict[str, str]]:
+        """
+        Resolve a producer from the snapshot, mirroring getProducerGuid.
+
+        An email that is not in the snapshot returns None rather than falling
+        back to the name, so contacts added since the last sync still resolve
+        by email through IMS.
+
+        Args:
+            producer_email: Email address of the producer
+            producer_name: Full name of the producer (used when there is no email)
+
+        Returns:
+            Dict with ProducerContactGUID and ProducerLocationGUID, or None on a miss
+        """
+        if not self._ensure_loaded():
+            return None
+
+        if producer_email:
+            producer = self._producers_by_email.get(self.normalize_email(producer_email))
+        else:
+            producer = self._producers_by_name.get(self.normalize_name(producer_name))
+
+        if producer is None:
+            return None
+        return {
+            "ProducerContactGUID": producer["ProducerContactGUID"],
+            "ProducerLocationGUID": producer["ProducerLocationGUID"]
+        }
+
+    def find_producer_by_guid(self, producer_contact_guid: str) -> Optional[Dict[str, str]]:
+        """Get the snapshot row for a producer contact GUID."""
+        if not self._ensure_loaded():
+            return None
+        producer = self._producers_by_guid.get((producer_contact_guid or "").lower())
+        return dict(producer) if producer else None
+
+    def find_underwriter(self, underwriter_name: str) -> Optional[str]:
+        """
+        Resolve an underwriter GUID from the snapshot, mirroring getUserbyName.
+
+        Returns:
+            UserGUID, or None on a miss
+        """
+        if not self._ensure_loaded():
+            return None
+        return self._underwriters_by_name.get(self.normalize_name(underwriter_name))
+
+    def find_underwriter_name(self, user_guid: str) -> Optional[str]:
+        """Get the full name for an underwriter GUID."""
+        if not self._ensure_loaded():
+            return None
+        return self._underwriters_by_guid.get((user_guid or "").lower())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot sizes and last sync results."""
+        return {
+            "enabled": self.enabled,
+            "loaded": self._loaded,
+            "producers_by_email": len(self._producers_by_email),
+            "producers_by_name": len(self._producers_by_name),
+            "underwriters": len(self._underwriters_by_name),
+            "last_sync": dict(self._last_sync)
+        }
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+
+    def sync(self) -> Tuple[bool, str]:
+        """
+        Pull both lists from IMS and apply the differences to the snapshot.
+
+        Returns:
+            Tuple[bool, str]: (success, message)
+        """
+        producers_ok, producers_msg = self._sync_table(
+            "producers",
+            "getProducerContactList",
+            "ProducerContactGUID",
+            ["ProducerContactGUID", "ProducerLocationGUID", "Email", "FullName", "StatusID", "EmailRank", "NameRank"]
+        )
+        underwriters_ok, underwriters_msg = self._sync_table(
+            "underwriters",
+            "getUserList",
+            "UserGUID",
+            ["UserGUID", "FullName"]
+        )
+        self._rebuild_indexes()
+        return producers_ok and underwriters_ok, f"{producers_msg}; {underwriters_msg}"
+
+    def start_scheduled_sync(self):
+        """Sync now and then every sync_interval_seconds on a daemon thread."""
+        if not self.enabled:
+            logger.info("Reference data snapshot disabled")
+            return
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return
+        self._stop.clear()
+        self._sync_thread = threading.Thread(target=self._sync_loop, name="reference-data-sync", daemon=True)
+        self._sync_thread.start()
+
+    def stop_scheduled_sync(self):
+        """Stop the scheduled sync thread."""
+        self._stop.set()
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            try:
+                success, message = self.sync()
+                log = logger.info if success else logger.warning
+                log(f"Reference data sync: {message}")
+            except Exception as e:
+                logger.error(f"Reference data sync failed: {str(e)}", exc_info=True)
+            self._stop.wait(self.sync_interval_seconds)
+
+    def _sync_table(self, table: str, procedure_name: str, key_column: str,
+                    columns: List[str]) -> Tuple[bool, str]:
+        """Fetch one list from IMS and upsert/delete the changed rows in SQLite."""
+        success, dataset, message = self.data_service.query_dataset(procedure_name, [])
+        if not success:
+            self._last_sync[table] = {"success": False, "message": message, "time": datetime.now().isoformat()}
+            return False, f"{table}: {message.splitlines()[0] if message else 'failed'}"
+
+        rows = {}
+        for row in dataset.rows():
+            key = (row.get(key_column) or "").lower()
+            if key:
+                rows[key] = tuple(row.get(column) for column in columns)
+
+        with self._lock, self._connect() as conn:
+            current = {
+                row[0]: tuple(row[1:])
+                for row in conn.execute(f"SELECT guid, {', '.join(columns)} FROM {table}")
+            }
+            changed = [(key, *values) for key, values in rows.items() if current.get(key) != values]
+            removed = [(key,) for key in current if key not in rows]
+
+            placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+            conn.executemany(f"INSERT OR REPLACE INTO {table} (guid, {', '.join(columns)}) VALUES ({placeholders})", changed)
+            conn.executemany(f"DELETE FROM {table} WHERE guid = ?", removed)
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (name, synced_at, row_count) VALUES (?, ?, ?)",
+                (table, datetime.now().isoformat(), len(rows))
+            )
+
+        result = {
+            "success": True,
+            "rows": len(rows),
+            "changed": len(changed),
+            "removed": len(removed),
+            "time": datetime.now().isoformat()
+        }
+        self._last_sync[table] = result
+        return True, f"{table}: {len(rows)} rows, {len(changed)} changed, {len(removed)} removed"
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("""CREATE TABLE IF NOT EXISTS producers (
+            guid TEXT PRIMARY KEY, ProducerContactGUID TEXT, ProducerLocationGUID TEXT,
+            Email TEXT, FullName TEXT, StatusID TEXT, EmailRank TEXT, NameRank TEXT)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS underwriters (
+            guid TEXT PRIMARY KEY, UserGUID TEXT, FullName TEXT)""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY, synced_at TEXT, row_count INTEGER)""")
+        return conn
+
+    def _ensure_loaded(self) -> bool:
+        """Load the indexes from SQLite on first use (no IMS call)."""
+        if not self.enabled:
+            return False
+        if not self._loaded:
+            self._rebuild_indexes()
+        return True
+
+    def _rebuild_indexes(self):
+        """Rebuild the in-memory indexes from SQLite."""
+        producers_by_email = {}
+        producers_by_name = {}
+        producers_by_guid = {}
+        underwriters_by_name = {}
+        underwriters_by_guid = {}
+
+        try:
+            with self._lock, self._connect() as conn:
+                for contact_guid, location_guid, email, full_name, status_id, email_rank, name_rank in conn.execute(
+                    "SELECT ProducerContactGUID, ProducerLocationGUID, Email, FullName, StatusID, EmailRank, NameRank FROM producers"
+                ):
+                    producer = {
+                        "ProducerContactGUID": contact_guid,
+                        "ProducerLocationGUID": location_guid,
+                        "Email": email,
+                        "FullName": full_name,
+                        "StatusID": status_id
+                    }
+                    producers_by_guid[contact_guid.lower()] = producer
+                    if email and email_rank == "1" and status_id == "1":
+                        producers_by_email[self.normalize_email(email)] = producer
+                    if full_name and name_rank == "1":
+                        producers_by_name.setdefault(self.normalize_name(full_name), producer)
+
+                for user_guid, full_name in conn.execute("SELECT UserGUID, FullName FROM underwriters"):
+                    underwriters_by_guid[user_guid.lower()] = full_name
+                    if full_name:
+                        underwriters_by_name.setdefault(self.normalize_name(full_name), user_guid)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load reference data from {self.db_path}: {str(e)}")
+            return
+
+        self._producers_by_email = producers_by_email
+        self._producers_by_name = producers_by_name
+        self._producers_by_guid = producers_by_guid
+        self._underwriters_by_name = underwriters_by_name
+        self._underwriters_by_guid = underwriters_by_guid
+        self._loaded = True
+        logger.info(
+            f"Reference data loaded: {len(producers_by_email)} producer emails, "
+            f"{len(producers_by_name)} producer names, {len(underwriters_by_name)} underwriters"
+        )
+
+
+# Singleton instance
+_reference_data_service = None
+_reference_data_service_lock = threading.Lock()
+
+
+def get_reference_data_service() -> IMSReferenceDataService:
+    """Get singleton instance of reference data service."""
+    global _reference_data_service
+    if _reference_data_service is None:
+        with _reference_data_service_lock:
+            if _reference_data_service is None:
+                _reference_data_service = IMSReferenceDataService()
+    return _reference_data_service
@@ -1,11 +1,11 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple, Dict, Any
 from datetime import datetime
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.dataset import DataSet, stripped
 from config import IMS_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -69,7 +69,7 @@ class IMSReinstatementService(BaseIMSService):
             ]
             
             # Call the stored procedure (IMS adds _WS suffix automatically)
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_ProcessFlatReinstatement",
                 parameters=params
             )
@@ -78,7 +78,7 @@ class IMSReinstatementService(BaseIMSService):
                 return False, {}, f"Failed to execute reinstatement procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_reinstatement_procedure_result(result_xml)
+            result_data = self._parse_reinstatement_procedure_result(dataset)
             
             if result_data and result_data.get("Result") == "1":
                 logger.info(f"Successfully reinstated policy. NewQuoteGuid: {result_data.get('NewQuoteGuid')}")
@@ -129,125 +129,122 @@ class IMSReinstatementService(BaseIMSService):
             logger.error(error_msg, exc_info=True)
             return False, {}, error_msg
     
-    def _parse_reinstatement_procedure_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_reinstatement_procedure_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from Triton_ProcessFlatReinstatement_WS stored procedure.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
             # Check all Table elements - collect all tables with different names
             all_results = []
             
             # Check Table3 first (most complete for Triton responses)
-            for table in root.findall('.//Table3'):
-                all_results.append(('Table3', table))
+            for row in dataset.rows('Table3'):
+                all_results.append(('Table3', row))
             # Then Table2
-            for table in root.findall('.//Table2'):
-                all_results.append(('Table2', table))
+            for row in dataset.rows('Table2'):
+                all_results.append(('Table2', row))
             # Then Table1
-            for table in root.findall('.//Table1'):
-                all_results.append(('Table1', table))
+            for row in dataset.rows('Table1'):
+                all_results.append(('Table1', row))
             # Finally plain Table
-            for table in root.findall('.//Table'):
-                all_results.append(('Table', table))
+            for row in dataset.rows('Table'):
+                all_results.append(('Table', row))
             
             best_result = None
             best_score = 0
             
-            for table_name, table in all_results:
+            for table_name, row in all_results:
                 # Try to extract structured fields
                 result_data = {}
                 
                 # Extract Result (0 or 1)
-                result_elem = table.find('Result')
-                if result_elem is not None and result_elem.text:
-                    result_data['Result'] = result_elem.text.strip()
+                result_value = stripped(row, 'Result')
+                if result_value is not None:
+                    result_data['Result'] = result_value
                 
                 # Extract Message
-                message_elem = table.find('Message')
-                if message_elem is not None and message_elem.text:
-                    result_data['Message'] = message_elem.text.strip()
+                message_value = stripped(row, 'Message')
+                if message_value is not None:
+                    result_data['Message'] = message_value
                 
                 # Extract NewQuoteGuid (the new quote created for reinstatement)
-                new_guid_elem = table.find('NewQuoteGuid')
-                if new_guid_elem is not None and new_guid_elem.text:
-                    result_data['NewQuoteGuid'] = new_guid_elem.text.strip()
+                new_guid_value = stripped(row, 'NewQuoteGuid')
+                if new_guid_value is not None:
+                    result_data['NewQuoteGuid'] = new_guid_value
                 
                 # Extract QuoteOptionGuid or NewQuoteOptionGuid (stored procedure returns it as NewQuoteOptionGuid)
-                option_guid_elem = table.find('NewQuoteOptionGuid')
-                if option_guid_elem is not None and option_guid_elem.text:
-                    result_data['QuoteOptionGuid'] = option_guid_elem.text.strip()
-                    result_data['NewQuoteOptionGuid'] = option_guid_elem.text.strip()
+                option_guid_value = stripped(row, 'NewQuoteOptionGuid')
+                if option_guid_value is not None:
+                    result_data['QuoteOptionGuid'] = option_guid_value
+                    result_data['NewQuoteOptionGuid'] = option_guid_value
                 else:
                     # Fallback to check for QuoteOptionGuid (alternative name)
-                    option_guid_elem = table.find('QuoteOptionGuid')
-                    if option_guid_elem is not None and option_guid_elem.text:
-                        result_data['QuoteOptionGuid'] = option_guid_elem.text.strip()
+                    option_guid_value = stripped(row, 'QuoteOptionGuid')
+                    if option_guid_value is not None:
+                        result_data['QuoteOptionGuid'] = option_guid_value
                 
                 # Extract OriginalQuoteGuid
-                original_guid_elem = table.find('OriginalQuoteGuid')
-                if original_guid_elem is not None and original_guid_elem.text:
-                    result_data['OriginalQuoteGuid'] = original_guid_elem.text.strip()
+                original_guid_value = stripped(row, 'OriginalQuoteGuid')
+                if original_guid_value is not None:
+                    result_data['OriginalQuoteGuid'] = original_guid_value
                 
                 # Extract CancellationQuoteGuid or CancelledQuoteGuid
-                cancellation_guid_elem = table.find('CancellationQuoteGuid')
-                if cancellation_guid_elem is not None and cancellation_guid_elem.text:
-                    result_data['CancellationQuoteGuid'] = cancellation_guid_elem.text.strip()
+                cancellation_guid_value = stripped(row, 'CancellationQuoteGuid')
+                if cancellation_guid_value is not None:
+                    result_data['CancellationQuoteGuid'] = cancellation_guid_value
                 else:
                     # Also check for CancelledQuoteGuid (from Triton_ProcessFlatReinstatement_WS)
-                    cancelled_guid_elem = table.find('CancelledQuoteGuid')
-                    if cancelled_guid_elem is not None and cancelled_guid_elem.text:
+                    cancelled_guid_value = stripped(row, 'CancelledQuoteGuid')
+                    if cancelled_guid_value is not None:
                         # Map CancelledQuoteGuid to both CancellationQuoteGuid and OriginalQuoteGuid
                         # Since for reinstatements, the cancelled quote IS the original
-                        result_data['CancellationQuoteGuid'] = cancelled_guid_elem.text.strip()
-                        result_data['OriginalQuoteGuid'] = cancelled_guid_elem.text.strip()
-                        result_data['CancelledQuoteGuid'] = cancelled_guid_elem.text.strip()
+                        result_data['CancellationQuoteGuid'] = cancelled_guid_value
+                        result_data['OriginalQuoteGuid'] = cancelled_guid_value
+                        result_data['CancelledQuoteGuid'] = cancelled_guid_value
                 
                 # Extract PolicyNumber
-                policy_num_elem = table.find('PolicyNumber')
-                if policy_num_elem is not None and policy_num_elem.text:
-                    result_data['PolicyNumber'] = policy_num_elem.text.strip()
+                policy_num_value = stripped(row, 'PolicyNumber')
+                if policy_num_value is not None:
+                    result_data['PolicyNumber'] = policy_num_value
                 
                 # Extract ControlNo
-                control_no_elem = table.find('ControlNo')
-                if control_no_elem is not None and control_no_elem.text:
-                    result_data['ControlNo'] = control_no_elem.text.strip()
+                control_no_value = stripped(row, 'ControlNo')
+                if control_no_value is not None:
+                    result_data['ControlNo'] = control_no_value
                 
                 # Extract ReinstatementNumber
-                reinstatement_num_elem = table.find('ReinstatementNumber')
-                if reinstatement_num_elem is not None and reinstatement_num_elem.text:
-                    result_data['ReinstatementNumber'] = reinstatement_num_elem.text.strip()
+                reinstatement_num_value = stripped(row, 'ReinstatementNumber')
+                if reinstatement_num_value is not None:
+                    result_data['ReinstatementNumber'] = reinstatement_num_value
                 
                 # Extract ReinstatementPremium
-                reinstatement_premium_elem = table.find('ReinstatementPremium')
-                if reinstatement_premium_elem is not None and reinstatement_premium_elem.text:
-                    result_data['ReinstatementPremium'] = reinstatement_premium_elem.text.strip()
+                reinstatement_premium_value = stripped(row, 'ReinstatementPremium')
+                if reinstatement_premium_value is not None:
+                    result_data['ReinstatementPremium'] = reinstatement_premium_value
                 
                 # Extract ReinstatementEffectiveDate
-                reinstatement_date_elem = table.find('ReinstatementEffectiveDate')
-                if reinstatement_date_elem is not None and reinstatement_date_elem.text:
-                    result_data['ReinstatementEffectiveDate'] = reinstatement_date_elem.text.strip()
+                reinstatement_date_value = stripped(row, 'ReinstatementEffectiveDate')
+                if reinstatement_date_value is not None:
+                    result_data['ReinstatementEffectiveDate'] = reinstatement_date_value
                 
                 # Extract CancellationRefund
-                cancellation_refund_elem = table.find('CancellationRefund')
-                if cancellation_refund_elem is not None and cancellation_refund_elem.text:
-                    result_data['CancellationRefund'] = cancellation_refund_elem.text.strip()
+                cancellation_refund_value = stripped(row, 'CancellationRefund')
+                if cancellation_refund_value is not None:
+                    result_data['CancellationRefund'] = cancellation_refund_value
                 
                 # Extract NetPremiumChange
-                net_change_elem = table.find('NetPremiumChange')
-                if net_change_elem is not None and net_change_elem.text:
-                    result_data['NetPremiumChange'] = net_change_elem.text.strip()
+                net_change_value = stripped(row, 'NetPremiumChange')
+                if net_change_value is not None:
+                    result_data['NetPremiumChange'] = net_change_value
                 
                 # Score this result based on completeness
                 score = 0
@@ -282,12 +279,9 @@ class IMSReinstatementService(BaseIMSService):
                 return best_result
             
             # If no recognized format, log what we found
-            logger.warning(f"Unrecognized reinstatement result format. XML: {result_xml}")
+            logger.warning(f"Unrecognized reinstatement result format. XML: {dataset.xml}")
             return None
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse reinstatement procedure result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing reinstatement procedure result: {str(e)}")
             return None
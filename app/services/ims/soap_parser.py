@@ -0,0 +1,168 @@
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional, Union
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+try:
+    from config import IMS_CONFIG
+except ImportError:
+    # Fall back to defaults if config.py can't be loaded (see auth_service)
+    IMS_CONFIG = {}
+
+logger = logging.getLogger(__name__)
+
+# Prefixes usable in SoapPath expressions
+NAMESPACES = {
+    "soap": "http://schemas.xmlsoap.org/soap/envelope/",
+    "logon": "http://tempuri.org/IMSWebServices/Logon",
+    "insured": "http://tempuri.org/IMSWebServices/InsuredFunctions",
+    "quote": "http://tempuri.org/IMSWebServices/QuoteFunctions",
+    "data": "http://tempuri.org/IMSWebServices/DataAccess",
+    "bo": "http://ws.mgasystems.com/BusinessObjects"
+}
+
+BACKENDS = ("lxml", "etree")
+
+
+class SoapParseError(ValueError):
+    """The SOAP response is not well-formed XML."""
+
+
+class SoapPath:
+    """
+    An ElementTree-style path (".//quote:BindQuoteResult", "bo:LineGuid")
+    into a SOAP response, compiled once per response type.
+
+    Under lxml the path becomes an XPath expression, compiled on first use
+    in each thread (compiled XPath objects are not shared across threads);
+    under ElementTree it is handed to Element.find, which caches its own
+    compiled form. Either way the node passed in decides which is used.
+    """
+
+    __slots__ = ("path", "_local")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def find(self, node: Any) -> Any:
+        """First matching element under node, or None."""
+        if lxml_etree is not None and isinstance(node, lxml_etree._Element):
+            xpath = getattr(self._local, "xpath", None)
+            if xpath is None:
+                xpath = self._local.xpath = lxml_etree.XPath(
+                    f"({self.path})[1]", namespaces=NAMESPACES, smart_strings=False
+                )
+            matches = xpath(node)
+            return matches[0] if matches else None
+        return node.find(self.path, NAMESPACES)
+
+    def text(self, node: Any) -> Optional[str]:
+        """Text of the first matching element, or None when it is missing or empty."""
+        element = self.find(node)
+        return element.text if element is not None else None
+
+
+FAULT = SoapPath(".//soap:Fault")
+FAULT_STRING = SoapPath("faultstring")
+
+
+def _parse_etree(xml: Union[str, bytes]) -> Any:
+    try:
+        return ET.fromstring(xml)
+    except ET.ParseError as e:
+        raise SoapParseError(str(e)) from e
+
+
+_lxml_parsers = threading.local()
+
+
+def _parse_lxml(xml: Union[str, bytes]) -> Any:
+    # One parser per thread; entities and network access stay off as with
+    # untrusted input. Text is handed over as UTF-8 bytes because lxml
+    # refuses str documents that carry an encoding declaration.
+    parsers = getattr(_lxml_parsers, "parsers", None)
+    if parsers is None:
+        options = dict(resolve_entities=False, no_network=True)
+        parsers = _lxml_parsers.parsers = (
+            lxml_etree.XMLParser(**options),
+            lxml_etree.XMLParser(encoding="utf-8", **options)
+        )
+    try:
+        if isinstance(xml, str):
+            return lxml_etree.fromstring(xml.encode("utf-8"), parsers[1])
+        return lxml_etree.fromstring(xml, parsers[0])
+    except lxml_etree.XMLSyntaxError as e:
+        raise SoapParseError(str(e)) from e
+
+
+_PARSERS: Dict[str, Callable[[Union[str, bytes]], Any]] = {"etree": _parse_etree}
+if lxml_etree is not None:
+    _PARSERS["lxml"] = _parse_lxml
+
+_backend = "etree"
+
+
+def available_backends() -> List[str]:
+    """Backends that can be used in this process, fastest first."""
+    return [name for name in BACKENDS if name in _PARSERS]
+
+
+def use_backend(name: str) -> str:
+    """
+    Select the XML backend for parse().
+
+    Args:
+        name: "lxml", "etree" or "auto" (lxml when installed)
+
+    Returns:
+        str: The backend now in use
+    """
+    global _backend
+    name = (name or "auto").lower()
+    if name == "auto":
+        name = available_backends()[0]
+    elif name not in BACKENDS:
+        raise ValueError(f"Unknown XML backend '{name}' (expected auto, {', '.join(BACKENDS)})")
+    elif name not in _PARSERS:
+        logger.warning(f"XML backend '{name}' is not installed; using etree")
+        name = "etree"
+    _backend = name
+    return name
+
+
+def get_backend() -> str:
+    """Name of the XML backend parse() uses."""
+    return _backend
+
+
+def parse(xml: Union[str, bytes]) -> Any:
+    """
+    Parse a SOAP response with the selected backend.
+
+    Args:
+        xml: The response body (text or bytes)
+
+    Returns:
+        The root element; query it with SoapPath
+
+    Raises:
+        SoapParseError: The response is not well-formed XML
+    """
+    return _PARSERS[_backend](xml)
+
+
+def fault_message(root: Any) -> Optional[str]:
+    """The faultstring of a SOAP fault in the response, or None when there is no fault."""
+    fault = FAULT.find(root)
+    if fault is None:
+        return None
+    return FAULT_STRING.text(fault) or "Unknown SOAP fault"
+
+
+use_backend(IMS_CONFIG.get("xml_backend", "auto"))
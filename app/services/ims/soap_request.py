@@ -0,0 +1,126 @@
+import re
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+LOGON_NAMESPACE = "http://tempuri.org/IMSWebServices/Logon"
+INSURED_FUNCTIONS_NAMESPACE = "http://tempuri.org/IMSWebServices/InsuredFunctions"
+QUOTE_FUNCTIONS_NAMESPACE = "http://tempuri.org/IMSWebServices/QuoteFunctions"
+DATA_ACCESS_NAMESPACE = "http://tempuri.org/IMSWebServices/DataAccess"
+
+CONTENT_TYPE = "text/xml; charset=utf-8"
+
+_ENVELOPE = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+{header}<soap:Body><{action} xmlns="{namespace}">{body}</{action}></soap:Body></soap:Envelope>"""
+
+_TOKEN_HEADER = """<soap:Header><TokenHeader xmlns="{namespace}"><Token>{{token}}</Token><Context>RSG_Integration</Context></TokenHeader></soap:Header>"""
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+_BETWEEN_TAGS = re.compile(r">\s+<")
+
+
+def escape_xml(value: Any) -> bytes:
+    """
+    Escape a value for use as XML element text, as UTF-8 bytes.
+
+    The value is encoded first and escaped with bytes.replace, which scans
+    the whole buffer in C and hands the buffer back as is when there is
+    nothing to replace, so large values (the payload JSON) cost a few
+    passes of memchr and no copies beyond the escapes themselves.
+
+    Args:
+        value: Text, or anything str() accepts; None gives b""
+
+    Returns:
+        bytes: The escaped UTF-8 text
+    """
+    if value is None:
+        return b""
+    if not isinstance(value, str):
+        value = str(value)
+    return (value.encode("utf-8")
+            .replace(b"&", b"&amp;")
+            .replace(b"<", b"&lt;")
+            .replace(b">", b"&gt;")
+            .replace(b'"', b"&quot;")
+            .replace(b"'", b"&apos;"))
+
+
+def element(name: str, value: Any) -> bytes:
+    """<name>value</name> with the value escaped."""
+    return b"".join((b"<", name.encode("ascii"), b">", escape_xml(value), b"</", name.encode("ascii"), b">"))
+
+
+def string_array(values: Iterable[Any]) -> bytes:
+    """
+    The <string> items of an ArrayOfString parameter (ExecuteDataSet's
+    name/value list), built into one buffer.
+    """
+    chunks: List[bytes] = []
+    for value in values:
+        chunks += (b"<string>", escape_xml(str(value)), b"</string>")
+    return b"".join(chunks)
+
+
+def envelope_text(soap_request: Union[str, bytes, None]) -> str:
+    """A request envelope as text, for logs and error messages."""
+    if isinstance(soap_request, bytes):
+        return soap_request.decode("utf-8", "replace")
+    return soap_request or ""
+
+
+class SoapTemplate:
+    """
+    The request envelope of one SOAP action, compiled to bytes once.
+
+    The body holds {name} placeholders for the action's parameters (plus
+    {token} in the TokenHeader of authenticated actions). Whitespace
+    between tags is dropped when the template is compiled, so the body can
+    be laid out readably. render() then only escapes the values and joins
+    them with the precompiled chunks into the bytes sent to IMS.
+    """
+
+    def __init__(self, namespace: str, action: str, body: str, token_header: bool = True):
+        """
+        Args:
+            namespace: IMS service namespace (e.g. QUOTE_FUNCTIONS_NAMESPACE)
+            action: SOAP action, which is also the body element
+            body: Content of the action element, with {name} placeholders
+            token_header: Send the session token in a TokenHeader
+        """
+        self.namespace = namespace
+        self.action = action
+        self.soap_action = f"{namespace}/{action}"
+        text = _ENVELOPE.format(
+            header=_TOKEN_HEADER.format(namespace=namespace) if token_header else "",
+            action=action,
+            namespace=namespace,
+            body=_BETWEEN_TAGS.sub("><", body.strip())
+        )
+        pieces = _PLACEHOLDER.split(text)
+        self._head = pieces[0].encode("utf-8")
+        # (placeholder, literal bytes that follow it)
+        self._fields: Tuple[Tuple[str, bytes], ...] = tuple(
+            (pieces[i], pieces[i + 1].encode("utf-8")) for i in range(1, len(pieces), 2)
+        )
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """HTTP headers for the request (a new dict per call)."""
+        return {"Content-Type": CONTENT_TYPE, "SOAPAction": self.soap_action}
+
+    def render(self, **values: Any) -> bytes:
+        """
+        Fill in the placeholders.
+
+        Values are escaped (see escape_xml); bytes values are taken as
+        ready-made XML, e.g. from element() or string_array().
+
+        Returns:
+            bytes: The UTF-8 envelope, ready for the transport
+        """
+        chunks: List[bytes] = [self._head]
+        for name, literal in self._fields:
+            value = values[name]
+            chunks.append(value if isinstance(value, bytes) else escape_xml(value))
+            chunks.append(literal)
+        return b"".join(chunks)
@@ -0,0 +1,338 @@
+import atexit
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from app.services.ims.cassette import CassetteReplayAdapter, CassetteWriter
+from app.services.ims.unit_of_work import get_current_unit_of_work
+from app.utils.tracing import record_span
+
+try:
+    from config import IMS_CONFIG
+except ImportError:
+    # Fall back to defaults if config.py can't be loaded (see auth_service)
+    IMS_CONFIG = {}
+
+logger = logging.getLogger(__name__)
+
+# Read size for streamed response bodies (see IMSSoapTransport.iter_body)
+STREAM_CHUNK_SIZE = 65536
+
+
+class IMSSoapTransport:
+    """
+    Shared HTTP transport for all IMS SOAP calls.
+
+    Keeps one pooled keep-alive session per IMS endpoint (logon.asmx,
+    dataaccess.asmx, quotefunctions.asmx, ...) so consecutive calls in a
+    transaction reuse the same TCP/TLS connection instead of paying a new
+    handshake on every request.
+    """
+
+    def __init__(self, transport_config: Optional[Dict[str, Any]] = None):
+        config = transport_config or IMS_CONFIG.get("transport", {})
+        self.connect_timeout = config.get("connect_timeout", 5)
+        self.read_timeout = config.get("read_timeout", IMS_CONFIG.get("timeout", 30))
+        self.pool_block = config.get("pool_block", False)
+        self.default_pool_size = config.get("default_pool_size", 10)
+        self.pool_sizes = config.get("pool_sizes", {})
+
+        # Map "/dataaccess.asmx" -> "data_access" so URLs resolve to a pool key
+        self._endpoint_keys = {
+            path.strip("/").lower(): key
+            for key, path in IMS_CONFIG.get("endpoints", {}).items()
+        }
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._mounted_adapter: Optional[BaseAdapter] = None
+        self._recorder: Optional[CassetteWriter] = None
+        self._lock = threading.Lock()
+
+        cassette_mode = config.get("cassette_mode", "off")
+        if cassette_mode == "record":
+            self.start_recording(config["cassette_path"])
+        elif cassette_mode == "replay":
+            self.replay(config["cassette_path"], config.get("cassette_latency_scale", 1.0))
+
+    @property
+    def timeout(self):
+        """(connect, read) timeout tuple passed to requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def endpoint_key(self, url: str) -> str:
+        """Resolve the pool key for a request URL."""
+        path = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1].lower()
+        return self._endpoint_keys.get(path, path or "default")
+
+    def _get_session(self, key: str) -> requests.Session:
+        """Get (or lazily create) the pooled session for an endpoint."""
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                pool_size = self.pool_sizes.get(key, self.default_pool_size)
+                adapter = self._mounted_adapter or HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=pool_size,
+                    pool_block=self.pool_block,
+                    max_retries=0  # SOAP writes are not idempotent
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._adapters[key] = adapter
+                self._sessions[key] = session
+                self._stats[key] = {
+                    "pool_size": pool_size,
+                    "requests": 0,
+                    "errors": 0,
+                    "in_flight": 0,
+                    "bytes_sent": 0,
+                    "bytes_received": 0,
+                    "total_time_ms": 0.0
+                }
+                logger.info(f"Created IMS connection pool for {key} (size {pool_size})")
+        return session
+
+    def post(
+        self,
+        url: str,
+        data: Union[str, bytes],
+        headers: Dict[str, str],
+        timeout: Optional[Any] = None,
+        stream: bool = False
+    ) -> requests.Response:
+        """
+        POST a SOAP request over the pooled session for the URL's endpoint.
+
+        Raises the same requests exceptions as requests.post so callers keep
+        their existing error handling.
+
+        With stream=True a 200 response comes back with its body unread;
+        read it with iter_body(), which counts the received bytes and
+        completes the call's stats, span and cassette record. Other
+        responses (faults) are read here as usual.
+        """
+        soap_action = headers.get("SOAPAction", "")
+        uow = get_current_unit_of_work()
+        if uow is not None:
+            uow.note_soap_action(soap_action)
+
+        key = self.endpoint_key(url)
+        session = self._get_session(key)
+        body = data.encode("utf-8") if isinstance(data, str) else data
+        stats = self._stats[key]
+
+        with self._lock:
+            stats["in_flight"] += 1
+        start = time.perf_counter()
+        response = None
+        try:
+            response = session.post(
+                url,
+                data=body,
+                headers=headers,
+                timeout=timeout or self.timeout,
+                stream=stream
+            )
+        except requests.exceptions.RequestException:
+            with self._lock:
+                stats["errors"] += 1
+            self._finish(key, soap_action, body, None, None, start)
+            raise
+        if stream and response.status_code == 200:
+            # Finished by iter_body once the caller has read the body
+            response._ims_stream = (key, soap_action, body, start)
+            return response
+        self._finish(key, soap_action, body, response, response.content, start)
+        return response
+
+    def iter_body(self, response: requests.Response, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Read the body of a post(..., stream=True) response chunk by chunk.
+
+        Only the current chunk is held (plus the whole body while a cassette
+        is recording). The call's stats, span and cassette record are
+        completed when the body has been read or the iterator is closed.
+        """
+        pending = getattr(response, "_ims_stream", None)
+        if pending is None:
+            # Not streamed (or a fault): the body was read by post()
+            yield response.content
+            return
+        response._ims_stream = None
+        key, soap_action, body, start = pending
+        recorded = [] if self._recorder is not None else None
+        received = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                received += len(chunk)
+                if recorded is not None:
+                    recorded.append(chunk)
+                yield chunk
+        finally:
+            response.close()
+            content = b"".join(recorded) if recorded is not None else None
+            self._finish(key, soap_action, body, response, content, start, received)
+
+    def _finish(self, key: str, soap_action: str, body: bytes, response: Optional[requests.Response],
+                content: Optional[bytes], start: float, response_bytes: Optional[int] = None):
+        """Count a completed call and record its span (and cassette entry when content is known)."""
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if response_bytes is None:
+            response_bytes = len(content) if content is not None else 0
+        stats = self._stats[key]
+        with self._lock:
+            stats["in_flight"] -= 1
+            stats["requests"] += 1
+            stats["bytes_sent"] += len(body)
+            stats["total_time_ms"] += elapsed_ms
+            stats["bytes_received"] += response_bytes
+        self._record_span(soap_action, body, response, response_bytes, key, start)
+        recorder = self._recorder
+        if recorder is not None and response is not None and content is not None:
+            recorder.write(soap_action, body, response.status_code, content, elapsed_ms)
+
+    def _record_span(self, soap_action: str, body: bytes, response: Optional[requests.Response],
+                     response_bytes: int, endpoint: str, start: float):
+        """Record the call as an "ims" span named after its SOAP action (and procedure)."""
+        action = soap_action.strip('"').rsplit("/", 1)[-1] or "unknown"
+        name = action
+        attributes = {"action": action, "endpoint": endpoint}
+        if action == "ExecuteDataSet":
+            begin = body.find(b"<procedureName>")
+            if begin != -1:
+                begin += len(b"<procedureName>")
+                procedure = body[begin:body.find(b"</procedureName>", begin)].decode("utf-8", "replace").strip()
+                name = f"{action}:{procedure}"
+                attributes["procedure"] = procedure
+
+        if response is None:
+            outcome = "error"
+        elif response.status_code >= 400:
+            outcome = "fault" if b"faultstring>" in response.content else "http_error"
+            attributes["http_status"] = response.status_code
+        else:
+            outcome = "ok"
+        record_span(name, start, kind="ims", outcome=outcome,
+                    request_bytes=len(body), response_bytes=response_bytes, **attributes)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-endpoint request counters and connection pool usage."""
+        with self._lock:
+            snapshot = {key: dict(values) for key, values in self._stats.items()}
+
+        for key, values in snapshot.items():
+            values["avg_time_ms"] = round(values["total_time_ms"] / values["requests"], 2) if values["requests"] else 0.0
+            values["total_time_ms"] = round(values["total_time_ms"], 2)
+            values.update(self._pool_usage(key))
+        return snapshot
+
+    def _pool_usage(self, key: str) -> Dict[str, int]:
+        """Read connection counts from the urllib3 pools behind an adapter."""
+        usage = {"connections_opened": 0, "connections_idle": 0, "pooled_requests": 0}
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            return usage
+        try:
+            for pool in list(adapter.poolmanager.pools._container.values()):
+                usage["connections_opened"] += pool.num_connections
+                usage["pooled_requests"] += pool.num_requests
+                if pool.pool is not None:
+                    usage["connections_idle"] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        except Exception as e:
+            logger.debug(f"Could not read pool usage for {key}: {str(e)}")
+        return usage
+
+    def mount(self, adapter: Optional[BaseAdapter]):
+        """
+        Send every IMS request through adapter instead of the network pools.
+
+        For offline runs (benchmarks, recorded responses). Open sessions are
+        closed and recreated on the next request; pass None to go back to
+        the network.
+        """
+        self._mounted_adapter = adapter
+        self.close()
+
+    def start_recording(self, path: str) -> CassetteWriter:
+        """
+        Append every IMS call (response XML and latency) to a cassette file.
+
+        Args:
+            path: Cassette to create or append to (gzip-compressed JSON lines)
+
+        Returns:
+            The cassette writer
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        recorder = CassetteWriter(path)
+        atexit.register(recorder.close)
+        self.stop_recording()
+        self._recorder = recorder
+        return recorder
+
+    def stop_recording(self):
+        """Stop recording and close the cassette."""
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def replay(self, path: str, latency_scale: float = 1.0) -> CassetteReplayAdapter:
+        """
+        Answer every IMS call from a recorded cassette instead of the network.
+
+        Args:
+            path: Cassette written by start_recording
+            latency_scale: Multiple of the recorded latency to wait before answering (0: none)
+
+        Returns:
+            The replay adapter (its stats count exact, repeated, nearest and missing matches)
+        """
+        adapter = CassetteReplayAdapter(path, latency_scale)
+        self.mount(adapter)
+        return adapter
+
+    def get_cassette_stats(self) -> Optional[Dict[str, Any]]:
+        """Recording or replay state, or None when neither is active."""
+        recorder = self._recorder
+        if recorder is not None:
+            return {"mode": "record", "path": recorder.path, "calls": recorder.calls}
+        if isinstance(self._mounted_adapter, CassetteReplayAdapter):
+            adapter = self._mounted_adapter
+            return {"mode": "replay", "path": adapter.path, "calls": len(adapter.calls), **adapter.stats}
+        return None
+
+    def close(self):
+        """Close all pooled connections."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._adapters.clear()
+        logger.info("Closed IMS connection pools")
+
+
+# Singleton instance
+_soap_transport = None
+_soap_transport_lock = threading.Lock()
+
+
+def get_soap_transport() -> IMSSoapTransport:
+    """Get singleton instance of the shared SOAP transport."""
+    global _soap_transport
+    if _soap_transport is None:
+        with _soap_transport_lock:
+            if _soap_transport is None:
+                _soap_transport = IMSSoapTransport()
+    return _soap_transport
@@ -1,15 +1,24 @@
 import logging
-import xml.etree.ElementTree as ET
 from typing import Optional, Tuple, Dict, Any
 
 from app.services.ims.base_service import BaseIMSService
 from app.services.ims.auth_service import get_auth_service
 from app.services.ims.data_access_service import get_data_access_service
+from app.services.ims.dataset import DataSet, stripped
+from app.services.ims import soap_parser
+from app.services.ims.soap_request import QUOTE_FUNCTIONS_NAMESPACE, SoapTemplate
 from config import IMS_CONFIG
-import requests
 
 logger = logging.getLogger(__name__)
 
+UNBIND_POLICY = SoapTemplate(QUOTE_FUNCTIONS_NAMESPACE, "UnbindPolicy", """
+      <QuoteGuid>{quote_guid}</QuoteGuid>
+      <UserGuid>{user_guid}</UserGuid>
+      <KeepPolicyNumbers>{keep_policy_numbers}</KeepPolicyNumbers>
+      <KeepAffidavitNumbers>{keep_affidavit_numbers}</KeepAffidavitNumbers>
+""")
+UNBIND_POLICY_RESULT = soap_parser.SoapPath(".//quote:UnbindPolicyResult")
+
 
 class IMSUnbindService(BaseIMSService):
     """Service for unbinding policies in IMS."""
@@ -56,7 +65,7 @@ class IMSUnbindService(BaseIMSService):
             ]
             
             # Call the stored procedure
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_UnbindPolicy",
                 parameters=params
             )
@@ -65,7 +74,7 @@ class IMSUnbindService(BaseIMSService):
                 return False, f"Failed to execute unbind procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_unbind_procedure_result(result_xml)
+            result_data = self._parse_unbind_procedure_result(dataset)
             
             if result_data and result_data.get("Result") == "1":
                 logger.info(f"Successfully unbound policy for quote {quote_guid}")
@@ -110,7 +119,7 @@ class IMSUnbindService(BaseIMSService):
             ]
             
             # Call the stored procedure
-            success, result_xml, message = self.data_service.execute_dataset(
+            success, dataset, message = self.data_service.query_dataset(
                 procedure_name="Triton_UnbindPolicy",
                 parameters=params
             )
@@ -119,7 +128,7 @@ class IMSUnbindService(BaseIMSService):
                 return False, {}, f"Failed to execute unbind procedure: {message}"
             
             # Parse the result
-            result_data = self._parse_unbind_procedure_result(result_xml)
+            result_data = self._parse_unbind_procedure_result(dataset)
             
             if result_data and result_data.get("Result") == "1":
                 logger.info(f"Successfully unbound policy. QuoteGuid: {result_data.get('QuoteGuid')}, PolicyNumber: {result_data.get('PolicyNumber')}")
@@ -134,28 +143,15 @@ class IMSUnbindService(BaseIMSService):
             logger.error(error_msg, exc_info=True)
             return False, {}, error_msg
     
-    def _build_unbind_request(self, quote_guid: str, user_guid: str, keep_policy_numbers: bool, keep_affidavit_numbers: bool, token: str) -> str:
+    def _build_unbind_request(self, quote_guid: str, user_guid: str, keep_policy_numbers: bool, keep_affidavit_numbers: bool, token: str) -> bytes:
         """Build the SOAP request for UnbindPolicy."""
-        keep_policy_str = "true" if keep_policy_numbers else "false"
-        keep_affidavit_str = "true" if keep_affidavit_numbers else "false"
-        
-        return f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <UnbindPolicy xmlns="http://tempuri.org/IMSWebServices/QuoteFunctions">
-      <QuoteGuid>{quote_guid}</QuoteGuid>
-      <UserGuid>{user_guid}</UserGuid>
-      <KeepPolicyNumbers>{keep_policy_str}</KeepPolicyNumbers>
-      <KeepAffidavitNumbers>{keep_affidavit_str}</KeepAffidavitNumbers>
-    </UnbindPolicy>
-  </soap:Body>
-</soap:Envelope>"""
+        return UNBIND_POLICY.render(
+            token=token,
+            quote_guid=quote_guid,
+            user_guid=user_guid,
+            keep_policy_numbers="true" if keep_policy_numbers else "false",
+            keep_affidavit_numbers="true" if keep_affidavit_numbers else "false"
+        )
     
     def _parse_unbind_response(self, response_text: str) -> Tuple[bool, str]:
         """
@@ -169,10 +165,10 @@ class IMSUnbindService(BaseIMSService):
         """
         try:
             # Parse the XML
-            root = ET.fromstring(response_text)
+            root = soap_parser.parse(response_text)
             
             # Find UnbindPolicyResult
-            unbind_result = root.find('.//{http://tempuri.org/IMSWebServices/QuoteFunctions}UnbindPolicyResult')
+            unbind_result = UNBIND_POLICY_RESULT.find(root)
             
             if unbind_result is not None:
                 # Check if result is "1" (success) or "0" (failure)
@@ -183,10 +179,8 @@ class IMSUnbindService(BaseIMSService):
                     return False, "Unbind failed - quote may not be bound or other error occurred"
             
             # Check for fault
-            fault = root.find('.//soap:Fault', {'soap': 'http://schemas.xmlsoap.org/soap/envelope/'})
-            if fault is not None:
-                fault_string = fault.find('faultstring')
-                error_msg = fault_string.text if fault_string is not None else "Unknown SOAP fault"
+            error_msg = soap_parser.fault_message(root)
+            if error_msg is not None:
                 return False, f"SOAP Fault: {error_msg}"
             
             return False, "No UnbindPolicyResult found in response"
@@ -196,52 +190,33 @@ class IMSUnbindService(BaseIMSService):
             logger.error(error_msg)
             return False, error_msg
     
-    def _parse_unbind_procedure_result(self, result_xml: str) -> Optional[Dict[str, Any]]:
+    def _parse_unbind_procedure_result(self, dataset: Optional[DataSet]) -> Optional[Dict[str, Any]]:
         """
         Parse the result from Triton_UnbindPolicy_WS stored procedure.
         Handles both simple numeric results and structured results.
         
         Args:
-            result_xml: The XML result from ExecuteDataSet
+            dataset: The DataSet from ExecuteDataSet
             
         Returns:
             Dict containing the result data or None if parsing fails
         """
         try:
-            if not result_xml:
+            if not dataset:
                 return None
-                
-            # Parse the XML
-            root = ET.fromstring(result_xml)
             
             # Check all Table elements, as the result might be in Table2 or later
-            tables = root.findall('.//Table2')  # Check Table2 first
-            if not tables:
-                tables = root.findall('.//Table')  # Fall back to Table
+            rows = dataset.rows('Table2')  # Check Table2 first
+            if not rows:
+                rows = dataset.rows('Table')  # Fall back to Table
             
-            for table in tables:
-                # Try to extract structured fields
+            for row in rows:
+                # Try to extract structured fields: Result (0 or 1), Message, QuoteGuid, PolicyNumber
                 result_data = {}
-                
-                # Extract Result (0 or 1)
-                result_elem = table.find('Result')
-                if result_elem is not None and result_elem.text:
-                    result_data['Result'] = result_elem.text.strip()
-                
-                # Extract Message
-                message_elem = table.find('Message')
-                if message_elem is not None and message_elem.text:
-                    result_data['Message'] = message_elem.text.strip()
-                
-                # Extract QuoteGuid
-                quote_guid_elem = table.find('QuoteGuid')
-                if quote_guid_elem is not None and quote_guid_elem.text:
-                    result_data['QuoteGuid'] = quote_guid_elem.text.strip()
-                
-                # Extract PolicyNumber
-                policy_num_elem = table.find('PolicyNumber')
-                if policy_num_elem is not None and policy_num_elem.text:
-                    result_data['PolicyNumber'] = policy_num_elem.text.strip()
+                for column in ('Result', 'Message', 'QuoteGuid', 'PolicyNumber'):
+                    value = stripped(row, column)
+                    if value is not None:
+                        result_data[column] = value
                 
                 # If we got structured data with Result field, return it
                 if 'Result' in result_data:
@@ -249,11 +224,12 @@ class IMSUnbindService(BaseIMSService):
                     return result_data
             
             # If no Table2, check all tables for simple numeric result
-            all_tables = root.findall('.//*[starts-with(local-name(), "Table")]')
-            for table in all_tables:
-                # Check for simple numeric result (legacy format)
-                for child in table:
-                    if child.text and child.text.strip() == "1":
+            for table_name in dataset.table_names:
+                if not table_name.startswith("Table"):
+                    continue
+                for row in dataset.rows(table_name):
+                    # Check for simple numeric result (legacy format)
+                    if any(value and value.strip() == "1" for value in row.values()):
                         logger.debug("Found simple numeric result: 1")
                         return {
                             'Result': '1',
@@ -261,12 +237,9 @@ class IMSUnbindService(BaseIMSService):
                         }
             
             # If no recognized format, log what we found
-            logger.warning(f"Unrecognized result format. XML: {result_xml}")
+            logger.warning(f"Unrecognized result format. XML: {dataset.xml}")
             return None
             
-        except ET.ParseError as e:
-            logger.error(f"Failed to parse unbind procedure result XML: {str(e)}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing unbind procedure result: {str(e)}")
             return None
@@ -1,11 +1,15 @@
 import logging
 import requests
-import xml.etree.ElementTree as ET
-from typing import Dict, Optional, Tuple
-from xml.sax.saxutils import unescape
+from typing import Dict, List, Optional, Tuple
 
 from app.services.ims.auth_service import get_auth_service
-from config import IMS_CONFIG
+from app.services.ims.base_service import ThreadLocalAttribute
+from app.services.ims.data_access_service import EXECUTE_DATASET
+from app.services.ims.dataset import decode_dataset_response
+from app.services.ims.reference_data_service import get_reference_data_service
+from app.services.ims.soap_request import envelope_text, string_array
+from app.utils.lookup_cache import get_lookup_cache
+from config import IMS_CONFIG, CACHE_CONFIG
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +17,18 @@ logger = logging.getLogger(__name__)
 class IMSUnderwriterService:
     """Service for handling IMS Underwriter operations."""
     
+    # Per-call diagnostics, kept per thread since the service is shared
+    _last_soap_request = ThreadLocalAttribute()
+    _last_soap_response = ThreadLocalAttribute()
+    _last_url = ThreadLocalAttribute()
+    
     def __init__(self):
         self.base_url = IMS_CONFIG["base_url"]
         self.services_env = IMS_CONFIG.get("environments", {}).get("services", "/ims_one")
         self.endpoint = IMS_CONFIG["endpoints"]["data_access"]
-        self.timeout = IMS_CONFIG["timeout"]
         self.auth_service = get_auth_service()
+        # Shared by every handler; persisted (if configured) for other worker processes
+        self.underwriter_cache = get_lookup_cache("underwriter")
         self._last_soap_request = None
         self._last_soap_response = None
         self._last_url = None
@@ -33,6 +43,52 @@ class IMSUnderwriterService:
         Returns:
             Tuple[bool, Optional[str], str]: (success, underwriter_guid, message)
         """
+        # Resolve from the local underwriter snapshot when it knows the name
+        underwriter_guid = get_reference_data_service().find_underwriter(underwriter_name)
+        if underwriter_guid:
+            logger.info(f"Found underwriter '{underwriter_name}' in reference data: {underwriter_guid}")
+            return True, underwriter_guid, f"Found underwriter: {underwriter_name} (reference data)"
+        
+        cache_key = self.underwriter_cache.normalize_key(underwriter_name)
+        hit, negative, cached = self.underwriter_cache.get(cache_key)
+        if hit:
+            if negative:
+                return False, None, cached
+            logger.info(f"Found underwriter '{underwriter_name}' in cache: {cached}")
+            return True, cached, f"Found underwriter: {underwriter_name} (cached)"
+        
+        success, underwriter_guid, message = self._lookup_underwriter_by_name(underwriter_name)
+        if success:
+            self.underwriter_cache.set(cache_key, underwriter_guid)
+        elif message.startswith((f"Underwriter '{underwriter_name}' not found", "No underwriter found")):
+            self.underwriter_cache.set_negative(cache_key, message)
+        return success, underwriter_guid, message
+    
+    def prewarm_cache(self, underwriter_names: Optional[List[str]] = None) -> int:
+        """
+        Resolve underwriters ahead of the first transaction that needs them.
+        
+        Args:
+            underwriter_names: Names to load; defaults to CACHE_CONFIG["underwriter"]["prewarm"]
+            
+        Returns:
+            Number of underwriters resolved
+        """
+        if underwriter_names is None:
+            underwriter_names = CACHE_CONFIG.get("underwriter", {}).get("prewarm", [])
+        
+        resolved = 0
+        for name in underwriter_names:
+            success, _, message = self.get_underwriter_by_name(name)
+            if success:
+                resolved += 1
+            else:
+                logger.warning(f"Could not prewarm underwriter '{name}': {message}")
+        logger.info(f"Prewarmed underwriter cache with {resolved}/{len(underwriter_names)} underwriters")
+        return resolved
+    
+    def _lookup_underwriter_by_name(self, underwriter_name: str) -> Tuple[bool, Optional[str], str]:
+        """Run getUserbyName for a name (uncached)."""
         try:
             # Ensure we have a valid token
             token = self.auth_service.token
@@ -40,48 +96,29 @@ class IMSUnderwriterService:
                 return False, None, "Failed to authenticate with IMS"
             
             # Construct SOAP request for ExecuteDataSet
-            soap_request = f'''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" 
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema" 
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Header>
-    <TokenHeader xmlns="http://tempuri.org/IMSWebServices/DataAccess">
-      <Token>{token}</Token>
-      <Context>RSG_Integration</Context>
-    </TokenHeader>
-  </soap:Header>
-  <soap:Body>
-    <ExecuteDataSet xmlns="http://tempuri.org/IMSWebServices/DataAccess">
-      <procedureName>getUserbyName</procedureName>
-      <parameters>
-        <string>fullname</string>
-        <string>{self._escape_xml(underwriter_name)}</string>
-      </parameters>
-    </ExecuteDataSet>
-  </soap:Body>
-</soap:Envelope>'''
-            
-            # Prepare headers
-            headers = {
-                'Content-Type': 'text/xml; charset=utf-8',
-                'SOAPAction': 'http://tempuri.org/IMSWebServices/DataAccess/ExecuteDataSet'
-            }
+            soap_request = EXECUTE_DATASET.render(
+                token=token,
+                procedure="getUserbyName",
+                parameters=string_array(("fullname", underwriter_name))
+            )
+            headers = EXECUTE_DATASET.headers
             
             # Make request
             url = f"{self.base_url}{self.services_env}{self.endpoint}"
             logger.info(f"Looking up underwriter: {underwriter_name}")
             logger.debug(f"SOAP Request URL: {url}")
-            logger.debug(f"SOAP Request:\n{soap_request}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"SOAP Request:\n{envelope_text(soap_request)}")
             
             # Store request details for error reporting
             self._last_url = url
             self._last_soap_request = soap_request
             
-            response = requests.post(
+            response = self.auth_service.post_with_token_retry(
                 url,
-                data=soap_request,
-                headers=headers,
-                timeout=self.timeout
+                soap_request,
+                headers,
+                token
             )
             
             # Store response for error reporting
@@ -101,7 +138,7 @@ class IMSUnderwriterService:
             if self._last_url:
                 detailed_msg += f"\n\nRequest URL: {self._last_url}"
             if self._last_soap_request:
-                detailed_msg += f"\n\nSOAP Request Sent:\n{self._last_soap_request}"
+                detailed_msg += f"\n\nSOAP Request Sent:\n{envelope_text(self._last_soap_request)}"
             if hasattr(e, 'response') and e.response is not None:
                 detailed_msg += f"\n\nHTTP Response Status: {e.response.status_code}"
                 detailed_msg += f"\n\nHTTP Response Body:\n{e.response.text}"
@@ -123,49 +160,25 @@ class IMSUnderwriterService:
             Tuple[bool, Optional[str], str]: (success, underwriter_guid, message)
         """
         try:
-            # Parse XML
-            root = ET.fromstring(response_xml)
-            
-            # Define namespaces
-            namespaces = {
-                'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'ims': 'http://tempuri.org/IMSWebServices/DataAccess'
-            }
-            
-            # Find ExecuteDataSetResult
-            result = root.find('.//ims:ExecuteDataSetResult', namespaces)
-            
-            if result is None:
-                return False, None, "ExecuteDataSetResult not found in response"
-            
-            # The result contains escaped XML, need to unescape it
-            result_xml = result.text
-            if result_xml:
-                # Unescape the XML content
-                result_xml = unescape(result_xml)
-                
-                # Parse the inner XML
-                result_root = ET.fromstring(result_xml)
-                
-                # Find the Table element containing UserGUID
-                table = result_root.find('.//Table')
-                if table is not None:
-                    user_guid = table.find('UserGUID')
-                    if user_guid is not None and user_guid.text:
-                        underwriter_guid = user_guid.text
-                        logger.info(f"Found underwriter '{underwriter_name}' with GUID: {underwriter_guid}")
-                        return True, underwriter_guid, f"Found underwriter: {underwriter_name}"
-                    else:
-                        return False, None, f"Underwriter '{underwriter_name}' not found"
+            success, dataset, message = decode_dataset_response(response_xml, "getUserbyName")
+            if not success:
+                if message.startswith("No results returned"):
+                    return False, None, "No results returned from stored procedure"
+                logger.error(message)
+                return False, None, message
+            
+            # Find the Table row containing UserGUID
+            row = dataset.first()
+            if row is not None:
+                underwriter_guid = row.get('UserGUID')
+                if underwriter_guid:
+                    logger.info(f"Found underwriter '{underwriter_name}' with GUID: {underwriter_guid}")
+                    return True, underwriter_guid, f"Found underwriter: {underwriter_name}"
                 else:
-                    return False, None, f"No underwriter found with name: {underwriter_name}"
+                    return False, None, f"Underwriter '{underwriter_name}' not found"
             else:
-                return False, None, "No results returned from stored procedure"
+                return False, None, f"No underwriter found with name: {underwriter_name}"
                 
-        except ET.ParseError as e:
-            error_msg = f"Failed to parse XML response: {str(e)}"
-            logger.error(error_msg)
-            return False, None, error_msg
         except Exception as e:
             error_msg = f"Error processing underwriter response: {str(e)}"
             logger.error(error_msg)
@@ -193,17 +206,6 @@ class IMSUnderwriterService:
             return success, guid, message
         
         return success, guid, message
-    
-    def _escape_xml(self, value: str) -> str:
-        """Escape special XML characters."""
-        if not value:
-            return ""
-        return (value
-                .replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&apos;"))
 
 
 # Singleton instance
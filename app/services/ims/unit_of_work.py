@@ -0,0 +1,176 @@
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.utils.payload_json import serialize_payload
+
+logger = logging.getLogger(__name__)
+
+
+# ExecuteDataSet procedures that only read. Their results are memoized for
+# the life of a unit of work; any other procedure (or SOAP write) clears
+# the memo since it may change what they return.
+READ_ONLY_PROCEDURES = {
+    "getProducerGuid",
+    "spGetQuoteByOpportunityID",
+    "spGetLatestQuoteByOpportunityID",
+    "spGetQuoteByPolicyNumber",
+    "spGetQuoteByOptionID",
+    "spGetQuoteByExpiringPolicyNumber",
+    "spCheckQuoteBoundStatus",
+    "spGetPolicyPremiumTotal",
+    "ryan_rptInvoice",
+    "getProducerContactList",
+    "getUserList"
+}
+
+# SOAP actions (other than ExecuteDataSet) that do not change IMS data
+READ_ONLY_SOAP_ACTIONS = {
+    "LoginIMSUser",
+    "FindInsuredByName"
+}
+
+
+class UnitOfWork:
+    """
+    Per-request memo of read-only IMS results.
+
+    Opened around one transaction (or API request). Identical read-only
+    ExecuteDataSet calls inside it are served from the memo; any write
+    invalidates it. It also keeps the serialized transaction payload and
+    which payloads IMS already stored, so the payload is encoded once and
+    sent to the database once.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._memo: Dict[Tuple[str, Tuple[str, ...]], Tuple[bool, Any, str]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"memo_hits": 0, "memo_misses": 0, "invalidations": 0}
+        # id(payload) -> (payload, JSON text, hash); the payload is kept so its id stays unique
+        self._payloads: Dict[int, Tuple[Any, str, str]] = {}
+        # transaction_id -> hash of the payload stored in tblTritonTransactionData
+        self._stored_payloads: Dict[str, str] = {}
+
+    def execute(self, procedure_name: str, parameters: Tuple[str, ...],
+                call: Callable[[], Tuple[bool, Any, str]]) -> Tuple[bool, Any, str]:
+        """
+        Run an ExecuteDataSet call through the memo.
+
+        Args:
+            procedure_name: Stored procedure name (without _WS suffix)
+            parameters: Stringified [name, value, ...] parameters
+            call: Performs the actual IMS call
+
+        Returns:
+            Tuple[bool, Any, str]: (success, dataset, message)
+        """
+        if procedure_name not in READ_ONLY_PROCEDURES:
+            self.invalidate(procedure_name)
+            return call()
+
+        key = (procedure_name, parameters)
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self.stats["memo_hits"] += 1
+        if cached is not None:
+            logger.debug(f"Serving {procedure_name} from unit of work memo")
+            return cached
+
+        result = call()
+        success, _, message = result
+        with self._lock:
+            self.stats["memo_misses"] += 1
+            # Keep results and "no rows" answers; transport/auth errors may be transient
+            if success or (message or "").startswith("No results returned"):
+                self._memo[key] = result
+        return result
+
+    def note_soap_action(self, soap_action: str):
+        """Invalidate the memo for SOAP calls that may write."""
+        action = (soap_action or "").strip('"').rsplit("/", 1)[-1]
+        if action and action != "ExecuteDataSet" and action not in READ_ONLY_SOAP_ACTIONS:
+            self.invalidate(action)
+
+    def serialize_payload(self, payload: Any) -> Tuple[str, str]:
+        """
+        Serialize a payload once for the life of the unit of work.
+
+        The payload is treated as read-only once the transaction starts.
+
+        Returns:
+            Tuple[str, str]: (compact JSON text, SHA-256 hex digest)
+        """
+        with self._lock:
+            cached = self._payloads.get(id(payload))
+        if cached is not None and cached[0] is payload:
+            return cached[1], cached[2]
+        payload_json, payload_hash = serialize_payload(payload)
+        with self._lock:
+            self._payloads[id(payload)] = (payload, payload_json, payload_hash)
+        return payload_json, payload_hash
+
+    def note_stored_payload(self, transaction_id: str, payload_hash: str):
+        """Record that IMS holds the payload with this hash for the transaction."""
+        with self._lock:
+            self._stored_payloads[transaction_id] = payload_hash
+
+    def stored_payload_hash(self, transaction_id: str) -> Optional[str]:
+        """Hash of the payload IMS stored for the transaction in this unit of work, if any."""
+        with self._lock:
+            return self._stored_payloads.get(transaction_id)
+
+    def invalidate(self, reason: str = ""):
+        """Drop every memoized result."""
+        with self._lock:
+            if self._memo:
+                self._memo.clear()
+                self.stats["invalidations"] += 1
+                logger.debug(f"Unit of work memo cleared by {reason}")
+
+
+_current_unit_of_work: contextvars.ContextVar[Optional[UnitOfWork]] = contextvars.ContextVar(
+    "ims_unit_of_work", default=None
+)
+
+
+def get_current_unit_of_work() -> Optional[UnitOfWork]:
+    """The unit of work open in the current context, if any."""
+    return _current_unit_of_work.get()
+
+
+def serialized_payload(payload: Any) -> Tuple[str, str]:
+    """
+    Compact JSON and hash of a payload, memoized in the current unit of work.
+
+    Returns:
+        Tuple[str, str]: (compact JSON text, SHA-256 hex digest)
+    """
+    uow = _current_unit_of_work.get()
+    if uow is None:
+        return serialize_payload(payload)
+    return uow.serialize_payload(payload)
+
+
+@contextmanager
+def unit_of_work(name: str = "") -> Iterator[UnitOfWork]:
+    """
+    Open a unit of work for the current context.
+
+    Nested calls reuse the outer unit of work. Work handed to other threads
+    must run in a copied context (contextvars.copy_context()) to share it.
+    """
+    current = _current_unit_of_work.get()
+    if current is not None:
+        yield current
+        return
+
+    uow = UnitOfWork(name)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _current_unit_of_work.reset(token)
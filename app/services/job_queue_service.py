@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.transaction_scheduler import TransactionScheduler, get_transaction_scheduler
+from config import JOB_QUEUE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionJobQueue:
+    """
+    Durable queue of Triton transactions, backed by SQLite.
+
+    Submitting persists the payload and returns a job id straight away; a
+    pool of worker threads runs TransactionHandler.process_transaction for
+    queued jobs and stores the result.
+
+    Several processes (uvicorn workers) can share one database: a job is
+    claimed inside a write transaction, so only one process runs it, and
+    the claiming process (owner) renews a lease on it while it runs. Jobs
+    whose lease has expired, because their process stopped, are put back
+    in the queue.
+
+    Jobs for the same opportunity run one at a time in submission order;
+    jobs for different opportunities run in parallel.
+
+    Job status: queued -> running -> completed | failed
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or JOB_QUEUE_CONFIG
+        self.db_path = Path(config.get("db_path", "data/transaction_jobs.db"))
+        self.workers = config.get("workers", 4)
+        self.poll_interval_seconds = config.get("poll_interval_seconds", 5)
+        self.retention_days = config.get("retention_days", 30)
+        self.lease_seconds = config.get("lease_seconds", 60)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._wakeup = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Submit / status
+    # ------------------------------------------------------------------
+
+    def submit(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Persist a transaction for background processing.
+
+        A transaction_id that is already queued, running or completed is not
+        queued again (webhook retries); its existing job is returned.
+
+        Args:
+            payload: The Triton transaction payload
+
+        Returns:
+            Tuple[Dict[str, Any], bool]: (job, created)
+        """
+        transaction_id = str(payload.get("transaction_id") or "")
+        now = datetime.utcnow().isoformat()
+
+        with self._lock, self._connect() as conn:
+            if transaction_id:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE transaction_id = ? AND status != 'failed' "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (transaction_id,)
+                ).fetchone()
+                if row is not None:
+                    logger.info(f"Transaction {transaction_id} already has job {row['job_id']} ({row['status']})")
+                    return self._to_job(row), False
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO jobs (job_id, transaction_id, transaction_type, partition_key, status, "
+                "payload, attempts, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, 0, ?, ?)",
+                (
+                    job_id,
+                    transaction_id,
+                    payload.get("transaction_type"),
+                    TransactionScheduler.partition_key(payload),
+                    json.dumps(payload, default=str),
+                    now,
+                    now
+                )
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+        logger.info(f"Queued transaction {transaction_id} as job {job_id}")
+        self.start_workers()
+        with self._wakeup:
+            self._wakeup.notify()
+        return self._to_job(row), True
+
+    def get_job(self, job_id: str, include_payload: bool = False) -> Optional[Dict[str, Any]]:
+        """Current state of a job (with its result once finished)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row, include_payload) if row is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Job counts by status and worker state."""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "owner": self.owner,
+            "workers": self.workers,
+            "workers_running": sum(1 for thread in self._threads if thread.is_alive()),
+            "jobs": {status: counts.get(status, 0) for status in ("queued", "running", "completed", "failed")}
+        }
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def start_workers(self):
+        """Requeue interrupted jobs and start the worker and lease threads (once)."""
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return
+            self._stop.clear()
+            self._requeue_interrupted()
+            self._purge_old_jobs()
+            self._threads = [
+                threading.Thread(target=self._worker_loop, name=f"transaction-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads.append(threading.Thread(target=self._lease_loop, name="transaction-job-lease", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} transaction job workers ({self.db_path})")
+
+    def stop_workers(self):
+        """Ask the workers to stop after their current job."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            job = self._claim_next()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval_seconds)
+                continue
+            self._run_job(job)
+
+    def _lease_loop(self):
+        """Renew the leases of this process's running jobs and requeue expired ones."""
+        interval = max(self.lease_seconds / 3, 1)
+        while not self._stop.wait(interval):
+            try:
+                with self._lock, self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+                        (datetime.utcnow().isoformat(), self.owner)
+                    )
+                self._requeue_interrupted()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew transaction job leases: {str(e)}")
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest runnable queued job as running and return it.
+
+        A job whose opportunity (partition) already has a running job waits,
+        so jobs for one opportunity run in the order they were queued. The
+        select and update run under BEGIN IMMEDIATE, which holds the database
+        write lock, so other processes cannot claim the same job.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND partition_key NOT IN "
+                "(SELECT partition_key FROM jobs WHERE status = 'running') "
+                "ORDER BY created_at, rowid LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = datetime.utcnow().isoformat()
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                "updated_at = ?, step = NULL, owner = ?, heartbeat_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (now, now, self.owner, now, row["job_id"])
+            ).rowcount
+            if claimed != 1:
+                return None
+            return self._to_job(row, include_payload=True)
+
+    def _run_job(self, job: Dict[str, Any]):
+        """Process one job and store its result."""
+        # Imported here: the handler pulls in every IMS service
+        from app.api.process_transaction import process_triton_transaction
+
+        job_id = job["job_id"]
+        logger.info(f"Job {job_id}: processing transaction {job['transaction_id']}")
+        try:
+            # Through the scheduler, so it is also ordered with API transactions for the same opportunity
+            future = get_transaction_scheduler().submit(
+                job["payload"],
+                lambda payload: process_triton_transaction(payload, progress=lambda step: self._set_step(job_id, step))
+            )
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed: {str(e)}", exc_info=True)
+            result = {"success": False, "message": f"Fatal error: {str(e)}", "error": str(e)}
+
+        status = "completed" if result.get("success") else "failed"
+        now = datetime.utcnow().isoformat()
+        with self._lock, self._connect() as conn:
+            stored = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, message = ?, completed_at = ?, updated_at = ?, "
+                "owner = NULL, heartbeat_at = NULL WHERE job_id = ? AND owner = ?",
+                (status, json.dumps(result, default=str), result.get("message"), now, now, job_id, self.owner)
+            ).rowcount
+        if not stored:
+            logger.error(f"Job {job_id} finished after its lease was lost; result not stored: {result.get('message')}")
+            return
+
+        log = logger.info if status == "completed" else logger.warning
+        log(f"Job {job_id} {status}: {result.get('message')}")
+
+    def _set_step(self, job_id: str, step: str):
+        """Record the workflow step a running job has just finished."""
+        try:
+            with self._lock, self._connect() as conn:
+                now = datetime.utcnow().isoformat()
+                conn.execute(
+                    "UPDATE jobs SET step = ?, updated_at = ?, heartbeat_at = ? WHERE job_id = ? AND owner = ?",
+                    (step, now, now, job_id, self.owner)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record progress of job {job_id}: {str(e)}")
+
+    def _requeue_interrupted(self):
+        """
+        Put running jobs whose lease has expired back in the queue.
+
+        Jobs still renewed by a live process (this one or another worker)
+        are left alone.
+        """
+        now = datetime.utcnow()
+        expired = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+        with self._connect() as conn:
+            count = conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, heartbeat_at = NULL, updated_at = ? "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (now.isoformat(), expired)
+            ).rowcount
+        if count:
+            logger.warning(f"Requeued {count} transaction jobs whose worker stopped")
+
+    def _purge_old_jobs(self):
+        """Delete finished jobs older than retention_days."""
+        if self.retention_days <= 0:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') "
+                "AND completed_at < datetime('now', ?)",
+                (f"-{self.retention_days} days",)
+            )
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, transaction_id TEXT, transaction_type TEXT, partition_key TEXT,
+            status TEXT NOT NULL, step TEXT, payload TEXT NOT NULL, result TEXT, message TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0, created_at TEXT NOT NULL, started_at TEXT,
+            completed_at TEXT, updated_at TEXT, owner TEXT, heartbeat_at TEXT)""")
+        if not self._schema_ready:
+            # Databases created before job leases
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("owner", "heartbeat_at"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+            conn.commit()
+            self._schema_ready = True
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_transaction_id ON jobs (transaction_id)")
+        return conn
+
+    def _to_job(self, row: sqlite3.Row, include_payload: bool = False) -> Dict[str, Any]:
+        job = {
+            "job_id": row["job_id"],
+            "transaction_id": row["transaction_id"],
+            "transaction_type": row["transaction_type"],
+            "status": row["status"],
+            "step": row["step"],
+            "attempts": row["attempts"],
+            "message": row["message"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "completed_at": row["completed_at"],
+            "status_url": f"/api/triton/transaction/jobs/{row['job_id']}"
+        }
+        if include_payload:
+            job["payload"] = json.loads(row["payload"])
+        return job
+
+
+# Singleton instance
+_job_queue_service = None
+_job_queue_service_lock = threading.Lock()
+
+
+def get_job_queue_service() -> TransactionJobQueue:
+    """Get singleton instance of the transaction job queue."""
+    global _job_queue_service
+    if _job_queue_service is None:
+        with _job_queue_service_lock:
+            if _job_queue_service is None:
+                _job_queue_service = TransactionJobQueue()
+    return _job_queue_service
@@ -1,5 +1,10 @@
+import asyncio
+import contextvars
 import logging
-from typing import Dict, Any, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, Tuple
 from datetime import datetime
 
 from app.services.ims.auth_service import get_auth_service
@@ -15,9 +20,40 @@ from app.services.ims.unbind_service import get_unbind_service
 from app.services.ims.endorsement_service import get_endorsement_service
 from app.services.ims.cancellation_service import get_cancellation_service
 from app.services.ims.reinstatement_service import get_reinstatement_service
+from app.services.ims.unit_of_work import unit_of_work
+from app.services.ims.deferred_invoice_service import get_deferred_invoice_service
+from app.services.transaction_scheduler import get_transaction_scheduler
+from app.utils.tracing import record_span, span, trace
+from config import APP_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Executor for the concurrent lookups inside a transaction. Kept separate
+# from the IMS executor that runs whole transactions so a transaction
+# waiting on its lookups can never starve them of threads.
+_lookup_executor: Optional[ThreadPoolExecutor] = None
+_lookup_executor_lock = threading.Lock()
+
+
+def get_lookup_executor() -> ThreadPoolExecutor:
+    """Get the shared executor used for in-transaction lookups."""
+    global _lookup_executor
+    if _lookup_executor is None:
+        with _lookup_executor_lock:
+            if _lookup_executor is None:
+                _lookup_executor = ThreadPoolExecutor(
+                    max_workers=APP_CONFIG.get("lookup_workers", 16),
+                    thread_name_prefix="ims-lookup"
+                )
+    return _lookup_executor
+
+
+# Progress callback of the transaction running in the current context
+# (set by process_transaction, called with each step name as it finishes)
+_progress_callback: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar(
+    "transaction_progress", default=None
+)
+
 
 class TransactionHandler:
     """Handles complete transaction workflow from payload to completion."""
@@ -37,16 +73,36 @@ class TransactionHandler:
         self.cancellation_service = get_cancellation_service()
         self.reinstatement_service = get_reinstatement_service()
     
-    def process_transaction(self, payload: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], str]:
+    def process_transaction(self, payload: Dict[str, Any],
+                            progress: Optional[Callable[[str], None]] = None) -> Tuple[bool, Dict[str, Any], str]:
         """
         Process a complete transaction from payload reception to completion.
         
         Args:
             payload: The Triton transaction payload
+            progress: Optional callback, called with each workflow step name as it finishes
             
         Returns:
-            Tuple[bool, Dict[str, Any], str]: (success, results, message)
+            Tuple[bool, Dict[str, Any], str]: (success, results, message);
+            results["timings"] holds the step and IMS call timings
         """
+        transaction_id = str(payload.get("transaction_id", ""))
+        progress_token = _progress_callback.set(progress)
+        try:
+            # Repeated read-only IMS lookups within the transaction are memoized;
+            # every step and IMS call is timed into the trace
+            with trace(transaction_id) as transaction_trace, unit_of_work(transaction_id) as uow:
+                success, results, message = self._process_transaction(payload)
+        finally:
+            _progress_callback.reset(progress_token)
+        record_span(str(payload.get("transaction_type") or "unknown").lower(), transaction_trace.start,
+                    kind="transaction", outcome="ok" if success else "failed")
+        results["timings"] = transaction_trace.summary()
+        results["memoized_calls"] = dict(uow.stats)
+        return success, results, message
+    
+    def _process_transaction(self, payload: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], str]:
+        """Run the transaction workflow (see process_transaction)."""
         results = {
             "transaction_id": payload.get("transaction_id"),
             "transaction_type": payload.get("transaction_type"),
@@ -62,14 +118,14 @@ class TransactionHandler:
             transaction_type = payload.get("transaction_type", "").lower()
             logger.info(f"Processing {transaction_type} transaction: {payload.get('transaction_id')}")
             
-            # 1. Authenticate
-            auth_success, auth_message = self.auth_service.login()
+            # 1. Authenticate (reuses the cached token when still valid)
+            auth_success, auth_message = self._step("authenticate", self.auth_service.ensure_authenticated)
             if not auth_success:
                 return False, results, f"Authentication failed: {auth_message}"
             
             # 2. Store transaction first (no QuoteGuid)
             logger.info("Storing transaction data")
-            success, trans_result, message = self.data_service.store_triton_transaction(payload)
+            success, trans_result, message = self._step("store_transaction", self.data_service.store_triton_transaction, payload)
             if not success:
                 logger.warning(f"Transaction storage warning: {message}")
             else:
@@ -82,14 +138,14 @@ class TransactionHandler:
                 
                 if opportunity_id:
                     # Check if quote already exists for this opportunity_id
-                    success, quote_info, message = self.data_service.get_quote_by_opportunity_id(opportunity_id)
+                    success, quote_info, message = self._step("find_quote", self.data_service.get_quote_by_opportunity_id, opportunity_id)
                     if success and quote_info:
                         # Quote exists - check if already bound
                         quote_guid = quote_info.get("QuoteGuid")
                         logger.info(f"Found existing quote {quote_guid} for opportunity_id {opportunity_id}")
                         
                         # Check bound status
-                        success, is_bound, bound_message = self.data_service.check_quote_bound_status(quote_guid)
+                        success, is_bound, bound_message = self._step("check_bound_status", self.data_service.check_quote_bound_status, quote_guid)
                         if not success:
                             return False, results, f"Failed to check bound status: {bound_message}"
                         
@@ -106,7 +162,7 @@ class TransactionHandler:
                         # Validate producer exists before rebind
                         # This ensures we fail fast if producer is invalid
                         logger.info("Validating producer for rebind")
-                        success, producer_info, message = self.data_service.process_producer_from_payload(payload)
+                        success, producer_info, message = self._step("process_producer", self.data_service.process_producer_from_payload, payload)
                         if not success:
                             return False, results, f"Producer lookup failed during rebind: {message}"
                         results["producer_contact_guid"] = producer_info.get("ProducerContactGUID")
@@ -115,7 +171,7 @@ class TransactionHandler:
                         
                         # Process payload to update data and bind
                         # The stored procedure will now update tblQuotes with new dates and producer
-                        success, process_result, message = self.payload_processor.process_payload(
+                        success, process_result, message = self._step("process_payload", self.payload_processor.process_payload,
                             payload=payload,
                             quote_guid=quote_guid,
                             quote_option_guid=quote_info.get("QuoteOptionGuid")
@@ -125,7 +181,7 @@ class TransactionHandler:
                         
                         # Bind the existing quote
                         logger.info(f"Binding existing quote {quote_guid}")
-                        success, bind_result, message = self.bind_service.bind_quote(quote_guid)
+                        success, bind_result, message = self._step("bind_quote", self.bind_service.bind_quote, quote_guid, transaction_id=payload.get("transaction_id"))
                         if not success:
                             return False, results, f"Bind failed: {message}"
                         
@@ -135,6 +191,8 @@ class TransactionHandler:
                         # Include invoice data if available
                         if bind_result.get("invoice_data"):
                             results["invoice_data"] = bind_result["invoice_data"]
+                        elif bind_result.get("invoice_request"):
+                            results["invoice_request"] = bind_result["invoice_request"]
                         results["end_time"] = datetime.utcnow().isoformat()
                         results["status"] = "completed"
                         
@@ -155,14 +213,14 @@ class TransactionHandler:
                 if option_id:
                     logger.info(f"Looking up existing quote by option_id: {option_id}")
                     # Note: option_id is actually opportunity_id (naming confusion in the system)
-                    success, quote_info, message = self.data_service.get_quote_by_opportunity_id(int(option_id))
+                    success, quote_info, message = self._step("find_quote", self.data_service.get_quote_by_opportunity_id, int(option_id))
                     if not success and policy_number:
                         # Fall back to policy number if option_id lookup fails and policy_number is provided
                         logger.info(f"Option ID lookup failed, trying policy number: {policy_number}")
-                        success, quote_info, message = self.data_service.get_quote_by_policy_number(policy_number)
+                        success, quote_info, message = self._step("find_quote", self.data_service.get_quote_by_policy_number, policy_number)
                 elif policy_number:
                     logger.info(f"Looking up existing quote by policy number: {policy_number}")
-                    success, quote_info, message = self.data_service.get_quote_by_policy_number(policy_number)
+                    success, quote_info, message = self._step("find_quote", self.data_service.get_quote_by_policy_number, policy_number)
                 else:
                     return False, results, f"{transaction_type.capitalize()} transaction requires either option_id or policy_number"
                 
@@ -183,7 +241,7 @@ class TransactionHandler:
                 if transaction_type == "issue":
                     # Issue the policy
                     logger.info(f"Issuing policy for quote {quote_guid}")
-                    success, issue_date, message = self.issue_service.issue_policy(quote_guid)
+                    success, issue_date, message = self._step("issue_policy", self.issue_service.issue_policy, quote_guid)
                     if not success:
                         return False, results, f"Issue failed: {message}"
                     
@@ -197,7 +255,7 @@ class TransactionHandler:
                 elif transaction_type == "unbind":
                     # Unbind the policy
                     logger.info(f"Unbinding policy for quote {quote_guid}")
-                    success, message = self.unbind_service.unbind_policy(quote_guid)
+                    success, message = self._step("unbind_policy", self.unbind_service.unbind_policy, quote_guid)
                     if not success:
                         return False, results, f"Unbind failed: {message}"
                     
@@ -216,7 +274,7 @@ class TransactionHandler:
                         return False, results, "Midterm endorsement requires opportunity_id"
                     
                     logger.info(f"Finding latest quote in chain for opportunity_id: {option_id}")
-                    success, latest_quote_info, message = self.data_service.get_latest_quote_by_opportunity_id(int(option_id))
+                    success, latest_quote_info, message = self._step("find_latest_quote", self.data_service.get_latest_quote_by_opportunity_id, int(option_id))
                     
                     if not success or not latest_quote_info:
                         return False, results, f"Failed to find latest quote: {message}"
@@ -231,7 +289,7 @@ class TransactionHandler:
                     
                     # Step 2: Get total existing premium from all invoices
                     logger.info(f"Calculating total existing premium for control_no: {control_no}")
-                    success, existing_premium, message = self.data_service.get_policy_premium_total(control_no)
+                    success, existing_premium, message = self._step("get_premium_total", self.data_service.get_policy_premium_total, control_no)
                     
                     if not success:
                         logger.warning(f"Failed to get existing premium, using 0: {message}")
@@ -289,7 +347,7 @@ class TransactionHandler:
                     producer_email = payload.get("producer_email")
                     producer_name = payload.get("producer_name")
                     
-                    success, endorsement_result, message = self.endorsement_service.create_flat_endorsement_triton(
+                    success, endorsement_result, message = self._step("create_endorsement", self.endorsement_service.create_flat_endorsement_triton,
                         opportunity_id=int(option_id),
                         endorsement_premium=new_endorsement_premium,
                         effective_date=effective_date,
@@ -353,7 +411,7 @@ class TransactionHandler:
                         logger.info(f"  QuoteGuid: {endorsement_quote_guid}")
                         logger.info(f"  QuoteOptionGuid: {endorsement_quote_option_guid}")
                         
-                        success, process_result, message = self.payload_processor.process_payload(
+                        success, process_result, message = self._step("process_payload", self.payload_processor.process_payload,
                             payload=payload,
                             quote_guid=endorsement_quote_guid,
                             quote_option_guid=endorsement_quote_option_guid
@@ -368,7 +426,7 @@ class TransactionHandler:
                     
                     # Step 10: Bind the endorsement
                     logger.info(f"Binding endorsement quote {endorsement_quote_guid}")
-                    success, bind_result, message = self.bind_service.bind_quote(endorsement_quote_guid)
+                    success, bind_result, message = self._step("bind_quote", self.bind_service.bind_quote, endorsement_quote_guid, transaction_id=payload.get("transaction_id"))
                     
                     if success:
                         results["endorsement_policy_number"] = bind_result.get("policy_number")
@@ -381,14 +439,7 @@ class TransactionHandler:
                     # Step 11: Get invoice data after successful endorsement
                     # Skip invoice retrieval for zero-premium endorsements (no invoice generated)
                     if endorsement_quote_guid and new_endorsement_premium != 0:
-                        logger.info(f"Retrieving invoice data for endorsement quote {endorsement_quote_guid}")
-                        invoice_success, invoice_data, invoice_message = self.data_service.get_invoice_data(endorsement_quote_guid)
-                        
-                        if invoice_success:
-                            results["invoice_data"] = invoice_data
-                            logger.info(f"Successfully retrieved invoice data for endorsement")
-                        else:
-                            logger.warning(f"Failed to retrieve invoice data for endorsement: {invoice_message}")
+                        self._collect_invoice(endorsement_quote_guid, results, "endorsement", payload, bind_result.get("invoice_data"))
                     elif endorsement_quote_guid and new_endorsement_premium == 0:
                         logger.info("Skipping invoice retrieval for zero-premium endorsement (no invoice generated)")
                     
@@ -462,7 +513,7 @@ class TransactionHandler:
                         market_segment_code = payload.get("market_segment_code")
                         policy_fee = payload.get("policy_fee")
                         
-                        success, cancellation_result, message = self.cancellation_service.cancel_policy_by_opportunity_id(
+                        success, cancellation_result, message = self._step("cancel_policy", self.cancellation_service.cancel_policy_by_opportunity_id,
                             opportunity_id=int(option_id),
                             cancellation_type=cancellation_type,
                             effective_date=effective_date,
@@ -475,7 +526,7 @@ class TransactionHandler:
                         )
                     else:
                         # Fall back to using quote_guid
-                        success, cancellation_result, message = self.cancellation_service.cancel_policy_by_quote_guid(
+                        success, cancellation_result, message = self._step("cancel_policy", self.cancellation_service.cancel_policy_by_quote_guid,
                             quote_guid=quote_guid,
                             cancellation_type=cancellation_type,
                             effective_date=effective_date,
@@ -509,7 +560,7 @@ class TransactionHandler:
                     # Bind the cancellation quote
                     if cancellation_quote_guid:
                         logger.info(f"Binding cancellation quote {cancellation_quote_guid}")
-                        success, bind_result, message = self.bind_service.bind_quote(cancellation_quote_guid)
+                        success, bind_result, message = self._step("bind_quote", self.bind_service.bind_quote, cancellation_quote_guid, transaction_id=payload.get("transaction_id"))
                         
                         if success:
                             results["cancellation_policy_number"] = bind_result.get("policy_number")
@@ -526,7 +577,7 @@ class TransactionHandler:
                         logger.info(f"  QuoteOptionGuid: {cancellation_quote_option_guid or '00000000-0000-0000-0000-000000000000'}")
                         
                         # Use the payload processor to store the cancellation data
-                        success, processing_result, processing_message = self.payload_processor.process_payload(
+                        success, processing_result, processing_message = self._step("process_payload", self.payload_processor.process_payload,
                             payload=payload,
                             quote_guid=cancellation_quote_guid,
                             quote_option_guid=cancellation_quote_option_guid or "00000000-0000-0000-0000-000000000000"
@@ -540,14 +591,7 @@ class TransactionHandler:
                     
                     # Get invoice data after successful cancellation
                     if cancellation_quote_guid:
-                        logger.info(f"Retrieving invoice data for cancellation quote {cancellation_quote_guid}")
-                        invoice_success, invoice_data, invoice_message = self.data_service.get_invoice_data(cancellation_quote_guid)
-                        
-                        if invoice_success:
-                            results["invoice_data"] = invoice_data
-                            logger.info(f"Successfully retrieved invoice data for cancellation")
-                        else:
-                            logger.warning(f"Failed to retrieve invoice data for cancellation: {invoice_message}")
+                        self._collect_invoice(cancellation_quote_guid, results, "cancellation", payload, bind_result.get("invoice_data"))
                     
                     results["end_time"] = datetime.utcnow().isoformat()
                     results["status"] = "completed"
@@ -591,7 +635,7 @@ class TransactionHandler:
                     # Create the reinstatement
                     if option_id:
                         # Use opportunity_id if available
-                        success, reinstatement_result, message = self.reinstatement_service.reinstate_policy_by_opportunity_id(
+                        success, reinstatement_result, message = self._step("reinstate_policy", self.reinstatement_service.reinstate_policy_by_opportunity_id,
                             opportunity_id=int(option_id),
                             reinstatement_premium=reinstatement_premium,
                             effective_date=effective_date,
@@ -628,7 +672,7 @@ class TransactionHandler:
                             logger.info(f"Retrieved QuoteOptionGuid for reinstatement: {reinstatement_quote_option_guid}")
                         
                         logger.info("Processing reinstatement payload to register in Triton tables")
-                        success, process_result, message = self.payload_processor.process_payload(
+                        success, process_result, message = self._step("process_payload", self.payload_processor.process_payload,
                             payload=payload,
                             quote_guid=reinstatement_quote_guid,
                             quote_option_guid=reinstatement_quote_option_guid
@@ -639,7 +683,7 @@ class TransactionHandler:
                     # Bind the reinstatement if we have a quote GUID
                     if reinstatement_quote_guid:
                         logger.info(f"Binding reinstatement quote {reinstatement_quote_guid}")
-                        success, bind_result, message = self.bind_service.bind_quote(reinstatement_quote_guid)
+                        success, bind_result, message = self._step("bind_quote", self.bind_service.bind_quote, reinstatement_quote_guid, transaction_id=payload.get("transaction_id"))
                         
                         if success:
                             results["reinstatement_policy_number"] = bind_result.get("policy_number")
@@ -658,14 +702,7 @@ class TransactionHandler:
                     
                     # Get invoice data after successful reinstatement
                     if reinstatement_quote_guid:
-                        logger.info(f"Retrieving invoice data for reinstatement quote {reinstatement_quote_guid}")
-                        invoice_success, invoice_data, invoice_message = self.data_service.get_invoice_data(reinstatement_quote_guid)
-                        
-                        if invoice_success:
-                            results["invoice_data"] = invoice_data
-                            logger.info(f"Successfully retrieved invoice data for reinstatement")
-                        else:
-                            logger.warning(f"Failed to retrieve invoice data for reinstatement: {invoice_message}")
+                        self._collect_invoice(reinstatement_quote_guid, results, "reinstatement", payload, bind_result.get("invoice_data"))
                     
                     results["end_time"] = datetime.utcnow().isoformat()
                     results["status"] = "completed"
@@ -676,44 +713,16 @@ class TransactionHandler:
                 return True, results, summary_msg
             
             # For all other transaction types, continue with the normal flow
-            # 2. Find/Create Insured
-            success, insured_guid, message = self.insured_service.find_or_create_insured(payload)
-            if not success:
-                return False, results, f"Insured processing failed: {message}"
-            results["insured_guid"] = insured_guid
-            
-            # 3. Find Producer
-            success, producer_info, message = self.data_service.process_producer_from_payload(payload)
-            if not success:
-                return False, results, f"Producer lookup failed: {message}"
-            results["producer_contact_guid"] = producer_info.get("ProducerContactGUID")
-            results["producer_location_guid"] = producer_info.get("ProducerLocationGUID")
-            
-            # 4. Find Underwriter
-            success, underwriter_guid, message = self.underwriter_service.process_underwriter_from_payload(payload)
+            # 2-5. Find/Create Insured, find Producer and Underwriter, and for
+            # renewals the expiring quote. None depends on another, so they run
+            # concurrently and the flow waits only for the slowest.
+            success, message = self._resolve_quote_parties(payload, results)
             if not success:
-                return False, results, f"Underwriter lookup failed: {message}"
-            results["underwriter_guid"] = underwriter_guid
-            
-            # 5. Handle renewal logic if needed
-            renewal_of_quote_guid = None
-            opportunity_type = payload.get("opportunity_type", "").lower()
-            
-            if opportunity_type == "renewal":
-                # Check for expiring policy to link renewal
-                expiring_policy_number = payload.get("expiring_policy_number")
-                if expiring_policy_number:
-                    logger.info(f"Looking up expiring policy: {expiring_policy_number}")
-                    success, expiring_quote_info, message = self.data_service.get_quote_by_expiring_policy_number(expiring_policy_number)
-                    if success and expiring_quote_info:
-                        renewal_of_quote_guid = expiring_quote_info.get("QuoteGuid")
-                        logger.info(f"Found expiring quote {renewal_of_quote_guid} for policy {expiring_policy_number}")
-                        results["renewal_of_quote_guid"] = renewal_of_quote_guid
-                    else:
-                        logger.warning(f"No expiring quote found for policy {expiring_policy_number}")
+                return False, results, message
+            renewal_of_quote_guid = results.get("renewal_of_quote_guid")
             
             # 6. Create Quote
-            success, quote_guid, message = self.quote_service.create_quote_from_payload(
+            success, quote_guid, message = self._step("create_quote", self.quote_service.create_quote_from_payload,
                 payload=payload,
                 insured_guid=results["insured_guid"],
                 producer_contact_guid=results["producer_contact_guid"],
@@ -726,7 +735,7 @@ class TransactionHandler:
             results["quote_guid"] = quote_guid
             
             # 7. Add Quote Options
-            success, option_info, message = self.quote_options_service.auto_add_quote_options(quote_guid)
+            success, option_info, message = self._step("add_quote_options", self.quote_options_service.auto_add_quote_options, quote_guid)
             if not success:
                 return False, results, f"Quote options failed: {message}"
             results["quote_option_guid"] = option_info.get("QuoteOptionGuid")
@@ -735,7 +744,7 @@ class TransactionHandler:
             results["company_location"] = option_info.get("CompanyLocation")
             
             # 8. Process Payload (Store data, update policy number, register premium)
-            success, process_result, message = self.payload_processor.process_payload(
+            success, process_result, message = self._step("process_payload", self.payload_processor.process_payload,
                 payload=payload,
                 quote_guid=results["quote_guid"],
                 quote_option_guid=results["quote_option_guid"]
@@ -746,7 +755,7 @@ class TransactionHandler:
             # 9. Handle transaction-specific operations
             if transaction_type == "bind":
                 logger.info(f"Binding quote {quote_guid} for transaction {payload.get('transaction_id')}")
-                success, bind_result, message = self.bind_service.bind_quote(quote_guid)
+                success, bind_result, message = self._step("bind_quote", self.bind_service.bind_quote, quote_guid, transaction_id=payload.get("transaction_id"))
                 if not success:
                     return False, results, f"Bind failed: {message}"
                 
@@ -758,6 +767,9 @@ class TransactionHandler:
                 if bind_result.get("invoice_data"):
                     results["invoice_data"] = bind_result["invoice_data"]
                     logger.info(f"Successfully bound policy: {bind_result.get('policy_number')} with invoice data")
+                elif bind_result.get("invoice_request"):
+                    results["invoice_request"] = bind_result["invoice_request"]
+                    logger.info(f"Successfully bound policy: {bind_result.get('policy_number')} (invoice pending)")
                 else:
                     logger.info(f"Successfully bound policy: {bind_result.get('policy_number')} (no invoice data)")
                 
@@ -776,6 +788,140 @@ class TransactionHandler:
             results["status"] = "failed"
             return False, results, error_msg
     
+    def _resolve_quote_parties(self, payload: Dict[str, Any], results: Dict[str, Any]) -> Tuple[bool, str]:
+        """
+        Resolve insured, producer, underwriter and (for renewals) the expiring
+        quote concurrently and store the GUIDs in results.
+        
+        Failures are reported in the same order and with the same messages
+        as the sequential flow; every failure is also listed in
+        results["errors"].
+        
+        Args:
+            payload: The Triton transaction payload
+            results: Transaction results dict, updated in place
+            
+        Returns:
+            Tuple[bool, str]: (success, message of the first failure)
+        """
+        lookups = [
+            ("find_or_create_insured", self.insured_service.find_or_create_insured),
+            ("process_producer", self.data_service.process_producer_from_payload),
+            ("process_underwriter", self.underwriter_service.process_underwriter_from_payload)
+        ]
+        
+        expiring_policy_number = None
+        if payload.get("opportunity_type", "").lower() == "renewal":
+            # Check for expiring policy to link renewal
+            expiring_policy_number = payload.get("expiring_policy_number")
+            if expiring_policy_number:
+                logger.info(f"Looking up expiring policy: {expiring_policy_number}")
+                lookups.append((
+                    "get_expiring_quote",
+                    lambda _payload: self.data_service.get_quote_by_expiring_policy_number(expiring_policy_number)
+                ))
+        
+        executor = get_lookup_executor()
+        fan_out_start = time.perf_counter()
+        # Each lookup runs in a copy of this context so it shares the unit of work and trace
+        futures = {
+            step: executor.submit(contextvars.copy_context().run, self._timed_call, step, lookup, payload)
+            for step, lookup in lookups
+        }
+        
+        outcomes = {step: future.result() for step, future in futures.items()}
+        record_span("parallel_lookups", fan_out_start)
+        self._report_progress("parallel_lookups")
+        
+        errors = []
+        
+        success, insured_guid, message = outcomes["find_or_create_insured"]
+        if success:
+            results["insured_guid"] = insured_guid
+        else:
+            errors.append(f"Insured processing failed: {message}")
+        
+        success, producer_info, message = outcomes["process_producer"]
+        if success:
+            results["producer_contact_guid"] = producer_info.get("ProducerContactGUID")
+            results["producer_location_guid"] = producer_info.get("ProducerLocationGUID")
+        else:
+            errors.append(f"Producer lookup failed: {message}")
+        
+        success, underwriter_guid, message = outcomes["process_underwriter"]
+        if success:
+            results["underwriter_guid"] = underwriter_guid
+        else:
+            errors.append(f"Underwriter lookup failed: {message}")
+        
+        if "get_expiring_quote" in outcomes:
+            success, expiring_quote_info, message = outcomes["get_expiring_quote"]
+            if success and expiring_quote_info:
+                renewal_of_quote_guid = expiring_quote_info.get("QuoteGuid")
+                logger.info(f"Found expiring quote {renewal_of_quote_guid} for policy {expiring_policy_number}")
+                results["renewal_of_quote_guid"] = renewal_of_quote_guid
+            else:
+                logger.warning(f"No expiring quote found for policy {expiring_policy_number}")
+        
+        if errors:
+            results["errors"] = errors
+            return False, errors[0]
+        
+        return True, "Quote parties resolved"
+    
+    def _collect_invoice(self, quote_guid: str, results: Dict[str, Any], label: str, payload: Dict[str, Any],
+                         invoice_data: Optional[Dict[str, Any]] = None):
+        """
+        Put the invoice for quote_guid into results: invoice_data when fetched
+        inline, or an invoice_request handle when deferred invoices are enabled.
+        
+        invoice_data is the invoice bind_quote already fetched for the quote;
+        when given it is used as is instead of calling ryan_rptInvoice again
+        (steps between the bind and here may have cleared the memo).
+        """
+        if invoice_data:
+            results["invoice_data"] = invoice_data
+            logger.info(f"Using invoice data retrieved by the {label} bind")
+            return
+        
+        deferred_invoices = get_deferred_invoice_service()
+        if deferred_invoices.enabled:
+            results["invoice_request"] = deferred_invoices.submit(quote_guid, payload.get("transaction_id"))
+            logger.info(f"Invoice for {label} quote {quote_guid} will be retrieved in the background")
+            return
+        
+        logger.info(f"Retrieving invoice data for {label} quote {quote_guid}")
+        invoice_success, invoice_data, invoice_message = self._step("get_invoice", self.data_service.get_invoice_data, quote_guid)
+        
+        if invoice_success:
+            results["invoice_data"] = invoice_data
+            logger.info(f"Successfully retrieved invoice data for {label}")
+        else:
+            logger.warning(f"Failed to retrieve invoice data for {label}: {invoice_message}")
+    
+    def _step(self, step: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run one workflow step as a timed span, then report it to the progress callback."""
+        result = self._timed_call(step, func, *args, **kwargs)
+        self._report_progress(step)
+        return result
+    
+    def _timed_call(self, step: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call func inside a span named step; a (False, ...) result marks the span failed."""
+        with span(step) as step_span:
+            result = func(*args, **kwargs)
+            if isinstance(result, tuple) and result and result[0] is False:
+                step_span.outcome = "failed"
+        return result
+    
+    def _report_progress(self, step: str):
+        """Call the progress callback of the running transaction, if any."""
+        progress = _progress_callback.get()
+        if progress is not None:
+            try:
+                progress(step)
+            except Exception as e:
+                logger.warning(f"Progress callback failed for step {step}: {str(e)}")
+    
     def _build_summary_message(self, results: Dict[str, Any], payload: Dict[str, Any]) -> str:
         """Build a summary message for the completed transaction."""
         transaction_type = payload.get("transaction_type", "").lower()
@@ -843,13 +989,51 @@ class TransactionHandler:
         return " | ".join(msg_parts)
 
 
-# Singleton instance
+class AsyncTransactionHandler:
+    """
+    Async variant of TransactionHandler for the FastAPI routes.
+    
+    Runs the same workflow through the transaction scheduler so the event
+    loop stays free and transactions for different opportunities run in
+    parallel, while those for the same opportunity keep their order.
+    """
+    
+    def __init__(self, handler: Optional[TransactionHandler] = None):
+        self.handler = handler or get_transaction_handler()
+    
+    async def process_transaction(self, payload: Dict[str, Any]) -> Tuple[bool, Dict[str, Any], str]:
+        """
+        Process a complete transaction without blocking the event loop.
+        
+        Args:
+            payload: The Triton transaction payload
+            
+        Returns:
+            Tuple[bool, Dict[str, Any], str]: (success, results, message)
+        """
+        future = get_transaction_scheduler().submit(payload, self.handler.process_transaction)
+        return await asyncio.wrap_future(future)
+
+
+# Singleton instances
 _transaction_handler = None
+_async_transaction_handler = None
+_transaction_handler_lock = threading.Lock()
 
 
 def get_transaction_handler() -> TransactionHandler:
     """Get singleton instance of transaction handler."""
     global _transaction_handler
     if _transaction_handler is None:
-        _transaction_handler = TransactionHandler()
-    return _transaction_handler
\ No newline at end of file
+        with _transaction_handler_lock:
+            if _transaction_handler is None:
+                _transaction_handler = TransactionHandler()
+    return _transaction_handler
+
+
+def get_async_transaction_handler() -> AsyncTransactionHandler:
+    """Get singleton instance of the async transaction handler."""
+    global _async_transaction_handler
+    if _async_transaction_handler is None:
+        _async_transaction_handler = AsyncTransactionHandler()
+    return _async_transaction_handler
\ No newline at end of file
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from config import APP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionScheduler:
+    """
+    Runs transactions in parallel across opportunities and in order within one.
+
+    Work is partitioned by opportunity_id (option_id, then policy_number
+    when there is none). Each partition is a FIFO; at most one transaction
+    per partition runs at a time, and partitions share a bounded worker
+    pool. A partition yields its worker after every transaction, so a long
+    chain for one opportunity does not hold a thread while others wait.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or APP_CONFIG.get("max_concurrent_transactions", 32)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transaction")
+        # partition key -> pending (enqueued_at, func, future) items
+        self._partitions: Dict[str, Deque[Tuple[float, Callable[[], Any], Future]]] = {}
+        # partition key -> start time of the transaction running for it
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    @staticmethod
+    def partition_key(payload: Dict[str, Any]) -> str:
+        """
+        Ordering key for a payload.
+
+        Returns:
+            "opportunity:<id>", "policy:<number>", or "transaction:<id>" when
+            the payload has neither (such a transaction is ordered only with itself)
+        """
+        opportunity_id = payload.get("opportunity_id") or payload.get("option_id")
+        if opportunity_id not in (None, ""):
+            return f"opportunity:{str(opportunity_id).strip()}"
+        policy_number = payload.get("policy_number")
+        if policy_number:
+            return f"policy:{str(policy_number).strip().upper()}"
+        return f"transaction:{payload.get('transaction_id', '')}"
+
+    def submit(self, payload: Dict[str, Any], func: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Future:
+        """
+        Schedule a transaction behind any earlier ones for the same partition.
+
+        Args:
+            payload: The Triton transaction payload
+            func: Called with the payload; defaults to TransactionHandler.process_transaction
+
+        Returns:
+            Future resolving to func's return value
+        """
+        if func is None:
+            # Imported here: the handler pulls in every IMS service
+            from app.services.transaction_handler import get_transaction_handler
+            func = get_transaction_handler().process_transaction
+
+        key = self.partition_key(payload)
+        future: Future = Future()
+        with self._lock:
+            queue = self._partitions.get(key)
+            idle = queue is None
+            if idle:
+                queue = self._partitions[key] = deque()
+            queue.append((time.monotonic(), lambda: func(payload), future))
+            self._stats["submitted"] += 1
+        if idle:
+            self._executor.submit(self._drain_one, key)
+        return future
+
+    def _drain_one(self, key: str):
+        """Run the next transaction of a partition, then requeue the partition if more are waiting."""
+        with self._lock:
+            _, call, future = self._partitions[key].popleft()
+            self._running[key] = time.monotonic()
+
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(call())
+                outcome = "completed"
+            except BaseException as e:
+                logger.error(f"Transaction in partition {key} raised: {str(e)}", exc_info=True)
+                future.set_exception(e)
+                outcome = "failed"
+        else:
+            outcome = "cancelled"
+
+        with self._lock:
+            self._stats[outcome] += 1
+            del self._running[key]
+            more = bool(self._partitions[key])
+            if not more:
+                del self._partitions[key]
+        if more:
+            self._executor.submit(self._drain_one, key)
+
+    def get_stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Queue depth and per-partition lag.
+
+        Args:
+            top: Number of most-lagging partitions to list
+
+        Returns:
+            Dict with totals and the partitions whose oldest waiting
+            transaction has waited longest (lag_seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            partitions = []
+            for key, queue in self._partitions.items():
+                running_since = self._running.get(key)
+                partitions.append({
+                    "partition": key,
+                    "queued": len(queue),
+                    "running": running_since is not None,
+                    "lag_seconds": round(now - queue[0][0], 3) if queue else 0.0,
+                    "running_seconds": round(now - running_since, 3) if running_since is not None else 0.0
+                })
+            stats = dict(self._stats)
+
+        partitions.sort(key=lambda p: p["lag_seconds"], reverse=True)
+        return {
+            **stats,
+            "max_workers": self.max_workers,
+            "queue_depth": sum(p["queued"] for p in partitions),
+            "running": sum(1 for p in partitions if p["running"]),
+            "active_partitions": len(partitions),
+            "max_lag_seconds": partitions[0]["lag_seconds"] if partitions else 0.0,
+            "partitions": partitions[:top]
+        }
+
+
+# Singleton instance
+_transaction_scheduler = None
+_transaction_scheduler_lock = threading.Lock()
+
+
+def get_transaction_scheduler() -> TransactionScheduler:
+    """Get singleton instance of the transaction scheduler."""
+    global _transaction_scheduler
+    if _transaction_scheduler is None:
+        with _transaction_scheduler_lock:
+            if _transaction_scheduler is None:
+                _transaction_scheduler = TransactionScheduler()
+    return _transaction_scheduler
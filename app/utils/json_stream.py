@@ -0,0 +1,193 @@
+import json
+import re
+from typing import Any, AsyncIterator, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+# Longest record accepted (in characters); a record still incomplete past
+# this is treated as malformed rather than buffered to the end of the body
+MAX_RECORD_CHARS = 16 * 1024 * 1024
+
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}{\[":]')
+
+
+class JSONStreamError(ValueError):
+    """Raised when a record in a JSON stream cannot be parsed."""
+
+
+class _ValueScanner:
+    """
+    Finds where a JSON value ends without decoding it.
+
+    Tracks string and bracket nesting only, resuming where the previous
+    call stopped, so a record split over many chunks is scanned once.
+    Whether the value is valid JSON is left to json.loads.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+
+    def end(self, buffer: str) -> Optional[int]:
+        """
+        End of the value at the start of buffer, or None while it is incomplete.
+
+        buffer must start with the value and only grow between calls.
+        """
+        if buffer[0] not in '{["':
+            # Number, true, false, null (or garbage): ends at the next delimiter
+            match = _SCALAR_END.search(buffer)
+            return match.start() if match else None
+
+        i = self.pos
+        while True:
+            if self.in_string:
+                match = _STRING_SPECIAL.search(buffer, i)
+                if match is None:
+                    self.pos = len(buffer)
+                    return None
+                if match.group() == "\\":
+                    if match.end() >= len(buffer):
+                        # The escaped character has not arrived yet
+                        self.pos = match.start()
+                        return None
+                    i = match.end() + 1
+                    continue
+                self.in_string = False
+                i = match.end()
+                if self.depth == 0:
+                    return i
+                continue
+
+            match = _STRUCTURE.search(buffer, i)
+            if match is None:
+                self.pos = len(buffer)
+                return None
+            i = match.end()
+            char = match.group()
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth <= 0:
+                    return i
+
+
+async def iter_json_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Parse NDJSON or a top-level JSON array from a stream of byte chunks.
+
+    Only the record being parsed is buffered, so arbitrarily long streams
+    can be consumed. The format is detected from the first non-whitespace
+    character: "[" means a JSON array, anything else NDJSON (blank lines
+    are skipped). Array records must be separated by ","; a record is
+    rejected as soon as it is complete and invalid, or once it grows past
+    MAX_RECORD_CHARS.
+
+    Args:
+        chunks: Async iterator of raw body chunks (e.g. Request.stream())
+
+    Yields:
+        Tuple[int, Any]: (record index, decoded record)
+
+    Raises:
+        JSONStreamError: On malformed input; records before it have already been yielded
+    """
+    buffer = ""
+    pending = b""
+    mode = None  # "array" or "ndjson"
+    index = 0
+    done = False
+    # Array mode: what may come next ("first" record or "]", a "record", or a "separator")
+    expect = "first"
+    scanner = _ValueScanner()
+
+    async for chunk in chunks:
+        if done:
+            continue
+        # Decode incrementally so multi-byte characters split across chunks survive
+        pending += chunk
+        try:
+            text = pending.decode("utf-8")
+            pending = b""
+        except UnicodeDecodeError as e:
+            if e.end < len(pending):
+                raise JSONStreamError(f"Invalid UTF-8 in request body: {e}")
+            text = pending[:e.start].decode("utf-8")
+            pending = pending[e.start:]
+        buffer += text
+
+        if mode is None:
+            stripped = buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                buffer = ""
+                continue
+            if stripped[0] == "[":
+                mode = "array"
+                buffer = stripped[1:]
+            else:
+                mode = "ndjson"
+                buffer = stripped
+
+        if mode == "ndjson":
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                if line.strip():
+                    yield index, _decode_line(line, index)
+                    index += 1
+            if len(buffer) > MAX_RECORD_CHARS:
+                raise JSONStreamError(f"Record {index} is longer than {MAX_RECORD_CHARS} characters")
+        else:
+            while True:
+                buffer = buffer.lstrip(_WHITESPACE)
+                if not buffer:
+                    break
+                if expect == "separator":
+                    if buffer[0] == ",":
+                        expect = "record"
+                        buffer = buffer[1:]
+                        continue
+                    if buffer[0] == "]":
+                        done = True
+                        break
+                    raise JSONStreamError(f"Expected ',' or ']' after record {index - 1} near: {buffer[:80]!r}")
+                if buffer[0] == "]":
+                    if expect == "record":
+                        raise JSONStreamError(f"Trailing ',' after record {index - 1}")
+                    done = True
+                    break
+                end = scanner.end(buffer)
+                if end is None:
+                    # Incomplete record: wait for more data
+                    if len(buffer) > MAX_RECORD_CHARS:
+                        raise JSONStreamError(f"Record {index} is longer than {MAX_RECORD_CHARS} characters")
+                    break
+                record = _decode_line(buffer[:end], index)
+                buffer = buffer[end:]
+                scanner.reset()
+                expect = "separator"
+                yield index, record
+                index += 1
+
+    if pending:
+        raise JSONStreamError("Request body ends with an incomplete UTF-8 character")
+    if mode == "ndjson" and buffer.strip():
+        yield index, _decode_line(buffer, index)
+    elif mode == "array" and not done:
+        detail = f" near: {buffer[:80]!r}" if buffer.strip() else ""
+        raise JSONStreamError(f"JSON array is not terminated after record {index}{detail}")
+
+
+def _decode_line(line: str, index: int) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise JSONStreamError(f"Record {index} is not valid JSON: {e}")
@@ -0,0 +1,300 @@
+import atexit
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCache:
+    """
+    Bounded TTL/LRU cache for IMS reference lookups (producers, underwriters).
+
+    Entries are either positive (the lookup result) or negative ("not found"),
+    negative ones living for a shorter TTL. Optionally persisted to a SQLite
+    file so a restart starts warm. Changes are written behind: sets and
+    invalidations only mark keys dirty, and a background thread upserts or
+    deletes those keys every flush_interval_seconds, so other processes
+    sharing the file keep their own entries and pick up these on a miss.
+    """
+
+    def __init__(self, name: str, max_size: int = 1000, ttl_seconds: float = 21600,
+                 negative_ttl_seconds: float = 300, persist_path: Optional[str] = None,
+                 flush_interval_seconds: float = 5):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.flush_interval_seconds = flush_interval_seconds
+        self.enabled = max_size > 0
+
+        # key -> (value, negative, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, bool, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "sets": 0,
+            "invalidations": 0
+        }
+        # Keys changed since the last flush -> entry to write, or None to delete
+        self._dirty: Dict[str, Optional[Tuple[Any, bool, float]]] = {}
+        self._clear_pending = False
+        self._flush_lock = threading.Lock()
+        # Bumped by every invalidation, so a read of the persist file that raced one is discarded
+        self._invalidations = 0
+        self._local = threading.local()
+
+        if self.persist_path and self.enabled:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+            threading.Thread(target=self._flush_loop, name=f"{name}-cache-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def normalize_key(*parts: Optional[str]) -> str:
+        """Build a cache key from lookup values: trimmed, lower-cased, single-spaced."""
+        return "|".join(re.sub(r"\s+", " ", (part or "").strip().lower()) for part in parts)
+
+    def get(self, key: str) -> Tuple[bool, bool, Any]:
+        """
+        Look up a key.
+
+        Args:
+            key: Normalized cache key
+
+        Returns:
+            Tuple[bool, bool, Any]: (hit, negative, value)
+        """
+        if not self.enabled:
+            return False, False, None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None or not self._can_read_through(key):
+                return self._lookup_result(key, entry)
+            invalidations = self._invalidations
+
+        # Read what other processes have flushed without holding the lock
+        persisted = self._read_persisted(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None and persisted is not None and invalidations == self._invalidations
+                    and self._can_read_through(key)):
+                entry = self._insert(key, persisted)
+            return self._lookup_result(key, entry)
+
+    def _lookup_result(self, key: str, entry: Optional[Tuple[Any, bool, float]]) -> Tuple[bool, bool, Any]:
+        """Count and return a lookup of entry (called under _lock)."""
+        if entry is None:
+            self._stats["misses"] += 1
+            return False, False, None
+
+        value, negative, expires_at = entry
+        if time.time() >= expires_at:
+            self._entries.pop(key, None)
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return False, False, None
+
+        self._entries.move_to_end(key)
+        self._stats["negative_hits" if negative else "hits"] += 1
+        return True, negative, value
+
+    def _can_read_through(self, key: str) -> bool:
+        """Whether the persist file may hold a newer entry for key than we do (called under _lock)."""
+        return self.persist_path is not None and key not in self._dirty and not self._clear_pending
+
+    def _insert(self, key: str, entry: Tuple[Any, bool, float]) -> Tuple[Any, bool, float]:
+        """Add an entry, evicting the least recently used ones over max_size (called under _lock)."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+        return entry
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Cache a found value."""
+        self._store(key, value, False, ttl_seconds or self.ttl_seconds)
+
+    def set_negative(self, key: str, value: Any = None):
+        """Cache a "not found" result (value is typically the not-found message)."""
+        self._store(key, value, True, self.negative_ttl_seconds)
+
+    def _store(self, key: str, value: Any, negative: bool, ttl_seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._insert(key, (value, negative, time.time() + ttl_seconds))
+            self._stats["sets"] += 1
+            if self.persist_path:
+                self._dirty[key] = entry
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """
+        Drop one key, or every entry when key is None.
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._dirty.clear()
+                self._clear_pending = bool(self.persist_path)
+            else:
+                removed = 1 if self._entries.pop(key, None) is not None else 0
+                if self.persist_path:
+                    self._dirty[key] = None
+            self._invalidations += 1
+            self._stats["invalidations"] += removed
+        if removed:
+            logger.info(f"Invalidated {removed} entries from {self.name} cache")
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["unflushed"] = len(self._dirty)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else 0.0
+        stats["max_size"] = self.max_size
+        stats["persisted"] = self.persist_path is not None
+        return stats
+
+    def flush(self):
+        """
+        Write dirty entries to the persist file.
+
+        Each key is upserted or deleted on its own, so entries written by
+        other processes since our last flush are kept.
+        """
+        if not self.persist_path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                clear, self._clear_pending = self._clear_pending, False
+            if not dirty and not clear:
+                return
+            try:
+                with self._connect() as conn:
+                    if clear:
+                        conn.execute("DELETE FROM entries")
+                    conn.executemany(
+                        "DELETE FROM entries WHERE key = ?",
+                        [(key,) for key, entry in dirty.items() if entry is None]
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO entries (key, value, negative, expires_at) VALUES (?, ?, ?, ?)",
+                        [(key, json.dumps(entry[0], default=str), int(entry[1]), entry[2])
+                         for key, entry in dirty.items() if entry is not None]
+                    )
+                    conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+                    conn.execute(
+                        "DELETE FROM entries WHERE rowid NOT IN "
+                        "(SELECT rowid FROM entries ORDER BY expires_at DESC LIMIT ?)",
+                        (self.max_size,)
+                    )
+            except Exception as e:
+                logger.error(f"Error saving {self.name} cache to {self.persist_path}: {e}")
+                with self._lock:
+                    # Keep the changes for the next flush, unless the key changed again since
+                    for key, entry in dirty.items():
+                        self._dirty.setdefault(key, entry)
+                    self._clear_pending = self._clear_pending or clear
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval_seconds)
+            self.flush()
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection to the persist file (opened on first use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.persist_path), timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _load(self):
+        """Create the persist table if needed and load the newest unexpired entries."""
+        try:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, value TEXT, negative INTEGER NOT NULL, expires_at REAL NOT NULL)""")
+                rows = conn.execute(
+                    "SELECT key, value, negative, expires_at FROM entries WHERE expires_at > ? "
+                    "ORDER BY expires_at DESC LIMIT ?",
+                    (time.time(), self.max_size)
+                ).fetchall()
+            self._entries = OrderedDict(
+                (key, (json.loads(value), bool(negative), expires_at))
+                for key, value, negative, expires_at in reversed(rows)
+            )
+            logger.info(f"Loaded {len(self._entries)} entries into {self.name} cache from {self.persist_path}")
+        except Exception as e:
+            logger.error(f"Error loading {self.name} cache from {self.persist_path}: {e}")
+
+    def _read_persisted(self, key: str) -> Optional[Tuple[Any, bool, float]]:
+        """Entry another process has flushed for a key we do not hold."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, negative, expires_at FROM entries WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading {self.name} cache from {self.persist_path}: {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), bool(row[1]), row[2]
+
+
+# Named cache instances, configured from CACHE_CONFIG
+_caches: Dict[str, LookupCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_lookup_cache(name: str) -> LookupCache:
+    """Get the singleton cache configured under CACHE_CONFIG[name]."""
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                config = CACHE_CONFIG.get(name, {})
+                cache = LookupCache(
+                    name,
+                    max_size=config.get("max_size", 1000),
+                    ttl_seconds=config.get("ttl_seconds", 21600),
+                    negative_ttl_seconds=config.get("negative_ttl_seconds", 300),
+                    persist_path=config.get("persist_path") or None,
+                    flush_interval_seconds=config.get("flush_interval_seconds", 5)
+                )
+                _caches[name] = cache
+    return cache
+
+
+def get_all_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every cache created so far."""
+    return {name: cache.get_stats() for name, cache in list(_caches.items())}
@@ -0,0 +1,449 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.tracing import get_timing_histograms
+from config import METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram kind recorded by app.utils.tracing -> metric name prefix
+TIMING_PREFIXES = {
+    "transaction": "triton_transaction",
+    "step": "triton_step",
+    "ims": "ims_request",
+    "http": "http_request"
+}
+
+# Sample key of ims_cache_lookups_total (label values are already escaped)
+_CACHE_LOOKUP_KEY = re.compile(r'cache="(?P<cache>(?:[^"\\]|\\.)*)",result="(?P<result>\w+)"')
+
+TIMING_HELP = {
+    "transaction": "Triton transactions processed, by transaction type",
+    "step": "Transaction workflow steps",
+    "ims": "IMS SOAP calls, by SOAP action and ExecuteDataSet procedure",
+    "http": "Requests to this API, by route"
+}
+
+
+class MetricFamilies:
+    """
+    Metric families assembled for one scrape.
+
+    Samples are keyed by their rendered label set, which keeps the whole
+    structure JSON-serializable so the families of several worker processes
+    can be merged: counters and histograms add up, gauges add up or take the
+    maximum (merge="max") for values every worker reads from shared state.
+    """
+
+    def __init__(self, families: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.families: Dict[str, Dict[str, Any]] = families if families is not None else {}
+
+    def add(self, name: str, metric_type: str, help_text: str, value: float,
+            labels: Optional[Dict[str, Any]] = None, merge: str = "sum"):
+        """Set one counter or gauge sample."""
+        family = self._family(name, metric_type, help_text, merge)
+        family["samples"][_label_string(labels)] = value
+
+    def add_histogram(self, name: str, help_text: str, labels: Dict[str, Any],
+                      buckets: List[int], sum_seconds: float):
+        """Set one histogram sample from per-bucket (non-cumulative) counts."""
+        family = self._family(name, "histogram", help_text, "sum")
+        family["samples"][_label_string(labels)] = {"buckets": list(buckets), "sum": sum_seconds}
+
+    def merge(self, families: Dict[str, Dict[str, Any]]):
+        """Add another process's families into these."""
+        for name, other in families.items():
+            family = self.families.get(name)
+            if family is None:
+                self.families[name] = {**other, "samples": dict(other["samples"])}
+                continue
+            samples = family["samples"]
+            for key, value in other["samples"].items():
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif family["type"] == "histogram":
+                    samples[key] = {
+                        "buckets": [a + b for a, b in zip(current["buckets"], value["buckets"])],
+                        "sum": current["sum"] + value["sum"]
+                    }
+                elif family["merge"] == "max":
+                    samples[key] = max(current, value)
+                else:
+                    samples[key] = current + value
+
+    def render(self) -> str:
+        """Prometheus text exposition of every family."""
+        bounds = [_format(bound / 1000) for bound in get_timing_histograms().bounds_ms] + ["+Inf"]
+        lines = []
+        for name in sorted(self.families):
+            family = self.families[name]
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key in sorted(family["samples"]):
+                value = family["samples"][key]
+                if family["type"] != "histogram":
+                    lines.append(f"{name}{_braces(key)} {_format(value)}")
+                    continue
+                cumulative = 0
+                for le, count in zip(bounds, value["buckets"]):
+                    cumulative += count
+                    bucket_labels = f'{key},le="{le}"' if key else f'le="{le}"'
+                    lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+                lines.append(f"{name}_sum{_braces(key)} {_format(value['sum'])}")
+                lines.append(f"{name}_count{_braces(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name: str, metric_type: str, help_text: str, merge: str) -> Dict[str, Any]:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = {"type": metric_type, "help": help_text, "merge": merge, "samples": {}}
+        return family
+
+
+class HTTPRequestStats:
+    """Requests to this API by method, route and status, plus the in-flight gauge."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._counts: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method: str, route: str, status: int, start: float):
+        duration_ms = (time.perf_counter() - start) * 1000
+        key = (method, route, status)
+        with self._lock:
+            self.in_flight -= 1
+            self._counts[key] = self._counts.get(key, 0) + 1
+        get_timing_histograms().observe("http", f"{method} {route}", duration_ms, "ok" if status < 500 else "error")
+
+    def collect(self, metrics: MetricFamilies):
+        with self._lock:
+            counts = dict(self._counts)
+            in_flight = self.in_flight
+        metrics.add("http_requests_in_flight", "gauge", "Requests to this API being processed", in_flight)
+        for (method, route, status), count in counts.items():
+            metrics.add(
+                "http_requests_total", "counter", "Requests to this API, by route and status", count,
+                {"method": method, "route": route, "status": status}
+            )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware feeding HTTPRequestStats.
+
+    Requests are labelled with the route template (/api/triton/transaction/jobs/{job_id}),
+    not the raw path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _http_stats.started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            _http_stats.finished(scope["method"], route, status, start)
+
+
+class MultiprocessStore:
+    """
+    Metric files of the worker processes in a shared directory.
+
+    Every process writes its own families to metrics_<pid>.json (atomically,
+    every flush interval and on each scrape it serves); a scrape merges the
+    files written within stale_seconds, so it reports all live workers.
+    """
+
+    def __init__(self, directory: str, stale_seconds: float = 60):
+        self.directory = Path(directory)
+        self.stale_seconds = stale_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"metrics_{os.getpid()}.json"
+
+    def write(self, metrics: MetricFamilies):
+        # Per thread: the flush thread and a scrape may write at the same time
+        temp_path = self.path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(metrics.families, f)
+        os.replace(temp_path, self.path)
+
+    def read_others(self) -> List[Dict[str, Dict[str, Any]]]:
+        """Families written by the other live workers."""
+        own = self.path
+        cutoff = time.time() - self.stale_seconds
+        others = []
+        for path in self.directory.glob("metrics_*.json"):
+            if path == own:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    continue
+                with open(path, "r") as f:
+                    others.append(json.load(f))
+            except (OSError, ValueError) as e:
+                # A worker that just exited, or a file being replaced
+                logger.debug(f"Skipping metrics file {path}: {str(e)}")
+        return others
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_http_stats = HTTPRequestStats()
+
+_store: Optional[MultiprocessStore] = None
+_flush_stop = threading.Event()
+_flush_lock = threading.Lock()
+
+
+def get_metrics_text() -> str:
+    """
+    Current metrics in Prometheus text format.
+
+    With METRICS_MULTIPROC_DIR set this covers every uvicorn worker; otherwise
+    only the process serving the scrape.
+    """
+    metrics = collect_process_metrics()
+    store = _get_store()
+    processes = 1
+    if store is not None:
+        store.write(metrics)
+        for families in store.read_others():
+            metrics.merge(families)
+            processes += 1
+
+    metrics.add("metrics_worker_processes", "gauge", "Worker processes included in this scrape", processes)
+    _add_cache_hit_ratios(metrics)
+    return metrics.render()
+
+
+def collect_process_metrics() -> MetricFamilies:
+    """Metric families of this process."""
+    metrics = MetricFamilies()
+    _collect_timings(metrics)
+    _http_stats.collect(metrics)
+    for collector in (_collect_transport, _collect_caches, _collect_auth, _collect_scheduler, _collect_job_queue):
+        try:
+            collector(metrics)
+        except Exception as e:
+            logger.warning(f"Metrics collector {collector.__name__} failed: {str(e)}")
+    return metrics
+
+
+def start_multiprocess_flush():
+    """
+    Write this worker's metrics to METRICS_MULTIPROC_DIR every flush interval.
+
+    Does nothing when no directory is configured.
+    """
+    store = _get_store()
+    if store is None:
+        return
+    _flush_stop.clear()
+    interval = METRICS_CONFIG["flush_interval_seconds"]
+
+    def flush_loop():
+        while not _flush_stop.wait(interval):
+            try:
+                store.write(collect_process_metrics())
+            except Exception as e:
+                logger.warning(f"Could not write metrics to {store.directory}: {str(e)}")
+
+    threading.Thread(target=flush_loop, name="metrics-flush", daemon=True).start()
+    logger.info(f"Writing metrics of worker {os.getpid()} to {store.directory} every {interval}s")
+
+
+def stop_multiprocess_flush():
+    """Stop flushing and remove this worker's file so it drops out of scrapes."""
+    _flush_stop.set()
+    store = _get_store()
+    if store is not None:
+        store.remove()
+
+
+def _get_store() -> Optional[MultiprocessStore]:
+    global _store
+    directory = METRICS_CONFIG["multiproc_dir"]
+    if not directory:
+        return None
+    if _store is None:
+        with _flush_lock:
+            if _store is None:
+                _store = MultiprocessStore(directory, METRICS_CONFIG["stale_seconds"])
+    return _store
+
+
+def _collect_timings(metrics: MetricFamilies):
+    """Latency histograms and error counters from the tracing spans."""
+    for kind, names in get_timing_histograms().raw().items():
+        prefix = TIMING_PREFIXES.get(kind)
+        if prefix is None:
+            continue
+        help_text = TIMING_HELP[kind]
+        for name, series in names.items():
+            labels = _timing_labels(kind, name)
+            metrics.add_histogram(
+                f"{prefix}_duration_seconds", f"{help_text} (seconds)", labels,
+                series["buckets"], series["sum_ms"] / 1000
+            )
+            metrics.add(f"{prefix}_errors_total", "counter", f"{help_text} that failed", series["errors"], labels)
+            if kind == "ims":
+                metrics.add("ims_request_bytes_total", "counter", f"{help_text} (bytes)",
+                            series["request_bytes"], {**labels, "direction": "sent"})
+                metrics.add("ims_request_bytes_total", "counter", f"{help_text} (bytes)",
+                            series["response_bytes"], {**labels, "direction": "received"})
+
+
+def _timing_labels(kind: str, name: str) -> Dict[str, str]:
+    if kind == "transaction":
+        return {"transaction_type": name}
+    if kind == "step":
+        return {"step": name}
+    if kind == "http":
+        method, _, route = name.partition(" ")
+        return {"method": method, "route": route}
+    # IMS spans are named after the SOAP action, or ExecuteDataSet:<procedure>
+    action, _, procedure = name.partition(":")
+    return {"action": action, "procedure": procedure}
+
+
+def _collect_transport(metrics: MetricFamilies):
+    from app.services.ims.soap_transport import get_soap_transport
+
+    for endpoint, stats in get_soap_transport().get_stats().items():
+        labels = {"endpoint": endpoint}
+        metrics.add("ims_requests_in_flight", "gauge", "IMS SOAP calls waiting for a response", stats["in_flight"], labels)
+        metrics.add("ims_transport_errors_total", "counter", "IMS SOAP calls that got no HTTP response",
+                    stats["errors"], labels)
+        metrics.add("ims_pool_size", "gauge", "Connection pool size per IMS endpoint", stats["pool_size"], labels)
+        metrics.add("ims_pool_connections_created_total", "counter", "Connections opened by the IMS pools",
+                    stats["connections_opened"], labels)
+        metrics.add("ims_pool_connections_idle", "gauge", "Idle keep-alive connections in the IMS pools",
+                    stats["connections_idle"], labels)
+
+
+def _collect_caches(metrics: MetricFamilies):
+    from app.utils.lookup_cache import get_all_cache_stats
+
+    for cache, stats in get_all_cache_stats().items():
+        for result in ("hits", "negative_hits", "misses"):
+            metrics.add("ims_cache_lookups_total", "counter", "IMS lookup cache lookups, by result",
+                        stats[result], {"cache": cache, "result": result})
+        metrics.add("ims_cache_evictions_total", "counter", "Entries evicted from the IMS lookup caches",
+                    stats["evictions"], {"cache": cache})
+        metrics.add("ims_cache_entries", "gauge", "Entries in the IMS lookup caches", stats["size"], {"cache": cache})
+
+
+def _add_cache_hit_ratios(metrics: MetricFamilies):
+    """Hit ratio per cache, derived after merging so it covers every worker."""
+    lookups = metrics.families.get("ims_cache_lookups_total")
+    if lookups is None:
+        return
+    totals: Dict[str, List[int]] = {}
+    for key, count in lookups["samples"].items():
+        match = _CACHE_LOOKUP_KEY.match(key)
+        if match is None:
+            continue
+        entry = totals.setdefault(match.group("cache"), [0, 0])
+        entry[1] += count
+        if match.group("result") != "misses":
+            entry[0] += count
+    family = metrics._family("ims_cache_hit_ratio", "gauge",
+                             "Share of IMS lookup cache lookups answered from the cache", "max")
+    for cache, (hits, total) in totals.items():
+        family["samples"][f'cache="{cache}"'] = round(hits / total, 4) if total else 0.0
+
+
+def _collect_auth(metrics: MetricFamilies):
+    from app.services.ims.auth_service import get_auth_service
+
+    stats = get_auth_service().get_stats()
+    metrics.add("ims_auth_logins_total", "counter", "LoginIMSUser calls, by result", stats["logins"], {"result": "ok"})
+    metrics.add("ims_auth_logins_total", "counter", "LoginIMSUser calls, by result",
+                stats["login_failures"], {"result": "failed"})
+    metrics.add("ims_token_background_refreshes_total", "counter", "IMS token renewals ahead of expiry",
+                stats["background_refreshes"])
+    metrics.add("ims_token_invalid_retries_total", "counter",
+                "IMS calls retried after IMS rejected the session token", stats["invalid_token_retries"])
+
+
+def _collect_scheduler(metrics: MetricFamilies):
+    from app.services.transaction_scheduler import get_transaction_scheduler
+
+    stats = get_transaction_scheduler().get_stats(top=0)
+    for outcome in ("submitted", "completed", "failed", "cancelled"):
+        metrics.add("triton_scheduler_transactions_total", "counter", "Transactions through the scheduler, by outcome",
+                    stats.get(outcome, 0), {"outcome": outcome})
+    metrics.add("triton_scheduler_queue_depth", "gauge", "Transactions waiting behind another of the same opportunity",
+                stats["queue_depth"])
+    metrics.add("triton_transactions_in_flight", "gauge", "Transactions being processed", stats["running"])
+    metrics.add("triton_scheduler_max_lag_seconds", "gauge", "Longest wait of a queued transaction",
+                stats["max_lag_seconds"], merge="max")
+
+
+def _collect_job_queue(metrics: MetricFamilies):
+    from app.services.job_queue_service import get_job_queue_service
+
+    stats = get_job_queue_service().get_stats()
+    for status, count in stats["jobs"].items():
+        # The job database is shared by the workers, so every process reports the same counts
+        metrics.add("triton_jobs", "gauge", "Queued transaction jobs, by status", count, {"status": status}, merge="max")
+    metrics.add("triton_job_workers_running", "gauge", "Job queue worker threads running", stats["workers_running"])
+
+
+def _label_string(labels: Optional[Dict[str, Any]]) -> str:
+    if not labels:
+        return ""
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _braces(key: str) -> str:
+    return f"{{{key}}}" if key else ""
+
+
+def _format(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
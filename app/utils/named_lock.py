@@ -0,0 +1,119 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import NAMED_LOCK_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class NamedLockService:
+    """
+    Mutual exclusion by name across threads and processes, backed by SQLite.
+
+    A lock is a row in the locks table of the job database; holding it means
+    having inserted the row. Threads of one process first take a
+    threading.Lock kept per name (while anyone holds or waits for it), so
+    only one of them polls the database for a name. A row older than
+    ttl_seconds is assumed to belong to a stopped process and is taken over.
+    When the database cannot be used, the in-process lock is all that is held.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or NAMED_LOCK_CONFIG
+        self.db_path = Path(config.get("db_path", "data/transaction_jobs.db"))
+        self.ttl_seconds = config.get("ttl_seconds", 120)
+        self.poll_interval_seconds = config.get("poll_interval_seconds", 0.1)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # name -> [threading.Lock, number of threads holding or waiting for it]
+        self._thread_locks: Dict[str, List[Any]] = {}
+        self._thread_locks_lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, name: str) -> Iterator[None]:
+        """
+        Hold the lock called name for the duration of the with block.
+
+        Args:
+            name: Lock name, e.g. "insured|acme inc|austin|tx|78701"
+        """
+        with self._thread_locks_lock:
+            entry = self._thread_locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                token = self._acquire(name)
+                try:
+                    yield
+                finally:
+                    if token is not None:
+                        self._release(name, token)
+        finally:
+            with self._thread_locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._thread_locks[name]
+
+    def _acquire(self, name: str) -> Optional[str]:
+        """Insert the lock row, waiting while another process holds it; None if the database failed."""
+        token = f"{self.owner}:{uuid.uuid4()}"
+        waited = False
+        while True:
+            now = time.time()
+            try:
+                with self._connect() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("DELETE FROM locks WHERE name = ? AND expires_at < ?", (name, now))
+                    conn.execute(
+                        "INSERT INTO locks (name, token, acquired_at, expires_at) VALUES (?, ?, ?, ?)",
+                        (name, token, datetime.utcnow().isoformat(), now + self.ttl_seconds)
+                    )
+                if waited:
+                    logger.info(f"Acquired lock {name} after waiting for another process")
+                return token
+            except sqlite3.IntegrityError:
+                waited = True
+                time.sleep(self.poll_interval_seconds)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Could not take lock {name} in {self.db_path}, holding it in this process only: {str(e)}")
+                return None
+
+    def _release(self, name: str, token: str):
+        try:
+            with self._connect() as conn:
+                released = conn.execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token)).rowcount
+            if not released:
+                logger.warning(f"Lock {name} expired before it was released")
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Could not release lock {name}: {str(e)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS locks (
+            name TEXT PRIMARY KEY, token TEXT NOT NULL, acquired_at TEXT NOT NULL, expires_at REAL NOT NULL)""")
+        return conn
+
+
+# Singleton instance
+_named_lock_service = None
+_named_lock_service_lock = threading.Lock()
+
+
+def get_named_lock_service() -> NamedLockService:
+    """Get singleton instance of the named lock service."""
+    global _named_lock_service
+    if _named_lock_service is None:
+        with _named_lock_service_lock:
+            if _named_lock_service is None:
+                _named_lock_service = NamedLockService()
+    return _named_lock_service
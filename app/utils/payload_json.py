@@ -0,0 +1,43 @@
+import hashlib
+import json
+from typing import Any, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_compact(value: Any) -> bytes:
+    """
+    Serialize a value as compact JSON (no indentation or spaces), as UTF-8.
+
+    Uses orjson when it is installed and falls back to the json module for
+    values orjson refuses (e.g. integers wider than 64 bits).
+
+    Args:
+        value: A JSON-compatible value
+
+    Returns:
+        bytes: The UTF-8 JSON text
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def serialize_payload(payload: Any) -> Tuple[str, str]:
+    """
+    Serialize a transaction payload for the database.
+
+    Args:
+        payload: The Triton transaction payload
+
+    Returns:
+        Tuple[str, str]: (compact JSON text, SHA-256 hex digest of its UTF-8 bytes)
+    """
+    data = dumps_compact(payload)
+    return data.decode("utf-8"), hashlib.sha256(data).hexdigest()
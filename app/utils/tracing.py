@@ -0,0 +1,259 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Histogram bucket upper bounds in milliseconds (plus an overflow bucket)
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Spans kept per trace; further spans still feed the histograms
+MAX_SPANS_PER_TRACE = 500
+
+
+class Span:
+    """One timed operation: a workflow step or an IMS call."""
+
+    __slots__ = ("name", "kind", "start", "duration_ms", "outcome", "attributes")
+
+    def __init__(self, name: str, kind: str, start: float, attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.duration_ms = 0.0
+        self.outcome = "ok"
+        self.attributes = attributes
+
+    def set(self, **attributes: Any):
+        """Attach attributes (sizes, status codes, ...) to the span."""
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round(self.duration_ms, 1),
+            "outcome": self.outcome,
+            **self.attributes
+        }
+
+
+class Trace:
+    """
+    Spans recorded while one transaction runs.
+
+    Shared by every thread running in a copy of the transaction's context
+    (the parallel lookups), so adding spans is locked.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, recorded: Span):
+        with self._lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(recorded)
+            else:
+                self.dropped += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        The timings block returned with transaction results.
+
+        Returns:
+            Dict with total_ms, steps (step -> ms), ims (per SOAP action or
+            procedure: count, total_ms, bytes, errors), ims_total_ms and
+            ims_calls (every IMS call in order)
+        """
+        with self._lock:
+            spans = list(self.spans)
+            dropped = self.dropped
+
+        steps: Dict[str, float] = {}
+        ims: Dict[str, Dict[str, Any]] = {}
+        calls = []
+        for recorded in spans:
+            if recorded.kind == "step":
+                # A step that runs more than once (e.g. a lookup fallback) adds up
+                steps[recorded.name] = round(steps.get(recorded.name, 0.0) + recorded.duration_ms, 1)
+                continue
+            calls.append(recorded.to_dict(self.start))
+            entry = ims.setdefault(recorded.name, {
+                "count": 0, "total_ms": 0.0, "request_bytes": 0, "response_bytes": 0, "errors": 0
+            })
+            entry["count"] += 1
+            entry["total_ms"] += recorded.duration_ms
+            entry["request_bytes"] += recorded.attributes.get("request_bytes", 0)
+            entry["response_bytes"] += recorded.attributes.get("response_bytes", 0)
+            if recorded.outcome != "ok":
+                entry["errors"] += 1
+
+        for entry in ims.values():
+            entry["total_ms"] = round(entry["total_ms"], 1)
+
+        timings = {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "steps": steps,
+            "ims_total_ms": round(sum(entry["total_ms"] for entry in ims.values()), 1),
+            "ims": ims,
+            "ims_calls": calls
+        }
+        if dropped:
+            timings["dropped_spans"] = dropped
+        return timings
+
+
+class TimingHistograms:
+    """Process-wide latency histograms per (kind, name), fed by every span."""
+
+    def __init__(self, bounds_ms=BUCKET_BOUNDS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self._series: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, name: str, duration_ms: float, outcome: str = "ok",
+                request_bytes: int = 0, response_bytes: int = 0):
+        bucket = bisect_left(self.bounds_ms, duration_ms)
+        with self._lock:
+            series = self._series.setdefault(kind, {}).get(name)
+            if series is None:
+                series = self._series[kind][name] = {
+                    "count": 0, "errors": 0, "sum_ms": 0.0, "max_ms": 0.0,
+                    "request_bytes": 0, "response_bytes": 0,
+                    "buckets": [0] * (len(self.bounds_ms) + 1)
+                }
+            series["count"] += 1
+            series["sum_ms"] += duration_ms
+            series["request_bytes"] += request_bytes
+            series["response_bytes"] += response_bytes
+            series["buckets"][bucket] += 1
+            if duration_ms > series["max_ms"]:
+                series["max_ms"] = duration_ms
+            if outcome != "ok":
+                series["errors"] += 1
+
+    def raw(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Copy of every series with per-bucket (non-cumulative) counts, as recorded."""
+        with self._lock:
+            return {
+                kind: {name: {**series, "buckets": list(series["buckets"])} for name, series in names.items()}
+                for kind, names in self._series.items()
+            }
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Copy of every series with mean and bucket-estimated percentiles.
+
+        Percentiles are the upper bound of the bucket they fall in (capped
+        at the observed maximum).
+        """
+        copied = self.raw()
+        for names in copied.values():
+            for series in names.values():
+                count = series["count"]
+                series["mean_ms"] = round(series["sum_ms"] / count, 1) if count else 0.0
+                for p in (50, 95, 99):
+                    series[f"p{p}_ms"] = self._percentile(series, p)
+                series["sum_ms"] = round(series["sum_ms"], 1)
+                series["max_ms"] = round(series["max_ms"], 1)
+                series["buckets"] = {
+                    (f"le_{bound}" if i < len(self.bounds_ms) else "inf"): n
+                    for i, (bound, n) in enumerate(zip(self.bounds_ms + (None,), series["buckets"]))
+                }
+        return copied
+
+    def _percentile(self, series: Dict[str, Any], p: float) -> float:
+        target = series["count"] * p / 100
+        cumulative = 0
+        for i, n in enumerate(series["buckets"]):
+            cumulative += n
+            if n and cumulative >= target:
+                upper = self.bounds_ms[i] if i < len(self.bounds_ms) else series["max_ms"]
+                return round(min(upper, series["max_ms"]), 1)
+        return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+_histograms = TimingHistograms()
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("timing_trace", default=None)
+
+
+def get_timing_histograms() -> TimingHistograms:
+    """The process-wide timing histograms."""
+    return _histograms
+
+
+def get_current_trace() -> Optional[Trace]:
+    """The trace open in the current context, if any."""
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(name: str = "") -> Iterator[Trace]:
+    """
+    Open a trace for the current context.
+
+    Nested calls reuse the outer trace. Work handed to other threads must
+    run in a copied context (contextvars.copy_context()) to record into it.
+    """
+    current = _current_trace.get()
+    if current is not None:
+        yield current
+        return
+
+    new_trace = Trace(name)
+    token = _current_trace.set(new_trace)
+    try:
+        yield new_trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "step", **attributes: Any) -> Iterator[Span]:
+    """
+    Time a block as a span of the current trace (if any) and the histograms.
+
+    An exception escaping the block marks the span "error"; callers can set
+    span.outcome themselves for failures reported by return value.
+    """
+    current = Span(name, kind, time.perf_counter(), attributes)
+    try:
+        yield current
+    except BaseException:
+        current.outcome = "error"
+        raise
+    finally:
+        _finish(current)
+
+
+def record_span(name: str, start: float, kind: str = "step", outcome: str = "ok", **attributes: Any) -> Span:
+    """Record a span that started at start (time.perf_counter()) and ends now."""
+    current = Span(name, kind, start, attributes)
+    current.outcome = outcome
+    _finish(current)
+    return current
+
+
+def _finish(current: Span):
+    current.duration_ms = (time.perf_counter() - current.start) * 1000
+    active = _current_trace.get()
+    if active is not None:
+        active.add(current)
+    _histograms.observe(
+        current.kind,
+        current.name,
+        current.duration_ms,
+        current.outcome,
+        current.attributes.get("request_bytes", 0),
+        current.attributes.get("response_bytes", 0)
+    )
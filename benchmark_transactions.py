@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+Offline Transaction Benchmark
+Runs TransactionHandler.process_transaction end to end for every
+transaction type against recorded IMS responses (no network) and reports
+the Python-side cost per transaction: CPU time, allocations, XML parse
+time and function calls.
+
+Corpus: the test<N>*.json payload families (bind, unbind, bind2, issue,
+endt, cancel, reinstate). Each family is first run in order against the
+in-process IMS simulator while the responses are recorded; the measured
+runs then replay those responses from memory, so the simulator's own
+work is not measured. Lookup caches are cleared before every run so
+each one makes the same IMS calls.
+
+Transaction types measured:
+  bind, rebind (bind2 after unbind), renewal_bind (bind whose expiring
+  policy exists in IMS), issue, unbind, midterm_endorsement,
+  cancellation, reinstatement
+
+Response parsers:
+  Every SOAP envelope recorded for the corpus is also fed to the service
+  method that parses it, once per installed XML backend (lxml, etree), to
+  show the CPU per response of each. ExecuteDataSet results are decoded
+  by app/services/ims/dataset.py whatever the backend, so they are left
+  out.
+
+Baselines:
+  --save-baseline writes the results to the baseline file; later runs
+  compare against it and exit with status 1 when a metric regresses by
+  more than --threshold (and by more than a small absolute floor, so
+  noise on tiny values does not fail the run).
+"""
+import sys
+import os
+import json
+import argparse
+import cProfile
+import gc
+import glob
+import logging
+import platform
+import pstats
+import re
+import statistics
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+
+# Add current directory to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from ims_simulator import IMSSimulator
+from app.services.ims import soap_parser
+from app.services.ims.auth_service import get_auth_service
+from app.services.ims.bind_service import get_bind_service
+from app.services.ims.cassette import build_response, request_key
+from app.services.ims.insured_service import get_insured_service
+from app.services.ims.issue_service import get_issue_service
+from app.services.ims.quote_options_service import get_quote_options_service
+from app.services.ims.quote_service import get_quote_service
+from app.services.ims.unbind_service import get_unbind_service
+from app.services.ims.soap_transport import get_soap_transport
+from app.services.transaction_handler import get_transaction_handler
+from app.utils.lookup_cache import get_all_cache_stats, get_lookup_cache
+
+# Files of one payload family, in the order they are processed
+SEQUENCE = [
+    ("bind", "bind"),
+    ("unbind", "unbind"),
+    ("rebind", "bind2"),
+    ("issue", "issue"),
+    ("midterm_endorsement", "endt"),
+    ("cancellation", "cancel"),
+    ("reinstatement", "reinstate")
+]
+TRANSACTION_TYPES = [name for name, _ in SEQUENCE[:1]] + ["renewal_bind"] + [name for name, _ in SEQUENCE[1:]]
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# metric -> absolute change below which a relative regression is ignored
+REGRESSION_FLOORS = {
+    "cpu_ms": 1.0,
+    "parse_ms": 0.25,
+    "peak_alloc_kb": 32.0,
+    "function_calls": 50
+}
+
+# SOAP action -> the service method parsing its response
+RESPONSE_PARSERS: Dict[str, Callable[[str], Any]] = {
+    "LoginIMSUser": lambda text: get_auth_service()._parse_login_response(text),
+    "FindInsuredByName": lambda text: get_insured_service()._parse_find_insured_response(text, ""),
+    "AddInsuredWithLocation": lambda text: get_insured_service()._parse_add_insured_response(text, ""),
+    "AddQuoteWithSubmission": lambda text: get_quote_service()._parse_quote_response(text),
+    "AutoAddQuoteOptions": lambda text: get_quote_options_service()._parse_quote_options_response(text, ""),
+    "BindQuote": lambda text: get_bind_service()._parse_bind_quote_response(text),
+    "IssuePolicy": lambda text: get_issue_service()._parse_issue_policy_response(text),
+    "UnbindPolicy": lambda text: get_unbind_service()._parse_unbind_response(text)
+}
+
+# Passes over the recorded responses per timed parser run
+PARSER_PASSES = 50
+
+# Profiler entries counted as XML parsing
+PARSE_FUNCTION = re.compile(r"xml[/\\](etree|sax|dom|parsers)|pyexpat|lxml")
+
+
+class RecordedIMS(BaseAdapter):
+    """
+    Requests adapter answering IMS SOAP calls without a network.
+
+    While recording, calls go to an in-process IMSSimulator and every
+    response is kept per SOAP action (and ExecuteDataSet procedure). While
+    replaying, each call gets the next recorded response for its key, so a
+    replayed transaction sees exactly what the recorded one saw.
+    """
+
+    def __init__(self, simulator: Optional[IMSSimulator] = None):
+        super().__init__()
+        self.simulator = simulator
+        self.recording: Optional[Dict[str, List[Tuple[int, bytes]]]] = None
+        self._replay: Optional[Dict[str, deque]] = None
+        self._lock = threading.Lock()
+
+    def record(self) -> Dict[str, List[Tuple[int, bytes]]]:
+        """Start a new recording (returned, filled as calls are made)."""
+        self._replay = None
+        self.recording = {}
+        return self.recording
+
+    def replay(self, recording: Dict[str, List[Tuple[int, bytes]]]):
+        """Serve the responses of recording, in order per key."""
+        self.recording = None
+        self._replay = {key: deque(responses) for key, responses in recording.items()}
+
+    def send(self, request, **kwargs):
+        soap_action = request.headers.get("SOAPAction", "")
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else (request.body or b"")
+        action, procedure, _ = request_key(soap_action, body)
+        key = f"{action}:{procedure}"
+
+        with self._lock:
+            if self._replay is not None:
+                responses = self._replay.get(key)
+                if not responses:
+                    raise requests.exceptions.ConnectionError(f"No recorded IMS response left for {key}")
+                status, content = responses.popleft()
+            else:
+                status, text = self.simulator.handle(soap_action, body)
+                content = text.encode("utf-8")
+                if self.recording is not None:
+                    self.recording.setdefault(key, []).append((status, content))
+
+        return build_response(request, status, content)
+
+    def close(self):
+        pass
+
+
+def discover_families(directory: str) -> List[str]:
+    """Family numbers with a complete set of test<N><step>.json files."""
+    families = []
+    for path in glob.glob(os.path.join(directory, "test*bind.json")):
+        family = os.path.basename(path)[len("test"):-len("bind.json")]
+        if family.isdigit() and all(
+            os.path.exists(os.path.join(directory, f"test{family}{suffix}.json")) for _, suffix in SEQUENCE
+        ):
+            families.append(family)
+    return sorted(families, key=int)
+
+
+def load_family(directory: str, family: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(transaction type, payload) for one family, in processing order."""
+    steps = []
+    for name, suffix in SEQUENCE:
+        with open(os.path.join(directory, f"test{family}{suffix}.json"), 'r') as f:
+            steps.append((name, json.load(f)))
+    return steps
+
+
+def renewal_payload(bind_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The family's bind as the renewal of its expiring policy, on an opportunity of its own."""
+    payload = dict(bind_payload)
+    payload["transaction_id"] = str(uuid.uuid4())
+    payload["opportunity_id"] = int(payload.get("opportunity_id") or 0) + 9000000
+    payload["opportunity_type"] = "Renewal"
+    if not payload.get("expiring_policy_number"):
+        payload["expiring_policy_number"] = f"EXP-{payload.get('policy_number') or payload['opportunity_id']}"
+    return payload
+
+
+class TransactionBenchmark:
+    """Records each family's IMS traffic once, then measures replayed runs."""
+
+    def __init__(self, directory: str, families: List[str], iterations: int):
+        self.directory = directory
+        self.families = families
+        self.iterations = iterations
+        self.adapter = RecordedIMS()
+        self.handler = get_transaction_handler()
+        # SOAP action -> every successful response recorded for it
+        self.responses: Dict[str, List[str]] = {}
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Measure every transaction type over all families.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: transaction type -> metrics (medians
+            across families and iterations)
+        """
+        get_soap_transport().mount(self.adapter)
+        try:
+            samples: Dict[str, List[Dict[str, float]]] = {name: [] for name in TRANSACTION_TYPES}
+            for family in self.families:
+                print(f"Family test{family}: recording IMS responses...")
+                for name, payload, recording in self.record_family(family):
+                    samples[name].extend(self.measure(payload, recording))
+                    print(f"  {name:<22} {len(samples[name])} runs")
+        finally:
+            get_soap_transport().mount(None)
+
+        return {name: summarize(runs) for name, runs in samples.items() if runs}
+
+    def record_family(self, family: str) -> List[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+        """Run the family in order against a fresh simulator, recording each transaction."""
+        self.adapter.simulator = IMSSimulator(seed=int(family))
+        # The cached token belongs to the previous family's simulator; log in
+        # to this one before recording so no transaction records a re-login
+        self.adapter.record()
+        auth_service = get_auth_service()
+        auth_service.invalidate_token()
+        success, message = auth_service.ensure_authenticated()
+        if not success:
+            raise RuntimeError(f"test{family}: login to the simulator failed: {message}")
+        steps = load_family(self.directory, family)
+        recorded = []
+
+        for name, payload in steps:
+            recorded.append((name, payload, self._record(family, name, payload)))
+
+        # Renewal: the expiring policy now exists, on an opportunity of its own
+        payload = renewal_payload(steps[0][1])
+        self.adapter.simulator.add_policy(payload["expiring_policy_number"], premium=float(payload.get("gross_premium") or 0))
+        recorded.insert(1, ("renewal_bind", payload, self._record(family, "renewal_bind", payload)))
+        return recorded
+
+    def _record(self, family: str, name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        clear_lookup_caches()
+        recording = self.adapter.record()
+        success, results, message = self.handler.process_transaction(payload)
+        if not success:
+            raise RuntimeError(f"test{family} {name} failed against the simulator: {message}")
+        if name == "renewal_bind" and not results.get("renewal_of_quote_guid"):
+            raise RuntimeError(f"test{family} renewal_bind did not find its expiring policy")
+        # Baselines only measure clean runs: a fault (and the retry after it) would be replayed every time
+        for key, responses in recording.items():
+            for status, content in responses:
+                fault = soap_parser.fault_message(soap_parser.parse(content))
+                if fault:
+                    raise RuntimeError(f"test{family} {name} recorded a SOAP fault from {key}: {fault}")
+        for key, responses in recording.items():
+            action = key.split(":", 1)[0]
+            if action in RESPONSE_PARSERS:
+                self.responses.setdefault(action, []).extend(
+                    content.decode("utf-8") for status, content in responses if status == 200
+                )
+        return recording
+
+    def measure(self, payload: Dict[str, Any], recording: Dict[str, Any]) -> List[Dict[str, float]]:
+        """Timed runs, then one run each under tracemalloc and cProfile."""
+        runs = []
+        for _ in range(self.iterations):
+            gc.collect()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            results = self._replay(payload, recording)
+            runs.append({
+                "wall_ms": (time.perf_counter() - wall_start) * 1000,
+                "cpu_ms": (time.process_time() - cpu_start) * 1000,
+                "ims_calls": len(results["timings"]["ims_calls"])
+            })
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            self._replay(payload, recording)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self._replay(payload, recording)
+        finally:
+            profiler.disable()
+        stats = pstats.Stats(profiler).stats
+        parse_seconds = sum(
+            entry[2] for (filename, _, function), entry in stats.items()
+            if PARSE_FUNCTION.search(filename) or PARSE_FUNCTION.search(function)
+        )
+        function_calls = sum(entry[1] for entry in stats.values())
+
+        for run in runs:
+            run["peak_alloc_kb"] = (peak - base) / 1024
+            run["retained_kb"] = (current - base) / 1024
+            run["parse_ms"] = parse_seconds * 1000
+            run["function_calls"] = function_calls
+        return runs
+
+    def measure_parsers(self) -> Dict[str, Dict[str, Any]]:
+        """
+        CPU per response of each response parser under every installed XML backend.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: SOAP action -> response count and
+            microseconds per response for each backend (fastest of
+            self.iterations runs)
+        """
+        results = {action: {"responses": len(texts)} for action, texts in sorted(self.responses.items())}
+        selected = soap_parser.get_backend()
+        try:
+            for backend in soap_parser.available_backends():
+                soap_parser.use_backend(backend)
+                for action, texts in self.responses.items():
+                    parse = RESPONSE_PARSERS[action]
+                    for text in texts:
+                        parse(text)
+                    timings = []
+                    for _ in range(self.iterations):
+                        cpu_start = time.process_time()
+                        for _ in range(PARSER_PASSES):
+                            for text in texts:
+                                parse(text)
+                        timings.append(time.process_time() - cpu_start)
+                    results[action][f"{backend}_us"] = round(
+                        min(timings) / (PARSER_PASSES * len(texts)) * 1_000_000, 2
+                    )
+        finally:
+            soap_parser.use_backend(selected)
+        return results
+
+    def _replay(self, payload: Dict[str, Any], recording: Dict[str, Any]) -> Dict[str, Any]:
+        clear_lookup_caches()
+        self.adapter.replay(recording)
+        success, results, message = self.handler.process_transaction(payload)
+        if not success:
+            raise RuntimeError(f"Replayed {payload.get('transaction_type')} failed: {message}")
+        return results
+
+
+def clear_lookup_caches():
+    for name in get_all_cache_stats():
+        get_lookup_cache(name).invalidate()
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Fastest CPU and wall time (like timeit, the least disturbed run), and
+    medians of everything else.
+    """
+    summary = {"runs": len(runs)}
+    for metric in ("cpu_ms", "wall_ms"):
+        values = [run[metric] for run in runs]
+        summary[metric] = round(min(values), 3)
+        summary[f"{metric}_median"] = round(statistics.median(values), 3)
+    for metric in ("parse_ms", "peak_alloc_kb", "retained_kb", "function_calls", "ims_calls"):
+        summary[metric] = round(statistics.median(run[metric] for run in runs), 3)
+    return summary
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """
+    Regressions of results against baseline.
+
+    Returns:
+        List[str]: One line per metric that grew by more than threshold
+        (relative) and its REGRESSION_FLOORS entry (absolute)
+    """
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric, floor in REGRESSION_FLOORS.items():
+            old, new = before.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                change = (new - old) / old * 100 if old else float("inf")
+                regressions.append(f"{name}: {metric} {old} -> {new} (+{change:.0f}%)")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]]):
+    print()
+    print(f"{'transaction':<22} {'cpu ms':>9} {'wall ms':>9} {'parse ms':>9} {'peak KB':>9} {'calls':>9} {'ims':>5}")
+    for name in TRANSACTION_TYPES:
+        metrics = results.get(name)
+        if metrics is None:
+            continue
+        print(f"{name:<22} {metrics['cpu_ms']:>9.2f} {metrics['wall_ms']:>9.2f} {metrics['parse_ms']:>9.2f} "
+              f"{metrics['peak_alloc_kb']:>9.1f} {metrics['function_calls']:>9.0f} {metrics['ims_calls']:>5.0f}")
+        before = (baseline or {}).get(name)
+        if before:
+            print(f"{'  baseline':<22} {before['cpu_ms']:>9.2f} {before['wall_ms']:>9.2f} {before['parse_ms']:>9.2f} "
+                  f"{before['peak_alloc_kb']:>9.1f} {before['function_calls']:>9.0f} {before['ims_calls']:>5.0f}")
+
+
+def print_parser_results(parsers: Dict[str, Dict[str, Any]]):
+    backends = soap_parser.available_backends()
+    print()
+    print(f"{'response parser':<24} {'responses':>9}" + "".join(f" {backend + ' us':>9}" for backend in backends)
+          + (f" {'saved':>7}" if len(backends) > 1 else ""))
+    for action, metrics in parsers.items():
+        line = f"{action:<24} {metrics['responses']:>9}" + "".join(
+            f" {metrics[f'{backend}_us']:>9.2f}" for backend in backends
+        )
+        if len(backends) > 1:
+            fastest, slowest = metrics[f"{backends[0]}_us"], metrics[f"{backends[-1]}_us"]
+            line += f" {(1 - fastest / slowest) * 100 if slowest else 0:>6.0f}%"
+        print(line)
+    print(f"(XML backend in use: {soap_parser.get_backend()})")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Measure the Python-side cost of each transaction type against recorded IMS responses',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Record a baseline on main
+  %(prog)s --save-baseline
+
+  # After a change: compare, exit 1 if anything regressed by more than 15%%
+  %(prog)s --threshold 0.15
+
+  # Quicker run on one family
+  %(prog)s --families 85 --iterations 5
+        """
+    )
+
+    parser.add_argument('--families', default=None,
+                        help='Comma-separated payload families, e.g. 4,85,86 (default: every complete test<N>*.json set)')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='Timed runs per transaction and family (default: 20)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help=f'Baseline JSON file (default: {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write these results to the baseline file instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative increase that counts as a regression (default: 0.2)')
+    parser.add_argument('--output', default=None,
+                        help='Also write the results to this JSON file')
+
+    args = parser.parse_args()
+
+    # The services log every IMS request and response; the plain binds also
+    # warn that their expiring policy does not exist
+    logging.basicConfig(level=logging.ERROR)
+
+    families = args.families.split(",") if args.families else discover_families(current_dir)
+    if not families:
+        print("No complete test<N>*.json payload families found")
+        return 2
+
+    benchmark = TransactionBenchmark(current_dir, families, args.iterations)
+    try:
+        results = benchmark.run()
+    except RuntimeError as e:
+        print(f"Benchmark corpus failed: {e}")
+        return 2
+    parsers = benchmark.measure_parsers()
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "families": families,
+        "iterations": args.iterations,
+        "xml_backend": soap_parser.get_backend(),
+        "results": results,
+        "parsers": parsers
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        print_results(results, None)
+        print_parser_results(parsers)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+    print_parser_results(parsers)
+
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,7 +11,10 @@ import argparse
 import traceback
 from datetime import datetime
 import time
+import math
 import re
+import threading
+from collections import defaultdict
 
 # Add current directory to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -29,9 +32,11 @@ logger = logging.getLogger(__name__)
 
 # Import transaction handler
 from app.services.transaction_handler import get_transaction_handler
+from app.services.transaction_scheduler import TransactionScheduler
 
 class BulkTransactionTester:
-    def __init__(self, csv_file, parameter_number=None, use_default_names=False, step_through=False):
+    def __init__(self, csv_file, parameter_number=None, use_default_names=False, step_through=False,
+                 workers=1, resume=False, checkpoint_file=None):
         """
         Initialize bulk tester
         
@@ -40,17 +45,39 @@ class BulkTransactionTester:
             parameter_number: Number to append to IDs (e.g., 42)
             use_default_names: If True, use default producer/underwriter names
             step_through: If True, pause after each transaction for user input
+            workers: Transactions processed in parallel (different opportunities only;
+                     rows for one opportunity always run in CSV order)
+            resume: If True, skip rows the checkpoint file records as succeeded
+            checkpoint_file: Checkpoint path (default derived from the CSV name and parameter)
         """
         self.csv_file = csv_file
         self.parameter_number = parameter_number
         self.use_default_names = use_default_names
         self.step_through = step_through
+        self.workers = max(1, workers)
+        self.resume = resume
+        param_suffix = f"_p{parameter_number}" if parameter_number else ""
+        csv_stem = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.splitext(os.path.basename(csv_file))[0])
+        self.checkpoint_file = checkpoint_file or f"bulk_test_checkpoint_{csv_stem}{param_suffix}.ndjson"
         self.handler = None
-        self.results = []
+        self.results = []  # Failed results only; every result is streamed to results_file
         self.processed_count = 0
         self.success_count = 0
         self.error_count = 0
-        self.csv_output_rows = []  # For storing modified CSV with results
+        self.skipped_count = 0
+        self.latencies = defaultdict(list)  # transaction_type -> seconds
+        self.started_at = None
+        self.finished_at = None
+        
+        # Output streams, opened by run()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.results_file = f"bulk_test_results_{timestamp}{param_suffix}.ndjson"
+        self.csv_output_file = f"bulk_test_output_{timestamp}{param_suffix}.csv"
+        self._results_out = None
+        self._csv_out = None
+        self._csv_writer = None
+        self._checkpoint_out = None
+        self._output_lock = threading.Lock()
         
     def modify_payload(self, payload):
         """
@@ -164,7 +191,9 @@ class BulkTransactionTester:
             logger.info(f"Processing: Type={trans_type}, OppID={opp_id}, PolicyNum={policy_num}, TransID={trans_id}")
             
             # Process the transaction
+            start_time = time.perf_counter()
             success, results, message = self.handler.process_transaction(modified_payload)
+            elapsed_seconds = time.perf_counter() - start_time
             
             result_data = {
                 'row_number': row_num,
@@ -174,6 +203,7 @@ class BulkTransactionTester:
                 'policy_number': policy_num,
                 'success': success,
                 'message': message,
+                'elapsed_seconds': round(elapsed_seconds, 3),
                 'results': results
             }
             
@@ -212,6 +242,10 @@ class BulkTransactionTester:
         """
         Run bulk transaction processing
         
+        Results are streamed as they complete: one JSON line per transaction
+        to results_file, one row per CSV row to csv_output_file, and the row
+        numbers that succeeded to checkpoint_file (used by resume).
+        
         Args:
             start_row: Starting row number (1-based, skips header)
             end_row: Ending row number (inclusive)
@@ -229,8 +263,13 @@ class BulkTransactionTester:
         print(f"Step Through Mode: {self.step_through}")
         print(f"Row Range: {start_row or 'start'} to {end_row or 'end'}")
         print(f"Continue on Error: {continue_on_error}")
+        print(f"Workers: {self.workers}")
+        print(f"Resume: {self.resume} (checkpoint: {self.checkpoint_file})")
         print("="*80 + "\n")
         
+        if self.step_through and self.workers > 1:
+            return {'error': 'INVALID_OPTIONS', 'message': 'Step through mode requires a single worker'}
+        
         # Initialize handler
         try:
             logger.info("Initializing transaction handler...")
@@ -240,6 +279,12 @@ class BulkTransactionTester:
             logger.error(f"Failed to initialize handler: {e}")
             return {'error': 'HANDLER_INIT_FAILED', 'message': str(e)}
         
+        completed_rows = self.load_checkpoint() if self.resume else {}
+        if self.resume:
+            print(f"Resuming: {len(completed_rows)} rows already succeeded\n")
+        
+        self.started_at = time.time()
+        
         # Read and process CSV
         try:
             with open(self.csv_file, 'r', encoding='utf-8') as f:
@@ -254,65 +299,12 @@ class BulkTransactionTester:
                     'response_data',
                     'timestamp'
                 ]
+                self.open_outputs(output_fieldnames)
                 
-                for row_num, row in enumerate(reader, start=1):
-                    # Check row range
-                    if start_row and row_num < start_row:
-                        # Still add to output CSV but mark as skipped
-                        output_row = row.copy()
-                        output_row['processing_status'] = 'SKIPPED'
-                        output_row['processing_message'] = 'Before start row'
-                        output_row['timestamp'] = datetime.now().isoformat()
-                        self.csv_output_rows.append(output_row)
-                        continue
-                        
-                    if end_row and row_num > end_row:
-                        # Add remaining rows as skipped
-                        output_row = row.copy()
-                        output_row['processing_status'] = 'SKIPPED'
-                        output_row['processing_message'] = 'After end row'
-                        output_row['timestamp'] = datetime.now().isoformat()
-                        self.csv_output_rows.append(output_row)
-                        break
-                    
-                    if not self.step_through:
-                        print(f"\n--- Processing Row {row_num} ---")
-                    
-                    # Process the transaction
-                    success, result_data, error_msg, modified_payload = self.process_transaction(row, row_num)
-                    
-                    # Check for user quit
-                    if success is None and error_msg == "User quit":
-                        print("\nUser requested quit. Saving results and exiting...")
-                        break
-                    
-                    # Prepare output row
-                    output_row = row.copy()
-                    output_row['modified_payload'] = json.dumps(modified_payload, default=str) if modified_payload else ''
-                    output_row['processing_status'] = 'SUCCESS' if success else 'FAILED'
-                    output_row['processing_message'] = error_msg or (result_data.get('message', '') if result_data else '')
-                    output_row['response_data'] = json.dumps(result_data.get('results', {}), default=str) if result_data and 'results' in result_data else ''
-                    output_row['timestamp'] = datetime.now().isoformat()
-                    
-                    self.csv_output_rows.append(output_row)
-                    
-                    # Store result
-                    if result_data:
-                        self.results.append(result_data)
-                        self.processed_count += 1
-                        
-                        if success:
-                            self.success_count += 1
-                        else:
-                            self.error_count += 1
-                            
-                            if not continue_on_error:
-                                print(f"\nStopping due to error: {error_msg}")
-                                break
-                    
-                    # Add delay between transactions to avoid overwhelming the API
-                    if not self.step_through:
-                        time.sleep(10)
+                if self.workers > 1:
+                    self.run_parallel(reader, start_row, end_row, continue_on_error, completed_rows)
+                else:
+                    self.run_sequential(reader, start_row, end_row, continue_on_error, completed_rows)
                     
         except FileNotFoundError:
             logger.error(f"CSV file not found: {self.csv_file}")
@@ -323,8 +315,9 @@ class BulkTransactionTester:
             traceback.print_exc()
             return {'error': 'CSV_READ_ERROR', 'message': str(e)}
         
-        # Save CSV output
-        self.save_csv_output()
+        finally:
+            self.finished_at = time.time()
+            self.close_outputs()
         
         # Generate summary
         summary = self.generate_summary()
@@ -334,18 +327,209 @@ class BulkTransactionTester:
         
         return summary
     
+    def iter_rows(self, reader, start_row, end_row, completed_rows):
+        """
+        Yield (row_num, row) for the rows to process, writing skipped rows to the CSV output.
+        """
+        for row_num, row in enumerate(reader, start=1):
+            # Check row range
+            if start_row and row_num < start_row:
+                # Still add to output CSV but mark as skipped
+                self.write_skipped_row(row, 'Before start row')
+                continue
+                
+            if end_row and row_num > end_row:
+                # Add remaining rows as skipped
+                self.write_skipped_row(row, 'After end row')
+                break
+            
+            if self.is_completed(row, row_num, completed_rows):
+                self.write_skipped_row(row, 'Already succeeded (resume)')
+                self.skipped_count += 1
+                continue
+            
+            yield row_num, row
+    
+    def run_sequential(self, reader, start_row, end_row, continue_on_error, completed_rows):
+        """Process rows one at a time in CSV order."""
+        for row_num, row in self.iter_rows(reader, start_row, end_row, completed_rows):
+            if not self.step_through:
+                print(f"\n--- Processing Row {row_num} ---")
+            
+            # Process the transaction
+            success, result_data, error_msg, modified_payload = self.process_transaction(row, row_num)
+            
+            # Check for user quit
+            if success is None and error_msg == "User quit":
+                print("\nUser requested quit. Saving results and exiting...")
+                break
+            
+            self.record_result(row, row_num, success, result_data, error_msg, modified_payload)
+            
+            if result_data and not success and not continue_on_error:
+                print(f"\nStopping due to error: {error_msg}")
+                break
+            
+            # Add delay between transactions to avoid overwhelming the API
+            if not self.step_through:
+                time.sleep(10)
+    
+    def run_parallel(self, reader, start_row, end_row, continue_on_error, completed_rows):
+        """
+        Process rows on a worker pool: rows for the same opportunity in CSV
+        order, different opportunities in parallel.
+        """
+        scheduler = TransactionScheduler(max_workers=self.workers)
+        stop = threading.Event()
+        in_flight = threading.Semaphore(self.workers * 4)  # bound rows read ahead of results
+        futures = []
+        
+        def run_row(row, row_num):
+            if stop.is_set():
+                return None
+            outcome = self.process_transaction(row, row_num)
+            success, result_data, error_msg, modified_payload = outcome
+            self.record_result(row, row_num, success, result_data, error_msg, modified_payload)
+            if result_data and not success and not continue_on_error:
+                stop.set()
+            return outcome
+        
+        for row_num, row in self.iter_rows(reader, start_row, end_row, completed_rows):
+            if stop.is_set():
+                print(f"\nStopping due to error; not starting row {row_num} or later")
+                break
+            try:
+                partition_payload = self.modify_payload(json.loads(row.get('payload', '{}')))
+            except (json.JSONDecodeError, AttributeError):
+                partition_payload = {'transaction_id': f"row-{row_num}"}
+            
+            in_flight.acquire()
+            future = scheduler.submit(partition_payload, lambda _payload, row=row, row_num=row_num: run_row(row, row_num))
+            future.add_done_callback(lambda _future: in_flight.release())
+            futures.append(future)
+        
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Worker error: {e}")
+        
+        stats = scheduler.get_stats()
+        logger.info(f"Scheduler: {stats['completed']} completed, {stats['failed']} failed")
+    
+    def record_result(self, row, row_num, success, result_data, error_msg, modified_payload):
+        """Update counters and stream one result to the output files (thread-safe)."""
+        # Prepare output row
+        output_row = row.copy()
+        output_row['modified_payload'] = json.dumps(modified_payload, default=str) if modified_payload else ''
+        output_row['processing_status'] = 'SUCCESS' if success else 'FAILED'
+        output_row['processing_message'] = error_msg or (result_data.get('message', '') if result_data else '')
+        output_row['response_data'] = json.dumps(result_data.get('results', {}), default=str) if result_data and 'results' in result_data else ''
+        output_row['timestamp'] = datetime.now().isoformat()
+        
+        with self._output_lock:
+            self._csv_writer.writerow(output_row)
+            self._csv_out.flush()
+            
+            if not result_data:
+                return
+            
+            self.processed_count += 1
+            self._results_out.write(json.dumps(result_data, default=str) + "\n")
+            self._results_out.flush()
+            
+            if 'elapsed_seconds' in result_data:
+                self.latencies[result_data.get('transaction_type') or 'unknown'].append(result_data['elapsed_seconds'])
+            
+            if success:
+                self.success_count += 1
+                if not result_data.get('results', {}).get('skipped'):
+                    self._checkpoint_out.write(json.dumps({
+                        'row_number': row_num,
+                        'transaction_id': result_data.get('transaction_id')
+                    }) + "\n")
+                    self._checkpoint_out.flush()
+            else:
+                self.error_count += 1
+                self.results.append(result_data)
+    
+    def write_skipped_row(self, row, message):
+        """Write a row that was not processed to the CSV output."""
+        output_row = row.copy()
+        output_row['processing_status'] = 'SKIPPED'
+        output_row['processing_message'] = message
+        output_row['timestamp'] = datetime.now().isoformat()
+        with self._output_lock:
+            self._csv_writer.writerow(output_row)
+    
+    def load_checkpoint(self):
+        """Read row_number -> transaction_id for rows that already succeeded."""
+        completed_rows = {}
+        if not os.path.exists(self.checkpoint_file):
+            return completed_rows
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    completed_rows[entry['row_number']] = entry.get('transaction_id')
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue  # Partially written last line
+        return completed_rows
+    
+    def is_completed(self, row, row_num, completed_rows):
+        """True when the checkpoint has this row with the same (modified) transaction_id."""
+        if row_num not in completed_rows:
+            return False
+        try:
+            transaction_id = self.modify_payload(json.loads(row.get('payload', '{}'))).get('transaction_id')
+        except (json.JSONDecodeError, AttributeError):
+            return False
+        return str(transaction_id) == str(completed_rows[row_num])
+    
+    def open_outputs(self, output_fieldnames):
+        """Open the streamed output files."""
+        self._results_out = open(self.results_file, 'a', encoding='utf-8')
+        self._csv_out = open(self.csv_output_file, 'w', newline='', encoding='utf-8')
+        self._csv_writer = csv.DictWriter(self._csv_out, fieldnames=output_fieldnames, extrasaction='ignore')
+        self._csv_writer.writeheader()
+        self._checkpoint_out = open(self.checkpoint_file, 'a', encoding='utf-8')
+    
+    def close_outputs(self):
+        """Close the streamed output files."""
+        for stream in (self._results_out, self._csv_out, self._checkpoint_out):
+            if stream:
+                stream.close()
+        if self._csv_out:
+            print(f"CSV output saved to: {self.csv_output_file}")
+            if self.error_count > 0:
+                print(f"  Contains {self.error_count} failed transactions for review")
+        if self._results_out:
+            print(f"Results streamed to: {self.results_file}")
+    
     def generate_summary(self):
         """Generate test summary"""
+        elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
         summary = {
             'timestamp': datetime.now().isoformat(),
             'csv_file': self.csv_file,
             'parameter_number': self.parameter_number,
             'use_default_names': self.use_default_names,
+            'workers': self.workers,
             'total_processed': self.processed_count,
             'successful': self.success_count,
             'failed': self.error_count,
+            'skipped_resume': self.skipped_count,
             'success_rate': f"{(self.success_count/self.processed_count*100):.1f}%" if self.processed_count > 0 else "0%",
-            'results': self.results
+            'elapsed_seconds': round(elapsed, 1),
+            'throughput_per_minute': round(self.processed_count / elapsed * 60, 2) if elapsed > 0 else 0,
+            'latency_seconds': {
+                transaction_type: latency_summary(values)
+                for transaction_type, values in sorted(self.latencies.items())
+            },
+            'results_file': self.results_file,
+            'csv_output_file': self.csv_output_file,
+            'checkpoint_file': self.checkpoint_file,
+            'failed_results': self.results
         }
         
         # Print summary
@@ -355,56 +539,32 @@ class BulkTransactionTester:
         print(f"Total Processed: {self.processed_count}")
         print(f"Successful: {self.success_count}")
         print(f"Failed: {self.error_count}")
+        if self.skipped_count:
+            print(f"Skipped (already succeeded): {self.skipped_count}")
         print(f"Success Rate: {summary['success_rate']}")
+        print(f"Elapsed: {summary['elapsed_seconds']}s  Throughput: {summary['throughput_per_minute']}/min")
+        
+        if summary['latency_seconds']:
+            print("\nLatency by transaction type (seconds):")
+            for transaction_type, stats in summary['latency_seconds'].items():
+                print(f"  {transaction_type:<22} n={stats['count']:<5} "
+                      f"p50={stats['p50']:<8} p90={stats['p90']:<8} p99={stats['p99']:<8} max={stats['max']}")
         
         if self.error_count > 0:
             print("\nFailed Transactions:")
-            for result in self.results:
-                if not result.get('success', False):
-                    print(f"  Row {result.get('row_number', 'N/A')}: "
-                          f"Type={result.get('transaction_type', 'N/A')}, "
-                          f"OppID={result.get('opportunity_id', 'N/A')}, "
-                          f"Message={result.get('message', 'N/A')}")
+            for result in sorted(self.results, key=lambda r: r.get('row_number') or 0):
+                print(f"  Row {result.get('row_number', 'N/A')}: "
+                      f"Type={result.get('transaction_type', 'N/A')}, "
+                      f"OppID={result.get('opportunity_id', 'N/A')}, "
+                      f"Message={result.get('message', 'N/A')}")
         
         print("="*80 + "\n")
         
         return summary
     
-    def save_csv_output(self):
-        """Save modified CSV with processing results"""
-        if not self.csv_output_rows:
-            return
-            
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        param_suffix = f"_p{self.parameter_number}" if self.parameter_number else ""
-        output_file = f"bulk_test_output_{timestamp}{param_suffix}.csv"
-        
-        try:
-            # Get fieldnames from first row
-            if self.csv_output_rows:
-                fieldnames = list(self.csv_output_rows[0].keys())
-                
-                with open(output_file, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(self.csv_output_rows)
-                
-                logger.info(f"CSV output saved to: {output_file}")
-                print(f"CSV output saved to: {output_file}")
-                
-                # Print summary of errors
-                error_count = sum(1 for row in self.csv_output_rows if row.get('processing_status') == 'FAILED')
-                if error_count > 0:
-                    print(f"  Contains {error_count} failed transactions for review")
-                    
-        except Exception as e:
-            logger.error(f"Failed to save CSV output: {e}")
-    
     def save_results(self, summary):
-        """Save test results to JSON file"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        param_suffix = f"_p{self.parameter_number}" if self.parameter_number else ""
-        output_file = f"bulk_test_results_{timestamp}{param_suffix}.json"
+        """Save test summary (and failed results) to JSON file"""
+        output_file = self.results_file.replace('.ndjson', '_summary.json')
         
         try:
             with open(output_file, 'w', encoding='utf-8') as f:
@@ -417,6 +577,24 @@ class BulkTransactionTester:
             logger.error(f"Failed to save results: {e}")
 
 
+def latency_summary(values):
+    """Count, mean and nearest-rank percentiles of a list of latencies."""
+    ordered = sorted(values)
+    
+    def percentile(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3)
+    
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p95': percentile(95),
+        'p99': percentile(99),
+        'max': round(ordered[-1], 3)
+    }
+
+
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(
@@ -444,6 +622,12 @@ Examples:
   
   # Stop on first error
   %(prog)s transactions.csv --stop-on-error
+  
+  # 8 opportunities in parallel (each opportunity's rows still run in order)
+  %(prog)s transactions.csv -p 42 --workers 8
+  
+  # Re-run after a crash, skipping rows that already succeeded
+  %(prog)s transactions.csv -p 42 --workers 8 --resume
         """
     )
     
@@ -468,6 +652,15 @@ Examples:
     parser.add_argument('--stop-on-error', action='store_true',
                        help='Stop processing on first error (default: continue)')
     
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Process up to N opportunities in parallel; rows for one opportunity keep CSV order (default: 1, sequential)')
+    
+    parser.add_argument('--resume', action='store_true',
+                       help='Skip rows the checkpoint file records as succeeded')
+    
+    parser.add_argument('--checkpoint', default=None,
+                       help='Checkpoint file (default: bulk_test_checkpoint_<csv name>[_p<parameter>].ndjson)')
+    
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Enable verbose debug output')
     
@@ -487,7 +680,10 @@ Examples:
         csv_file=args.csv_file,
         parameter_number=args.parameter,
         use_default_names=args.names,
-        step_through=args.step
+        step_through=args.step,
+        workers=args.workers,
+        resume=args.resume,
+        checkpoint_file=args.checkpoint
     )
     
     summary = tester.run(
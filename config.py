@@ -29,7 +29,38 @@ IMS_CONFIG = {
         "program_code": os.getenv("IMS_PROGRAM_CODE", "TRTON"),
         "project_name": os.getenv("IMS_PROJECT_NAME", "RSG_Integration")
     },
-    "timeout": int(os.getenv("IMS_TIMEOUT", "30"))
+    "timeout": int(os.getenv("IMS_TIMEOUT", "30")),
+    "auth": {
+        "token_lifetime_minutes": int(os.getenv("IMS_TOKEN_LIFETIME_MINUTES", "480")),
+        # Renew the cached token this long before it expires
+        "refresh_margin_minutes": int(os.getenv("IMS_TOKEN_REFRESH_MARGIN_MINUTES", "15")),
+        "background_refresh": os.getenv("IMS_TOKEN_BACKGROUND_REFRESH", "True").lower() == "true"
+    },
+    "transport": {
+        "connect_timeout": float(os.getenv("IMS_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("IMS_READ_TIMEOUT", os.getenv("IMS_TIMEOUT", "30"))),
+        "pool_block": os.getenv("IMS_POOL_BLOCK", "False").lower() == "true",
+        "default_pool_size": int(os.getenv("IMS_POOL_SIZE", "10")),
+        # Per-endpoint pool sizes, keyed like "endpoints" above
+        "pool_sizes": {
+            "logon": int(os.getenv("IMS_POOL_SIZE_LOGON", "2")),
+            "data_access": int(os.getenv("IMS_POOL_SIZE_DATA_ACCESS", os.getenv("IMS_POOL_SIZE", "10"))),
+            "quote_functions": int(os.getenv("IMS_POOL_SIZE_QUOTE_FUNCTIONS", os.getenv("IMS_POOL_SIZE", "10"))),
+            "insured_functions": int(os.getenv("IMS_POOL_SIZE_INSURED_FUNCTIONS", os.getenv("IMS_POOL_SIZE", "10")))
+        },
+        # "record" appends every IMS call to the cassette; "replay" answers from it instead
+        # of IMS (no network). Record with a single worker: processes do not share the file.
+        "cassette_mode": os.getenv("IMS_CASSETTE_MODE", "off").lower(),
+        "cassette_path": os.getenv("IMS_CASSETTE_PATH", str(BASE_DIR / "data" / "ims_cassette.jsonl.gz")),
+        # Replay waits this multiple of each recorded latency (0 answers immediately)
+        "cassette_latency_scale": float(os.getenv("IMS_CASSETTE_LATENCY_SCALE", "1"))
+    },
+    # XML library for SOAP responses: "auto" uses lxml when installed, else xml.etree
+    "xml_backend": os.getenv("IMS_XML_BACKEND", "auto").lower(),
+    # spProcessTritonPayload_WS reads the payload stored by spStoreTritonTransaction_WS
+    # instead of receiving it again (needs both procedures from sql/Procs_8_25_25
+    # and the payload_hash column)
+    "payload_by_reference": os.getenv("IMS_PAYLOAD_BY_REFERENCE", "False").lower() == "true"
 }
 
 TRITON_CONFIG = {
@@ -49,9 +80,96 @@ QUOTE_CONFIG = {
     "default_company_commission": 0.25
 }
 
+# Persisted lookup caches write changes to their SQLite file this often (seconds)
+CACHE_FLUSH_INTERVAL = float(os.getenv("CACHE_FLUSH_INTERVAL", "5"))
+
+# Lookup caches for rarely-changing IMS reference data.
+# Set max_size to 0 to disable a cache; set persist_path to keep it across restarts.
+# POST /api/ims/cache/{name}/invalidate only clears the worker process that serves it;
+# other workers keep their in-memory entries until the TTL expires.
+CACHE_CONFIG = {
+    "producer": {
+        "max_size": int(os.getenv("PRODUCER_CACHE_SIZE", "2000")),
+        "ttl_seconds": int(os.getenv("PRODUCER_CACHE_TTL", "21600")),
+        "negative_ttl_seconds": int(os.getenv("PRODUCER_CACHE_NEGATIVE_TTL", "300")),
+        "persist_path": os.getenv("PRODUCER_CACHE_PATH", ""),
+        "flush_interval_seconds": CACHE_FLUSH_INTERVAL
+    },
+    "insured": {
+        "max_size": int(os.getenv("INSURED_CACHE_SIZE", "5000")),
+        "ttl_seconds": int(os.getenv("INSURED_CACHE_TTL", "86400")),
+        "negative_ttl_seconds": int(os.getenv("INSURED_CACHE_NEGATIVE_TTL", "60")),
+        "persist_path": os.getenv("INSURED_CACHE_PATH", ""),
+        "flush_interval_seconds": CACHE_FLUSH_INTERVAL
+    },
+    "underwriter": {
+        "max_size": int(os.getenv("UNDERWRITER_CACHE_SIZE", "500")),
+        "ttl_seconds": int(os.getenv("UNDERWRITER_CACHE_TTL", "43200")),
+        "negative_ttl_seconds": int(os.getenv("UNDERWRITER_CACHE_NEGATIVE_TTL", "300")),
+        "persist_path": os.getenv("UNDERWRITER_CACHE_PATH", ""),
+        "flush_interval_seconds": CACHE_FLUSH_INTERVAL,
+        # Comma-separated full names resolved at startup
+        "prewarm": [name.strip() for name in os.getenv("UNDERWRITER_CACHE_PREWARM", "").split(",") if name.strip()]
+    }
+}
+
+# Local snapshot of IMS producers/underwriters. Requires the getProducerContactList_WS
+# and getUserList_WS procedures (sql/Procs_8_25_25) to be deployed.
+REFERENCE_DATA_CONFIG = {
+    "enabled": os.getenv("REFERENCE_DATA_ENABLED", "False").lower() == "true",
+    "db_path": os.getenv("REFERENCE_DATA_DB_PATH", str(BASE_DIR / "data" / "reference_data.db")),
+    "sync_interval_seconds": int(os.getenv("REFERENCE_DATA_SYNC_INTERVAL", "3600"))
+}
+
+INVOICE_CONFIG = {
+    # Return bind/endorsement/cancellation/reinstatement results without waiting for
+    # the invoice; clients poll GET /api/triton/invoice/status/{invoice_id}. Requests are
+    # stored in the JOB_QUEUE_CONFIG database, so any uvicorn worker can answer the poll
+    "deferred": os.getenv("INVOICE_DEFERRED", "False").lower() == "true",
+    "workers": int(os.getenv("INVOICE_WORKERS", "4")),
+    "max_attempts": int(os.getenv("INVOICE_MAX_ATTEMPTS", "3")),
+    "retry_delay_seconds": float(os.getenv("INVOICE_RETRY_DELAY", "2")),
+    # Completed/failed requests kept for status polling
+    "retention": int(os.getenv("INVOICE_RETENTION", "1000"))
+}
+
+# Durable queue for transactions submitted with POST /api/triton/transaction/new?mode=queue
+JOB_QUEUE_CONFIG = {
+    "db_path": os.getenv("JOB_QUEUE_DB_PATH", str(BASE_DIR / "data" / "transaction_jobs.db")),
+    "workers": int(os.getenv("JOB_QUEUE_WORKERS", "4")),
+    "poll_interval_seconds": float(os.getenv("JOB_QUEUE_POLL_INTERVAL", "5")),
+    # Completed/failed jobs older than this are deleted at startup (0 keeps them)
+    "retention_days": int(os.getenv("JOB_QUEUE_RETENTION_DAYS", "30")),
+    # A running job whose process has not renewed it for this long is queued again
+    "lease_seconds": float(os.getenv("JOB_QUEUE_LEASE_SECONDS", "60"))
+}
+
+# Locks shared by all uvicorn workers (e.g. one find-or-create per insured at a time).
+# A lock held longer than ttl_seconds is taken to belong to a stopped process.
+NAMED_LOCK_CONFIG = {
+    "db_path": JOB_QUEUE_CONFIG["db_path"],
+    "ttl_seconds": float(os.getenv("NAMED_LOCK_TTL_SECONDS", "120")),
+    "poll_interval_seconds": float(os.getenv("NAMED_LOCK_POLL_INTERVAL", "0.1"))
+}
+
+# /metrics. Under several uvicorn workers, set METRICS_MULTIPROC_DIR to a directory
+# the workers share so a scrape served by any of them reports all of them.
+METRICS_CONFIG = {
+    "multiproc_dir": os.getenv("METRICS_MULTIPROC_DIR", os.getenv("PROMETHEUS_MULTIPROC_DIR", "")),
+    "flush_interval_seconds": float(os.getenv("METRICS_FLUSH_INTERVAL", "5")),
+    # Files of workers that stopped writing this long ago are left out
+    "stale_seconds": float(os.getenv("METRICS_STALE_SECONDS", "60"))
+}
+
 APP_CONFIG = {
     "debug": os.getenv("DEBUG", "False").lower() == "true",
     "host": os.getenv("HOST", "0.0.0.0"),
     "port": int(os.getenv("PORT", "8000")),
-    "log_level": os.getenv("LOG_LEVEL", "INFO")
+    "log_level": os.getenv("LOG_LEVEL", "INFO"),
+    # Transactions the API processes concurrently (threads on the IMS executor)
+    "max_concurrent_transactions": int(os.getenv("MAX_CONCURRENT_TRANSACTIONS", "32")),
+    # Threads for the concurrent insured/producer/underwriter lookups of a transaction
+    "lookup_workers": int(os.getenv("LOOKUP_WORKERS", "16")),
+    # Records of a /api/triton/transactions/batch stream read ahead of their results
+    "batch_max_in_flight": int(os.getenv("BATCH_MAX_IN_FLIGHT", "200"))
 }
\ No newline at end of file
@@ -0,0 +1,999 @@
+#!/usr/bin/env python3
+"""
+Local IMS simulator for load and latency testing.
+
+Serves the IMS SOAP actions this service uses (LoginIMSUser,
+FindInsuredByName, AddInsuredWithLocation, AddQuoteWithSubmission,
+AutoAddQuoteOptions, BindQuote, IssuePolicy and ExecuteDataSet for every
+stored procedure we call) from in-memory state, so whole transaction
+workflows can be run without touching a real IMS environment.
+
+Quotes, policies and invoices are stateful: a bind issues a policy number
+and an invoice, endorsements/cancellations/reinstatements chain new quotes
+onto the opportunity, and the lookup procedures answer from that state.
+
+Point the service at it with:
+    IMS_BASE_URL=http://127.0.0.1:8099/ims_one
+
+Usage:
+    python ims_simulator.py [--port 8099]
+        [--latency default=lognormal:120:0.5] [--latency ExecuteDataSet:ryan_rptInvoice=uniform:400:900]
+        [--fault BindQuote=0.02] [--token-lifetime 3600] [--seed 42]
+
+Latency distributions (milliseconds): fixed:MS, uniform:MIN:MAX,
+normal:MEAN:SD, lognormal:MEDIAN:SIGMA. Keys are a SOAP action name,
+"ExecuteDataSet:<procedure>" or "default".
+
+GET /stats returns throughput, per-action counts, faults and latency;
+POST /reset clears state and counters; GET /health is a liveness check.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+NULL_GUID = "00000000-0000-0000-0000-000000000000"
+SIM_USER_GUID = "5e1a5e1a-0000-4000-8000-000000000001"
+BUSINESS_OBJECTS_NS = "http://ws.mgasystems.com/BusinessObjects"
+LINE_GUID = "07564291-CBFE-4BBE-88D1-0548C88ACED4"
+
+# Quote status ids as IMS reports them
+QUOTE_STATUS = {"quoted": 1, "bound": 3, "issued": 4, "cancelled": 12}
+
+
+class SOAPFault(Exception):
+    """Returned to the client as a soap:Server fault (HTTP 500)."""
+
+
+class LatencyDistribution:
+    """Samples simulated IMS latency in milliseconds from a spec like "lognormal:120:0.5"."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *args = spec.split(":")
+        values = [float(arg) for arg in args]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(
+                f"Invalid latency spec '{spec}' (use fixed:MS, uniform:MIN:MAX, normal:MEAN:SD or lognormal:MEDIAN:SIGMA)"
+            )
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.values)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(*self.values))
+        median, sigma = self.values
+        return rng.lognormvariate(math.log(max(median, 0.001)), sigma)
+
+
+class SimulatorStats:
+    """Thread-safe throughput, fault and latency counters per action."""
+
+    def __init__(self, window: int = 2000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.total = 0
+            self.faults = 0
+            self.in_flight = 0
+            self._actions: Dict[str, Dict[str, Any]] = defaultdict(
+                lambda: {"count": 0, "faults": 0, "injected": 0, "latencies": deque(maxlen=self.window)}
+            )
+            # Completion times of the last minute of requests, for current throughput
+            self._recent: Deque[float] = deque()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def record(self, action: str, elapsed_ms: float, fault: bool, injected: bool):
+        now = time.time()
+        with self._lock:
+            self.in_flight -= 1
+            self.total += 1
+            entry = self._actions[action]
+            entry["count"] += 1
+            entry["latencies"].append(elapsed_ms)
+            if fault:
+                self.faults += 1
+                entry["faults"] += 1
+            if injected:
+                entry["injected"] += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            uptime = max(now - self.started, 0.001)
+            recent = sum(1 for t in self._recent if t >= now - 60)
+            actions = {}
+            for action, entry in sorted(self._actions.items()):
+                latencies = sorted(entry["latencies"])
+                actions[action] = {
+                    "count": entry["count"],
+                    "faults": entry["faults"],
+                    "injected_faults": entry["injected"],
+                    "latency_ms": _latency_summary(latencies)
+                }
+            return {
+                "uptime_seconds": round(uptime, 1),
+                "requests": self.total,
+                "faults": self.faults,
+                "in_flight": self.in_flight,
+                "requests_per_second": round(self.total / uptime, 2),
+                "requests_per_second_last_minute": round(recent / min(uptime, 60), 2),
+                "actions": actions
+            }
+
+
+def _latency_summary(sorted_ms: List[float]) -> Dict[str, Any]:
+    if not sorted_ms:
+        return {}
+
+    def percentile(p: float) -> float:
+        return round(sorted_ms[min(len(sorted_ms) - 1, max(0, math.ceil(p / 100 * len(sorted_ms)) - 1))], 1)
+
+    return {
+        "mean": round(sum(sorted_ms) / len(sorted_ms), 1),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": round(sorted_ms[-1], 1)
+    }
+
+
+class IMSState:
+    """In-memory insureds, quotes, policies and invoices."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.tokens: Dict[str, float] = {}
+            self.insureds: Dict[str, Dict[str, Any]] = {}
+            self.insureds_by_key: Dict[Tuple[str, str, str, str], str] = {}
+            self.quotes: Dict[str, Dict[str, Any]] = {}
+            self.options: Dict[str, str] = {}  # quote option guid -> quote guid
+            # opportunity id -> quote guids in chain order (original quote first)
+            self.opportunities: Dict[str, List[str]] = {}
+            self.invoices: List[Dict[str, Any]] = []
+            self.producers: Dict[str, Dict[str, str]] = {}
+            self.users: Dict[str, str] = {}
+            self.transactions: Dict[str, Dict[str, str]] = {}
+            self.next_control_no = 100001
+            self.next_invoice_num = 500001
+
+
+class IMSSimulator:
+    """
+    Handles IMS SOAP requests against IMSState.
+
+    Args:
+        latency: Latency spec per action key ("default", a SOAP action or
+            "ExecuteDataSet:<procedure>")
+        faults: Injected fault rate (0-1) per action key
+        token_lifetime_seconds: Tokens older than this get an "Invalid Token" fault
+        seed: Random seed for latency sampling and fault injection
+    """
+
+    def __init__(self, latency: Optional[Dict[str, str]] = None, faults: Optional[Dict[str, float]] = None,
+                 token_lifetime_seconds: float = 8 * 3600, seed: Optional[int] = None):
+        self.latency = {key: LatencyDistribution(spec) for key, spec in (latency or {}).items()}
+        self.faults = dict(faults or {})
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self.state = IMSState()
+        self.stats = SimulatorStats()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.actions: Dict[str, Callable[[Dict[str, Any]], str]] = {
+            "LoginIMSUser": self.login_ims_user,
+            "FindInsuredByName": self.find_insured_by_name,
+            "AddInsuredWithLocation": self.add_insured_with_location,
+            "AddQuoteWithSubmission": self.add_quote_with_submission,
+            "AutoAddQuoteOptions": self.auto_add_quote_options,
+            "BindQuote": self.bind_quote,
+            "IssuePolicy": self.issue_policy,
+            "ExecuteDataSet": self.execute_dataset
+        }
+        self.procedures: Dict[str, Callable[[Dict[str, str]], List[Tuple[str, Dict[str, Any]]]]] = {
+            "getProducerGuid": self.proc_get_producer_guid,
+            "getUserbyName": self.proc_get_user_by_name,
+            "getProducerContactList": self.proc_get_producer_contact_list,
+            "getUserList": self.proc_get_user_list,
+            "spStoreTritonTransaction": self.proc_store_triton_transaction,
+            "spProcessTritonPayload": self.proc_process_triton_payload,
+            "spGetQuoteByOpportunityID": self.proc_get_quote_by_opportunity_id,
+            "spGetLatestQuoteByOpportunityID": self.proc_get_latest_quote_by_opportunity_id,
+            "spGetQuoteByPolicyNumber": self.proc_get_quote_by_policy_number,
+            "spGetQuoteByOptionID": self.proc_get_quote_by_opportunity_id,
+            "spGetQuoteByExpiringPolicyNumber": self.proc_get_quote_by_expiring_policy_number,
+            "spCheckQuoteBoundStatus": self.proc_check_quote_bound_status,
+            "spGetPolicyPremiumTotal": self.proc_get_policy_premium_total,
+            "ryan_rptInvoice": self.proc_rpt_invoice,
+            "Triton_ProcessFlatEndorsement": self.proc_flat_endorsement,
+            "Triton_ProcessFlatCancellation": self.proc_flat_cancellation,
+            "Triton_ProcessFlatReinstatement": self.proc_flat_reinstatement,
+            "Triton_UnbindPolicy": self.proc_unbind_policy,
+            "spChangeProducer_Triton": self.proc_change_producer,
+            "ExecuteDataSet": self.proc_query
+        }
+
+    # ------------------------------------------------------------------
+    # Request handling
+    # ------------------------------------------------------------------
+
+    def add_policy(self, policy_number: str, opportunity_id: str = "", premium: float = 0.0) -> Dict[str, Any]:
+        """
+        Seed a bound policy, e.g. the expiring policy of a renewal.
+
+        Args:
+            policy_number: Policy number renewals refer to as expiring_policy_number
+            opportunity_id: Opportunity the policy belongs to, if it should be found by opportunity too
+            premium: Premium of the policy
+
+        Returns:
+            The quote record
+        """
+        with self.state.lock:
+            quote = self._new_quote(
+                quote_option_guid=str(uuid.uuid4()),
+                policy_number=policy_number,
+                opportunity_id=str(opportunity_id),
+                status="bound",
+                premium=premium,
+                control_no=self.state.next_control_no
+            )
+            self.state.next_control_no += 1
+            self.state.options[quote["quote_option_guid"]] = quote["quote_guid"]
+            if opportunity_id:
+                self.state.opportunities.setdefault(str(opportunity_id), []).append(quote["quote_guid"])
+            return quote
+
+    def handle(self, soap_action: str, body: bytes) -> Tuple[int, str]:
+        """
+        Process one SOAP request.
+
+        Args:
+            soap_action: SOAPAction header value
+            body: Request envelope
+
+        Returns:
+            Tuple[int, str]: (HTTP status, response envelope)
+        """
+        soap_action = (soap_action or "").strip('"')
+        namespace, _, action = soap_action.rpartition("/")
+        started = time.perf_counter()
+        self.stats.begin()
+        stats_key, fault, injected = action or "unknown", False, False
+        try:
+            request = self._parse_request(body)
+            if action == "ExecuteDataSet":
+                stats_key = f"ExecuteDataSet:{request.get('procedureName', '')}"
+            self._sleep(stats_key, action)
+            handler = self.actions.get(action)
+            if handler is None:
+                raise SOAPFault(f"Server did not recognize the value of HTTP Header SOAPAction: {soap_action}.")
+            if action != "LoginIMSUser":
+                self._check_token(request.get("Token"))
+            if self._inject_fault(stats_key, action):
+                injected = True
+                raise SOAPFault("Server was unable to process request. ---> Simulated IMS fault")
+            result = handler(request)
+            return 200, _envelope(
+                f'<{action}Response xmlns="{namespace}"><{action}Result>{result}</{action}Result></{action}Response>'
+            )
+        except SOAPFault as e:
+            fault = True
+            return 500, _envelope(
+                f"<soap:Fault><faultcode>soap:Server</faultcode><faultstring>{escape(str(e))}</faultstring></soap:Fault>"
+            )
+        except ET.ParseError as e:
+            fault = True
+            return 500, _envelope(
+                f"<soap:Fault><faultcode>soap:Client</faultcode><faultstring>{escape(str(e))}</faultstring></soap:Fault>"
+            )
+        finally:
+            self.stats.record(stats_key, (time.perf_counter() - started) * 1000, fault, injected)
+
+    def _parse_request(self, body: bytes) -> Dict[str, Any]:
+        """First text of every element by local name, plus ExecuteDataSet's <string> parameters."""
+        root = ET.fromstring(body)
+        fields: Dict[str, Any] = {}
+        strings: List[str] = []
+        for element in root.iter():
+            name = element.tag.rsplit("}", 1)[-1]
+            if name == "string":
+                strings.append(element.text or "")
+            elif name not in fields and len(element) == 0:
+                fields[name] = (element.text or "").strip()
+        fields["parameters"] = dict(zip(strings[0::2], strings[1::2]))
+        return fields
+
+    def _sleep(self, stats_key: str, action: str):
+        distribution = self.latency.get(stats_key) or self.latency.get(action) or self.latency.get("default")
+        if distribution is not None:
+            with self._rng_lock:
+                delay_ms = distribution.sample(self._rng)
+            time.sleep(delay_ms / 1000)
+
+    def _inject_fault(self, stats_key: str, action: str) -> bool:
+        rate = self.faults.get(stats_key, self.faults.get(action, self.faults.get("default", 0.0)))
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def _check_token(self, token: Optional[str]):
+        with self.state.lock:
+            issued = self.state.tokens.get(token or "")
+        if issued is None or time.time() - issued > self.token_lifetime_seconds:
+            raise SOAPFault("Invalid Token")
+
+    # ------------------------------------------------------------------
+    # SOAP actions
+    # ------------------------------------------------------------------
+
+    def login_ims_user(self, request: Dict[str, Any]) -> str:
+        token = str(uuid.uuid4())
+        with self.state.lock:
+            self.state.tokens[token] = time.time()
+        return f"<UserGuid>{SIM_USER_GUID}</UserGuid><Token>{token}</Token>"
+
+    def find_insured_by_name(self, request: Dict[str, Any]) -> str:
+        key = _insured_key(request.get("insuredName"), request.get("city"), request.get("state"), request.get("zip"))
+        with self.state.lock:
+            return self.state.insureds_by_key.get(key, NULL_GUID)
+
+    def add_insured_with_location(self, request: Dict[str, Any]) -> str:
+        name = request.get("CorporationName") or request.get("FirstName", "")
+        key = _insured_key(name, request.get("City"), request.get("State"), request.get("Zip"))
+        with self.state.lock:
+            existing = self.state.insureds_by_key.get(key)
+            if existing:
+                return existing
+            insured_guid = str(uuid.uuid4())
+            self.state.insureds[insured_guid] = {
+                "name": name,
+                "address": request.get("Address1", ""),
+                "city": request.get("City", ""),
+                "state": request.get("State", ""),
+                "zip": request.get("Zip", "")
+            }
+            self.state.insureds_by_key[key] = insured_guid
+            return insured_guid
+
+    def add_quote_with_submission(self, request: Dict[str, Any]) -> str:
+        insured_guid = request.get("Insured", "")
+        with self.state.lock:
+            if insured_guid not in self.state.insureds:
+                raise SOAPFault(f"Insured {insured_guid} does not exist")
+            quote = self._new_quote(
+                insured_guid=insured_guid,
+                producer_contact_guid=request.get("ProducerContact", ""),
+                underwriter_guid=request.get("Underwriter", ""),
+                effective=request.get("Effective", ""),
+                expiration=request.get("Expiration", ""),
+                state_id=request.get("StateID", ""),
+                control_no=self.state.next_control_no
+            )
+            self.state.next_control_no += 1
+            return quote["quote_guid"]
+
+    def auto_add_quote_options(self, request: Dict[str, Any]) -> str:
+        with self.state.lock:
+            quote = self._get_quote(request.get("quoteGuid"))
+            if not quote["quote_option_guid"]:
+                quote["quote_option_guid"] = str(uuid.uuid4())
+                self.state.options[quote["quote_option_guid"]] = quote["quote_guid"]
+            option_guid = quote["quote_option_guid"]
+        return (
+            f'<QuoteOption xmlns="{BUSINESS_OBJECTS_NS}">'
+            f"<QuoteOptionGuid>{option_guid}</QuoteOptionGuid>"
+            f"<LineGuid>{LINE_GUID}</LineGuid>"
+            f"<LineName>Commercial General Liability</LineName>"
+            f"<CompanyLocation>Simulated Company</CompanyLocation>"
+            f"</QuoteOption>"
+        )
+
+    def bind_quote(self, request: Dict[str, Any]) -> str:
+        with self.state.lock:
+            quote = self._get_quote(request.get("quoteGuid"))
+            if quote["status"] != "quoted":
+                raise SOAPFault(f"Quote {quote['quote_guid']} is already bound")
+            if not quote["quote_option_guid"]:
+                raise SOAPFault(f"Quote {quote['quote_guid']} has no quote options")
+            self._bind(quote)
+            return quote["policy_number"]
+
+    def issue_policy(self, request: Dict[str, Any]) -> str:
+        with self.state.lock:
+            quote = self._get_quote(request.get("quoteGuid"))
+            if quote["status"] not in ("bound", "issued"):
+                raise SOAPFault(f"Quote {quote['quote_guid']} must be bound before it is issued")
+            quote["status"] = "issued"
+            quote["issued_at"] = datetime.now()
+            return quote["issued_at"].strftime("%Y-%m-%dT%H:%M:%S")
+
+    def execute_dataset(self, request: Dict[str, Any]) -> str:
+        procedure = request.get("procedureName", "")
+        handler = self.procedures.get(procedure)
+        if handler is None:
+            raise SOAPFault(f"Could not find stored procedure '{procedure}_WS'.")
+        with self.state.lock:
+            tables = handler(request["parameters"])
+        if not tables:
+            return ""
+        return escape(_dataset_xml(tables))
+
+    # ------------------------------------------------------------------
+    # Stored procedures (return [(table name, row), ...]; empty = no rows)
+    # ------------------------------------------------------------------
+
+    def proc_get_producer_guid(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        key = (params.get("producer_email") or params.get("producer_name") or "").strip().lower()
+        if not key:
+            return []
+        producer = self.state.producers.setdefault(key, {
+            "ProducerContactGUID": str(uuid.uuid5(uuid.NAMESPACE_URL, f"producer-contact:{key}")),
+            "ProducerLocationGUID": str(uuid.uuid5(uuid.NAMESPACE_URL, f"producer-location:{key}")),
+            "ProducerName": params.get("producer_name") or key
+        })
+        return [("Table", producer)]
+
+    def proc_get_user_by_name(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        fullname = (params.get("fullname") or "").strip()
+        if not fullname:
+            return []
+        user_guid = self.state.users.setdefault(
+            fullname.lower(), str(uuid.uuid5(uuid.NAMESPACE_URL, f"user:{fullname.lower()}"))
+        )
+        return [("Table", {"UserGUID": user_guid})]
+
+    def proc_get_producer_contact_list(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        return [("Table", producer) for producer in self.state.producers.values()]
+
+    def proc_get_user_list(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        return [("Table", {"UserGUID": guid, "UserName": name}) for name, guid in self.state.users.items()]
+
+    def proc_store_triton_transaction(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        transaction_id = params.get("TransactionID") or params.get("transaction_id") or str(len(self.state.transactions))
+        stored = self.state.transactions.get(transaction_id)
+        if stored is not None:
+            return [("Table", {"Status": "Warning", "Message": "Transaction already exists",
+                               "payload_hash": stored.get("payload_hash")})]
+        self.state.transactions[transaction_id] = dict(params)
+        return [("Table", {"Status": "Success", "Message": "Transaction stored",
+                           "payload_hash": params.get("payload_hash")})]
+
+    def proc_process_triton_payload(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        quote = self.state.quotes.get(_norm_guid(params.get("QuoteGuid")))
+        if quote is None:
+            return [("Table", {"Status": "Error", "Message": f"Quote {params.get('QuoteGuid')} not found"})]
+        payload_json = params.get("full_payload_json")
+        if payload_json is None:
+            # Reference to the payload stored by spStoreTritonTransaction
+            stored = self.state.transactions.get(params.get("payload_transaction_id") or "")
+            if stored is None or not params.get("payload_hash") or stored.get("payload_hash") != params["payload_hash"]:
+                return [("Table", {"Status": "Error", "Message": "Stored payload not found for transaction"})]
+            payload_json = stored.get("full_payload_json")
+        try:
+            payload = json.loads(payload_json or "{}")
+        except ValueError:
+            payload = {}
+
+        opportunity_id = str(payload.get("opportunity_id") or params.get("opportunity_id") or "")
+        if opportunity_id and not quote["opportunity_id"]:
+            quote["opportunity_id"] = opportunity_id
+            self.state.opportunities.setdefault(opportunity_id, []).append(quote["quote_guid"])
+        premium = _to_float(payload.get("gross_premium", payload.get("net_premium")))
+        # Chained quotes carry the premium change set by their wrapper procedure
+        if premium is not None and quote["status"] == "quoted" and quote["transaction_type"] == "new":
+            quote["premium"] = premium
+        quote["insured_name"] = payload.get("insured_name") or quote["insured_name"]
+        quote["transaction_id"] = payload.get("transaction_id") or quote["transaction_id"]
+        return [("Table", {"Status": "Success", "Message": "Payload processed"})]
+
+    def proc_get_quote_by_opportunity_id(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        chain = self.state.opportunities.get(str(params.get("OpportunityID") or params.get("OptionID") or "").strip())
+        if not chain:
+            return []
+        return [("Table", self._quote_row(self.state.quotes[chain[0]]))]
+
+    def proc_get_latest_quote_by_opportunity_id(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        chain = self.state.opportunities.get(str(params.get("OpportunityID") or "").strip())
+        if not chain:
+            return []
+        quote = self.state.quotes[chain[-1]]
+        return [("Table", {
+            "QuoteGuid": quote["quote_guid"],
+            "ControlNo": quote["control_no"],
+            "PolicyNumber": quote["policy_number"],
+            "QuoteStatusID": QUOTE_STATUS[quote["status"]],
+            "EndorsementNum": quote["endorsement_num"],
+            "ChainLevel": len(chain) - 1
+        })]
+
+    def proc_get_quote_by_policy_number(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        policy_number = (params.get("PolicyNumber") or "").strip().upper()
+        matches = [q for q in self.state.quotes.values() if q["policy_number"].upper() == policy_number and policy_number]
+        if not matches:
+            return []
+        return [("Table", self._quote_row(matches[-1]))]
+
+    def proc_get_quote_by_expiring_policy_number(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        # Only policies seeded with add_policy() or bound here can be renewed
+        return self.proc_get_quote_by_policy_number({"PolicyNumber": params.get("ExpiringPolicyNumber", "")})
+
+    def proc_check_quote_bound_status(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        quote = self.state.quotes.get(_norm_guid(params.get("QuoteGuid")))
+        bound = quote is not None and quote["status"] != "quoted"
+        return [("Table", {
+            "IsBound": "1" if bound else "0",
+            "BoundMessage": f"Quote is bound with policy {quote['policy_number']}" if bound else "Quote is not bound"
+        })]
+
+    def proc_get_policy_premium_total(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        control_no = str(params.get("ControlNo") or "").strip()
+        invoices = [i for i in self.state.invoices if str(i["control_no"]) == control_no]
+        return [("Table", {
+            "TotalPremium": f"{sum(i['premium'] for i in invoices):.2f}",
+            "InvoiceCount": len(invoices)
+        })]
+
+    def proc_rpt_invoice(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        quote_guid = _norm_guid(params.get("QuoteGuid"))
+        invoice_num = str(params.get("InvoiceNum") or "").strip()
+        policy_number = (params.get("PolicyNumber") or "").strip().upper()
+        opportunity_id = str(params.get("OpportunityID") or "").strip()
+        chain = set(self.state.opportunities.get(opportunity_id, [])) if opportunity_id else set()
+
+        matches = [
+            i for i in self.state.invoices
+            if (quote_guid and i["quote_guid"] == quote_guid)
+            or (invoice_num and str(i["invoice_num"]) == invoice_num)
+            or (policy_number and i["policy_number"].upper() == policy_number)
+            or i["quote_guid"] in chain
+        ]
+        if not matches:
+            return []
+        invoice = matches[-1]
+        quote = self.state.quotes[invoice["quote_guid"]]
+        return [
+            ("Table", {
+                "InvoiceNum": invoice["invoice_num"],
+                "OfficeInvoiceNum": f"SIM-{invoice['invoice_num']}",
+                "PolicyNumber": invoice["policy_number"],
+                "ControlNo": invoice["control_no"],
+                "PolicyType": invoice["description"],
+                "LineName": "Commercial General Liability",
+                "Premium": f"{invoice['premium']:.2f}",
+                "CommissionPct": "0.15",
+                "CommissionAmount": f"{invoice['premium'] * 0.15:.2f}",
+                "NetPremium": f"{invoice['premium'] * 0.85:.2f}",
+                "NetDue": f"{invoice['premium'] * 0.85:.2f}",
+                "EffectiveDate": quote["effective"],
+                "ExpirationDate": quote["expiration"],
+                "InvoiceDate": invoice["invoice_date"],
+                "DueDate": invoice["due_date"],
+                "PolicyPeriod": f"{quote['effective']} - {quote['expiration']}",
+                "NamedInsured": quote["insured_name"],
+                "InsuredID": quote["insured_guid"],
+                "ProducerName": "Simulated Producer",
+                "CompanyName": "Simulated Company",
+                "QuotingOfficeName": "Simulated Office"
+            }),
+            ("Table5", {
+                "InvoiceNum": invoice["invoice_num"],
+                "Description": invoice["description"],
+                "EffectiveDate": quote["effective"],
+                "DueDate": invoice["due_date"],
+                "Premium": f"{invoice['premium']:.2f}",
+                "Fees": "0.00",
+                "Commission": f"{invoice['premium'] * 0.15:.2f}",
+                "GrossPremium": f"{invoice['premium']:.2f}",
+                "AmountDue": f"{invoice['premium']:.2f}",
+                "NetAmountDue": f"{invoice['premium'] * 0.85:.2f}"
+            })
+        ]
+
+    def proc_flat_endorsement(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        chain, latest, error = self._bound_chain(params.get("OpportunityID"))
+        if error:
+            return [("Table", {"Result": 0, "Message": error})]
+        existing_premium = self._chain_premium(chain)
+        endorsement_premium = _to_float(params.get("EndorsementPremium")) or 0.0
+        quote = self._chain_quote(latest, "endorsement", endorsement_premium,
+                                  params.get("EndorsementEffectiveDate") or latest["effective"])
+        quote["endorsement_num"] = latest["endorsement_num"] + 1
+        return [
+            ("Table", {"Result": "Success", "NewQuoteGuid": quote["quote_guid"]}),
+            ("Table1", {
+                "Result": 1,
+                "Message": "Endorsement created successfully",
+                "NewQuoteGuid": quote["quote_guid"],
+                "NewQuoteOptionGuid": quote["quote_option_guid"],
+                "ControlNo": quote["control_no"],
+                "ExistingPremium": f"{existing_premium:.2f}",
+                "EndorsementPremium": f"{endorsement_premium:.2f}",
+                "TotalPremium": f"{existing_premium + endorsement_premium:.2f}",
+                "EndorsementNumber": quote["endorsement_num"]
+            })
+        ]
+
+    def proc_flat_cancellation(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        chain, latest, error = self._bound_chain(params.get("OpportunityID"))
+        if error:
+            return [("Table", {"Result": 0, "Message": error})]
+        refund = abs(_to_float(params.get("ReturnPremium")) or 0.0)
+        quote = self._chain_quote(latest, "cancellation", -refund,
+                                  params.get("CancellationDate") or latest["effective"])
+        return [("Table", {
+            "Result": 1,
+            "Message": "Policy cancelled successfully",
+            "CancellationQuoteGuid": quote["quote_guid"],
+            "NewQuoteOptionGuid": quote["quote_option_guid"],
+            "OriginalQuoteGuid": chain[0],
+            "PolicyNumber": quote["policy_number"],
+            "ControlNo": quote["control_no"],
+            "RefundAmount": f"{refund:.2f}"
+        })]
+
+    def proc_flat_reinstatement(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        chain = self.state.opportunities.get(str(params.get("OpportunityID") or "").strip())
+        if not chain:
+            return [("Table", {"Result": 0, "Message": f"No policy found for opportunity {params.get('OpportunityID')}"})]
+        latest = self.state.quotes[chain[-1]]
+        if latest["status"] != "cancelled":
+            return [("Table", {"Result": 0, "Message": "Policy is not cancelled"})]
+        refund = -latest["premium"]
+        quote = self._chain_quote(latest, "reinstatement", refund, latest["effective"])
+        quote["endorsement_num"] = latest["endorsement_num"] + 1
+        return [("Table", {
+            "Result": 1,
+            "Message": "Policy reinstated successfully",
+            "NewQuoteGuid": quote["quote_guid"],
+            "NewQuoteOptionGuid": quote["quote_option_guid"],
+            "OriginalQuoteGuid": chain[0],
+            "CancellationQuoteGuid": latest["quote_guid"],
+            "PolicyNumber": quote["policy_number"],
+            "ControlNo": quote["control_no"],
+            "ReinstatementNumber": quote["endorsement_num"],
+            "ReinstatementPremium": f"{refund:.2f}",
+            "ReinstatementEffectiveDate": quote["effective"],
+            "CancellationRefund": f"{refund:.2f}",
+            "NetPremiumChange": f"{refund:.2f}"
+        })]
+
+    def proc_unbind_policy(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        quote = self.state.quotes.get(_norm_guid(params.get("QuoteGuid")))
+        if quote is None and params.get("OptionID"):
+            chain = self.state.opportunities.get(str(params["OptionID"]).strip())
+            quote = self.state.quotes[chain[-1]] if chain else None
+        if quote is None:
+            return [("Table", {"Result": 0, "Message": "Quote not found"})]
+        if quote["status"] == "quoted":
+            return [("Table", {"Result": 0, "Message": "Quote is not bound"})]
+        quote["status"] = "quoted"
+        self.state.invoices = [i for i in self.state.invoices if i["quote_guid"] != quote["quote_guid"]]
+        return [("Table", {
+            "Result": 1,
+            "Message": "Policy unbound successfully",
+            "QuoteGuid": quote["quote_guid"],
+            "PolicyNumber": quote["policy_number"]
+        })]
+
+    def proc_change_producer(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        quote = self.state.quotes.get(_norm_guid(params.get("QuoteGuid")))
+        if quote is None:
+            return [("Table", {"Result": 0, "Message": "Quote not found"})]
+        quote["producer_contact_guid"] = params.get("NewProducerContactGuid") or quote["producer_contact_guid"]
+        return [("Table", {"Result": 1, "Message": "Producer changed"})]
+
+    def proc_query(self, params: Dict[str, str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Ad-hoc queries sent as a procedure named ExecuteDataSet (producer contact of a quote)."""
+        guids = re.findall(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}",
+                           " ".join(f"{k} {v}" for k, v in params.items()))
+        for guid in guids:
+            quote = self.state.quotes.get(_norm_guid(guid))
+            if quote is not None:
+                return [("Table", {"ProducerContactGuid": quote["producer_contact_guid"]})]
+        return []
+
+    # ------------------------------------------------------------------
+    # State helpers (caller holds state.lock)
+    # ------------------------------------------------------------------
+
+    def _new_quote(self, **fields: Any) -> Dict[str, Any]:
+        quote = {
+            "quote_guid": str(uuid.uuid4()),
+            "quote_option_guid": "",
+            "insured_guid": "",
+            "insured_name": "",
+            "producer_contact_guid": "",
+            "underwriter_guid": "",
+            "effective": "",
+            "expiration": "",
+            "state_id": "",
+            "control_no": 0,
+            "policy_number": "",
+            "opportunity_id": "",
+            "transaction_id": "",
+            "transaction_type": "new",
+            "status": "quoted",
+            "premium": 0.0,
+            "endorsement_num": 0,
+            "issued_at": None
+        }
+        quote.update(fields)
+        if quote["insured_guid"] in self.state.insureds and not quote["insured_name"]:
+            quote["insured_name"] = self.state.insureds[quote["insured_guid"]]["name"]
+        self.state.quotes[quote["quote_guid"]] = quote
+        return quote
+
+    def _get_quote(self, quote_guid: Optional[str]) -> Dict[str, Any]:
+        quote = self.state.quotes.get(_norm_guid(quote_guid))
+        if quote is None:
+            raise SOAPFault(f"Quote {quote_guid} does not exist")
+        return quote
+
+    def _bind(self, quote: Dict[str, Any]):
+        if not quote["policy_number"]:
+            quote["policy_number"] = f"SIM{quote['control_no']:07d}"
+        quote["status"] = "cancelled" if quote["transaction_type"] == "cancellation" else "bound"
+        if quote["premium"]:
+            today = datetime.now()
+            self.state.invoices.append({
+                "invoice_num": self.state.next_invoice_num,
+                "quote_guid": quote["quote_guid"],
+                "policy_number": quote["policy_number"],
+                "control_no": quote["control_no"],
+                "premium": quote["premium"],
+                "description": quote["transaction_type"].title(),
+                "invoice_date": today.strftime("%m/%d/%Y"),
+                "due_date": (today + timedelta(days=30)).strftime("%m/%d/%Y")
+            })
+            self.state.next_invoice_num += 1
+
+    def _bound_chain(self, opportunity_id: Optional[str]) -> Tuple[List[str], Optional[Dict[str, Any]], str]:
+        chain = self.state.opportunities.get(str(opportunity_id or "").strip())
+        if not chain:
+            return [], None, f"No policy found for opportunity {opportunity_id}"
+        latest = self.state.quotes[chain[-1]]
+        if latest["status"] not in ("bound", "issued"):
+            return chain, latest, f"Latest quote for opportunity {opportunity_id} is not bound"
+        return chain, latest, ""
+
+    def _chain_quote(self, latest: Dict[str, Any], transaction_type: str, premium: float,
+                     effective: str) -> Dict[str, Any]:
+        quote = self._new_quote(
+            insured_guid=latest["insured_guid"],
+            insured_name=latest["insured_name"],
+            producer_contact_guid=latest["producer_contact_guid"],
+            underwriter_guid=latest["underwriter_guid"],
+            effective=effective,
+            expiration=latest["expiration"],
+            state_id=latest["state_id"],
+            control_no=latest["control_no"],
+            policy_number=latest["policy_number"],
+            opportunity_id=latest["opportunity_id"],
+            transaction_type=transaction_type,
+            premium=premium,
+            endorsement_num=latest["endorsement_num"],
+            quote_option_guid=str(uuid.uuid4())
+        )
+        self.state.options[quote["quote_option_guid"]] = quote["quote_guid"]
+        self.state.opportunities[latest["opportunity_id"]].append(quote["quote_guid"])
+        return quote
+
+    def _chain_premium(self, chain: List[str]) -> float:
+        return sum(self.state.quotes[guid]["premium"] for guid in chain)
+
+    def _quote_row(self, quote: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "QuoteGuid": quote["quote_guid"],
+            "QuoteOptionGuid": quote["quote_option_guid"],
+            "PolicyNumber": quote["policy_number"],
+            "ControlNo": quote["control_no"],
+            "InsuredGuid": quote["insured_guid"],
+            "InsuredPolicyName": quote["insured_name"],
+            "Effective": quote["effective"],
+            "Expiration": quote["expiration"],
+            "QuoteStatusID": QUOTE_STATUS[quote["status"]],
+            "IsBound": 0 if quote["status"] == "quoted" else 1,
+            "ProducerContactGuid": quote["producer_contact_guid"],
+            "UnderwriterGuid": quote["underwriter_guid"],
+            "opportunity_id": quote["opportunity_id"],
+            "net_premium": f"{quote['premium']:.2f}",
+            "LastTransactionId": quote["transaction_id"]
+        }
+
+
+def _envelope(body: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">'
+        f"<soap:Body>{body}</soap:Body></soap:Envelope>"
+    )
+
+
+def _dataset_xml(tables: List[Tuple[str, Dict[str, Any]]]) -> str:
+    rows = "".join(
+        f"<{name}>" + "".join(f"<{k}>{escape(str(v))}</{k}>" for k, v in row.items() if v not in (None, "")) + f"</{name}>"
+        for name, row in tables
+    )
+    return f"<NewDataSet>{rows}</NewDataSet>"
+
+
+def _insured_key(name: Optional[str], city: Optional[str], state: Optional[str], zip_code: Optional[str]) -> Tuple[str, str, str, str]:
+    return tuple((value or "").strip().lower() for value in (name, city, state, (zip_code or "")[:5]))
+
+
+def _norm_guid(value: Optional[str]) -> str:
+    return (value or "").strip().lower()
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _SimulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY every
+    # keep-alive response waits ~40ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+    simulator: IMSSimulator = None
+    verbose = False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path.rstrip("/") == "/reset":
+            self.simulator.state.reset()
+            self.simulator.stats.reset()
+            return self._send(200, "application/json", json.dumps({"status": "reset"}))
+        status, response = self.simulator.handle(self.headers.get("SOAPAction", ""), body)
+        self._send(status, "text/xml; charset=utf-8", response)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/stats":
+            return self._send(200, "application/json", json.dumps(self.simulator.stats.snapshot(), indent=2))
+        if path == "/health":
+            return self._send(200, "application/json", json.dumps({"status": "ok"}))
+        self._send(404, "text/plain", "Not found")
+
+    def _send(self, status: int, content_type: str, text: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(simulator: IMSSimulator, host: str = "127.0.0.1", port: int = 8099,
+                  verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) an HTTP server for the simulator.
+
+    Port 0 picks a free port (see server.server_address).
+    """
+    handler = type("SimulatorRequestHandler", (_SimulatorRequestHandler,), {"simulator": simulator, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(simulator: Optional[IMSSimulator] = None, host: str = "127.0.0.1",
+                        port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start a simulator server on a daemon thread.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: (server, IMS_BASE_URL to point the service at)
+    """
+    server = create_server(simulator or IMSSimulator(), host, port)
+    threading.Thread(target=server.serve_forever, name="ims-simulator", daemon=True).start()
+    bound_host, bound_port = server.server_address[:2]
+    return server, f"http://{bound_host}:{bound_port}/ims_one"
+
+
+def _parse_key_values(items: List[str], option: str, convert: Callable[[str], Any]) -> Dict[str, Any]:
+    result = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            key, value = "default", item
+        try:
+            result[key.strip()] = convert(value.strip())
+        except ValueError as e:
+            raise SystemExit(f"Invalid {option} '{item}': {e}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local IMS SOAP simulator for load and latency testing")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8099, help="Port to listen on")
+    parser.add_argument("--latency", action="append", metavar="KEY=DIST",
+                        help="Latency distribution, e.g. default=lognormal:120:0.5 or ExecuteDataSet:ryan_rptInvoice=uniform:400:900")
+    parser.add_argument("--fault", action="append", metavar="KEY=RATE",
+                        help="Injected fault rate between 0 and 1, e.g. BindQuote=0.02 or default=0.01")
+    parser.add_argument("--token-lifetime", type=float, default=8 * 3600,
+                        help="Seconds before a token is rejected with 'Invalid Token'")
+    parser.add_argument("--seed", type=int, help="Random seed for latency and fault injection")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="Print throughput every N seconds (0 = off)")
+    parser.add_argument("--verbose", action="store_true", help="Log every HTTP request")
+    args = parser.parse_args()
+
+    def rate(value: str) -> float:
+        value = float(value)
+        if not 0 <= value <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        return value
+
+    latency = _parse_key_values(args.latency, "--latency", lambda spec: LatencyDistribution(spec).spec)
+    faults = _parse_key_values(args.fault, "--fault", rate)
+    simulator = IMSSimulator(latency, faults, args.token_lifetime, args.seed)
+    server = create_server(simulator, args.host, args.port, args.verbose)
+
+    print(f"IMS simulator listening on http://{args.host}:{args.port}")
+    print(f"Set IMS_BASE_URL=http://{args.host}:{args.port}/ims_one")
+    if latency:
+        print(f"Latency: {latency}")
+    if faults:
+        print(f"Fault rates: {faults}")
+
+    if args.stats_interval > 0:
+        def report():
+            while True:
+                time.sleep(args.stats_interval)
+                snapshot = simulator.stats.snapshot()
+                print(f"[{datetime.now():%H:%M:%S}] requests={snapshot['requests']} "
+                      f"faults={snapshot['faults']} in_flight={snapshot['in_flight']} "
+                      f"rps_1m={snapshot['requests_per_second_last_minute']}")
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping IMS simulator")
+        print(json.dumps(simulator.stats.snapshot(), indent=2))
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+Load Test Harness
+Replays real Triton payloads from CSV against a running instance (the
+FastAPI app or the Azure Function) and reports latency, errors and a
+saturation curve.
+
+Two load models:
+  * closed loop (--clients 1,4,16): N clients each send the next
+    transaction as soon as their previous one answers
+  * open loop (--rps 2,5,10): transactions are sent at a target rate
+    whether or not earlier ones have answered; latency is measured from
+    the scheduled send time, so a backed-up server shows up as latency
+    instead of silently lowering the offered load
+
+Each comma-separated value is one step of the saturation curve, run for
+--step-seconds. Rows for one opportunity are always sent in CSV order and
+never overlap. IDs are rewritten the way BulkTransactionTester.modify_payload
+does; each pass over a CSV gets its own parameter number so replays never
+collide with earlier ones.
+"""
+import sys
+import os
+import csv
+import json
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+# Add current directory to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from bulk_test_transactions import BulkTransactionTester, latency_summary
+from fix_csv_json import fix_json_string
+from app.services.transaction_scheduler import TransactionScheduler
+
+DEFAULT_CSV_FILES = [
+    "ims_payloads_from_triton (1).csv",
+    os.path.join("Final_Deployment", "triton_ims_queued_transactions.csv")
+]
+DEFAULT_URLS = {
+    "fastapi": "http://localhost:8000",
+    "function": "http://localhost:7071"
+}
+TRANSACTION_ROUTE = "/api/triton/transaction/new"
+
+
+class ReplayQueue:
+    """
+    Hands out replay rows so that each opportunity has at most one
+    transaction in flight, in CSV order. Opportunities take turns, so a
+    long chain does not starve the others.
+    """
+
+    def __init__(self, csv_files, base_parameter, use_default_names=False, loop=False):
+        self.csv_files = csv_files
+        self.base_parameter = base_parameter
+        self.use_default_names = use_default_names
+        self.loop = loop
+        self.pass_number = 0
+        self.skipped_rows = []
+        self._rows = {csv_file: load_rows(csv_file, self.skipped_rows) for csv_file in csv_files}
+        self._pending = {}  # partition key -> deque of rows
+        self._ready = deque()  # partition keys with no transaction in flight
+        self._in_flight = set()
+        self._condition = threading.Condition()
+        self._load_next_pass()
+
+    def _load_next_pass(self):
+        """Queue every CSV once more with the next parameter number. Caller holds the condition."""
+        for csv_file in self.csv_files:
+            parameter = self.base_parameter + self.pass_number
+            self.pass_number += 1
+            tester = BulkTransactionTester(csv_file, parameter_number=parameter,
+                                           use_default_names=self.use_default_names)
+            for row in self._rows[csv_file]:
+                payload = tester.modify_payload(row['payload'])
+                key = TransactionScheduler.partition_key(payload)
+                if key not in self._pending:
+                    self._pending[key] = deque()
+                    if key not in self._in_flight:
+                        self._ready.append(key)
+                self._pending[key].append({
+                    'csv_file': csv_file,
+                    'row_number': row['row_number'],
+                    'parameter': parameter,
+                    'partition': key,
+                    'transaction_type': payload.get('transaction_type') or row['transaction_type'],
+                    'transaction_id': payload.get('transaction_id'),
+                    'opportunity_id': payload.get('opportunity_id'),
+                    'payload': payload
+                })
+
+    def take(self, timeout=None):
+        """
+        Next row whose opportunity is idle.
+
+        Args:
+            timeout: Seconds to wait for one (None waits until the replay is exhausted)
+
+        Returns:
+            The row, or None on timeout or when every row has been handed out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._ready:
+                    key = self._ready.popleft()
+                    row = self._pending[key].popleft()
+                    if not self._pending[key]:
+                        del self._pending[key]
+                    self._in_flight.add(key)
+                    return row
+                if self.loop:
+                    # Every queued opportunity is busy: start the next pass rather than wait
+                    self._load_next_pass()
+                    continue
+                if not self._pending:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def done(self, row):
+        """Mark a row's transaction finished so the opportunity's next row can go."""
+        with self._condition:
+            key = row['partition']
+            self._in_flight.discard(key)
+            if key in self._pending:
+                self._ready.append(key)
+            self._condition.notify_all()
+
+    def is_finished(self):
+        with self._condition:
+            return not self.loop and not self._pending and not self._in_flight
+
+    def backlog(self):
+        with self._condition:
+            return sum(len(rows) for rows in self._pending.values())
+
+
+def load_rows(csv_file, skipped_rows):
+    """Rows of a Triton CSV with parsed payloads (Ruby-style nil is accepted)."""
+    csv.field_size_limit(sys.maxsize)
+    rows = []
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        for row_num, row in enumerate(csv.DictReader(f), start=1):
+            try:
+                payload = json.loads(row.get('payload') or '{}')
+            except json.JSONDecodeError:
+                # fix_json_string prints its own diagnostics; keep the run output readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    fixed = fix_json_string(row.get('payload'))
+                try:
+                    payload = json.loads(fixed)
+                except json.JSONDecodeError as e:
+                    skipped_rows.append({'csv_file': csv_file, 'row_number': row_num, 'error': str(e)})
+                    continue
+            rows.append({
+                'row_number': row_num,
+                'transaction_type': row.get('transaction_type'),
+                'payload': payload
+            })
+    return rows
+
+
+class LoadTester:
+    def __init__(self, url, replay, timeout=300, api_mode="sync"):
+        """
+        Initialize load tester
+
+        Args:
+            url: Base URL of the running instance (FastAPI or Azure Function)
+            replay: ReplayQueue supplying the transactions
+            timeout: Per-request timeout in seconds
+            api_mode: "sync" or "queue" (FastAPI only: 202 + job id)
+        """
+        self.endpoint = url.rstrip('/') + TRANSACTION_ROUTE
+        self.replay = replay
+        self.timeout = timeout
+        self.api_mode = api_mode
+        self.headers = {'Content-Type': 'application/json'}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.steps = []
+        self.records = []
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.requests_file = f"load_test_requests_{timestamp}.ndjson"
+        self.report_file = f"load_test_report_{timestamp}.json"
+        self.curve_file = f"load_test_saturation_{timestamp}.csv"
+        self._requests_out = None
+
+    def _session(self):
+        # One keep-alive session per client thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, row, step, scheduled_at=None):
+        """
+        Send one transaction and record the outcome.
+
+        Args:
+            row: Row from the ReplayQueue
+            step: Index of the saturation step it belongs to
+            scheduled_at: Open loop only: perf_counter time it was due to be sent
+        """
+        sent_at = time.perf_counter()
+        status, success, message = None, False, ""
+        try:
+            response = self._session().post(
+                self.endpoint,
+                params={'mode': self.api_mode} if self.api_mode != "sync" else None,
+                data=json.dumps(row['payload'], default=str),
+                headers=self.headers,
+                timeout=self.timeout
+            )
+            status = response.status_code
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if status in (200, 202):
+                success = body.get('success', True) is not False
+                message = body.get('message', '')
+            else:
+                message = body.get('detail') or body.get('message') or response.text[:200]
+        except requests.exceptions.Timeout:
+            status, message = 'timeout', f"No response within {self.timeout}s"
+        except requests.exceptions.RequestException as e:
+            status, message = 'connection_error', str(e)
+        finally:
+            self.replay.done(row)
+
+        finished_at = time.perf_counter()
+        record = {
+            'step': step,
+            'csv_file': row['csv_file'],
+            'row_number': row['row_number'],
+            'transaction_type': row['transaction_type'],
+            'transaction_id': row['transaction_id'],
+            'opportunity_id': row['opportunity_id'],
+            'status': status,
+            'success': success,
+            'message': str(message)[:500],
+            'service_seconds': round(finished_at - sent_at, 4),
+            # Open loop: includes time spent waiting for a free client slot
+            'latency_seconds': round(finished_at - (scheduled_at or sent_at), 4),
+            'finished_at': finished_at
+        }
+        with self._lock:
+            self.records.append(record)
+            if self._requests_out:
+                self._requests_out.write(json.dumps(record) + '\n')
+        return record
+
+    def run_closed_step(self, step, clients, duration):
+        """N clients, each sending its next transaction as soon as the previous one answers."""
+        stop_at = time.perf_counter() + duration
+
+        def client():
+            while time.perf_counter() < stop_at:
+                row = self.replay.take(timeout=max(0.0, stop_at - time.perf_counter()))
+                if row is None:
+                    return
+                self.send(row, step)
+
+        threads = [threading.Thread(target=client, name=f"load-client-{i}", daemon=True) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open_step(self, step, rps, duration, max_in_flight, poisson=False):
+        """
+        Send at a target rate regardless of responses.
+
+        Returns:
+            Number of sends that were due but had no idle opportunity to draw from
+        """
+        stop_at = time.perf_counter() + duration
+        next_at = time.perf_counter()
+        starved = 0
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="load-open") as pool:
+            while next_at < stop_at:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                row = self.replay.take(timeout=0)
+                if row is None:
+                    if self.replay.is_finished():
+                        break
+                    # Every remaining opportunity has a transaction in flight
+                    starved += 1
+                else:
+                    pool.submit(self.send, row, step, next_at)
+                next_at += random.expovariate(rps) if poisson else 1.0 / rps
+        return starved
+
+    def run(self, clients=None, rps=None, step_seconds=60, max_in_flight=256, poisson=False):
+        """
+        Run each step of the saturation curve and write the reports.
+
+        Args:
+            clients: Closed-loop client counts, one step each
+            rps: Open-loop target rates, one step each
+            step_seconds: Duration of each step
+            max_in_flight: Open loop: cap on concurrent requests
+            poisson: Open loop: exponential inter-arrival times instead of fixed
+
+        Returns:
+            The report dict
+        """
+        self._requests_out = open(self.requests_file, 'w', encoding='utf-8')
+        started = datetime.now()
+        try:
+            levels = [('clients', n) for n in clients or []] + [('rps', r) for r in rps or []]
+            for step, (model, level) in enumerate(levels):
+                print(f"\nStep {step + 1}/{len(levels)}: {model}={level} for {step_seconds}s "
+                      f"(backlog {self.replay.backlog()} rows)")
+                step_started = time.perf_counter()
+                starved = 0
+                if model == 'clients':
+                    self.run_closed_step(step, level, step_seconds)
+                else:
+                    starved = self.run_open_step(step, level, step_seconds, max_in_flight, poisson)
+                elapsed = time.perf_counter() - step_started
+                summary = self.summarize_step(step, model, level, elapsed, starved)
+                self.steps.append(summary)
+                self.print_step(summary)
+                if self.replay.is_finished():
+                    print("\nAll rows replayed; stopping (use --loop to keep replaying with fresh IDs)")
+                    break
+        finally:
+            self._requests_out.close()
+            self._requests_out = None
+
+        report = self.build_report(started)
+        with open(self.report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        self.write_curve()
+        self.print_report(report)
+        return report
+
+    def summarize_step(self, step, model, level, elapsed, starved=0):
+        records = [r for r in self.records if r['step'] == step]
+        latencies = [r['latency_seconds'] for r in records]
+        succeeded = sum(1 for r in records if r['success'])
+        return {
+            'step': step + 1,
+            'model': model,
+            'level': level,
+            'duration_seconds': round(elapsed, 1),
+            'requests': len(records),
+            'succeeded': succeeded,
+            'error_rate': round(1 - succeeded / len(records), 4) if records else 0.0,
+            'throughput_per_second': round(len(records) / elapsed, 3) if elapsed else 0.0,
+            'goodput_per_second': round(succeeded / elapsed, 3) if elapsed else 0.0,
+            'starved_sends': starved,
+            'latency_seconds': latency_summary(latencies) if latencies else {},
+            'status_counts': dict(Counter(str(r['status']) for r in records))
+        }
+
+    def build_report(self, started):
+        by_type = defaultdict(list)
+        errors = defaultdict(Counter)
+        for record in self.records:
+            by_type[record['transaction_type']].append(record)
+            if not record['success']:
+                errors[str(record['status'])][record['message'][:120]] += 1
+
+        return {
+            'endpoint': self.endpoint,
+            'api_mode': self.api_mode,
+            'started_at': started.isoformat(),
+            'finished_at': datetime.now().isoformat(),
+            'total_requests': len(self.records),
+            'succeeded': sum(1 for r in self.records if r['success']),
+            'skipped_rows': self.replay.skipped_rows,
+            'steps': self.steps,
+            'by_transaction_type': {
+                transaction_type: {
+                    'requests': len(records),
+                    'succeeded': sum(1 for r in records if r['success']),
+                    'latency_seconds': latency_summary([r['latency_seconds'] for r in records]),
+                    'status_counts': dict(Counter(str(r['status']) for r in records))
+                }
+                for transaction_type, records in sorted(by_type.items())
+            },
+            'errors_by_status': {
+                status: {'count': sum(messages.values()), 'top_messages': dict(messages.most_common(5))}
+                for status, messages in sorted(errors.items())
+            },
+            'requests_file': self.requests_file
+        }
+
+    def write_curve(self):
+        fieldnames = ['step', 'model', 'level', 'duration_seconds', 'requests', 'throughput_per_second',
+                      'goodput_per_second', 'error_rate', 'starved_sends', 'p50', 'p95', 'p99', 'max']
+        with open(self.curve_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for step in self.steps:
+                latency = step['latency_seconds']
+                writer.writerow({**step, **{k: latency.get(k) for k in ('p50', 'p95', 'p99', 'max')}})
+
+    def print_step(self, step):
+        latency = step['latency_seconds']
+        print(f"  {step['requests']} requests, {step['throughput_per_second']}/s "
+              f"(goodput {step['goodput_per_second']}/s), errors {step['error_rate']:.1%}, "
+              f"p50 {latency.get('p50', '-')}s p95 {latency.get('p95', '-')}s p99 {latency.get('p99', '-')}s, "
+              f"status {step['status_counts']}")
+
+    def print_report(self, report):
+        print("\n" + "=" * 78)
+        print("SATURATION CURVE")
+        print("=" * 78)
+        print(f"{'step':>4} {'load':>12} {'req/s':>8} {'good/s':>8} {'errors':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for step in report['steps']:
+            latency = step['latency_seconds']
+            print(f"{step['step']:>4} {step['model'] + '=' + str(step['level']):>12} "
+                  f"{step['throughput_per_second']:>8} {step['goodput_per_second']:>8} {step['error_rate']:>7.1%} "
+                  f"{latency.get('p50', '-'):>8} {latency.get('p95', '-'):>8} {latency.get('p99', '-'):>8}")
+
+        print("\nLATENCY BY TRANSACTION TYPE (seconds)")
+        for transaction_type, stats in report['by_transaction_type'].items():
+            latency = stats['latency_seconds']
+            print(f"  {transaction_type:<22} n={stats['requests']:<5} ok={stats['succeeded']:<5} "
+                  f"p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+
+        if report['errors_by_status']:
+            print("\nERRORS BY HTTP STATUS")
+            for status, errors in report['errors_by_status'].items():
+                print(f"  {status}: {errors['count']}")
+                for message, count in errors['top_messages'].items():
+                    print(f"      {count:>5} x {message}")
+
+        if report['skipped_rows']:
+            print(f"\n{len(report['skipped_rows'])} CSV rows skipped (unparseable payload)")
+
+        print(f"\nReport: {self.report_file}")
+        print(f"Saturation curve: {self.curve_file}")
+        print(f"Per-request log: {self.requests_file}")
+
+
+def parse_levels(value, convert):
+    try:
+        levels = [convert(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected comma-separated numbers, got '{value}'")
+    if not levels or any(level <= 0 for level in levels):
+        raise argparse.ArgumentTypeError("Levels must be positive")
+    return levels
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Replay Triton payloads against a running instance and measure latency/saturation',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Closed loop: 1, 4, 16 and 32 concurrent clients, 2 minutes each
+  %(prog)s --clients 1,4,16,32 --step-seconds 120
+
+  # Open loop: ramp the arrival rate, Poisson arrivals, against the Azure Function
+  %(prog)s --target function --rps 1,2,5,10 --poisson
+
+  # Offline against the IMS simulator (python ims_simulator.py), keep replaying with fresh IDs
+  %(prog)s --clients 8,32,64 --loop -p 500
+
+  # Queue mode (202 Accepted); measures intake, not processing
+  %(prog)s --rps 20,50,100 --api-mode queue
+        """
+    )
+
+    parser.add_argument('--csv', action='append', dest='csv_files',
+                        help='CSV to replay (repeatable; default: both Triton exports)')
+    parser.add_argument('--target', choices=sorted(DEFAULT_URLS), default='fastapi',
+                        help='Which app is running, for the default URL (default: fastapi)')
+    parser.add_argument('--url', default=None,
+                        help='Base URL of the running instance (overrides --target)')
+    parser.add_argument('--clients', type=lambda v: parse_levels(v, int), default=None,
+                        help='Closed-loop step levels: concurrent clients, e.g. 1,4,16')
+    parser.add_argument('--rps', type=lambda v: parse_levels(v, float), default=None,
+                        help='Open-loop step levels: target requests per second, e.g. 1,2,5')
+    parser.add_argument('--step-seconds', type=float, default=60,
+                        help='Duration of each step (default: 60)')
+    parser.add_argument('--max-in-flight', type=int, default=256,
+                        help='Open loop: maximum concurrent requests (default: 256)')
+    parser.add_argument('--poisson', action='store_true',
+                        help='Open loop: Poisson arrivals instead of evenly spaced')
+    parser.add_argument('-p', '--parameter', type=int, default=None,
+                        help='First parameter number for ID rewriting; each pass adds 1 (default: from the clock)')
+    parser.add_argument('--names', action='store_true',
+                        help='Use default producer/underwriter names (Mike Woodworth / Christina Rentas)')
+    parser.add_argument('--loop', action='store_true',
+                        help='Replay the CSVs again with the next parameter number when they run out')
+    parser.add_argument('--api-mode', choices=['sync', 'queue'], default='sync',
+                        help='Transaction endpoint mode (queue is FastAPI only)')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Per-request timeout in seconds (default: 300)')
+
+    args = parser.parse_args()
+
+    if not args.clients and not args.rps:
+        args.clients = [1, 4, 16]
+
+    csv_files = args.csv_files or DEFAULT_CSV_FILES
+    for csv_file in csv_files:
+        if not os.path.exists(csv_file):
+            print(f"Error: CSV file not found: {csv_file}")
+            return 1
+
+    # Fresh IDs per run unless told otherwise (6 digits max: it replaces the end of transaction IDs)
+    parameter = args.parameter if args.parameter is not None else int(datetime.now().strftime("%H%M%S")) + 100000
+    replay = ReplayQueue(csv_files, parameter, use_default_names=args.names, loop=args.loop)
+    url = args.url or DEFAULT_URLS[args.target]
+    print(f"Replaying {', '.join(csv_files)} against {url}{TRANSACTION_ROUTE} (parameter {parameter})")
+
+    tester = LoadTester(url, replay, timeout=args.timeout, api_mode=args.api_mode)
+    report = tester.run(
+        clients=args.clients,
+        rps=args.rps,
+        step_seconds=args.step_seconds,
+        max_in_flight=args.max_in_flight,
+        poisson=args.poisson
+    )
+    return 0 if report['total_requests'] and report['succeeded'] == report['total_requests'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,18 @@
 import logging
 import logging.handlers
 import os
+import threading
 from datetime import datetime
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import APP_CONFIG
+from config import APP_CONFIG, CACHE_CONFIG
 from app.api import triton, ims
+from app.utils.metrics import (
+    CONTENT_TYPE, MetricsMiddleware, get_metrics_text, start_multiprocess_flush, stop_multiprocess_flush
+)
 
 # Create logs directory if it doesn't exist
 log_dir = "logs"
@@ -59,10 +64,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counters and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(triton.router)
 app.include_router(ims.router)
 
+@app.on_event("startup")
+async def start_reference_data_sync():
+    """Load the producer/underwriter snapshot and keep it in sync with IMS."""
+    from app.services.ims.reference_data_service import get_reference_data_service
+    get_reference_data_service().start_scheduled_sync()
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Requeue transactions interrupted by a restart and start the queue workers."""
+    from app.services.job_queue_service import get_job_queue_service
+    get_job_queue_service().start_workers()
+
+@app.on_event("startup")
+async def prewarm_caches():
+    """Resolve configured underwriters in the background so early transactions hit the cache."""
+    if CACHE_CONFIG["underwriter"]["prewarm"]:
+        from app.services.ims.underwriter_service import get_underwriter_service
+        threading.Thread(
+            target=get_underwriter_service().prewarm_cache,
+            name="underwriter-prewarm",
+            daemon=True
+        ).start()
+
+@app.on_event("startup")
+async def start_metrics_flush():
+    """Share this worker's metrics with the others when METRICS_MULTIPROC_DIR is set."""
+    start_multiprocess_flush()
+
+@app.on_event("shutdown")
+async def stop_metrics_flush():
+    """Drop this worker out of the shared metrics."""
+    stop_multiprocess_flush()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -78,10 +119,20 @@ async def health_check():
         "version": "1.0.0",
         "endpoints": {
             "triton": "/api/triton",
-            "ims": "/api/ims"
+            "ims": "/api/ims",
+            "metrics": "/metrics"
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: request counters and latency histograms per transaction
+    type and IMS SOAP action / procedure, in-flight gauges, cache hit ratios,
+    connection pool usage and token refresh counts.
+    """
+    return Response(await run_in_threadpool(get_metrics_text), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     logger.info("="*80)
     logger.info(f"Starting RSG Integration Service on {APP_CONFIG['host']}:{APP_CONFIG['port']}")
@@ -0,0 +1,36 @@
+-- Script to add payload_hash column to tblTritonTransactionData
+-- spStoreTritonTransaction_WS stores the SHA-256 of the payload JSON here, so
+-- spProcessTritonPayload_WS can read the stored payload instead of receiving it again
+-- Run before deploying the updated spStoreTritonTransaction_WS / spProcessTritonPayload_WS
+
+IF NOT EXISTS (
+    SELECT *
+    FROM sys.columns
+    WHERE object_id = OBJECT_ID('tblTritonTransactionData')
+    AND name = 'payload_hash'
+)
+BEGIN
+    ALTER TABLE tblTritonTransactionData
+    ADD payload_hash CHAR(64) NULL;
+
+    PRINT 'Added payload_hash column to tblTritonTransactionData';
+END
+ELSE
+BEGIN
+    PRINT 'Column payload_hash already exists in tblTritonTransactionData';
+END
+GO
+
+-- Verify the column was added
+SELECT
+    c.name AS ColumnName,
+    t.name AS DataType,
+    c.max_length AS MaxLength,
+    c.is_nullable AS IsNullable,
+    'Added/Verified' AS Status
+FROM sys.columns c
+INNER JOIN sys.types t ON c.user_type_id = t.user_type_id
+WHERE c.object_id = OBJECT_ID('tblTritonTransactionData')
+  AND c.name = 'payload_hash';
+
+PRINT 'Column addition/verification complete';
\ No newline at end of file
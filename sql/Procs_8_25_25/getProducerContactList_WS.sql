@@ -0,0 +1,37 @@
+CREATE OR ALTER PROCEDURE [dbo].[getProducerContactList_WS]
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    -- Bulk export for the integration's local producer snapshot.
+    -- Returns only the rows getProducerGuid_WS could ever pick:
+    --   EmailRank = 1 -> the row getProducerGuid_WS returns for that email (active only)
+    --   NameRank  = 1 -> the row it returns for that full name (name fallback)
+    WITH ranked AS (
+        SELECT
+            ProducerContactGUID,
+            ProducerLocationGUID,
+            LTRIM(RTRIM(email)) AS Email,
+            LTRIM(RTRIM(fname)) + ' ' + LTRIM(RTRIM(lname)) AS FullName,
+            statusid AS StatusID,
+            CASE WHEN statusid = 1 AND email IS NOT NULL
+                 THEN ROW_NUMBER() OVER (
+                     PARTITION BY CASE WHEN statusid = 1 THEN email END
+                     ORDER BY ProducerContactGUID DESC)
+            END AS EmailRank,
+            ROW_NUMBER() OVER (
+                PARTITION BY LTRIM(RTRIM(fname)) + ' ' + LTRIM(RTRIM(lname))
+                ORDER BY fname, lname) AS NameRank
+        FROM tblproducercontacts
+    )
+    SELECT
+        ProducerContactGUID,
+        ProducerLocationGUID,
+        Email,
+        FullName,
+        StatusID,
+        EmailRank,
+        NameRank
+    FROM ranked
+    WHERE EmailRank = 1 OR NameRank = 1
+END
@@ -0,0 +1,22 @@
+CREATE OR ALTER PROCEDURE [dbo].[getUserList_WS]
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    -- Bulk export for the integration's local underwriter snapshot.
+    -- One row per full name: the row getUserbyName_WS returns for it.
+    WITH ranked AS (
+        SELECT
+            UserGUID,
+            LTRIM(RTRIM(firstname)) + ' ' + LTRIM(RTRIM(lastname)) AS FullName,
+            ROW_NUMBER() OVER (
+                PARTITION BY LTRIM(RTRIM(firstname)) + ' ' + LTRIM(RTRIM(lastname))
+                ORDER BY firstname, lastname) AS NameRank
+        FROM tblusers
+    )
+    SELECT
+        UserGUID,
+        FullName
+    FROM ranked
+    WHERE NameRank = 1
+END
@@ -4,15 +4,31 @@ CREATE OR ALTER PROCEDURE [dbo].[spProcessTritonPayload_WS]
     @QuoteOptionGuid UNIQUEIDENTIFIER,
    
     -- Full JSON payload for processing and audit trail
-    @full_payload_json NVARCHAR(MAX),
+    @full_payload_json NVARCHAR(MAX) = NULL,
    
     -- Optional renewal information
-    @renewal_of_quote_guid UNIQUEIDENTIFIER = NULL
+    @renewal_of_quote_guid UNIQUEIDENTIFIER = NULL,
+   
+    -- Instead of @full_payload_json: the payload already stored by
+    -- spStoreTritonTransaction_WS, identified by transaction and hash
+    @payload_transaction_id NVARCHAR(100) = NULL,
+    @payload_hash CHAR(64) = NULL
 AS
 BEGIN
     SET NOCOUNT ON;
    
     BEGIN TRY
+        IF @full_payload_json IS NULL
+        BEGIN
+            SELECT @full_payload_json = full_payload_json
+            FROM tblTritonTransactionData
+            WHERE transaction_id = @payload_transaction_id
+              AND payload_hash = @payload_hash;
+           
+            IF @full_payload_json IS NULL
+                THROW 50001, 'Stored payload not found for transaction (no @full_payload_json given)', 1;
+        END
+       
         BEGIN TRANSACTION;
        
         -- Declare variables to hold parsed JSON values
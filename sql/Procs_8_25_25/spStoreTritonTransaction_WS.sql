@@ -6,7 +6,8 @@ CREATE OR ALTER PROCEDURE [dbo].[spStoreTritonTransaction_WS]
     @insured_name NVARCHAR(500) = NULL,
     @transaction_type NVARCHAR(100),
     @transaction_date NVARCHAR(50),
-    @source_system NVARCHAR(50)
+    @source_system NVARCHAR(50),
+    @payload_hash CHAR(64) = NULL  -- SHA-256 of the payload JSON, see spProcessTritonPayload_WS
 AS
 BEGIN
     SET NOCOUNT ON;
@@ -20,6 +21,7 @@ BEGIN
                 'Warning' AS Status,
                 'Transaction already exists' AS Message,
                 transaction_id,
+                payload_hash,
                 date_created
             FROM tblTritonTransactionData
             WHERE transaction_id = @transaction_id;
@@ -37,6 +39,7 @@ BEGIN
             transaction_type,
             transaction_date,
             source_system,
+            payload_hash,
             date_created
         )
         VALUES (
@@ -48,6 +51,7 @@ BEGIN
             @transaction_type,
             @transaction_date,
             @source_system,
+            @payload_hash,
             GETDATE()
         );
         
@@ -57,6 +61,7 @@ BEGIN
             'Transaction stored successfully' AS Message,
             @transaction_id AS transaction_id,
             SCOPE_IDENTITY() AS TritonTransactionDataID,
+            @payload_hash AS payload_hash,
             GETDATE() AS date_created;
             
     END TRY
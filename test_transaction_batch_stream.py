@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test POST /api/triton/transactions/batch end to end over ASGI.
+
+The request body is delivered in several http.request messages, the way
+uvicorn hands it over, and every NDJSON result line is read back. IMS is
+answered by the in-process simulator, so no network is needed.
+
+Run with: python test_transaction_batch_stream.py (or pytest)
+"""
+
+import sys
+import json
+import asyncio
+import logging
+from pathlib import Path
+
+from fastapi import FastAPI
+from requests.adapters import BaseAdapter
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ims_simulator import IMSSimulator
+from app.api.triton import router as triton_router
+from app.services.ims.cassette import build_response
+from app.services.ims.soap_transport import get_soap_transport
+
+logging.basicConfig(level=logging.WARNING)
+
+TIMEOUT_SECONDS = 30
+
+
+class SimulatorAdapter(BaseAdapter):
+    """Requests adapter answering IMS SOAP calls from an IMSSimulator."""
+
+    def __init__(self):
+        super().__init__()
+        self.simulator = IMSSimulator(seed=85)
+
+    def send(self, request, **kwargs):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else (request.body or b"")
+        status, text = self.simulator.handle(request.headers.get("SOAPAction", ""), body)
+        return build_response(request, status, text.encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+def post_batch(chunks):
+    """POST the chunks as one request body; returns (status, body lines)."""
+    app = FastAPI()
+    app.include_router(triton_router)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/triton/transactions/batch",
+        "raw_path": b"/api/triton/transactions/batch",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/x-ndjson")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)] or [{"type": "http.request", "body": b"", "more_body": False}]
+    sent = []
+
+    async def run():
+        response_done = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Like a server: nothing more until the client goes away
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                response_done.set()
+
+        await asyncio.wait_for(app(scope, receive, send), TIMEOUT_SECONDS)
+
+    adapter = SimulatorAdapter()
+    get_soap_transport().mount(adapter)
+    try:
+        asyncio.run(run())
+    finally:
+        get_soap_transport().mount(None)
+
+    status = sent[0]["status"]
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, [json.loads(line) for line in body.decode("utf-8").splitlines() if line]
+
+
+def test_empty_array():
+    status, lines = post_batch([b"[]"])
+    assert status == 200
+    assert lines == []
+
+
+def test_single_ndjson_line():
+    status, lines = post_batch([b'{"transaction_id": "x"}\n'])
+    assert status == 200
+    assert len(lines) == 1
+    assert lines[0]["index"] == 0 and lines[0]["success"] is False
+
+
+def test_small_batch_in_chunks():
+    payload = json.loads((Path(__file__).parent / "test85bind.json").read_text())
+    body = "\n".join([
+        json.dumps(payload),
+        json.dumps({"transaction_id": "missing-fields"}),
+        json.dumps([1, 2])
+    ]).encode("utf-8")
+    # Split mid-record so records span http.request messages
+    chunks = [body[i:i + 100] for i in range(0, len(body), 100)]
+    status, lines = post_batch(chunks)
+
+    assert status == 200
+    results = {line["index"]: line for line in lines}
+    assert sorted(results) == [0, 1, 2]
+    assert results[0]["success"] is True, results[0]["message"]
+    assert results[0]["transaction_id"] == payload["transaction_id"]
+    assert results[1]["success"] is False
+    assert results[2]["message"] == "Record is not a JSON object"
+
+
+if __name__ == "__main__":
+    for test in (test_empty_array, test_single_ndjson_line, test_small_batch_in_chunks):
+        test()
+        print(f"{test.__name__}: passed")